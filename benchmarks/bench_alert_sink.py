@@ -0,0 +1,167 @@
+# benchmarks/bench_alert_sink.py
+"""
+Đo thời gian vòng lặp chấm điểm bị chặn khi gửi cảnh báo: gọi index() đồng bộ từng cảnh báo
+(cách làm cũ) so với AlertSink (hàng đợi + luồng ghi lô). Backend giả lập có độ trễ mỗi
+round trip cố định nên không cần cluster Elasticsearch. Đồng thời kiểm tra rằng mọi cảnh báo
+đều được ghi hoặc ghi tràn ra đĩa (không mất) khi backend lỗi tạm thời và khi hàng đợi đầy, và khi hàng đợi
+đầy thì vòng lặp chấm điểm không mở file tràn cho từng cảnh báo, cũng không log cảnh báo cho từng cảnh báo.
+
+Chạy: python -m benchmarks.bench_alert_sink [số_cảnh_báo] [độ_trễ_ms]
+"""
+
+import json
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from src.alert_sink import AlertSink, FileAlertSink
+
+class SlowBackendSink(AlertSink):
+    """Backend giả lập: mỗi lần ghi (một lô) tốn round_trip_sec, fail_first lần ghi đầu tiên ném lỗi."""
+
+    name = 'slow'
+
+    def __init__(self, round_trip_sec, fail_first=0, **kwargs):
+        super().__init__(**kwargs)
+        self.round_trip_sec = round_trip_sec
+        self.fail_first = fail_first
+        self.calls = 0
+        self.received = []
+        self.unblocked = threading.Event()
+        self.unblocked.set()
+        self.spill_threads = [] # Tên luồng của mỗi lần mở file tràn
+
+    def _spill(self, alerts, reason):
+        if alerts:
+            self.spill_threads.append(threading.current_thread().name)
+        super()._spill(alerts, reason)
+
+    def _write_bulk(self, alerts):
+        self.unblocked.wait()
+        time.sleep(self.round_trip_sec)
+        self.calls += 1
+        if self.calls <= self.fail_first:
+            raise ConnectionError("backend giả lập tạm thời lỗi")
+        self.received.extend(alerts)
+        return []
+
+def make_alert(i):
+    return {'@timestamp': '2024-01-01T00:00:00Z', 'seq': i, 'message': f"alert {i}"}
+
+class CountingHandler(logging.Handler):
+    """Đếm số bản ghi log từ mức WARNING trở lên."""
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        self.count += 1
+
+def count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+def bench_sync(n, round_trip_sec):
+    """Cách cũ: mỗi cảnh báo là một round trip chặn vòng lặp chấm điểm."""
+    start = time.perf_counter()
+    for i in range(n):
+        time.sleep(round_trip_sec) # es_client.index(...)
+    return time.perf_counter() - start
+
+def bench_sink(n, round_trip_sec, spill_path):
+    sink = SlowBackendSink(round_trip_sec, queue_size=n, bulk_size=500, flush_interval_sec=0.2,
+                           spill_path=spill_path).start()
+    start = time.perf_counter()
+    for i in range(n):
+        sink.send(make_alert(i))
+    blocked = time.perf_counter() - start
+    sink.close()
+    drained = time.perf_counter() - start
+    assert [a['seq'] for a in sink.received] == list(range(n)), "Sink làm mất hoặc đảo thứ tự cảnh báo"
+    return blocked, drained, sink.calls
+
+def check_retry_and_spill(tmp_dir):
+    """Backend lỗi 2 lần rồi hồi phục: không mất cảnh báo. Hàng đợi đầy: phần dư được ghi tràn ra đĩa."""
+    spill_path = os.path.join(tmp_dir, 'retry_spill.ndjson')
+    sink = SlowBackendSink(0.0, fail_first=2, bulk_size=50, flush_interval_sec=0.05,
+                           retry_backoff_sec=0.01, spill_path=spill_path).start()
+    for i in range(200):
+        sink.send(make_alert(i))
+    sink.close()
+    assert sorted(a['seq'] for a in sink.received) == list(range(200)), "Thử lại không giữ đủ cảnh báo"
+    assert sink.stats['retries'] == 2 and count_lines(spill_path) == 0
+    print(f"Thử lại: backend lỗi 2 lần -> {sink.stats}")
+
+    spill_path = os.path.join(tmp_dir, 'full_spill.ndjson')
+    sink = SlowBackendSink(0.0, queue_size=10, bulk_size=10, spill_path=spill_path)
+    sink.unblocked.clear() # Backend treo: luồng ghi chỉ lấy được lô đầu tiên
+    sink.start()
+    warnings = CountingHandler()
+    logging.getLogger().addHandler(warnings)
+    start = time.perf_counter()
+    accepted = sum(sink.send(make_alert(i)) for i in range(1000))
+    blocked = time.perf_counter() - start
+    scoring_spills = sink.spill_threads.count(threading.current_thread().name)
+    sink.unblocked.set()
+    sink.close()
+    logging.getLogger().removeHandler(warnings)
+    spilled = count_lines(spill_path)
+    assert len(sink.received) + spilled == 1000, "Có cảnh báo bị mất khi hàng đợi đầy"
+    assert scoring_spills == 0, "Vòng lặp chấm điểm tự mở file tràn"
+    assert warnings.count <= 1, "Log cảnh báo cho từng cảnh báo bị ghi tràn"
+    with open(spill_path, encoding='utf-8') as f:
+        json.loads(f.readline())
+    print(f"Hàng đợi đầy: {accepted} vào hàng đợi, {len(sink.received)} đã ghi, {spilled} ghi tràn ra {os.path.basename(spill_path)} "
+          f"trong {len(sink.spill_threads)} lần mở file ({scoring_spills} trên vòng lặp chấm điểm), {warnings.count} dòng WARNING; "
+          f"send() chặn tổng {blocked * 1000:.1f} ms")
+
+    # Bộ đệm tràn đầy khi luồng ghi kẹt: vòng lặp chấm điểm tự ghi theo từng khối, không theo từng cảnh báo
+    spill_path = os.path.join(tmp_dir, 'chunk_spill.ndjson')
+    sink = SlowBackendSink(0.0, queue_size=10, bulk_size=10, spill_buffer_size=100, spill_path=spill_path)
+    sink.unblocked.clear()
+    sink.start()
+    for i in range(1000):
+        sink.send(make_alert(i))
+    scoring_spills = sink.spill_threads.count(threading.current_thread().name)
+    sink.unblocked.set()
+    sink.close()
+    assert len(sink.received) + count_lines(spill_path) == 1000, "Có cảnh báo bị mất khi bộ đệm tràn đầy"
+    assert scoring_spills <= 1000 // 100, "Vòng lặp chấm điểm mở file tràn cho từng cảnh báo"
+    print(f"Bộ đệm tràn 100 cảnh báo đầy: vòng lặp chấm điểm mở file tràn {scoring_spills} lần cho {count_lines(spill_path)} cảnh báo")
+
+def check_file_sink(tmp_dir):
+    path = os.path.join(tmp_dir, 'alerts.ndjson')
+    sink = FileAlertSink(path=path, spill_path=os.path.join(tmp_dir, 'file_spill.ndjson')).start()
+    for i in range(1000):
+        sink.send(make_alert(i))
+    sink.close()
+    with open(path, encoding='utf-8') as f:
+        seqs = [json.loads(line)['seq'] for line in f]
+    assert seqs == list(range(1000)), "FileAlertSink ghi thiếu hoặc sai thứ tự"
+    print(f"FileAlertSink: {len(seqs)} cảnh báo NDJSON -> OK")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    round_trip_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 2.0
+    round_trip_sec = round_trip_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        check_file_sink(tmp_dir)
+        check_retry_and_spill(tmp_dir)
+
+        sync_sec = bench_sync(n, round_trip_sec)
+        blocked, drained, calls = bench_sink(n, round_trip_sec, os.path.join(tmp_dir, 'bench_spill.ndjson'))
+
+    print(f"\n{n} cảnh báo, round trip giả lập {round_trip_ms} ms:")
+    print(f"  index() đồng bộ từng cảnh báo : vòng lặp bị chặn {sync_sec * 1000:9.1f} ms ({n} round trip)")
+    print(f"  AlertSink (bulk, luồng nền)   : vòng lặp bị chặn {blocked * 1000:9.1f} ms, "
+          f"xả xong sau {drained * 1000:.1f} ms ({calls} round trip)")
+
+if __name__ == "__main__":
+    main()
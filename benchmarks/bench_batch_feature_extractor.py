@@ -0,0 +1,103 @@
+# benchmarks/bench_batch_feature_extractor.py
+"""
+Kiểm tra và đo BatchFeatureExtractor (vector hóa theo lô) so với ZeekFeatureExtractor (từng dòng):
+1. Parity: với cùng conn.log, mọi đặc trưng (giá trị và kiểu) của mọi flow phải giống hệt,
+   kể cả khi ts không tăng dần, dưới SYN flood, khi cửa sổ thời gian vượt giới hạn quá tải max_window_flows
+   và khi cửa sổ vắt qua ranh giới giữa các lô.
+2. Tốc độ trích xuất đặc trưng (flow/giây) của hai cách trên cùng các khối ZeekConnBatch.
+
+Chạy: python -m benchmarks.bench_batch_feature_extractor [số_dòng]
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+from src.batch_feature_extractor import BatchFeatureExtractor
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from benchmarks.common import synthetic_zeek_entries, write_conn_log
+from benchmarks.bench_zeek_feature_extractor import syn_flood_entries
+
+def read_blocks(log_path, chunk_size):
+    """Đọc toàn bộ conn.log thành các khối ZeekConnBatch (chunk_size nhỏ -> nhiều lô)."""
+    reader = ZeekConnReader(log_path, chunk_size=chunk_size)
+    reader.read_header()
+    blocks = list(reader)
+    reader.close()
+    return blocks
+
+def out_of_order_entries(n, seed=21):
+    """Lưu lượng hỗn hợp nhưng ~10% flow có ts lùi lại tới 3 giây (Zeek ghi conn.log khi kết nối kết thúc)."""
+    rng = random.Random(seed)
+    entries = synthetic_zeek_entries(n, seed=seed, rate=3000.0)
+    for entry in entries:
+        if rng.random() < 0.1:
+            entry['ts'] = f"{float(entry['ts']) - rng.random() * 3.0:.6f}"
+    return entries
+
+def check_parity(log_path, chunk_size, max_window_flows=None):
+    """So sánh từng flow giữa hai cách tính trên cùng các khối (max_window_flows: giới hạn quá tải, None là mặc định)."""
+    kwargs = {} if max_window_flows is None else {'max_window_flows': max_window_flows}
+    streaming, batch = ZeekFeatureExtractor(**kwargs), BatchFeatureExtractor(**kwargs)
+    i = 0
+    for block in read_blocks(log_path, chunk_size):
+        actual = batch.transform(block).to_dict('records')
+        for log_entry_dict, features in zip(block.to_records(CONN_LOG_SCORING_FIELDS), actual):
+            expected = streaming.process_zeek_log_entry(log_entry_dict)
+            if expected != features or [type(v) for v in expected.values()] != [type(v) for v in features.values()]:
+                diff = {k: (expected[k], features[k]) for k in expected if expected[k] != features[k]}
+                print(f"Sai khác tại flow {i}: {diff or 'kiểu dữ liệu'}")
+                return False
+            i += 1
+    return True
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Giới hạn 500 flow: SYN flood 3000 flow/s (~6000 flow trong cửa sổ 2s) bị loại sớm liên tục
+        cases = (('hỗn hợp', synthetic_zeek_entries(20000, seed=3), None),
+                 ('ts không tăng dần', out_of_order_entries(20000), None),
+                 ('SYN flood', syn_flood_entries(20000, rate=3000.0), None),
+                 ('SYN flood quá tải', syn_flood_entries(20000, rate=3000.0), 500),
+                 ('ts không tăng dần quá tải', out_of_order_entries(20000), 500))
+        for name, entries, max_window_flows in cases:
+            log_path = os.path.join(tmp_dir, 'parity_conn.log')
+            write_conn_log(log_path, entries)
+            # Khối 4 KiB (~25 flow/lô, nhỏ hơn cửa sổ 100 flow) và khối lớn (cả file một lô)
+            for chunk_size in (1 << 12, 1 << 24):
+                if not check_parity(log_path, chunk_size, max_window_flows):
+                    print(f"BatchFeatureExtractor KHÔNG khớp với ZeekFeatureExtractor ({name}, khối {chunk_size} byte)")
+                    sys.exit(1)
+        print("Parity: đặc trưng giống hệt ZeekFeatureExtractor (hỗn hợp, ts không tăng dần, SYN flood, "
+              "quá tải max_window_flows; lô nhỏ và lớn)")
+
+        log_path = os.path.join(tmp_dir, 'conn.log')
+        write_conn_log(log_path, synthetic_zeek_entries(n, seed=12, n_hosts=250, rate=5000.0))
+        blocks = read_blocks(log_path, 1 << 20)
+
+        start = time.perf_counter()
+        extractor = ZeekFeatureExtractor()
+        for block in blocks:
+            for log_entry_dict in block.to_records(CONN_LOG_SCORING_FIELDS):
+                extractor.process_zeek_log_entry(log_entry_dict)
+        streaming_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        extractor = BatchFeatureExtractor()
+        for block in blocks:
+            extractor.transform(block)
+        batch_sec = time.perf_counter() - start
+
+        print(f"\n{n} flow, {len(blocks)} khối:")
+        print(f"  ZeekFeatureExtractor (từng dòng): {n / streaming_sec:10.0f} flow/s")
+        print(f"  BatchFeatureExtractor (theo lô) : {n / batch_sec:10.0f} flow/s "
+              f"({streaming_sec / batch_sec:.1f}x nhanh hơn)")
+
+if __name__ == "__main__":
+    main()
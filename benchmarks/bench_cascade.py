@@ -0,0 +1,146 @@
+# benchmarks/bench_cascade.py
+"""
+Đo chấm điểm hai tầng (src/cascade.py) trên conn.log giả lập: huấn luyện tạm mô hình đầy đủ và bộ lọc trước
+(train_prefilter, ngưỡng theo --fn-budget) trên đặc trưng giả lập, rồi so:
+  - flow/s đầu-cuối của FlowBatcher (đọc + trích xuất + chấm điểm, không log từng flow) và thời gian chỉ riêng
+    score_batch, có và không có cascade, ở lô live và lô đuổi kịp backlog (tốt nhất trong --repeat lần);
+  - tỉ lệ flow bỏ qua mô hình đầy đủ, tỉ lệ flow tấn công (S0/REJ) bị bộ lọc bỏ lọt và số false negative
+    cascade thêm vào so với mô hình đầy đủ.
+Hai mô hình được huấn luyện trên một conn.log giả lập khác (seed khác, cùng phân bố). Nhãn: flow S0/REJ là
+tấn công, --label-noise nhãn tấn công bị đổi thành bình thường để cây của mô hình đầy đủ mọc đủ sâu như khi
+huấn luyện trên dữ liệu thật (dữ liệu giả lập tách được quá dễ).
+Lợi ích tăng theo chi phí của mô hình đầy đủ (--trees/--depth) và tỉ lệ lưu lượng bình thường.
+
+Chạy: python -m benchmarks.bench_cascade [--flows 50000] [--trees 100 --depth 5] [--fn-budget 0.001]
+"""
+
+import argparse
+import logging
+import random
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.config import (MONITOR_BATCH_SIZE, MONITOR_CATCHUP_BATCH_SIZE, NSL_KDD_RELEVANT_COLUMNS,
+                        CASCADE_FN_BUDGET)
+from src.cascade import CascadeModel, train_prefilter, cascade_report, export_prefilter, load_cascade
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import export_native_model, load_model
+from src.preprocess import preprocess_features
+from src.stream_monitor import FlowBatcher, score_batch
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader
+from benchmarks.conn_log_generator import write_synthetic_conn_log, DEFAULT_ATTACK_MIX
+
+def train_models(train_features, trees, depth, fn_budget, label_noise, tmp_dir):
+    """Mô hình đầy đủ, CascadeModel (cùng mô hình đầy đủ) và preprocessor đã biên dịch, huấn luyện trên đặc trưng giả lập."""
+    import xgboost as xgb
+    X, _, preprocessor = preprocess_features(pd.DataFrame(train_features, columns=NSL_KDD_RELEVANT_COLUMNS),
+                                             fit=True, save_path=None)
+    rng = random.Random(1)
+    y = np.array([record['flag'] in ('S0', 'REJ') and rng.random() >= label_noise for record in train_features],
+                 dtype=np.int8)
+    classifier = xgb.XGBClassifier(n_estimators=trees, max_depth=depth, random_state=42).fit(X, y)
+    model = load_model(export_native_model(classifier, f"{tmp_dir}/xgb_model.ubj"))
+
+    prefilter, threshold, val_report = train_prefilter(X, y, fn_budget=fn_budget)
+    cascade = load_cascade(load_model(f"{tmp_dir}/xgb_model.ubj"),
+                           export_prefilter(prefilter, threshold, fn_budget, f"{tmp_dir}/cascade_prefilter.npz"))
+    return model, cascade, compile_preprocessor(preprocessor) or preprocessor, val_report
+
+def run_monitor(log_path, model, preprocessor, batch_size):
+    """Một lượt FlowBatcher như _drain_reader (không alert sink, không log từng flow); trả về (số flow, số giây)."""
+    batcher = FlowBatcher(model, preprocessor, None, ZeekFeatureExtractor())
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    flows = 0
+    start = time.perf_counter()
+    try:
+        for zeek_batch in reader:
+            flows += batcher.add_block(zeek_batch, batch_size, log_flows=False)
+        batcher.flush(log_flows=False)
+    finally:
+        reader.close()
+    return flows, time.perf_counter() - start
+
+def run_scoring(model, preprocessor, features, batch_size):
+    """Chỉ chấm điểm (score_batch) các đặc trưng đã trích xuất theo lô; trả về số giây."""
+    start = time.perf_counter()
+    for i in range(0, len(features), batch_size):
+        score_batch(model, preprocessor, features[i:i + batch_size])
+    return time.perf_counter() - start
+
+def extract_features(log_path):
+    extractor = ZeekFeatureExtractor()
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    features = []
+    try:
+        for zeek_batch in reader:
+            for record in zeek_batch.to_records():
+                nslkdd_features = extractor.process_zeek_log_entry(record)
+                if nslkdd_features is not None:
+                    features.append(nslkdd_features)
+    finally:
+        reader.close()
+    return features
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_cascade',
+                                     description="So sánh flow/s và false negative của chấm điểm một tầng và hai tầng.")
+    parser.add_argument('--flows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--trees', type=int, default=100, help="Số cây của mô hình đầy đủ (train_model: 100)")
+    parser.add_argument('--depth', type=int, default=5, help="Độ sâu cây của mô hình đầy đủ (train_model: 5)")
+    parser.add_argument('--fn-budget', type=float, default=CASCADE_FN_BUDGET)
+    parser.add_argument('--label-noise', type=float, default=0.2)
+    parser.add_argument('--syn-flood', type=float, default=DEFAULT_ATTACK_MIX['syn_flood'])
+    parser.add_argument('--port-sweep', type=float, default=DEFAULT_ATTACK_MIX['port_sweep'])
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        attack_mix = {'syn_flood': args.syn_flood, 'port_sweep': args.port_sweep}
+        # Tập huấn luyện: log khác (seed khác) nhưng cùng phân bố với log dùng để đo
+        train_path = write_synthetic_conn_log(f"{tmp_dir}/train_conn.log", 20000, attack_mix=attack_mix, seed=1)
+        model, cascade, preprocessor, val_report = train_models(extract_features(train_path), args.trees, args.depth,
+                                                                args.fn_budget, args.label_noise, tmp_dir)
+        log_path = write_synthetic_conn_log(f"{tmp_dir}/conn.log", args.flows, attack_mix=attack_mix)
+        features = extract_features(log_path)
+
+        print(f"Mô hình đầy đủ {args.trees} cây sâu {args.depth}, bộ lọc: ngưỡng {cascade.threshold:.4g} "
+              f"(validation: bỏ qua {val_report['short_circuit_rate']:.1%}, lọt {val_report['attack_miss_rate']:.3%} tấn công)")
+        for batch_size in (max(1, MONITOR_BATCH_SIZE), MONITOR_CATCHUP_BATCH_SIZE):
+            run_monitor(log_path, model, preprocessor, batch_size) # Làm nóng
+            best = {name: [float('inf'), float('inf')] for name in ('một tầng', 'cascade')}
+            for _ in range(args.repeat):
+                for name, scorer in (('một tầng', model), ('cascade', cascade)):
+                    flows, sec = run_monitor(log_path, scorer, preprocessor, batch_size)
+                    best[name][0] = min(best[name][0], sec)
+                    best[name][1] = min(best[name][1], run_scoring(scorer, preprocessor, features, batch_size))
+            (end_single, score_single), (end_cascade, score_cascade) = best['một tầng'], best['cascade']
+            print(f"  lô {batch_size}: đầu-cuối một tầng {flows / end_single:8.0f} flow/s | cascade "
+                  f"{flows / end_cascade:8.0f} flow/s ({end_single / end_cascade:.2f}x); chỉ chấm điểm "
+                  f"{score_single / len(features) * 1e6:.2f} -> {score_cascade / len(features) * 1e6:.2f} us/flow "
+                  f"({score_single / score_cascade:.2f}x)")
+
+    X = preprocessor.transform_records(features)
+    prefilter_scores = cascade.prefilter.predict_proba(X)[:, 1]
+    full_proba = model.predict_proba(X)[:, 1]
+    y = np.array([record['flag'] in ('S0', 'REJ') for record in features], dtype=np.int8)
+    report = cascade_report(prefilter_scores, cascade.threshold, y, full_proba=full_proba)
+    _, cascade_probas, _ = score_batch(cascade, preprocessor, features)
+    uncertain = prefilter_scores >= cascade.threshold
+    # Flow qua mô hình đầy đủ phải có xác suất giống hệt chấm điểm một tầng
+    same = np.array_equal(np.asarray(cascade_probas, dtype=np.float32)[uncertain], full_proba[uncertain])
+    print(f"  {len(features)} flow: bỏ qua mô hình đầy đủ {report['short_circuit_rate']:.1%}, "
+          f"lọt {report['attack_miss_rate']:.3%} flow S0/REJ, thêm {report['added_false_negatives']} false negative "
+          f"(recall {report['recall']:.4f} -> {report['cascade_recall']:.4f})")
+    print(f"  flow không bị lọc: xác suất {'giống hệt' if same else 'KHÁC'} mô hình đầy đủ")
+    if not same or not isinstance(cascade, CascadeModel):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_compiled_preprocessor.py
+"""
+So sánh preprocess_features (pandas + ColumnTransformer) với CompiledPreprocessor.
+Kiểm tra kết quả giống hệt preprocessor.transform trước khi đo thời gian.
+
+Chạy: python -m benchmarks.bench_compiled_preprocessor
+"""
+
+import sys
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.config import NSL_KDD_RELEVANT_COLUMNS
+from src.preprocess import preprocess_features
+from src.compiled_preprocessor import CompiledPreprocessor
+from benchmarks.common import synthetic_feature_records, load_or_fit_preprocessor, timeit
+
+def _dense(X):
+    return X.toarray() if sparse.issparse(X) else np.asarray(X)
+
+def check_parity(preprocessor, compiled, records):
+    """So sánh từng phần tử với preprocessor.transform, trả về True nếu giống hệt."""
+    df = pd.DataFrame(records, columns=NSL_KDD_RELEVANT_COLUMNS)
+    expected, _, _ = preprocess_features(df, preprocessor=preprocessor, fit=False, compiled=False)
+    actual = compiled.transform_records(records)
+    if sparse.issparse(expected) != sparse.issparse(actual):
+        print("Sai khác: một bên trả về sparse, bên kia dense.")
+        return False
+    if expected.dtype != actual.dtype:
+        print(f"Sai khác kiểu: {expected.dtype} != {actual.dtype}")
+        return False
+    if sparse.issparse(expected) and (expected.nnz != actual.nnz or
+                                      (abs(expected.sign()) != abs(actual.sign())).nnz):
+        # XGBoost coi phần tử không lưu là missing: vị trí các phần tử được lưu cũng phải giống hệt
+        print(f"Sai khác cấu trúc sparse: {expected.nnz} != {actual.nnz} phần tử được lưu")
+        return False
+    expected, actual = _dense(expected), _dense(actual)
+    if expected.shape != actual.shape:
+        print(f"Sai khác kích thước: {expected.shape} != {actual.shape}")
+        return False
+    max_diff = float(np.max(np.abs(expected - actual))) if expected.size else 0.0
+    print(f"Parity: {expected.shape[0]} hàng, sai khác lớn nhất = {max_diff}")
+    return np.array_equal(expected, actual)
+
+def main():
+    records = synthetic_feature_records(20000, seed=2)
+    preprocessor = load_or_fit_preprocessor()
+    compiled = CompiledPreprocessor.from_preprocessor(preprocessor)
+
+    # Thêm vài bản ghi có giá trị lạ để kiểm tra ép kiểu / giá trị phân loại chưa gặp
+    odd = dict(records[0], service='not_a_service', duration='abc', src_bytes=None, land=1.7)
+    if not check_parity(preprocessor, compiled, records + [odd]):
+        print("CompiledPreprocessor KHÔNG khớp với preprocessor.transform")
+        sys.exit(1)
+
+    # transform_frame theo từng khối (như khi tiền xử lý tập huấn luyện) phải cho đúng ma trận transform_records
+    frame = pd.DataFrame(records + [odd], columns=NSL_KDD_RELEVANT_COLUMNS)
+    by_records, by_chunks = compiled.transform_records(records + [odd]), compiled.transform_frame(frame, chunk_rows=3000)
+    if sparse.issparse(by_records) and not (np.array_equal(by_records.indptr, by_chunks.indptr) and
+                                            np.array_equal(by_records.indices, by_chunks.indices)):
+        print("transform_frame theo khối KHÔNG cùng cấu trúc sparse với transform_records")
+        sys.exit(1)
+    if not np.array_equal(_dense(by_records), _dense(by_chunks)):
+        print("transform_frame theo khối KHÔNG khớp với transform_records")
+        sys.exit(1)
+    print(f"transform_frame theo khối 3000 dòng khớp transform_records ({frame.shape[0]} hàng)")
+
+    one = records[:1]
+    n_single = 500
+    t_pandas_one = timeit(lambda: [preprocess_features(pd.DataFrame(one, columns=NSL_KDD_RELEVANT_COLUMNS),
+                                                       preprocessor=preprocessor, fit=False, compiled=False)
+                                   for _ in range(n_single)], repeat=3) / n_single
+    t_compiled_one = timeit(lambda: [compiled.transform_one(one[0]) for _ in range(n_single)], repeat=3) / n_single
+    print(f"Từng flow : pandas {t_pandas_one * 1e6:9.1f} us/flow | compiled {t_compiled_one * 1e6:8.1f} us/flow "
+          f"| nhanh hơn {t_pandas_one / t_compiled_one:6.1f}x")
+
+    for batch_size in (256, 4096):
+        batch = records[:batch_size]
+        df_batch = lambda: pd.DataFrame(batch, columns=NSL_KDD_RELEVANT_COLUMNS)
+        t_pandas = timeit(lambda: preprocess_features(df_batch(), preprocessor=preprocessor, fit=False, compiled=False))
+        t_compiled = timeit(lambda: compiled.transform_records(batch))
+        print(f"Lô {batch_size:5d}: pandas {t_pandas / batch_size * 1e6:9.2f} us/flow | compiled "
+              f"{t_compiled / batch_size * 1e6:8.2f} us/flow | nhanh hơn {t_pandas / t_compiled:6.1f}x")
+
+if __name__ == "__main__":
+    main()
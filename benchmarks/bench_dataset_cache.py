@@ -0,0 +1,100 @@
+# benchmarks/bench_dataset_cache.py
+"""
+Đo cache tập dữ liệu NSL-KDD (src/dataset_cache.py) trên file giả lập cùng định dạng KDDTrain+/KDDTest+:
+1. Cách cũ: read_csv không khai báo kiểu + apply(lambda) cho outcome + preprocess_features.
+2. Lần đầu (chưa có cache): đọc CSV có kiểu, tiền xử lý và ghi cache.
+3. Các lần sau: tải ma trận float32/nhãn int8 bằng memory-map.
+Kiểm tra dữ liệu từ cache giống hệt tiền xử lý trực tiếp, và cache bị bỏ khi file dữ liệu thay đổi.
+
+Chạy: python -m benchmarks.bench_dataset_cache [số_dòng_train]
+"""
+
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.dataset_cache import load_training_data
+from src.preprocess import preprocess_features
+from benchmarks.common import synthetic_feature_records
+
+NSL_KDD_FILE_COLUMNS = [
+    'duration', 'protocol_type', 'service', 'flag', 'src_bytes', 'dst_bytes',
+    'land', 'wrong_fragment', 'urgent', 'hot', 'num_failed_logins', 'logged_in',
+    'num_compromised', 'root_shell', 'su_attempted', 'num_root', 'num_file_creations',
+    'num_shells', 'num_access_files', 'num_outbound_cmds', 'is_host_login',
+    'is_guest_login', 'count', 'srv_count', 'serror_rate', 'srv_serror_rate',
+    'rerror_rate', 'srv_rerror_rate', 'same_srv_rate', 'diff_srv_rate',
+    'srv_diff_host_rate', 'dst_host_count', 'dst_host_srv_count',
+    'dst_host_same_srv_rate', 'dst_host_diff_srv_rate', 'dst_host_same_src_port_rate',
+    'dst_host_srv_diff_host_rate', 'dst_host_serror_rate', 'dst_host_srv_serror_rate',
+    'dst_host_rerror_rate', 'dst_host_srv_rerror_rate', 'outcome', 'difficulty'
+]
+
+def write_nslkdd_file(path, n, seed=0):
+    """Ghi n dòng CSV không header theo định dạng NSL-KDD (đặc trưng lấy từ dữ liệu Zeek giả lập)."""
+    rng = random.Random(seed)
+    df = pd.DataFrame(synthetic_feature_records(n, seed=seed))
+    df['outcome'] = [('neptune' if flag in ('S0', 'REJ') else 'normal') if rng.random() < 0.9 else
+                     rng.choice(['smurf', 'portsweep', 'normal']) for flag in df['flag']]
+    df['difficulty'] = [rng.randint(1, 21) for _ in range(n)]
+    df[NSL_KDD_FILE_COLUMNS].to_csv(path, header=False, index=False)
+
+def legacy_load(path):
+    """load_nslkdd_data trước khi có cache: read_csv tự đoán kiểu, outcome ánh xạ bằng apply."""
+    df = pd.read_csv(path, header=None, names=NSL_KDD_FILE_COLUMNS)
+    df['outcome'] = df['outcome'].apply(lambda x: 0 if x == 'normal' else 1)
+    return df.drop('difficulty', axis=1)
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 125973 # Số dòng của KDDTrain+.txt
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        train_path, test_path = os.path.join(tmp_dir, 'KDDTrain+.txt'), os.path.join(tmp_dir, 'KDDTest+.txt')
+        write_nslkdd_file(train_path, n, seed=1)
+        write_nslkdd_file(test_path, max(1, n // 6), seed=2)
+        cache_dir = os.path.join(tmp_dir, 'cache')
+
+        start = time.perf_counter()
+        X_train, y_train, preprocessor = preprocess_features(legacy_load(train_path), fit=True, save_path=None)
+        X_test, y_test, _ = preprocess_features(legacy_load(test_path), preprocessor=preprocessor, fit=False)
+        legacy_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_training_data(train_path, test_path, cache_dir=cache_dir)
+        build_sec = time.perf_counter() - start
+
+        start = time.perf_counter()
+        cached = load_training_data(train_path, test_path, cache_dir=cache_dir)
+        warm_sec = time.perf_counter() - start
+
+        expected = (X_train, y_train, X_test, y_test)
+        for name, want, got in zip(('X_train', 'y_train', 'X_test', 'y_test'), expected, cached[:4]):
+            want = want.toarray() if hasattr(want, 'toarray') else np.asarray(want)
+            got = got.toarray() if hasattr(got, 'toarray') else np.asarray(got)
+            if not np.array_equal(want.astype(got.dtype), got):
+                print(f"{name} từ cache KHÁC tiền xử lý trực tiếp")
+                sys.exit(1)
+        print(f"Parity: X (float32) và y (int8) từ cache giống hệt tiền xử lý trực tiếp ({X_train.shape[0]} + {X_test.shape[0]} dòng)")
+
+        with open(test_path, 'a') as f:
+            f.write(open(test_path).readline())
+        rebuilt = load_training_data(train_path, test_path, cache_dir=cache_dir)
+        entries = [name for name in os.listdir(cache_dir) if not name.startswith('.')]
+        if rebuilt[2].shape[0] != X_test.shape[0] + 1 or len(entries) != 1:
+            print("Cache KHÔNG được làm mới khi file dữ liệu thay đổi")
+            sys.exit(1)
+        print("Sửa file test -> cache được tạo lại, entry cũ bị xóa")
+
+        print(f"\nCách cũ (CSV + apply + tiền xử lý): {legacy_sec * 1000:9.1f} ms")
+        print(f"Lần đầu (CSV có kiểu + ghi cache)  : {build_sec * 1000:9.1f} ms")
+        print(f"Từ cache (hash file + memory-map)  : {warm_sec * 1000:9.1f} ms ({legacy_sec / warm_sec:.0f}x nhanh hơn)")
+
+if __name__ == "__main__":
+    main()
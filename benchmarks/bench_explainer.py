@@ -0,0 +1,140 @@
+# benchmarks/bench_explainer.py
+"""
+Đo AlertExplainer (src/alert_explainer.py) trên conn.log giả lập có nhiều SYN flood / quét cổng:
+  - số cảnh báo/s luồng nền giải thích được theo kích thước lô pred_contribs;
+  - chi phí send() trên luồng chấm điểm (chỉ đưa vào hàng đợi);
+  - monitor đầu-cuối (FlowBatcher) gửi cảnh báo thẳng tới sink so với qua AlertExplainer: flow/s, số cảnh báo/s
+    monitor tạo ra, và số cảnh báo không kịp giải thích (hàng đợi đầy) — 0 nghĩa là giải thích theo kịp.
+Kiểm tra: tổng đóng góp + base_value bằng log-odds xác suất của mô hình, mọi cảnh báo tới sink đủ và đúng thứ tự.
+
+Chạy: python -m benchmarks.bench_explainer [--flows 50000] [--syn-flood 0.3] [--port-sweep 0.1]
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+
+import joblib
+
+from src.config import MONITOR_BATCH_SIZE
+from src.alert_explainer import AlertExplainer
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import load_model
+from src.stream_monitor import FlowBatcher, build_alert, score_batch
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from benchmarks.common import ensure_model_files
+from benchmarks.conn_log_generator import write_synthetic_conn_log
+
+class CollectingSink:
+    """Sink giả lập: chỉ giữ lại cảnh báo nhận được."""
+
+    def __init__(self):
+        self.alerts = []
+
+    def send(self, alert):
+        self.alerts.append(alert)
+        return True
+
+def make_alerts(log_path, model, preprocessor):
+    """Cảnh báo (như process_batch tạo) của mọi flow Malicious trong log."""
+    extractor = ZeekFeatureExtractor()
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    batch = []
+    try:
+        for zeek_batch in reader:
+            for record in zeek_batch.to_records(CONN_LOG_SCORING_FIELDS):
+                features = extractor.process_zeek_log_entry(record)
+                if features is not None:
+                    batch.append((record, features))
+    finally:
+        reader.close()
+    labels, probas, _ = score_batch(model, preprocessor, [features for _, features in batch])
+    return [build_alert(record, features, label, proba)
+            for (record, features), label, proba in zip(batch, labels, probas) if label == 'Malicious']
+
+def run_monitor(log_path, model, preprocessor, sink):
+    """FlowBatcher với lô live (có log từng flow tắt); trả về (số flow, số giây)."""
+    batcher = FlowBatcher(model, preprocessor, sink, ZeekFeatureExtractor())
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    flows = 0
+    start = time.perf_counter()
+    try:
+        for zeek_batch in reader:
+            flows += batcher.add_block(zeek_batch, max(1, MONITOR_BATCH_SIZE), log_flows=False)
+        batcher.flush(log_flows=False)
+    finally:
+        reader.close()
+    return flows, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_explainer',
+                                     description="Đo thông lượng giải thích cảnh báo so với tốc độ tạo cảnh báo.")
+    parser.add_argument('--flows', type=int, default=50000)
+    parser.add_argument('--syn-flood', type=float, default=0.3)
+    parser.add_argument('--port-sweep', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = write_synthetic_conn_log(f"{tmp_dir}/conn.log", args.flows,
+                                            attack_mix={'syn_flood': args.syn_flood, 'port_sweep': args.port_sweep})
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        model = load_model(model_path)
+        preprocessor = compile_preprocessor(joblib.load(preprocessor_path)) or joblib.load(preprocessor_path)
+        alerts = make_alerts(log_path, model, preprocessor)
+        print(f"{args.flows} flow, {len(alerts)} cảnh báo:")
+
+        # top_k = mọi cột: tổng đóng góp + base_value phải bằng log-odds (margin) của mô hình
+        full = AlertExplainer(model, preprocessor, None, top_k=preprocessor.n_features_out).explain(alerts[:200])
+        margins = model.booster.inplace_predict(preprocessor.transform_records(
+            [alert['ml_ids']['nsl_kdd_features'] for alert in alerts[:200]]), predict_type='margin')
+        max_error = max(abs(sum(f['contribution'] for f in alert['ml_ids']['explanation']['top_features'])
+                            + alert['ml_ids']['explanation']['base_value'] - float(margin))
+                        for alert, margin in zip(full, margins))
+        print(f"  tổng đóng góp + base_value so với log-odds của mô hình: lệch tối đa {max_error:.2e}")
+        explainer = AlertExplainer(model, preprocessor, CollectingSink())
+        explained = explainer.explain(alerts[:1])
+        top = explained[0]['ml_ids']['explanation']['top_features']
+        print("  ví dụ: " + ', '.join(f"{f['feature']}={f['value']} ({f['contribution']:+.3f})" for f in top))
+
+        for batch_size in (1, 16, 64, 256):
+            sample = alerts[:max(batch_size * 20, 2000)]
+            start = time.perf_counter()
+            for i in range(0, len(sample), batch_size):
+                explainer.explain(sample[i:i + batch_size])
+            sec = time.perf_counter() - start
+            print(f"  giải thích lô {batch_size:3d}: {len(sample) / sec:9.0f} cảnh báo/s ({sec / len(sample) * 1e6:7.1f} us/cảnh báo)")
+
+        sink = CollectingSink()
+        explainer = AlertExplainer(model, preprocessor, sink, queue_size=len(alerts) + 1)
+        start = time.perf_counter()
+        for alert in alerts:
+            explainer.send(alert)
+        send_sec = time.perf_counter() - start
+        print(f"  send() trên luồng chấm điểm: {send_sec / len(alerts) * 1e6:.2f} us/cảnh báo")
+
+        run_monitor(log_path, model, preprocessor, CollectingSink()) # Làm nóng
+        flows, direct_sec = run_monitor(log_path, model, preprocessor, CollectingSink())
+        sink = CollectingSink()
+        explainer = AlertExplainer(model, preprocessor, sink).start()
+        flows, explained_sec = run_monitor(log_path, model, preprocessor, explainer)
+        scoring_done = time.perf_counter()
+        explainer.close()
+        drain_sec = time.perf_counter() - scoring_done
+
+    ok = (len(sink.alerts) == len(alerts) and all('explanation' in alert['ml_ids'] for alert in sink.alerts)
+          and [a['@timestamp'] for a in sink.alerts] == [a['@timestamp'] for a in alerts])
+    print(f"  monitor lô {MONITOR_BATCH_SIZE}: không giải thích {flows / direct_sec:8.0f} flow/s | có AlertExplainer "
+          f"{flows / explained_sec:8.0f} flow/s ({direct_sec / explained_sec:.2f}x), "
+          f"{len(alerts) / explained_sec:.0f} cảnh báo/s; xả hàng đợi sau khi chấm điểm xong {drain_sec * 1000:.0f} ms")
+    print(f"  {explainer.stats['explained']} cảnh báo được giải thích trong {explainer.stats['batches']} lô, "
+          f"{explainer.stats['unexplained']} không kịp giải thích; sink nhận {'ĐỦ, đúng thứ tự' if ok else 'THIẾU/SAI THỨ TỰ'}")
+    if not ok or max_error > 1e-3:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
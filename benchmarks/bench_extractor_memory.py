@@ -0,0 +1,146 @@
+# benchmarks/bench_extractor_memory.py
+"""
+Đo bộ nhớ trạng thái cửa sổ của ZeekFeatureExtractor (bộ đệm vòng dạng mảng, host/dịch vụ intern thành số
+nguyên, cờ là mã uint8, bộ đếm gói trong một int) so với cách cũ (deque các dict flow + dict bộ đếm dạng list):
+  - byte trên mỗi flow đang theo dõi (tracemalloc, gồm cả chuỗi IP mà trạng thái giữ lại) và số object Python
+    GC phải theo dõi trên mỗi flow, thời gian một lần gc.collect() đầy đủ;
+  - SYN flood tới vài host đích (cửa sổ 2 giây chứa --flows flow) và quét nhiều host đích (mỗi flow một đích);
+  - giới hạn cứng: cùng flood với max_window_flows = --flows / 4 thì bộ nhớ đứng yên, phần vượt bị loại sớm;
+  - host nhàn rỗi: sau đợt quét, lưu lượng bình thường tới vài host làm bảng intern co lại.
+
+Chạy: python -m benchmarks.bench_extractor_memory [--flows 200000]
+"""
+
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+from collections import deque
+
+from src.zeek_feature_extractor import ZeekFeatureExtractor, SERROR_FLAGS, RERROR_FLAGS
+
+class DequeZeekFeatureExtractor(ZeekFeatureExtractor):
+    """
+    Trạng thái cửa sổ như ZeekFeatureExtractor trước đây: mỗi flow là một dict trong hai deque,
+    bộ đếm là list [count, serror, rerror] theo dest_ip và (dest_ip, service). Chỉ cập nhật trạng thái.
+    """
+
+    def __init__(self, time_window_sec=2.0, host_window_count=100):
+        super().__init__(time_window_sec, host_window_count)
+        self.recent_flows_time = deque()
+        self.recent_flows_host = deque()
+
+    @staticmethod
+    def _update(host_stats, srv_stats, flow_info, sign):
+        serror = 1 if flow_info['flag'] in SERROR_FLAGS else 0
+        rerror = 1 if flow_info['flag'] in RERROR_FLAGS else 0
+        for stats, key in ((host_stats, flow_info['dest_ip']),
+                           (srv_stats, (flow_info['dest_ip'], flow_info['service']))):
+            counters = stats.get(key)
+            if counters is None:
+                stats[key] = [1, serror, rerror]
+            elif sign < 0 and counters[0] == 1:
+                del stats[key]
+            else:
+                counters[0] += sign
+                counters[1] += sign * serror
+                counters[2] += sign * rerror
+
+    def process_zeek_log_entry(self, log_entry_dict, seq=None, watermark=None):
+        current_ts = float(log_entry_dict['ts'])
+        proto = log_entry_dict.get('proto', 'unknown').lower()
+        service = log_entry_dict.get('service', '-')
+        if service == '-':
+            service = self._map_port_to_service(proto, int(log_entry_dict.get('id.resp_p', 0)))
+        seq = self._next_seq
+        self._next_seq = seq + 1
+        watermark = max(self._watermark, current_ts)
+        self._watermark = watermark
+        flow_info = {'ts': current_ts, 'dest_ip': log_entry_dict.get('id.resp_h'),
+                     'src_ip': log_entry_dict.get('id.orig_h'), 'service': service,
+                     'flag': self._map_zeek_conn_state_to_nsl_flag(log_entry_dict.get('conn_state', 'OTH')),
+                     'seq': seq, 'watermark': watermark}
+        self.recent_flows_time.append(flow_info)
+        self._update(self.time_host_stats, self.time_srv_stats, flow_info, 1)
+        while self.recent_flows_time[0]['watermark'] < watermark - self.time_window_sec:
+            self._update(self.time_host_stats, self.time_srv_stats, self.recent_flows_time.popleft(), -1)
+        self.recent_flows_host.append(flow_info)
+        self._update(self.host_host_stats, self.host_srv_stats, flow_info, 1)
+        while self.recent_flows_host[0]['seq'] <= seq - self.host_window_count:
+            self._update(self.host_host_stats, self.host_srv_stats, self.recent_flows_host.popleft(), -1)
+        return flow_info
+
+    def window_sizes(self):
+        return {'time_flows': len(self.recent_flows_time)}
+
+def flood_entries(n, rate, n_targets=2, start_ts=1700000000.0, service='-', conn_state='S0'):
+    """
+    Sinh dần n flow (chuỗi IP tạo mới cho từng flow như khi đọc log) với tốc độ `rate` flow/giây.
+    n_targets=None: mỗi flow tới một host đích khác nhau (quét nhiều host).
+    """
+    step = 1.0 / rate
+    for i in range(n):
+        target = i if n_targets is None else i % n_targets
+        yield {'ts': f"{start_ts + i * step:.6f}", 'id.orig_h': f"172.16.{(i >> 8) & 255}.{i & 255}",
+               'id.orig_p': str(1024 + i % 60000),
+               'id.resp_h': f"10.{(target >> 16) & 255}.{(target >> 8) & 255}.{1 + (target & 255)}",
+               'id.resp_p': '80', 'proto': 'tcp', 'service': service, 'duration': '0', 'orig_bytes': '0',
+               'resp_bytes': '0', 'conn_state': conn_state}
+
+def measure(make_extractor, entries):
+    """Chạy extractor trên entries khi đang theo dõi cấp phát; trả về (extractor, byte giữ lại, số object GC theo dõi thêm)."""
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    tracemalloc.start()
+    extractor = make_extractor()
+    for entry in entries:
+        extractor.process_zeek_log_entry(entry)
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return extractor, current, len(gc.get_objects()) - objects_before
+
+def gc_collect_ms():
+    start = time.perf_counter()
+    gc.collect()
+    return (time.perf_counter() - start) * 1000
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_extractor_memory',
+                                     description="So sánh bộ nhớ trên mỗi flow của trạng thái cửa sổ cũ và mới.")
+    parser.add_argument('--flows', type=int, default=200000, help="Số flow trong cửa sổ 2 giây khi flood")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.ERROR)
+    n = args.flows
+
+    scenarios = (('SYN flood 2 host đích', lambda: flood_entries(n, rate=n / 2.0)),
+                 ('quét nhiều host đích', lambda: flood_entries(n, rate=n / 2.0, n_targets=None)))
+    for title, entries in scenarios:
+        print(f"{title}, {n} flow trong cửa sổ:")
+        for name, cls in (('deque + dict', DequeZeekFeatureExtractor), ('bộ đệm mảng', ZeekFeatureExtractor)):
+            extractor, nbytes, objects = measure(cls, entries())
+            tracked = extractor.window_sizes()['time_flows']
+            print(f"  {name:<13s}: {nbytes / 2**20:7.1f} MB, {nbytes / tracked:6.1f} byte/flow, "
+                  f"{objects / tracked:5.2f} object GC/flow, gc.collect() {gc_collect_ms():6.1f} ms")
+            del extractor
+
+    cap = max(1, n // 4)
+    extractor, nbytes, _ = measure(lambda: ZeekFeatureExtractor(max_window_flows=cap), flood_entries(n, rate=n / 2.0))
+    sizes = extractor.window_sizes()
+    print(f"Giới hạn {cap} flow, SYN flood {n} flow: {nbytes / 2**20:.1f} MB, cửa sổ {sizes['time_flows']} flow, "
+          f"loại sớm {sizes['overload_evictions']} flow")
+
+    # Host nhàn rỗi: sau đợt quét, 3 giây lưu lượng bình thường tới 5 host làm các host đã quét rời cả hai cửa sổ
+    extractor = ZeekFeatureExtractor()
+    for entry in flood_entries(n, rate=n / 2.0, n_targets=None):
+        extractor.process_zeek_log_entry(entry)
+    scanned = extractor.window_sizes()['interned_hosts']
+    for entry in flood_entries(3000, rate=1000.0, n_targets=5, start_ts=1700000003.0, service='http', conn_state='SF'):
+        extractor.process_zeek_log_entry(entry)
+    sizes = extractor.window_sizes()
+    print(f"Host nhàn rỗi: bảng intern {scanned} host sau đợt quét -> {sizes['interned_hosts']} host, "
+          f"bộ đệm thời gian {sizes['time_capacity']} ô sau khi lưu lượng trở lại bình thường")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# benchmarks/bench_extractor_snapshot.py
+"""
+Đo snapshot và nạp lại trạng thái cửa sổ của ZeekFeatureExtractor (src/extractor_snapshot.py) với trạng thái lớn:
+  - thời gian chụp trên luồng chấm điểm (snapshot_state, chỉ chép mảng) so với thời gian ghi ở luồng nền;
+  - kích thước file (byte/flow), thời gian nạp lại (đọc file + dựng lại bộ đếm) so với dựng lại cửa sổ
+    bằng cách xử lý lại từng flow;
+  - kiểm tra: extractor nạp lại cho đặc trưng giống hệt extractor chạy liên tục trên các flow tiếp theo;
+    nạp muộn hơn thì flow hết hạn bị bỏ, snapshot quá cũ bị bỏ toàn bộ.
+
+Chạy: python -m benchmarks.bench_extractor_snapshot [--flows 500000]
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import tempfile
+import time
+
+from src.config import EXTRACTOR_SNAPSHOT_MAX_AGE_SEC
+from src.extractor_snapshot import ExtractorSnapshotter, load_snapshot, save_snapshot
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from benchmarks.bench_extractor_memory import flood_entries
+
+def restored_extractor(path, now):
+    extractor = ZeekFeatureExtractor()
+    start = time.perf_counter()
+    restored = extractor.restore_state(load_snapshot(path), now=now)
+    return extractor, restored, time.perf_counter() - start
+
+def run_scenario(title, entries, n, path, check_flows=5000):
+    print(f"{title}, {n} flow:")
+    live = ZeekFeatureExtractor()
+    start = time.perf_counter()
+    for entry in itertools.islice(entries, n):
+        live.process_zeek_log_entry(entry)
+    build_sec = time.perf_counter() - start
+    sizes = live.window_sizes()
+
+    start = time.perf_counter()
+    state = live.snapshot_state()
+    copy_sec = time.perf_counter() - start
+    start = time.perf_counter()
+    nbytes = save_snapshot(state, path)
+    write_sec = time.perf_counter() - start
+    flows = sizes['time_flows'] + sizes['host_flows']
+    print(f"  cửa sổ {sizes['time_flows']} flow, {sizes['interned_hosts']} host đích; "
+          f"chụp trên luồng chấm điểm {copy_sec * 1000:6.1f} ms, ghi nền {write_sec * 1000:7.1f} ms, "
+          f"file {nbytes / 2**20:.1f} MB ({nbytes / flows:.1f} byte/flow)")
+
+    watermark = live._watermark
+    restored, (time_flows, host_flows), restore_sec = restored_extractor(path, now=watermark)
+    print(f"  nạp lại {restore_sec * 1000:7.1f} ms | dựng lại bằng cách xử lý lại từng flow {build_sec * 1000:8.1f} ms "
+          f"({build_sec / restore_sec:.0f}x)")
+
+    # Cùng các flow tiếp theo: extractor nạp lại phải cho đặc trưng giống hệt extractor chạy liên tục
+    ok = (time_flows, host_flows) == (sizes['time_flows'], sizes['host_flows'])
+    for entry in itertools.islice(entries, check_flows):
+        ok = ok and live.process_zeek_log_entry(entry) == restored.process_zeek_log_entry(entry)
+    ignored = ('overload_evictions', 'time_capacity')
+    ok = ok and {k: v for k, v in live.window_sizes().items() if k not in ignored} == \
+        {k: v for k, v in restored.window_sizes().items() if k not in ignored}
+    print(f"  {check_flows} flow tiếp theo: đặc trưng {'GIỐNG HỆT' if ok else 'KHÁC'} extractor chạy liên tục")
+
+    # Khởi động lại muộn: flow của cửa sổ thời gian đã hết hạn bị bỏ, snapshot quá cũ bị bỏ toàn bộ
+    half_expired = restored_extractor(path, now=watermark + live.time_window_sec / 2)[1]
+    stale = restored_extractor(path, now=watermark + (EXTRACTOR_SNAPSHOT_MAX_AGE_SEC or 0) + 1)[1]
+    print(f"  nạp sau {live.time_window_sec / 2:.0f}s: {half_expired[0]} flow cửa sổ thời gian, {half_expired[1]} flow cửa sổ host; "
+          f"sau {EXTRACTOR_SNAPSHOT_MAX_AGE_SEC}s: {stale}")
+    return ok and half_expired[0] < time_flows
+
+def measure_stall(path, n, chunk=1000):
+    """Độ trễ xử lý từng khối flow khi ExtractorSnapshotter đang ghi ở luồng nền (so với khi không ghi)."""
+    extractor = ZeekFeatureExtractor()
+    entries = flood_entries(n * 3, rate=n / 2.0)
+    for entry in itertools.islice(entries, n):
+        extractor.process_zeek_log_entry(entry)
+
+    def chunk_ms():
+        start = time.perf_counter()
+        for entry in itertools.islice(entries, chunk):
+            extractor.process_zeek_log_entry(entry)
+        return (time.perf_counter() - start) * 1000
+
+    baseline = min(chunk_ms() for _ in range(20))
+    snapshotter = ExtractorSnapshotter(path)
+    snapshotter.snapshot(extractor)
+    during = []
+    while snapshotter._thread.is_alive():
+        during.append(chunk_ms())
+    snapshotter.close()
+    print(f"Luồng chấm điểm khi đang ghi snapshot {n} flow: chụp {snapshotter.stats['last_copy_ms']:.1f} ms, "
+          f"ghi nền {snapshotter.stats['last_write_ms']:.0f} ms; mỗi {chunk} flow {baseline:.1f} ms khi không ghi, "
+          f"trung bình {sum(during) / max(1, len(during)):.1f} ms trong {len(during)} khối lúc đang ghi")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_extractor_snapshot',
+                                     description="Đo snapshot và nạp lại trạng thái cửa sổ của extractor.")
+    parser.add_argument('--flows', type=int, default=500000, help="Số flow trong cửa sổ 2 giây")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.ERROR)
+    n = args.flows
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, 'extractor_state.npz')
+        ok = run_scenario('SYN flood 2 host đích', flood_entries(n + 5000, rate=n / 2.0), n, path)
+        ok = run_scenario('quét nhiều host đích', flood_entries(n + 5000, rate=n / 2.0, n_targets=None), n, path) and ok
+        measure_stall(path, n)
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
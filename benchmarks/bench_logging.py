@@ -0,0 +1,125 @@
+# benchmarks/bench_logging.py
+"""
+Đo ảnh hưởng của logging lên vòng monitor ở chế độ live (lô MONITOR_BATCH_SIZE, có log từng flow):
+chạy cùng một conn.log giả lập qua FlowBatcher với root logger ghi ra file và console (/dev/null)
+như main.setup_logging, ở các cấu hình:
+  sync_all      : handler đồng bộ, log mọi flow (trước thay đổi)
+  async_all     : handler ở luồng nền (setup_async_logging), log mọi flow
+  async_sample  : handler ở luồng nền, 1 trên LOG_FLOW_SAMPLE_EVERY flow + tổng kết định kỳ
+  async_off     : handler ở luồng nền, tắt log từng flow (chỉ cảnh báo + tổng kết)
+Thời gian tính cả lúc luồng ghi log xả hết hàng đợi. Flow Malicious luôn được log đầy đủ ở các cấu hình async.
+
+Chạy: python -m benchmarks.bench_logging [--flows 30000] [--repeat 2] [--syn-flood 0.1 --port-sweep 0.05]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+
+import joblib
+
+from src.config import MONITOR_BATCH_SIZE, LOG_FLOW_SAMPLE_EVERY
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import load_model
+from src.monitor_logging import FlowLogger, setup_async_logging
+from src.stream_monitor import FlowBatcher
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader
+from benchmarks.common import ensure_model_files
+from benchmarks.conn_log_generator import write_synthetic_conn_log, DEFAULT_ATTACK_MIX
+
+CONFIGS = {
+    'sync_all': (False, None),
+    'sync_sample': (False, 'sample'),
+    'sync_off': (False, 'off'),
+    'async_all': (True, 'all'),
+    'async_sample': (True, 'sample'),
+    'async_off': (True, 'off'),
+}
+
+def configure_logging(async_logging, log_path, console):
+    """Cấu hình root logger như main.setup_logging; trả về hàm dừng (xả hàng đợi, đóng file)."""
+    handlers = [logging.FileHandler(log_path), logging.StreamHandler(console)]
+    if async_logging:
+        stop = setup_async_logging(handlers).stop
+    else:
+        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            handler.setFormatter(formatter)
+            root.addHandler(handler)
+        root.setLevel(logging.INFO)
+        stop = lambda: None
+
+    def close():
+        stop()
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        for handler in handlers:
+            handler.close()
+    return close
+
+def run_config(name, log_path, model, preprocessor, tmp_dir, console):
+    async_logging, mode = CONFIGS[name]
+    app_log = os.path.join(tmp_dir, f"app_{name}.log")
+    close_logging = configure_logging(async_logging, app_log, console)
+    flow_log = FlowLogger(mode=mode) if mode is not None else None
+    batcher = FlowBatcher(model, preprocessor, None, ZeekFeatureExtractor(), flow_log=flow_log)
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    flows = 0
+    start = time.perf_counter()
+    try:
+        for zeek_batch in reader:
+            flows += batcher.add_block(zeek_batch, max(1, MONITOR_BATCH_SIZE))
+        batcher.flush()
+        if flow_log is not None:
+            flow_log.log_summary()
+        scoring_sec = time.perf_counter() - start
+    finally:
+        reader.close()
+        close_logging()
+    total_sec = time.perf_counter() - start
+    with open(app_log, 'rb') as f:
+        lines = sum(1 for _ in f)
+    os.remove(app_log)
+    return flows, scoring_sec, total_sec, lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_logging',
+                                     description="So sánh flow/s của monitor với logging đồng bộ và logging qua hàng đợi.")
+    parser.add_argument('--flows', type=int, default=30000)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--syn-flood', type=float, default=DEFAULT_ATTACK_MIX['syn_flood'], help="Tỉ lệ flow SYN flood (S0)")
+    parser.add_argument('--port-sweep', type=float, default=DEFAULT_ATTACK_MIX['port_sweep'], help="Tỉ lệ flow quét cổng (REJ)")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir, open(os.devnull, 'w') as console:
+        log_path = write_synthetic_conn_log(os.path.join(tmp_dir, 'conn.log'), args.flows,
+                                            attack_mix={'syn_flood': args.syn_flood, 'port_sweep': args.port_sweep})
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        model = load_model(model_path)
+        preprocessor = compile_preprocessor(joblib.load(preprocessor_path)) or joblib.load(preprocessor_path)
+        for _ in range(args.repeat):
+            for name in CONFIGS:
+                flows, scoring_sec, total_sec, lines = run_config(name, log_path, model, preprocessor, tmp_dir, console)
+                best = results.get(name)
+                if best is None or total_sec < best[2]:
+                    results[name] = (flows, scoring_sec, total_sec, lines)
+        logging.getLogger().addHandler(logging.StreamHandler())
+
+    print(f"Monitor live, lô {MONITOR_BATCH_SIZE}, sample 1/{LOG_FLOW_SAMPLE_EVERY} (tốt nhất trong {args.repeat} lần):")
+    print(f"  {'cấu hình':<13s} {'flow/s':>10s} {'flow/s (chấm điểm)':>19s} {'dòng log':>9s}")
+    baseline = results['sync_all'][0] / results['sync_all'][2]
+    for name, (flows, scoring_sec, total_sec, lines) in results.items():
+        rate = flows / total_sec
+        print(f"  {name:<13s} {rate:10.0f} {flows / scoring_sec:19.0f} {lines:9d}  ({rate / baseline:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+# benchmarks/bench_memory.py
+"""
+Đo bộ nhớ (peak RSS) của ma trận đặc trưng float64 dense (cách cũ: ColumnTransformer mặc định)
+so với CSR float32 (preprocess_features hiện tại), mỗi kịch bản chạy trong một tiến trình riêng:
+1. Huấn luyện: tiền xử lý + XGBClassifier(tree_method='hist') trên tập NSL-KDD giả lập.
+2. Replay theo lô: chấm điểm một conn.log lớn bằng replay() với preprocessor/mô hình tương ứng.
+Đo peak RSS riêng của từng bước (nạp CSV, tiền xử lý, huấn luyện / replay) trong cùng tiến trình.
+
+Chạy: python -m benchmarks.bench_memory [số_dòng_train] [số_dòng_conn.log]
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from src.config import SERVICE_MAPPING, ZEEK_CONN_STATE_TO_NSL_FLAG
+from benchmarks.bench_dataset_cache import NSL_KDD_FILE_COLUMNS
+from benchmarks.common import synthetic_zeek_entries, write_conn_log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def write_large_nslkdd_file(path, n, seed=0):
+    """Ghi nhanh n dòng NSL-KDD giả lập (sinh theo cột bằng NumPy, không qua ZeekFeatureExtractor)."""
+    rng = np.random.default_rng(seed)
+    services = sorted(set(SERVICE_MAPPING.values())) + ['other', 'private', 'ecr_i']
+    flags = sorted(set(ZEEK_CONN_STATE_TO_NSL_FLAG.values()))
+    columns = {}
+    for col in NSL_KDD_FILE_COLUMNS:
+        if col.endswith('_rate'):
+            columns[col] = np.round(rng.random(n) * (rng.random(n) < 0.3), 2)
+        else:
+            columns[col] = rng.integers(0, 256, n) * (rng.random(n) < 0.2)
+    columns['duration'] = rng.integers(0, 5000, n) * (rng.random(n) < 0.1)
+    columns['src_bytes'] = rng.integers(0, 100000, n)
+    columns['dst_bytes'] = rng.integers(0, 100000, n)
+    columns['protocol_type'] = rng.choice(['tcp', 'udp', 'icmp'], n)
+    columns['service'] = rng.choice(services, n)
+    columns['flag'] = rng.choice(flags, n)
+    columns['outcome'] = np.where(columns['flag'] == 'S0', 'neptune', rng.choice(['normal', 'normal', 'smurf'], n))
+    pd.DataFrame(columns)[NSL_KDD_FILE_COLUMNS].to_csv(path, header=False, index=False)
+
+SCENARIO_SCRIPT = r'''
+import json, logging, resource, sys
+logging.disable(logging.CRITICAL)
+import joblib
+import numpy as np
+import xgboost as xgb
+from src.preprocess import load_nslkdd_data, preprocess_features
+
+def peak_mb():
+    """
+    Peak RSS (MB) từ lần reset_peak gần nhất. Dùng VmHWM của Linux: ru_maxrss giữ cả peak
+    của tiến trình cha qua fork/exec nên không đo đúng tiến trình con.
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def reset_peak():
+    """Đặt lại VmHWM về RSS hiện tại để đo peak riêng của bước tiếp theo (Linux)."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+def legacy_preprocessor(X):
+    """preprocess_features trước khi chuyển sang CSR float32: ColumnTransformer mặc định, float64."""
+    from sklearn.compose import ColumnTransformer
+    from sklearn.preprocessing import StandardScaler, OneHotEncoder
+    return ColumnTransformer([
+        ('num', StandardScaler(), X.select_dtypes(include=['number']).columns),
+        ('cat', OneHotEncoder(handle_unknown='ignore'), X.select_dtypes(include=['object']).columns),
+    ], remainder='passthrough')
+
+mode, scenario, data_path, model_dir = sys.argv[1:5]
+stages = {}
+df = load_nslkdd_data(data_path)
+stages['csv'] = peak_mb()
+reset_peak()
+if mode == 'legacy':
+    X_frame = df.drop('outcome', axis=1)
+    preprocessor = legacy_preprocessor(X_frame)
+    X = preprocessor.fit_transform(X_frame)
+    y = df['outcome']
+else:
+    X, y, preprocessor = preprocess_features(df, fit=True, save_path=None)
+del df
+stages['preprocess'] = peak_mb()
+reset_peak()
+model = xgb.XGBClassifier(n_estimators=50, max_depth=5, tree_method='hist', random_state=42)
+
+if scenario == 'train':
+    model.fit(X, y)
+    stages['fit'] = peak_mb()
+    matrix = {'format': type(X).__name__, 'dtype': str(X.dtype),
+              'mb': (X.data.nbytes + X.indices.nbytes + X.indptr.nbytes if hasattr(X, 'indptr') else X.nbytes) / 2**20}
+    print(json.dumps({'stages': stages, 'matrix': matrix}))
+else:
+    from src.compiled_preprocessor import compile_preprocessor
+    from src.model_runtime import BoosterModel
+    from src.replay import replay
+    model.fit(X, y)
+    runtime, compiled = BoosterModel(model.get_booster()), compile_preprocessor(preprocessor)
+    del X
+    stages['fit'] = peak_mb()
+    reset_peak()
+    stats = replay([sys.argv[5]], model=runtime, preprocessor=compiled, batch_size=int(sys.argv[6]))
+    stages['replay'] = peak_mb()
+    print(json.dumps({'stages': stages, 'flows': stats['lines']}))
+'''
+
+def run_scenario(mode, scenario, *args):
+    result = subprocess.run([sys.executable, '-c', SCENARIO_SCRIPT, mode, scenario, *args],
+                            cwd=ROOT, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip()[-2000:])
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def format_stages(stages):
+    """'csv 310.2 MB -> preprocess 720.5 MB -> ...' (peak RSS trong từng bước)."""
+    return ' -> '.join(f"{name} {mb:.1f} MB" for name, mb in stages.items())
+
+def main():
+    n_train = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    n_flows = int(sys.argv[2]) if len(sys.argv) > 2 else 500000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        data_path = os.path.join(tmp_dir, 'KDDTrain+.txt')
+        write_large_nslkdd_file(data_path, n_train)
+        replay_data_path = os.path.join(tmp_dir, 'KDDTrain_small.txt')
+        write_large_nslkdd_file(replay_data_path, 20000) # Kịch bản replay chỉ cần một mô hình nhỏ
+        log_path = os.path.join(tmp_dir, 'conn.log')
+        write_conn_log(log_path, synthetic_zeek_entries(n_flows, seed=7, n_hosts=250, rate=5000.0))
+
+        print(f"Huấn luyện trên {n_train} dòng NSL-KDD giả lập:")
+        for mode in ('legacy', 'csr'):
+            r = run_scenario(mode, 'train', data_path, tmp_dir)
+            m = r['matrix']
+            print(f"  {mode:<6s}: ma trận {m['format']} {m['dtype']} {m['mb']:.1f} MB | peak RSS {format_stages(r['stages'])}")
+
+        for batch_size in (8192, 65536):
+            print(f"\nReplay {n_flows} flow, lô {batch_size}:")
+            for mode in ('legacy', 'csr'):
+                r = run_scenario(mode, 'replay', replay_data_path, tmp_dir, log_path, str(batch_size))
+                print(f"  {mode:<6s}: peak RSS {format_stages(r['stages'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# benchmarks/bench_merged_monitor.py
+"""
+Kiểm tra và đo chế độ nhiều thư mục log (src/merged_monitor.py) với K sensor giả lập, mỗi sensor một conn.log
+có các dòng lệch thứ tự ts tới --jitter giây (Zeek ghi conn.log khi kết nối kết thúc):
+1. Bộ trộn (BoundedLatenessMerger) chạy offline theo từng khối xen kẽ các nguồn, với nhiều mức độ trễ tối đa:
+   số flow đến muộn, độ sâu heap lớn nhất, chi phí trộn mỗi flow, và số flow có đặc trưng giống hệt
+   tham chiếu (ZeekFeatureExtractor trên toàn bộ flow đã sắp theo ts). Độ trễ >= jitter thì phải giống hệt.
+2. Đầu-cuối: merged_monitor_loop (luồng đọc cho từng thư mục + trộn + chấm điểm) so với một conn.log
+   chứa cùng các flow theo đúng thứ tự (FlowBatcher.add_block): flow/s và đặc trưng so với tham chiếu.
+
+Chạy: python -m benchmarks.bench_merged_monitor [--sensors 4] [--flows 50000] [--jitter 0.5]
+"""
+
+import argparse
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+import joblib
+
+from src.checkpoint import OffsetCheckpoint
+from src.compiled_preprocessor import compile_preprocessor
+from src.merged_monitor import BoundedLatenessMerger, merged_monitor_loop
+from src.model_runtime import load_model
+from src.monitor_logging import FlowLogger
+from src.stream_monitor import FlowBatcher
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from benchmarks.common import write_conn_log, ensure_model_files
+from benchmarks.conn_log_generator import iter_conn_log_entries
+
+class RecordingBatcher(FlowBatcher):
+    """FlowBatcher giữ lại đặc trưng của mọi flow đã chấm điểm (theo thứ tự chấm điểm)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.features = []
+
+    def flush(self, log_flows=True):
+        self.features.extend(features for _, features in self.pending)
+        super().flush(log_flows)
+
+def write_sensor_logs(root, n_sensors, n, jitter, rate):
+    """Mỗi sensor một thư mục chứa conn.log: flow được ghi theo ts + độ trễ ngẫu nhiên trong [0, jitter]."""
+    dirs = []
+    for sensor in range(n_sensors):
+        rng = random.Random(sensor)
+        entries = list(iter_conn_log_entries(n, flow_rate=rate, seed=sensor))
+        entries.sort(key=lambda entry: float(entry['ts']) + rng.uniform(0, jitter))
+        log_dir = os.path.join(root, f"sensor{sensor}")
+        os.makedirs(log_dir)
+        write_conn_log(os.path.join(log_dir, 'conn.log'), entries)
+        dirs.append(log_dir)
+    return dirs
+
+def read_blocks(log_dir):
+    """Các khối (vị trí sau khối, dict flow) của conn.log như LogSourceTailer đọc."""
+    reader = ZeekConnReader(os.path.join(log_dir, 'conn.log'))
+    reader.read_header()
+    try:
+        return [(zeek_batch.end_offset, zeek_batch.to_records(CONN_LOG_SCORING_FIELDS)) for zeek_batch in reader]
+    finally:
+        reader.close()
+
+def extract(records):
+    extractor = ZeekFeatureExtractor()
+    return [extractor.process_zeek_log_entry(record) for record in records]
+
+def offline_merge(blocks_by_source, lateness_sec, block_flows=500):
+    """Đưa các khối (cắt nhỏ block_flows flow) xen kẽ từng nguồn vào bộ trộn; trả về (flow đã trộn, merger, heap lớn nhất, giây)."""
+    merger = BoundedLatenessMerger(range(len(blocks_by_source)), lateness_sec=lateness_sec)
+    chunks = [[records[i:i + block_flows] for _, records in blocks for i in range(0, len(records), block_flows)]
+              for blocks in blocks_by_source]
+    merged, max_depth = [], 0
+    start = time.perf_counter()
+    for round_chunks in zip(*chunks):
+        for source, records in enumerate(round_chunks):
+            merger.add(source, None, None, 0, records)
+        max_depth = max(max_depth, len(merger))
+        merged.extend(merger.release())
+    merged.extend(merger.release(flush=True))
+    return merged, merger, max_depth, time.perf_counter() - start
+
+def run_merged_loop(dirs, model, preprocessor, total, checkpoint_path):
+    batcher = RecordingBatcher(model, preprocessor, None, ZeekFeatureExtractor(), flow_log=FlowLogger(mode='off'))
+    stop_event = threading.Event()
+
+    def stop_when_done():
+        while len(batcher.features) + len(batcher.pending) < total:
+            time.sleep(0.01)
+        stop_event.set()
+
+    watcher = threading.Thread(target=stop_when_done, daemon=True)
+    watcher.start()
+    merger = BoundedLatenessMerger(dirs, idle_sec=0.5)
+    start = time.perf_counter()
+    merged_monitor_loop(batcher, dirs, checkpoint=OffsetCheckpoint(checkpoint_path), merger=merger,
+                        from_start=True, stop_event=stop_event)
+    return batcher.features, merger, time.perf_counter() - start
+
+def run_single_file(log_path, model, preprocessor):
+    batcher = RecordingBatcher(model, preprocessor, None, ZeekFeatureExtractor(), flow_log=FlowLogger(mode='off'))
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    start = time.perf_counter()
+    try:
+        for zeek_batch in reader:
+            batcher.add_block(zeek_batch, 256, log_flows=False)
+        batcher.flush(log_flows=False)
+    finally:
+        reader.close()
+    return batcher.features, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_merged_monitor',
+                                     description="Kiểm tra và đo trộn nhiều conn.log theo ts.")
+    parser.add_argument('--sensors', type=int, default=4)
+    parser.add_argument('--flows', type=int, default=50000, help="Số flow của mỗi sensor")
+    parser.add_argument('--jitter', type=float, default=0.5, help="Độ lệch thứ tự ts tối đa trong mỗi conn.log (giây)")
+    parser.add_argument('--rate', type=float, default=2000.0, help="Số flow/giây của mỗi sensor")
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.ERROR)
+
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        dirs = write_sensor_logs(tmp_dir, args.sensors, args.flows, args.jitter, args.rate)
+        blocks_by_source = [read_blocks(log_dir) for log_dir in dirs]
+        # Tham chiếu: mọi flow sắp theo (ts, nguồn, thứ tự trong file), đúng thứ tự bộ trộn giải phóng
+        ordered = sorted(((record['ts'], source, i, record)
+                          for source, blocks in enumerate(blocks_by_source)
+                          for i, record in enumerate(record for _, records in blocks for record in records)),
+                         key=lambda item: item[:3])
+        reference = extract([record for *_, record in ordered])
+        expected = {id(record): features for (*_, record), features in zip(ordered, reference)}
+        total = len(reference)
+        print(f"{args.sensors} sensor x {args.flows} flow, lệch thứ tự tới {args.jitter}s trong mỗi conn.log:")
+
+        for lateness in (0.0, args.jitter / 4, args.jitter, 2.0):
+            merged, merger, max_depth, sec = offline_merge(blocks_by_source, lateness)
+            same = sum(features == expected[id(record)] for record, features in zip(merged, extract(merged)))
+            print(f"  trễ tối đa {lateness:5.3f}s: {merger.stats['late']:6d} flow đến muộn, heap tối đa {max_depth:6d} flow, "
+                  f"trộn {sec / total * 1e6:5.2f} us/flow, đặc trưng giống tham chiếu {same}/{total}")
+            if lateness >= args.jitter:
+                ok = ok and same == total and merger.stats['late'] == 0
+
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        model = load_model(model_path)
+        preprocessor = compile_preprocessor(joblib.load(preprocessor_path)) or joblib.load(preprocessor_path)
+        single_path = os.path.join(tmp_dir, 'all_conn.log')
+        write_conn_log(single_path, ({name: ('-' if value is None else str(value)) for name, value in record.items()}
+                                     for *_, record in ordered))
+        run_single_file(single_path, model, preprocessor) # Làm nóng
+        _, single_sec = run_single_file(single_path, model, preprocessor)
+        features, merger, merged_sec = run_merged_loop(dirs, model, preprocessor, total,
+                                                       os.path.join(tmp_dir, 'offsets.json'))
+        same = features == reference
+        ok = ok and same
+        print(f"  đầu-cuối (đọc + trích xuất + chấm điểm): một conn.log đã sắp {total / single_sec:8.0f} flow/s | "
+              f"{args.sensors} thư mục + trộn {total / merged_sec:8.0f} flow/s; đặc trưng {'GIỐNG HỆT' if same else 'KHÁC'} tham chiếu")
+        print(f"  {merger.summary()}")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# benchmarks/bench_metrics.py
+"""
+Đo chi phí của metrics (src/metrics.py) trên vòng monitor: chạy cùng một conn.log giả lập qua
+FlowBatcher không có metrics và có MonitorMetrics (đo parse/extract/transform/predict, bộ đếm,
+độ trễ ingest), xen kẽ nhiều lần để giảm nhiễu, rồi so flow/s. Sau đó mở endpoint HTTP trên
+cổng ngẫu nhiên, scrape /metrics và kiểm tra các bộ đếm khớp với số flow đã xử lý.
+
+Chạy: python -m benchmarks.bench_metrics [--flows 50000] [--repeat 3]
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+import urllib.request
+
+import joblib
+
+from src.config import MONITOR_CATCHUP_BATCH_SIZE
+from src.compiled_preprocessor import compile_preprocessor
+from src.metrics import MonitorMetrics, MetricsServer
+from src.model_runtime import load_model
+from src.stream_monitor import FlowBatcher, _timed_blocks
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader
+from benchmarks.common import ensure_model_files
+from benchmarks.conn_log_generator import write_synthetic_conn_log
+
+def run_monitor(log_path, model, preprocessor, batch_size, metrics=None):
+    """Một lượt FlowBatcher như _drain_reader (không alert sink); trả về (số flow, số giây)."""
+    extractor = ZeekFeatureExtractor()
+    batcher = FlowBatcher(model, preprocessor, None, extractor, metrics=metrics)
+    if metrics is not None:
+        metrics.watch_extractor(extractor)
+        metrics.watch_queue('pending_flows', lambda: len(batcher.pending))
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    flows = 0
+    start = time.perf_counter()
+    try:
+        for zeek_batch in _timed_blocks(iter(reader), metrics):
+            flows += batcher.add_block(zeek_batch, batch_size, log_flows=False)
+        batcher.flush(log_flows=False)
+    finally:
+        reader.close()
+    return flows, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_metrics',
+                                     description="Đo chi phí của metrics trên vòng monitor và scrape thử endpoint.")
+    parser.add_argument('--flows', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=MONITOR_CATCHUP_BATCH_SIZE)
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = write_synthetic_conn_log(f"{tmp_dir}/conn.log", args.flows)
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        model = load_model(model_path)
+        preprocessor = compile_preprocessor(joblib.load(preprocessor_path)) or joblib.load(preprocessor_path)
+
+        run_monitor(log_path, model, preprocessor, args.batch_size) # Làm nóng
+        best = {'off': float('inf'), 'on': float('inf')}
+        metrics = None
+        for _ in range(args.repeat):
+            flows, sec = run_monitor(log_path, model, preprocessor, args.batch_size)
+            best['off'] = min(best['off'], sec)
+            metrics = MonitorMetrics()
+            flows, sec = run_monitor(log_path, model, preprocessor, args.batch_size, metrics)
+            best['on'] = min(best['on'], sec)
+
+    print(f"Monitor {flows} flow, lô {args.batch_size} (tốt nhất trong {args.repeat} lần):")
+    for name in ('off', 'on'):
+        print(f"  metrics {name:<3s}: {best[name]:7.3f} s | {flows / best[name]:10.0f} flow/s")
+    print(f"  chi phí metrics: {(best['on'] / best['off'] - 1) * 100:+.2f}%")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        text = metrics.registry.render()
+    print(f"  render /metrics: {(time.perf_counter() - start) * 10:.3f} ms, {len(text)} byte")
+
+    server = MetricsServer(metrics.registry, '127.0.0.1', 0).start()
+    try:
+        host, port = server.address
+        with urllib.request.urlopen(f"http://{host}:{port}/metrics", timeout=5) as response:
+            body = response.read().decode('utf-8')
+            content_type = response.headers.get('Content-Type')
+    finally:
+        server.close()
+
+    expected = {'ids_flows_read_total': flows,
+                'ids_flows_scored_total': metrics.flows_scored.value,
+                'ids_stage_duration_seconds_count{stage="parse"}': sum(metrics.stage_latency['parse'].snapshot()[0])}
+    values = dict(line.rsplit(' ', 1) for line in body.splitlines() if line and not line.startswith('#'))
+    ok = all(float(values.get(name, 'nan')) == value for name, value in expected.items())
+    ok = ok and metrics.flows_scored.value + metrics.flows_skipped.value == flows
+    print(f"  scrape http://{host}:{port}/metrics ({content_type}): {len(values)} chuỗi, "
+          f"bộ đếm {'KHỚP' if ok else 'KHÔNG KHỚP'}")
+    if not ok:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# benchmarks/bench_model_reload.py
+"""
+Kiểm tra và đo nạp lại mô hình khi monitor đang chạy (src/model_reloader.py). FlowBatcher (có AlertExplainer
+trước sink) chấm điểm liên tục luồng flow giả lập trong khi manifest lần lượt trỏ tới:
+    v2 (mô hình lớn hơn), ba bộ hỏng (file mô hình bị cắt cụt, sha256 khác manifest, preprocessor khác
+    số đặc trưng của mô hình), rồi v3.
+In ra:
+  - thời gian tải + kiểm tra mỗi bộ ở luồng nền, bộ nào được nạp và bộ nào bị từ chối;
+  - độ trễ mỗi lô (p50/p99/max) khi không nạp lại so với các lô chạy trùng lúc luồng nền đang nạp;
+  - kiểm tra: cảnh báo chỉ mang các phiên bản v1 -> v2 -> v3 theo đúng thứ tự, xác suất của mỗi cảnh báo bằng
+    xác suất mô hình cùng phiên bản cho, explanation (tổng đóng góp + base_value) khớp log-odds của mô hình đó.
+
+Chạy: python -m benchmarks.bench_model_reload [--flows 200000]
+"""
+
+import argparse
+import itertools
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from src.config import MONITOR_BATCH_SIZE
+from src.alert_explainer import AlertExplainer
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_reloader import ModelReloader, write_model_manifest
+from src.model_runtime import load_model
+from src.monitor_logging import FlowLogger
+from src.stream_monitor import FlowBatcher
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from benchmarks.common import ensure_model_files, synthetic_feature_records
+from benchmarks.conn_log_generator import iter_conn_log_entries
+from benchmarks.bench_explainer import CollectingSink
+
+class TimedFlowBatcher(FlowBatcher):
+    """FlowBatcher ghi lại (bắt đầu, kết thúc) của mỗi lần chấm điểm lô."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flushes = []
+
+    def flush(self, log_flows=True):
+        start = time.perf_counter()
+        scored = bool(self.pending)
+        super().flush(log_flows)
+        if scored:
+            self.flushes.append((start, time.perf_counter()))
+
+class TimedReloader(ModelReloader):
+    """ModelReloader ghi lại (phiên bản trong manifest, đã nạp?, bắt đầu, kết thúc) của mỗi lần manifest đổi."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.loads = []
+
+    def check(self):
+        signature = self._manifest_signature()
+        if signature is None or signature == self._signature:
+            return None
+        start = time.perf_counter()
+        bundle = super().check()
+        self.loads.append((bundle.version if bundle is not None else None, bundle is not None,
+                           start, time.perf_counter()))
+        return bundle
+
+def train_release(root, name, preprocessor_path, records, n_estimators, max_depth, drop_columns=0):
+    """Thư mục releases/<name> với mô hình định dạng gốc huấn luyện trên `records` và bản sao preprocessor."""
+    import xgboost as xgb
+    directory = os.path.join(root, 'releases', name)
+    os.makedirs(directory)
+    preprocessor = joblib.load(preprocessor_path)
+    X = compile_preprocessor(preprocessor).transform_records(records)
+    y = [1 if record['flag'] in ('S0', 'REJ') or record['serror_rate'] > 0.5 else 0 for record in records]
+    model = xgb.XGBClassifier(n_estimators=n_estimators, max_depth=max_depth, random_state=len(name))
+    model.fit(X[:, drop_columns:], y)
+    model_path = os.path.join(directory, 'xgb_model.ubj')
+    model.get_booster().save_model(model_path)
+    shutil.copy(preprocessor_path, os.path.join(directory, 'preprocessor.pkl'))
+    return model_path, os.path.join(directory, 'preprocessor.pkl')
+
+def make_releases(root, preprocessor_path, base_model_path):
+    """(tên, đường dẫn mô hình, đường dẫn preprocessor, hàm làm hỏng hoặc None) theo thứ tự triển khai."""
+    records = synthetic_feature_records(20000, seed=2)
+    v1_dir = os.path.join(root, 'releases', 'v1')
+    os.makedirs(v1_dir)
+    load_model(base_model_path).booster.save_model(os.path.join(v1_dir, 'xgb_model.ubj'))
+    shutil.copy(preprocessor_path, os.path.join(v1_dir, 'preprocessor.pkl'))
+    v1 = (os.path.join(v1_dir, 'xgb_model.ubj'), os.path.join(v1_dir, 'preprocessor.pkl'))
+    v2 = train_release(root, 'v2', preprocessor_path, records, 400, 8)
+    truncated = train_release(root, 'truncated', preprocessor_path, records, 50, 4)
+    with open(truncated[0], 'r+b') as f:
+        f.truncate(os.path.getsize(truncated[0]) // 2)
+    checksum = train_release(root, 'checksum', preprocessor_path, records, 50, 4)
+    features = train_release(root, 'features', preprocessor_path, records, 50, 4, drop_columns=3)
+    v3 = train_release(root, 'v3', preprocessor_path, records, 150, 6)
+
+    def overwrite_model(): # Ghi đè file mô hình sau khi manifest đã ghi sha256 của bản cũ
+        shutil.copy(v1[0], checksum[0])
+
+    return [('v1', *v1, None), ('v2', *v2, None), ('truncated', *truncated, None),
+            ('checksum', *checksum, overwrite_model), ('features', *features, None), ('v3', *v3, None)]
+
+def percentiles(values):
+    if not values:
+        return "  (không có lô)"
+    ms = np.asarray(values) * 1000
+    return f"p50 {np.percentile(ms, 50):6.2f} ms, p99 {np.percentile(ms, 99):6.2f} ms, max {ms.max():7.2f} ms ({len(ms)} lô)"
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_model_reload',
+                                     description="Kiểm tra và đo nạp lại mô hình khi monitor đang chạy.")
+    parser.add_argument('--flows', type=int, default=200000)
+    args = parser.parse_args(argv)
+    logging.getLogger().setLevel(logging.CRITICAL)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        base_model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        root = os.path.join(tmp_dir, 'models')
+        releases = make_releases(root, preprocessor_path, base_model_path)
+        manifest_path = os.path.join(root, 'manifest.json')
+        write_model_manifest('v1', releases[0][1], releases[0][2], path=manifest_path)
+
+        def load_release(name):
+            _, model_path, release_preprocessor_path, _ = next(r for r in releases if r[0] == name)
+            preprocessor = joblib.load(release_preprocessor_path)
+            return load_model(model_path), compile_preprocessor(preprocessor) or preprocessor
+
+        served = {name: load_release(name) for name in ('v1', 'v2', 'v3')}
+        model, preprocessor = served['v1']
+        sink = CollectingSink()
+        explainer = AlertExplainer(model, preprocessor, sink, top_k=preprocessor.n_features_out,
+                                   queue_size=args.flows + 1).start()
+        reloader = TimedReloader(manifest_path, interval_sec=0.05, version='v1')
+        reloader.check() # Lần kiểm tra đầu: manifest đang trỏ tới đúng v1, không nạp
+        reloader.loads.clear()
+        reloader.start()
+        batcher = TimedFlowBatcher(model, preprocessor, explainer, ZeekFeatureExtractor(), flow_log=FlowLogger(mode='off'),
+                                   model_version='v1', model_reloader=reloader)
+
+        entries = iter_conn_log_entries(args.flows, attack_mix={'syn_flood': 0.2, 'port_sweep': 0.1})
+        chunk, deployed = 1000, 0
+        deploy_every = args.flows // len(releases)
+        flows = 0
+        start = time.perf_counter()
+        while True:
+            records = list(itertools.islice(entries, chunk))
+            if not records:
+                # Hết flow nhưng luồng nền chưa xét xong manifest cuối: chờ rồi xả lô cuối bằng mô hình mới nhất
+                if len(reloader.loads) < deployed:
+                    time.sleep(0.01)
+                    continue
+                batcher.flush(log_flows=False)
+                break
+            flows += batcher.add_records(records, max(1, MONITOR_BATCH_SIZE), log_flows=False)
+            # Triển khai bộ kế tiếp khi đã đến lượt và luồng nền đã xét xong manifest trước
+            if deployed + 1 < len(releases) and flows >= (deployed + 1) * deploy_every and len(reloader.loads) == deployed:
+                deployed += 1
+                name, model_path, release_preprocessor_path, corrupt = releases[deployed]
+                write_model_manifest(name, model_path, release_preprocessor_path, path=manifest_path)
+                if corrupt is not None:
+                    corrupt()
+        total_sec = time.perf_counter() - start
+        reloader.close()
+        explainer.close()
+
+        print(f"{flows} flow, {len(batcher.flushes)} lô {MONITOR_BATCH_SIZE} flow, {flows / total_sec:.0f} flow/s, "
+              f"{len(sink.alerts)} cảnh báo:")
+        for (name, *_), (version, loaded, load_start, load_end) in zip(releases[1:], reloader.loads):
+            print(f"  manifest {name:9s}: {'đã nạp' if loaded else 'TỪ CHỐI'} sau {(load_end - load_start) * 1000:6.1f} ms ở luồng nền")
+        durations = [(end - begin, any(begin < load_end and end > load_start for *_, load_start, load_end in reloader.loads))
+                     for begin, end in batcher.flushes]
+        print(f"  lô khi không nạp lại: {percentiles([d for d, during in durations if not during])}")
+        print(f"  lô trùng lúc đang nạp: {percentiles([d for d, during in durations if during])}")
+        print(f"  {reloader.stats}")
+
+        # Phiên bản của cảnh báo theo đúng thứ tự triển khai, chỉ các bộ hợp lệ
+        versions = [alert['ml_ids']['model_version'] for alert in sink.alerts]
+        sequence = [version for version, _ in itertools.groupby(versions)]
+        ok = sequence == ['v1', 'v2', 'v3'] and batcher.model_version == 'v3' and reloader.stats['rejected'] == 3
+        print(f"  phiên bản trong cảnh báo: {sequence} ({', '.join(f'{v}: {versions.count(v)}' for v in sequence)}) "
+              f"{'ĐÚNG' if ok else 'SAI'}")
+
+        # Xác suất và explanation của mỗi cảnh báo khớp mô hình cùng phiên bản
+        ok = ok and explainer.stats['unexplained'] == 0
+        max_proba_error = max_margin_error = 0.0
+        for version in sequence:
+            alerts = [alert for alert in sink.alerts if alert['ml_ids']['model_version'] == version]
+            model, preprocessor = served.get(version, served['v1'])
+            X = preprocessor.transform_records([alert['ml_ids']['nsl_kdd_features'] for alert in alerts])
+            probas = model.predict_proba(X)[:, 1]
+            margins = model.booster.inplace_predict(X, predict_type='margin')
+            for alert, proba, margin in zip(alerts, probas, margins):
+                explanation = alert['ml_ids']['explanation']
+                max_proba_error = max(max_proba_error, abs(alert['ml_ids']['prediction_probability'] - float(proba)))
+                max_margin_error = max(max_margin_error, abs(sum(f['contribution'] for f in explanation['top_features'])
+                                                             + explanation['base_value'] - float(margin)))
+        print(f"  xác suất cảnh báo so với mô hình cùng phiên bản: lệch tối đa {max_proba_error:.2e}; "
+              f"explanation so với log-odds: lệch tối đa {max_margin_error:.2e}")
+    if not ok or not max_proba_error < 1e-5 or not max_margin_error < 1e-3:
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
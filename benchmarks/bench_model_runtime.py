@@ -0,0 +1,84 @@
+# benchmarks/bench_model_runtime.py
+"""
+So sánh đường pickle (joblib.load XGBClassifier + predict_proba) với booster định dạng gốc
+(xgboost.Booster + inplace_predict, src/model_runtime.py):
+1. Parity: xác suất của mọi flow giống hệt nhau.
+2. Khởi động nguội: thời gian import + tải mô hình trong một tiến trình Python mới.
+3. Độ trễ mỗi lô (preprocessor đã biên dịch -> ma trận -> xác suất) theo kích thước lô và số luồng.
+
+Chạy: python -m benchmarks.bench_model_runtime
+"""
+
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+
+import joblib
+import numpy as np
+
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import export_native_model, load_model
+from benchmarks.common import ensure_model_files, synthetic_feature_records, timeit
+
+COLD_START_SCRIPT = {
+    'pickle': "import joblib; joblib.load({path!r})",
+    'native': "from src.model_runtime import load_model; load_model({path!r})",
+}
+
+def cold_start(kind, path, repeat=3):
+    """Thời gian tốt nhất (giây) để một tiến trình mới import thư viện và tải mô hình."""
+    code = ("import time; t0 = time.perf_counter(); " + COLD_START_SCRIPT[kind].format(path=path) +
+            "; print(time.perf_counter() - t0)")
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+        times.append(float(output.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        native_path = export_native_model(joblib.load(model_path), os.path.join(tmp_dir, 'xgb_model.ubj'))
+
+        classifier = joblib.load(model_path)
+        booster_model = load_model(native_path)
+        preprocessor = compile_preprocessor(joblib.load(preprocessor_path))
+        X = preprocessor.transform_records(synthetic_feature_records(20000, seed=5))
+
+        expected = classifier.predict_proba(X)[:, 1]
+        actual = booster_model.predict_proba(X)[:, 1]
+        if not np.array_equal(expected, actual):
+            print(f"Xác suất KHÁC nhau: lệch tối đa {np.max(np.abs(expected - actual))}")
+            sys.exit(1)
+        print(f"Parity: xác suất giống hệt XGBClassifier.predict_proba trên {X.shape[0]} flow")
+
+        print("\nKhởi động nguội (tiến trình mới, import + tải mô hình):")
+        pickle_sec = cold_start('pickle', model_path)
+        native_sec = cold_start('native', native_path)
+        print(f"  pickle (joblib.load)        : {pickle_sec * 1000:8.1f} ms")
+        print(f"  định dạng gốc (load_model)  : {native_sec * 1000:8.1f} ms ({pickle_sec / native_sec:.2f}x)")
+
+        print(f"\nTải mô hình trong tiến trình đã import (file {os.path.getsize(model_path)} vs "
+              f"{os.path.getsize(native_path)} byte):")
+        pickle_load = timeit(lambda: joblib.load(model_path))
+        native_load = timeit(lambda: load_model(native_path))
+        print(f"  pickle: {pickle_load * 1000:7.2f} ms | định dạng gốc: {native_load * 1000:7.2f} ms")
+
+        print(f"\nĐộ trễ mỗi lô (CPU: {os.cpu_count()}):")
+        for nthread in sorted({1, os.cpu_count() or 1}):
+            classifier.set_params(n_jobs=nthread)
+            booster_model.set_nthread(nthread)
+            for batch_size in (1, 64, 1024, 8192):
+                batch = X[:batch_size]
+                pickle_sec = timeit(lambda: classifier.predict_proba(batch), repeat=20)
+                native_sec = timeit(lambda: booster_model.predict_proba(batch), repeat=20)
+                print(f"  nthread={nthread:2d} lô {batch_size:5d}: predict_proba {pickle_sec * 1e6:9.1f} us | "
+                      f"inplace_predict {native_sec * 1e6:9.1f} us ({pickle_sec / native_sec:.2f}x)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# benchmarks/bench_pipeline.py
+"""
+Đo từng bước của đường chấm điểm trên một conn.log giả lập (benchmarks/conn_log_generator.py)
+và cả vòng monitor với alert sink ghi file cục bộ. Mỗi bước được đo riêng:
+  parse                : ZeekConnReader đọc khối + to_records (đơn vị: khối)
+  extract              : ZeekFeatureExtractor.process_zeek_log_entry (đơn vị: flow)
+  preprocess_features  : DataFrame + preprocess_features (pandas/ColumnTransformer, đơn vị: lô)
+  compiled_preprocess  : CompiledPreprocessor.transform_records, đường monitor thực dùng (đơn vị: lô)
+  inference            : predict_proba của mô hình monitor tải (đơn vị: lô)
+  alert_serialization  : build_alert + json.dumps như FileAlertSink (đơn vị: cảnh báo)
+  monitor_live         : FlowBatcher lô MONITOR_BATCH_SIZE (timeout MONITOR_BATCH_TIMEOUT_MS) + FileAlertSink
+  monitor_catchup      : FlowBatcher lô MONITOR_CATCHUP_BATCH_SIZE, không log từng flow + FileAlertSink
+Với mỗi bước báo cáo flow/s và độ trễ p50/p99 (ms) của một đơn vị, dạng JSON để so sánh giữa các lần chạy.
+
+Chạy: python -m benchmarks.bench_pipeline [--flows 100000] [--output report.json] [tham số generator...]
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.config import (NSL_KDD_RELEVANT_COLUMNS, MONITOR_BATCH_SIZE, MONITOR_BATCH_TIMEOUT_MS,
+                        MONITOR_CATCHUP_BATCH_SIZE)
+from src.preprocess import preprocess_features
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import load_model
+from src.stream_monitor import FlowBatcher, build_alert
+from src.alert_sink import FileAlertSink
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from benchmarks.common import ensure_model_files
+from benchmarks.conn_log_generator import write_synthetic_conn_log, DEFAULT_ATTACK_MIX
+
+def summarize(samples_sec, flows, unit):
+    """Tổng hợp thời gian từng đơn vị xử lý thành flow/s và độ trễ p50/p99/max (ms)."""
+    samples = np.asarray(samples_sec, dtype=np.float64) * 1000
+    total_sec = float(samples.sum()) / 1000
+    return {
+        'unit': unit, 'calls': int(samples.size), 'flows': int(flows), 'total_sec': total_sec,
+        'flows_per_sec': flows / total_sec if total_sec > 0 else None,
+        'p50_ms': float(np.percentile(samples, 50)) if samples.size else None,
+        'p99_ms': float(np.percentile(samples, 99)) if samples.size else None,
+        'max_ms': float(samples.max()) if samples.size else None,
+    }
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+def batches(items, batch_size):
+    return [items[i:i + batch_size] for i in range(0, len(items), batch_size)]
+
+def bench_parse(log_path):
+    """Đọc conn.log theo khối như monitor; trả về (kết quả, các dict bản ghi)."""
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    samples, records = [], []
+    blocks = iter(reader)
+    while True:
+        start = time.perf_counter()
+        zeek_batch = next(blocks, None)
+        if zeek_batch is None:
+            break
+        block_records = zeek_batch.to_records(CONN_LOG_SCORING_FIELDS)
+        samples.append(time.perf_counter() - start)
+        records.extend(block_records)
+    reader.close()
+    return summarize(samples, len(records), 'block'), records
+
+def bench_extract(records):
+    extractor = ZeekFeatureExtractor()
+    samples, flows = [], []
+    for log_entry_dict in records:
+        start = time.perf_counter()
+        features = extractor.process_zeek_log_entry(log_entry_dict)
+        samples.append(time.perf_counter() - start)
+        if features is not None:
+            flows.append((log_entry_dict, features))
+    return summarize(samples, len(records), 'flow'), flows
+
+def bench_preprocess_features(features_batches, preprocessor):
+    samples = []
+    for features_batch in features_batches:
+        _, elapsed = timed(lambda: preprocess_features(pd.DataFrame(features_batch, columns=NSL_KDD_RELEVANT_COLUMNS),
+                                                       preprocessor=preprocessor, fit=False, compiled=False))
+        samples.append(elapsed)
+    return summarize(samples, sum(map(len, features_batches)), 'batch')
+
+def bench_compiled_preprocess(features_batches, compiled):
+    samples, matrices = [], []
+    compiled.transform_records(features_batches[0]) # Làm nóng
+    for features_batch in features_batches:
+        X, elapsed = timed(compiled.transform_records, features_batch)
+        samples.append(elapsed)
+        matrices.append(X)
+    return summarize(samples, sum(map(len, features_batches)), 'batch'), matrices
+
+def bench_inference(matrices, model):
+    samples, probas = [], []
+    model.predict_proba(matrices[0]) # Làm nóng
+    for X in matrices:
+        batch_probas, elapsed = timed(model.predict_proba, X)
+        samples.append(elapsed)
+        probas.extend(batch_probas[:, 1].tolist())
+    return summarize(samples, sum(X.shape[0] for X in matrices), 'batch'), probas
+
+def bench_alert_serialization(flows, probas):
+    """Tạo và tuần tự hóa tài liệu cảnh báo của các flow Malicious (mọi flow nếu mô hình không báo flow nào)."""
+    scored = [(flow, proba) for flow, proba in zip(flows, probas) if proba > 0.5] or list(zip(flows, probas))
+    samples = []
+    for (log_entry_dict, features), proba in scored:
+        start = time.perf_counter()
+        json.dumps(build_alert(log_entry_dict, features, 'Malicious', proba), default=str, ensure_ascii=False)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples, len(scored), 'alert')
+
+class TimedFlowBatcher(FlowBatcher):
+    """FlowBatcher ghi lại thời gian chấm điểm (kèm gửi cảnh báo) của từng lô."""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.samples = []
+
+    def flush(self, log_flows=True):
+        start = time.perf_counter()
+        scored = bool(self.pending)
+        super().flush(log_flows)
+        if scored:
+            self.samples.append(time.perf_counter() - start)
+
+def bench_monitor(log_path, model, preprocessor, alerts_path, batch_size, batch_timeout_ms=None, log_flows=True):
+    """
+    Chạy conn.log qua FlowBatcher như _monitor_loop (đọc khối, trích xuất, gom lô, chấm điểm, gửi cảnh báo)
+    với FileAlertSink; thời gian tổng tính cả lúc sink ghi xong cảnh báo cuối cùng.
+    """
+    alert_sink = FileAlertSink(alerts_path, spill_path=alerts_path + '.spill').start()
+    batcher = TimedFlowBatcher(model, preprocessor, alert_sink, ZeekFeatureExtractor())
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    batcher.reset_offset(reader.position)
+    flows = 0
+    start = time.perf_counter()
+    try:
+        for zeek_batch in reader:
+            flows += batcher.add_block(zeek_batch, batch_size, batch_timeout_ms, log_flows=log_flows)
+        batcher.flush(log_flows)
+    finally:
+        reader.close()
+        alert_sink.close()
+    total_sec = time.perf_counter() - start
+
+    result = summarize(batcher.samples, flows, 'batch')
+    result.update({'total_sec': total_sec, 'flows_per_sec': flows / total_sec, 'batch_size': batch_size,
+                   'alerts_written': alert_sink.stats['written'], 'alerts_spilled': alert_sink.stats['spilled']})
+    return result
+
+def environment():
+    import sklearn
+    import xgboost
+    return {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pd.__version__, 'sklearn': sklearn.__version__,
+            'xgboost': xgboost.__version__}
+
+def run(args, tmp_dir):
+    generator = {'flows': args.flows, 'flow_rate': args.rate, 'n_clients': args.clients, 'n_servers': args.servers,
+                 'n_services': args.services, 'seed': args.seed,
+                 'attack_mix': {'syn_flood': args.syn_flood, 'port_sweep': args.port_sweep}}
+    log_path = args.log or write_synthetic_conn_log(
+        os.path.join(tmp_dir, 'conn.log'), args.flows, flow_rate=args.rate, n_clients=args.clients,
+        n_servers=args.servers, n_services=args.services, attack_mix=generator['attack_mix'], seed=args.seed)
+
+    model_path, preprocessor_path = ensure_model_files(tmp_dir)
+    model = load_model(model_path)
+    preprocessor = joblib.load(preprocessor_path)
+    compiled = compile_preprocessor(preprocessor) or preprocessor
+
+    stages = {}
+    stages['parse'], records = bench_parse(log_path)
+    stages['extract'], flows = bench_extract(records)
+    features_batches = batches([features for _, features in flows], args.batch_size)
+    stages['preprocess_features'] = bench_preprocess_features(features_batches, preprocessor)
+    stages['compiled_preprocess'], matrices = bench_compiled_preprocess(features_batches, compiled)
+    stages['inference'], probas = bench_inference(matrices, model)
+    stages['alert_serialization'] = bench_alert_serialization(flows, probas)
+    stages['monitor_live'] = bench_monitor(log_path, model, compiled, os.path.join(tmp_dir, 'alerts_live.ndjson'),
+                                           max(1, MONITOR_BATCH_SIZE), MONITOR_BATCH_TIMEOUT_MS)
+    stages['monitor_catchup'] = bench_monitor(log_path, model, compiled, os.path.join(tmp_dir, 'alerts_catchup.ndjson'),
+                                              MONITOR_CATCHUP_BATCH_SIZE, log_flows=False)
+
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'log': args.log, 'generator': None if args.log else generator, 'batch_size': args.batch_size,
+        'malicious_flows': int(sum(proba > 0.5 for proba in probas)),
+        'environment': environment(), 'stages': stages,
+    }
+
+def format_report(report):
+    lines = [f"{'bước':<21s} {'đơn vị':>6s} {'flow/s':>12s} {'p50 ms':>10s} {'p99 ms':>10s}"]
+    for name, stage in report['stages'].items():
+        rate = f"{stage['flows_per_sec']:12.0f}" if stage['flows_per_sec'] else f"{'-':>12s}"
+        p50 = f"{stage['p50_ms']:10.3f}" if stage['p50_ms'] is not None else f"{'-':>10s}"
+        p99 = f"{stage['p99_ms']:10.3f}" if stage['p99_ms'] is not None else f"{'-':>10s}"
+        lines.append(f"{name:<21s} {stage['unit']:>6s} {rate} {p50} {p99}")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_pipeline',
+                                     description="Đo flow/s và độ trễ p50/p99 của từng bước chấm điểm, xuất JSON.")
+    parser.add_argument('--log', help="Dùng conn.log có sẵn thay vì sinh dữ liệu giả lập")
+    parser.add_argument('--output', help="Ghi báo cáo JSON ra file (mặc định in JSON ra stdout)")
+    parser.add_argument('--batch-size', type=int, default=MONITOR_BATCH_SIZE,
+                        help="Kích thước lô của các bước preprocess/inference")
+    parser.add_argument('--flows', type=int, default=100000, help="Số flow giả lập")
+    parser.add_argument('--rate', type=float, default=2000.0, help="Số flow trung bình mỗi giây")
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--servers', type=int, default=50)
+    parser.add_argument('--services', type=int, default=12)
+    parser.add_argument('--syn-flood', type=float, default=DEFAULT_ATTACK_MIX['syn_flood'])
+    parser.add_argument('--port-sweep', type=float, default=DEFAULT_ATTACK_MIX['port_sweep'])
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.log and not os.path.isfile(args.log):
+        parser.error(f"Không tìm thấy file: {args.log}")
+
+    logging.getLogger().setLevel(logging.WARNING) # Không đo thời gian in log từng flow ra console
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        report = run(args, tmp_dir)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(format_report(report))
+        print(f"Đã ghi báo cáo JSON tại: {args.output}")
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# benchmarks/bench_prediction_cache.py
+"""
+Đo PredictionCache trên conn.log giả lập có nhiều SYN flood / quét cổng: trích xuất đặc trưng một lần
+rồi chấm điểm theo lô bằng score_batch không cache, cache khóa chính xác và cache lượng tử hóa.
+Kiểm tra:
+  - cache khóa chính xác cho xác suất giống hệt không cache;
+  - cache lượng tử hóa: tỉ lệ nhãn trùng với không cache và sai lệch xác suất lớn nhất;
+  - đổi mô hình (tải lại) thì cache tự xóa.
+
+Mỗi cấu hình cache chạy hai lần: luôn tra cache, và bỏ qua cache khi tỉ lệ hit của lô dưới
+PREDICTION_CACHE_MIN_HIT_RATE (mặc định của monitor). Lợi ích phụ thuộc chi phí mô hình: với mô hình nhỏ, tạo khóa
+và tra cache tốn gần bằng dự đoán; --trees/--depth huấn luyện tạm một XGBClassifier lớn hơn để thấy điểm hòa vốn.
+
+Chạy: python -m benchmarks.bench_prediction_cache [--flows 50000] [--syn-flood 0.4] [--port-sweep 0.2] [--trees 500 --depth 8]
+"""
+
+import argparse
+import copy
+import logging
+import random
+import tempfile
+import time
+
+import joblib
+import pandas as pd
+
+from src.config import MONITOR_BATCH_SIZE, MONITOR_CATCHUP_BATCH_SIZE, NSL_KDD_RELEVANT_COLUMNS
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import load_model
+from src.prediction_cache import PredictionCache
+from src.stream_monitor import score_batch
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from src.preprocess import preprocess_features
+from benchmarks.common import ensure_model_files, synthetic_feature_records
+from benchmarks.conn_log_generator import write_synthetic_conn_log
+
+def extract_features(log_path):
+    extractor = ZeekFeatureExtractor()
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    features = []
+    try:
+        for zeek_batch in reader:
+            for record in zeek_batch.to_records(CONN_LOG_SCORING_FIELDS):
+                nslkdd_features = extractor.process_zeek_log_entry(record)
+                if nslkdd_features is not None:
+                    features.append(nslkdd_features)
+    finally:
+        reader.close()
+    return features
+
+def train_model(trees, depth):
+    """
+    XGBClassifier tạm trên đặc trưng giả lập (flow S0/REJ là tấn công, cùng cách với ensure_model_files).
+    20% nhãn bị đảo ngẫu nhiên để cây mọc đủ độ sâu như mô hình huấn luyện trên dữ liệu thật.
+    """
+    import xgboost as xgb
+    records = synthetic_feature_records(20000, seed=1)
+    X, _, preprocessor = preprocess_features(pd.DataFrame(records, columns=NSL_KDD_RELEVANT_COLUMNS),
+                                             fit=True, save_path=None)
+    rng = random.Random(1)
+    y = [(record['flag'] in ('S0', 'REJ')) != (rng.random() < 0.2) for record in records]
+    model = xgb.XGBClassifier(n_estimators=trees, max_depth=depth, random_state=42).fit(X, y)
+    return model, preprocessor
+
+def run(model, preprocessor, features, batch_size, cache=None):
+    """Chấm điểm toàn bộ đặc trưng theo lô; trả về (xác suất, số giây)."""
+    probas = []
+    start = time.perf_counter()
+    for i in range(0, len(features), batch_size):
+        _, batch_probas, _ = score_batch(model, preprocessor, features[i:i + batch_size], cache=cache)
+        probas.extend(batch_probas)
+    return probas, time.perf_counter() - start
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.bench_prediction_cache',
+                                     description="Đo tỉ lệ hit và flow/s của cache dự đoán khi có flood/quét cổng.")
+    parser.add_argument('--flows', type=int, default=50000)
+    parser.add_argument('--syn-flood', type=float, default=0.4)
+    parser.add_argument('--port-sweep', type=float, default=0.2)
+    parser.add_argument('--trees', type=int, help="Huấn luyện tạm mô hình với số cây này thay vì dùng models/")
+    parser.add_argument('--depth', type=int, default=6, help="Độ sâu cây của mô hình huấn luyện tạm")
+    parser.add_argument('--no-compile', action='store_true',
+                        help="Dùng ColumnTransformer gốc (đường dự phòng khi không biên dịch được preprocessor)")
+    args = parser.parse_args(argv)
+
+    logging.getLogger().setLevel(logging.WARNING)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_path = write_synthetic_conn_log(f"{tmp_dir}/conn.log", args.flows,
+                                            attack_mix={'syn_flood': args.syn_flood, 'port_sweep': args.port_sweep})
+        if args.trees:
+            model, preprocessor = train_model(args.trees, args.depth)
+        else:
+            model_path, preprocessor_path = ensure_model_files(tmp_dir)
+            model, preprocessor = load_model(model_path), joblib.load(preprocessor_path)
+        if not args.no_compile:
+            preprocessor = compile_preprocessor(preprocessor) or preprocessor
+        features = extract_features(log_path)
+
+    print(f"{len(features)} flow (SYN flood {args.syn_flood:.0%}, quét cổng {args.port_sweep:.0%}):")
+    ok = True
+    for batch_size in (max(1, MONITOR_BATCH_SIZE), MONITOR_CATCHUP_BATCH_SIZE):
+        reference, base_sec = run(model, preprocessor, features, batch_size)
+        print(f"  lô {batch_size}: không cache {len(features) / base_sec:10.0f} flow/s")
+        for name, quantize, min_hit_rate in (('chính xác', False, 0.0), ('chính xác', False, None),
+                                             ('lượng tử hóa', True, 0.0), ('lượng tử hóa', True, None)):
+            # min_hit_rate 0: luôn tra cache; None: theo PREDICTION_CACHE_MIN_HIT_RATE (bỏ qua cache khi ít hit)
+            kwargs = {} if min_hit_rate is None else {'min_hit_rate': min_hit_rate}
+            cache = PredictionCache(quantize=quantize, **kwargs)
+            probas, sec = run(model, preprocessor, features, batch_size, cache)
+            hit_rate = cache.stats['hits'] / max(1, cache.stats['hits'] + cache.stats['misses'])
+            same_labels = sum((a > 0.5) == (b > 0.5) for a, b in zip(probas, reference)) / len(reference)
+            max_diff = max(abs(a - b) for a, b in zip(probas, reference))
+            mode = 'luôn tra' if min_hit_rate is not None else f"bỏ qua {cache.stats['bypassed_batches']:3d} lô"
+            print(f"    cache {name:<12s} {mode:<14s}: {len(features) / sec:10.0f} flow/s ({base_sec / sec:.2f}x), "
+                  f"hit {hit_rate:.1%} các lô đã tra, {len(cache)} phần tử, nhãn trùng {same_labels:.4%}, "
+                  f"lệch xác suất tối đa {max_diff:.2e}")
+            if not quantize and probas != reference:
+                print("    LỖI: cache khóa chính xác cho xác suất khác không cache")
+                ok = False
+
+    cache = PredictionCache()
+    run(model, preprocessor, features[:1000], 256, cache)
+    reloaded = copy.deepcopy(model)
+    cache.bind(reloaded, preprocessor)
+    invalidated = len(cache) == 0 and cache.stats['invalidations'] == 1
+    print(f"  tải lại mô hình: cache {'đã tự xóa' if invalidated else 'KHÔNG được xóa'}")
+    if not (ok and invalidated):
+        raise SystemExit(1)
+
+if __name__ == "__main__":
+    main()
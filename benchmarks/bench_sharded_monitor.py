@@ -0,0 +1,129 @@
+# benchmarks/bench_sharded_monitor.py
+"""
+Kiểm tra và đo chế độ nhiều tiến trình (ShardedFlowBatcher):
+1. Tính đúng đắn: đặc trưng và xác suất của từng flow khi chia cho N worker phải giống hệt
+   chạy một tiến trình (ZeekFeatureExtractor + score_batch) trên cùng conn.log, kể cả khi cửa sổ thời gian
+   vượt giới hạn quá tải max_window_flows (giới hạn tính theo mọi flow, không theo flow của từng shard).
+2. Khả năng mở rộng: số flow/giây (đọc + trích xuất đặc trưng + chấm điểm) theo số worker.
+
+Chạy: python -m benchmarks.bench_sharded_monitor [số_dòng] [danh_sách_worker, ví dụ 1,2,4,8]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+import joblib
+
+from src.compiled_preprocessor import compile_preprocessor
+from src.config import EXTRACTOR_MAX_WINDOW_FLOWS
+from src.sharded_monitor import ShardedFlowBatcher
+from src.stream_monitor import FlowBatcher, score_batch
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from benchmarks.common import synthetic_zeek_entries, write_conn_log, ensure_model_files
+
+BATCH_SIZE = 4096
+
+def single_process_results(log_path, model, preprocessor, max_window_flows=EXTRACTOR_MAX_WINDOW_FLOWS):
+    """Kết quả tham chiếu: seq -> (đặc trưng, xác suất) khi chạy một tiến trình."""
+    extractor = ZeekFeatureExtractor(max_window_flows=max_window_flows)
+    results = {}
+    seq = 0
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    for zeek_batch in reader:
+        batch_seqs, features_batch = [], []
+        for log_entry_dict in zeek_batch.to_records(CONN_LOG_SCORING_FIELDS):
+            features = extractor.process_zeek_log_entry(log_entry_dict)
+            if features is not None:
+                batch_seqs.append(seq)
+                features_batch.append(features)
+            seq += 1
+        if features_batch:
+            _, probas, _ = score_batch(model, preprocessor, features_batch)
+            results.update(zip(batch_seqs, zip(features_batch, probas)))
+    reader.close()
+    return results
+
+def run_batcher(batcher, log_path):
+    """Đưa toàn bộ conn.log qua một batcher như chế độ đuổi kịp backlog; trả về thời gian (giây)."""
+    reader = ZeekConnReader(log_path)
+    reader.read_header()
+    batcher.reset_offset(reader.position)
+    start = time.perf_counter()
+    for zeek_batch in reader:
+        batcher.add_block(zeek_batch, BATCH_SIZE, log_flows=False)
+    batcher.flush(log_flows=False)
+    elapsed = time.perf_counter() - start
+    assert batcher.committed_offset == reader.position, "Checkpoint chưa tới cuối file sau khi xả hết"
+    reader.close()
+    return elapsed
+
+def check_parity(log_path, model_path, preprocessor_path, n_workers, max_window_flows=EXTRACTOR_MAX_WINDOW_FLOWS):
+    model = joblib.load(model_path)
+    preprocessor = compile_preprocessor(joblib.load(preprocessor_path))
+    expected = single_process_results(log_path, model, preprocessor, max_window_flows)
+
+    actual = {}
+    batcher = ShardedFlowBatcher(n_workers, model_path=model_path, preprocessor_path=preprocessor_path,
+                                 on_result=lambda results: actual.update((seq, (f, p)) for seq, f, p in results),
+                                 max_window_flows=max_window_flows)
+    batcher.start()
+    try:
+        run_batcher(batcher, log_path)
+    finally:
+        batcher.close()
+
+    mismatched = [seq for seq in expected if actual.get(seq) != expected[seq]]
+    if len(actual) != len(expected) or mismatched:
+        print(f"Sai khác: {len(mismatched)} flow khác, {len(actual)} vs {len(expected)} flow (ví dụ seq {mismatched[:5]})")
+        return False
+    return True
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    worker_counts = [int(w) for w in sys.argv[2].split(',')] if len(sys.argv) > 2 else \
+        sorted({1, 2, 4, 8, os.cpu_count() or 1})
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+
+        parity_log = os.path.join(tmp_dir, 'parity_conn.log')
+        write_conn_log(parity_log, synthetic_zeek_entries(20000, seed=11, rate=5000.0))
+        for n_workers in (1, 3, 4):
+            if not check_parity(parity_log, model_path, preprocessor_path, n_workers):
+                print(f"Chế độ {n_workers} worker KHÔNG khớp với chạy một tiến trình")
+                sys.exit(1)
+        print("Parity: đặc trưng và xác suất của mọi flow giống hệt chạy một tiến trình (1, 3, 4 worker)")
+        # Giới hạn 1000 flow: ~10000 flow trong cửa sổ 2s nên cửa sổ thời gian bị loại sớm liên tục
+        for n_workers in (1, 3):
+            if not check_parity(parity_log, model_path, preprocessor_path, n_workers, max_window_flows=1000):
+                print(f"Chế độ {n_workers} worker KHÔNG khớp với chạy một tiến trình khi quá tải max_window_flows")
+                sys.exit(1)
+        print("Parity khi quá tải (max_window_flows=1000): giống hệt chạy một tiến trình (1, 3 worker)")
+
+        log_path = os.path.join(tmp_dir, 'conn.log')
+        write_conn_log(log_path, synthetic_zeek_entries(n, seed=12, n_hosts=250, rate=5000.0))
+
+        model = joblib.load(model_path)
+        preprocessor = compile_preprocessor(joblib.load(preprocessor_path))
+        baseline = run_batcher(FlowBatcher(model, preprocessor, None, ZeekFeatureExtractor()), log_path)
+        print(f"\n{n} flow, CPU: {os.cpu_count()}")
+        print(f"  một tiến trình (FlowBatcher) : {n / baseline:9.0f} flow/s")
+
+        for n_workers in worker_counts:
+            batcher = ShardedFlowBatcher(n_workers, model_path=model_path, preprocessor_path=preprocessor_path)
+            batcher.start()
+            try:
+                elapsed = run_batcher(batcher, log_path)
+            finally:
+                batcher.close()
+            print(f"  {n_workers:2d} worker                    : {n / elapsed:9.0f} flow/s "
+                  f"({baseline / elapsed:.2f}x so với một tiến trình)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+# benchmarks/bench_startup.py
+"""
+Đo thời gian khởi động theo từng chế độ, mỗi phép đo chạy trong một tiến trình Python mới:
+1. Thời gian import: `main` (điểm vào), module của từng chế độ, và cách cũ import hết mọi chế độ.
+2. Thời gian tới flow đầu tiên được chấm điểm: từ lúc tiến trình bắt đầu chạy mã tới khi replay
+   một conn.log một dòng xong (gồm import, tải mô hình + preprocessor, đọc, trích xuất, dự đoán).
+
+Chạy: python -m benchmarks.bench_startup [số_lần_lặp]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.common import ensure_model_files, synthetic_zeek_entries, write_conn_log
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_TARGETS = (
+    ('main.py (điểm vào)', 'import main'),
+    ('monitor', 'import src.stream_monitor'),
+    ('replay', 'import src.replay'),
+    ('monitor nhiều worker', 'import src.sharded_monitor'),
+    ('train', 'import src.train_model'),
+    ('import mọi chế độ (cách cũ)', 'import src.train_model, src.stream_monitor, src.replay'),
+)
+
+FIRST_FLOW_SCRIPT = '''
+import logging
+logging.disable(logging.CRITICAL)
+import joblib
+from src.compiled_preprocessor import compile_preprocessor
+from src.model_runtime import load_model
+from src.replay import replay
+stats = replay([{log_path!r}], model=load_model({model_path!r}),
+               preprocessor=compile_preprocessor(joblib.load({preprocessor_path!r})))
+assert stats['scored'] == 1
+'''
+
+def timed_run(code, repeat):
+    """Thời gian tốt nhất (giây) để chạy `code` trong tiến trình mới (không tính khởi động trình thông dịch)."""
+    wrapped = f"import time as _t; _t0 = _t.perf_counter()\n{code}\nprint(_t.perf_counter() - _t0)"
+    times = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', wrapped], cwd=ROOT, capture_output=True, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(result.stderr.strip().splitlines()[-1])
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(times)
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print("Thời gian import (tiến trình mới):")
+    for name, code in IMPORT_TARGETS:
+        print(f"  {name:<30s}: {timed_run(code, repeat) * 1000:8.1f} ms")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_path, preprocessor_path = ensure_model_files(tmp_dir)
+        log_path = os.path.join(tmp_dir, 'conn.log')
+        write_conn_log(log_path, synthetic_zeek_entries(1, seed=1))
+        code = FIRST_FLOW_SCRIPT.format(log_path=log_path, model_path=model_path,
+                                        preprocessor_path=preprocessor_path)
+        print(f"\nTới flow đầu tiên được chấm điểm (replay 1 dòng): {timed_run(code, repeat) * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
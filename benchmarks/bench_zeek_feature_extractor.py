@@ -0,0 +1,81 @@
+# benchmarks/bench_zeek_feature_extractor.py
+"""
+Đo ZeekFeatureExtractor (bộ đếm cộng dồn O(1)) so với cách quét lại cả cửa sổ (O(cửa sổ)),
+dưới SYN flood làm cửa sổ 2 giây chứa rất nhiều flow, và dưới quét nhiều host đích (mỗi flow một host đích,
+host nguồn và cổng nguồn khác nhau: bộ đếm srv_diff_host_rate / dst_host_same_src_port_rate /
+dst_host_srv_diff_host_rate có số khóa lớn nhất). Kiểm tra kết quả giống hệt trước khi đo.
+
+Chạy: python -m benchmarks.bench_zeek_feature_extractor
+"""
+
+import logging
+import sys
+import time
+
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+from benchmarks.common import synthetic_zeek_entries
+from benchmarks.reference_extractor import BruteForceZeekFeatureExtractor
+
+def syn_flood_entries(n, start_ts=1700000000.0, rate=100000.0, n_targets=2):
+    """
+    n flow S0 tới vài host đích với tốc độ `rate` flow/giây (cửa sổ 2 giây chứa ~2*rate flow).
+    n_targets=None: mỗi flow tới một host đích khác (quét nhiều host).
+    """
+    step = 1.0 / rate
+    return [{
+        'ts': f"{start_ts + i * step:.6f}", 'id.orig_h': f"172.16.{(i >> 8) & 255}.{i & 255}",
+        'id.orig_p': str(1024 + i % 60000),
+        'id.resp_h': f"10.0.0.{1 + i % n_targets}" if n_targets else f"10.{(i >> 16) & 255}.{(i >> 8) & 255}.{i & 255}",
+        'id.resp_p': '80', 'proto': 'tcp', 'service': '-', 'duration': '0', 'orig_bytes': '0',
+        'resp_bytes': '0', 'conn_state': 'S0',
+    } for i in range(n)]
+
+def check_parity(entries):
+    """So sánh đầu ra của hai cách tính trên cùng chuỗi flow."""
+    fast, reference = ZeekFeatureExtractor(), BruteForceZeekFeatureExtractor()
+    for i, entry in enumerate(entries):
+        expected = reference.process_zeek_log_entry(entry)
+        actual = fast.process_zeek_log_entry(entry)
+        if expected != actual or [type(v) for v in expected.values()] != [type(v) for v in actual.values()]:
+            print(f"Sai khác tại flow {i}: {entry}")
+            return False
+    return True
+
+def bench_flood(window_flows, measured_flows=2000, measured_reference=200, n_targets=2):
+    """Lấp đầy cửa sổ 2 giây với `window_flows` flow rồi đo chi phí mỗi flow tiếp theo."""
+    entries = syn_flood_entries(window_flows + measured_flows, rate=window_flows / 2.0, n_targets=n_targets)
+    fill, measured = entries[:window_flows], entries[window_flows:]
+
+    results = {}
+    for name, cls, n in (('incremental', ZeekFeatureExtractor, measured_flows),
+                         ('brute-force', BruteForceZeekFeatureExtractor, measured_reference)):
+        extractor = cls()
+        for entry in fill:
+            # Lấp cửa sổ bằng bản O(1) cho nhanh, trạng thái deque giống hệt nhau
+            ZeekFeatureExtractor.process_zeek_log_entry(extractor, entry)
+        start = time.perf_counter()
+        for entry in measured[:n]:
+            extractor.process_zeek_log_entry(entry)
+        results[name] = (time.perf_counter() - start) / n
+    return results
+
+def main():
+    logging.getLogger().setLevel(logging.WARNING)
+
+    mixed = synthetic_zeek_entries(20000, seed=3)
+    if not check_parity(mixed) or not check_parity(syn_flood_entries(5000, rate=3000.0)) \
+            or not check_parity(syn_flood_entries(5000, rate=3000.0, n_targets=None)):
+        print("ZeekFeatureExtractor KHÔNG khớp với cách tính vét cạn")
+        sys.exit(1)
+    print("Parity: đầu ra giống hệt cách tính vét cạn (lưu lượng hỗn hợp + SYN flood + quét nhiều host)")
+
+    for title, n_targets in (('SYN flood 2 host đích', 2), ('quét nhiều host đích', None)):
+        print(f"{title}:")
+        for window_flows in (1000, 10000, 100000, 300000):
+            r = bench_flood(window_flows, n_targets=n_targets)
+            print(f"  cửa sổ {window_flows:7d} flow: incremental {r['incremental'] * 1e6:8.1f} us/flow "
+                  f"({1 / r['incremental']:9.0f} flow/s) | vét cạn {r['brute-force'] * 1e6:10.1f} us/flow "
+                  f"({1 / r['brute-force']:8.0f} flow/s) | nhanh hơn {r['brute-force'] / r['incremental']:8.1f}x")
+
+if __name__ == "__main__":
+    main()
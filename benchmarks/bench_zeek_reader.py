@@ -0,0 +1,129 @@
+# benchmarks/bench_zeek_reader.py
+"""
+So sánh tốc độ đọc conn.log: vòng lặp cũ (readline + strip + split + dict từng dòng)
+với ZeekConnReader (đọc khối nhị phân, chuyển sang dạng cột). Trước đó kiểm tra rằng khi một header
+#fields mới (cùng số cột nhưng đổi thứ tự) xuất hiện giữa file, các dòng theo header cũ vẫn được chuyển
+kiểu theo #types cũ và các dòng sau theo #types mới.
+
+Chạy: python -m benchmarks.bench_zeek_reader [số_dòng]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from benchmarks.common import synthetic_zeek_entries, write_conn_log, CONN_LOG_FIELDS, CONN_LOG_TYPES
+
+def legacy_read(path):
+    """Vòng lặp đọc của stream_monitor trước đây (bỏ qua phần sleep khi gặp EOF)."""
+    rows = 0
+    with open(path, 'r', encoding='utf-8', errors='ignore') as log_file:
+        column_names = []
+        while True:
+            line = log_file.readline()
+            if not line:
+                break
+            if line.startswith('#'):
+                if line.startswith('#fields'):
+                    column_names = line.strip().split('\t')[1:]
+                continue
+            values = line.strip().split('\t')
+            if len(values) != len(column_names):
+                continue
+            dict(zip(column_names, values))
+            rows += 1
+    return rows
+
+def legacy_read_typed(path):
+    """Vòng lặp cũ cộng với phần ép kiểu float()/int() mà ZeekFeatureExtractor phải làm trên chuỗi."""
+    rows = 0
+    with open(path, 'r', encoding='utf-8', errors='ignore') as log_file:
+        column_names = []
+        while True:
+            line = log_file.readline()
+            if not line:
+                break
+            if line.startswith('#'):
+                if line.startswith('#fields'):
+                    column_names = line.strip().split('\t')[1:]
+                continue
+            values = line.strip().split('\t')
+            if len(values) != len(column_names):
+                continue
+            entry = dict(zip(column_names, values))
+            for name in ('ts', 'duration'):
+                value = entry[name]
+                float(value) if value != '-' else 0.0
+            for name in ('id.orig_p', 'id.resp_p', 'orig_bytes', 'resp_bytes'):
+                value = entry[name]
+                int(value) if value != '-' else 0
+            rows += 1
+    return rows
+
+def reader_columns(path):
+    """Chỉ đọc và chuyển kiểu các cột cần cho chấm điểm (đường đi của các bước xử lý theo lô)."""
+    reader = ZeekConnReader(path)
+    reader.read_header()
+    rows = 0
+    for batch in reader:
+        for name in CONN_LOG_SCORING_FIELDS:
+            batch.column(name)
+        rows += len(batch)
+    reader.close()
+    return rows
+
+def reader_records(path):
+    """Đọc sang dạng cột rồi chuyển về dict từng dòng (như monitor đang dùng cho extractor)."""
+    reader = ZeekConnReader(path)
+    reader.read_header()
+    rows = sum(len(batch.to_records(CONN_LOG_SCORING_FIELDS)) for batch in reader)
+    reader.close()
+    return rows
+
+def check_header_change(tmp):
+    """Header mới giữa file đổi chỗ cột service (string) và orig_bytes (count): mọi dòng phải giữ đúng giá trị và kiểu."""
+    path = os.path.join(tmp, 'header_change.log')
+    entries = synthetic_zeek_entries(200, seed=5)
+    write_conn_log(path, entries[:100])
+    i, j = CONN_LOG_FIELDS.index('service'), CONN_LOG_FIELDS.index('orig_bytes')
+    fields, types = list(CONN_LOG_FIELDS), list(CONN_LOG_TYPES)
+    fields[i], fields[j] = fields[j], fields[i]
+    types[i], types[j] = types[j], types[i]
+    with open(path, 'a') as f:
+        f.write('#fields\t' + '\t'.join(fields) + '\n#types\t' + '\t'.join(types) + '\n')
+        for entry in entries[100:]:
+            f.write('\t'.join(str(entry.get(name, '-')) for name in fields) + '\n')
+
+    reader = ZeekConnReader(path)
+    reader.read_header()
+    records = [record for batch in reader for record in batch.to_records(CONN_LOG_SCORING_FIELDS)]
+    reader.close()
+    assert len(records) == len(entries), f"Đọc được {len(records)}/{len(entries)} dòng"
+    for k, (record, entry) in enumerate(zip(records, entries)):
+        assert record['service'] == entry['service'] and record['orig_bytes'] == int(entry['orig_bytes']), \
+            f"Dòng {k} ({'trước' if k < 100 else 'sau'} header mới) sai giá trị/kiểu: " \
+            f"service={record['service']!r}, orig_bytes={record['orig_bytes']!r}"
+    print("Header đổi thứ tự cột giữa file: mọi dòng đúng giá trị và kiểu theo header của nó")
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500000
+    with tempfile.TemporaryDirectory() as tmp:
+        check_header_change(tmp)
+        path = os.path.join(tmp, 'conn.log')
+        write_conn_log(path, synthetic_zeek_entries(n, seed=4))
+        size_mb = os.path.getsize(path) / 1e6
+        print(f"conn.log giả lập: {n} dòng, {size_mb:.1f} MB")
+
+        for name, func in (('readline/split/dict (cũ)', legacy_read),
+                           ('cũ + ép kiểu như extractor', legacy_read_typed),
+                           ('ZeekConnReader -> cột', reader_columns),
+                           ('ZeekConnReader -> dict', reader_records)):
+            start = time.perf_counter()
+            rows = func(path)
+            elapsed = time.perf_counter() - start
+            print(f"{name:30s}: {rows:8d} dòng trong {elapsed:6.2f}s -> {rows / elapsed:10.0f} dòng/s")
+
+if __name__ == "__main__":
+    main()
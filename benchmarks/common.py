@@ -0,0 +1,116 @@
+# benchmarks/common.py
+
+import os
+import random
+import time
+import joblib
+import pandas as pd
+
+from src.config import PREPROCESSOR_PATH, MODEL_PATHS, NSL_KDD_RELEVANT_COLUMNS
+from src.preprocess import preprocess_features
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+
+def synthetic_zeek_entries(n, seed=0, n_hosts=50, start_ts=1700000000.0, rate=2000.0):
+    """
+    Sinh n bản ghi conn.log dạng dict (giá trị là chuỗi, giống dòng Zeek đã split),
+    trộn lưu lượng bình thường với SYN flood (S0) và quét cổng (REJ).
+    """
+    rng = random.Random(seed)
+    ts = start_ts
+    entries = []
+    for i in range(n):
+        ts += rng.expovariate(rate)
+        if rng.random() < 0.3:
+            conn_state = rng.choice(['S0', 'REJ'])
+            dest = f"10.0.0.{rng.randint(1, 3)}"
+            port, service, orig_bytes, resp_bytes = rng.randint(1, 1024), '-', '0', '0'
+            duration = f"{rng.random() * 0.001:.6f}"
+        else:
+            conn_state = rng.choice(['SF', 'SF', 'SF', 'S1', 'RSTO', 'OTH'])
+            dest = f"10.0.{rng.randint(0, 5)}.{rng.randint(1, n_hosts)}"
+            port = rng.choice([80, 443, 53, 22, 8080])
+            service = rng.choice(['http', 'dns', 'ssl', '-'])
+            duration = f"{rng.random():.6f}"
+            orig_bytes, resp_bytes = str(rng.randint(0, 9000)), str(rng.randint(0, 9000))
+        entries.append({
+            'ts': f"{ts:.6f}", 'uid': f"C{i:08d}",
+            'id.orig_h': f"192.168.1.{rng.randint(1, 40)}", 'id.orig_p': str(rng.randint(1024, 65535)),
+            'id.resp_h': dest, 'id.resp_p': str(port),
+            'proto': rng.choice(['tcp', 'tcp', 'udp']), 'service': service,
+            'duration': duration, 'orig_bytes': orig_bytes, 'resp_bytes': resp_bytes,
+            'conn_state': conn_state,
+        })
+    return entries
+
+CONN_LOG_FIELDS = ['ts', 'uid', 'id.orig_h', 'id.orig_p', 'id.resp_h', 'id.resp_p', 'proto', 'service',
+                   'duration', 'orig_bytes', 'resp_bytes', 'conn_state', 'local_orig', 'local_resp',
+                   'missed_bytes', 'history', 'orig_pkts', 'orig_ip_bytes', 'resp_pkts', 'resp_ip_bytes',
+                   'tunnel_parents']
+CONN_LOG_TYPES = ['time', 'string', 'addr', 'port', 'addr', 'port', 'enum', 'string', 'interval', 'count',
+                  'count', 'string', 'bool', 'bool', 'count', 'string', 'count', 'count', 'count', 'count',
+                  'set[string]']
+_CONN_LOG_DEFAULTS = {'local_orig': 'T', 'local_resp': 'F', 'missed_bytes': '0', 'history': 'ShADadFf',
+                      'orig_pkts': '6', 'orig_ip_bytes': '412', 'resp_pkts': '4', 'resp_ip_bytes': '300',
+                      'tunnel_parents': '(empty)'}
+
+def write_conn_log(path, entries):
+    """Ghi các bản ghi (dict) thành file conn.log đúng định dạng Zeek (có #fields/#types)."""
+    with open(path, 'w') as f:
+        f.write('#separator \\x09\n#set_separator\t,\n#empty_field\t(empty)\n#unset_field\t-\n'
+                '#path\tconn\n#open\t2023-11-14-22-13-20\n')
+        f.write('#fields\t' + '\t'.join(CONN_LOG_FIELDS) + '\n')
+        f.write('#types\t' + '\t'.join(CONN_LOG_TYPES) + '\n')
+        for entry in entries:
+            f.write('\t'.join(str(entry.get(name, _CONN_LOG_DEFAULTS.get(name, '-'))) for name in CONN_LOG_FIELDS) + '\n')
+
+def synthetic_feature_records(n, seed=0):
+    """Chạy ZeekFeatureExtractor trên dữ liệu giả lập để có các dict đặc trưng NSL-KDD thực tế."""
+    extractor = ZeekFeatureExtractor()
+    records = []
+    for entry in synthetic_zeek_entries(n, seed=seed):
+        features = extractor.process_zeek_log_entry(entry)
+        if features is not None:
+            records.append(features)
+    return records
+
+def load_or_fit_preprocessor(records=None):
+    """
+    Dùng preprocessor.pkl nếu đã huấn luyện, nếu chưa thì huấn luyện tạm trên dữ liệu giả lập
+    (không ghi đè file trong models/).
+    """
+    if os.path.exists(PREPROCESSOR_PATH):
+        return joblib.load(PREPROCESSOR_PATH)
+    records = records or synthetic_feature_records(5000, seed=1)
+    df = pd.DataFrame(records, columns=NSL_KDD_RELEVANT_COLUMNS)
+    _, _, preprocessor = preprocess_features(df, fit=True, save_path=None)
+    return preprocessor
+
+def ensure_model_files(directory):
+    """
+    Trả về (model_path, preprocessor_path) để tiến trình khác tự tải mô hình. Dùng models/ nếu đã
+    huấn luyện; nếu chưa thì huấn luyện tạm một XGBClassifier nhỏ trên dữ liệu giả lập
+    (flow S0/REJ là tấn công) và lưu vào `directory`.
+    """
+    if os.path.exists(MODEL_PATHS['xgb']) and os.path.exists(PREPROCESSOR_PATH):
+        return MODEL_PATHS['xgb'], PREPROCESSOR_PATH
+    import xgboost as xgb
+    records = synthetic_feature_records(5000, seed=1)
+    df = pd.DataFrame(records, columns=NSL_KDD_RELEVANT_COLUMNS)
+    X, _, preprocessor = preprocess_features(df, fit=True, save_path=None)
+    y = [1 if record['flag'] in ('S0', 'REJ') else 0 for record in records]
+    model = xgb.XGBClassifier(n_estimators=50, max_depth=4, random_state=42)
+    model.fit(X, y)
+    model_path = os.path.join(directory, 'xgb_model.pkl')
+    preprocessor_path = os.path.join(directory, 'preprocessor.pkl')
+    joblib.dump(model, model_path)
+    joblib.dump(preprocessor, preprocessor_path)
+    return model_path, preprocessor_path
+
+def timeit(func, repeat=5):
+    """Chạy func nhiều lần, trả về thời gian tốt nhất (giây)."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
@@ -0,0 +1,135 @@
+# benchmarks/conn_log_generator.py
+"""
+Sinh file conn.log giả lập đúng định dạng Zeek (header #separator/#fields/#types) để đo hiệu năng.
+Cấu hình được tốc độ flow, số host/dịch vụ và tỉ lệ các loại lưu lượng:
+- normal: client -> server trên các dịch vụ phổ biến (phân bố lệch: vài dịch vụ chiếm phần lớn),
+  phần lớn SF, số byte và thời lượng phân bố log-normal / mũ;
+- syn_flood: nhiều cổng nguồn tới một cổng của một nạn nhân, conn_state S0, không có byte;
+- port_sweep: một máy quét lần lượt các cổng tăng dần của một đích, conn_state REJ.
+Mỗi cuộc tấn công là một đợt liên tiếp (cùng nạn nhân/máy quét) xen kẽ với lưu lượng bình thường.
+
+Chạy: python -m benchmarks.conn_log_generator out/conn.log --flows 100000 --rate 5000 --syn-flood 0.1 --port-sweep 0.05
+"""
+
+import argparse
+import math
+import random
+
+from src.config import SERVICE_MAPPING
+from benchmarks.common import write_conn_log
+
+# (cổng, giao thức, tên dịch vụ Zeek) của lưu lượng bình thường, theo thứ tự phổ biến giảm dần
+NORMAL_SERVICES = [
+    (443, 'tcp', 'ssl'), (80, 'tcp', 'http'), (53, 'udp', 'dns'), (22, 'tcp', 'ssh'),
+    (25, 'tcp', 'smtp'), (8080, 'tcp', 'http'), (123, 'udp', '-'), (21, 'tcp', 'ftp'),
+    (143, 'tcp', 'imap'), (110, 'tcp', 'pop3'), (3306, 'tcp', '-'), (23, 'tcp', 'telnet'),
+] + [(port, 'tcp', '-') for port in sorted(SERVICE_MAPPING) if port not in (21, 22, 23, 25, 53, 80, 110, 143, 443)]
+
+NORMAL_CONN_STATES = ['SF'] * 16 + ['S1', 'RSTO', 'RSTR', 'OTH', 'SH', 'S0']
+DEFAULT_ATTACK_MIX = {'syn_flood': 0.1, 'port_sweep': 0.05}
+ATTACK_EPISODE_FLOWS = (200, 2000) # Số flow của mỗi đợt tấn công (ngẫu nhiên trong khoảng)
+
+def iter_conn_log_entries(n, flow_rate=2000.0, n_clients=200, n_servers=50, n_services=12,
+                          attack_mix=None, seed=0, start_ts=1700000000.0):
+    """
+    Sinh lần lượt n bản ghi conn.log (dict, giá trị là chuỗi như dòng Zeek đã split) theo thứ tự thời gian.
+    :param flow_rate: Số flow trung bình mỗi giây (khoảng cách giữa các flow phân bố mũ).
+    :param n_clients: Số địa chỉ nguồn của lưu lượng bình thường.
+    :param n_servers: Số địa chỉ đích (server) của lưu lượng bình thường, cũng là nơi chọn nạn nhân.
+    :param n_services: Số dịch vụ (cổng) khác nhau của lưu lượng bình thường, tối đa len(NORMAL_SERVICES).
+    :param attack_mix: dict 'syn_flood'/'port_sweep' -> tỉ lệ flow; phần còn lại là normal
+                       (mặc định DEFAULT_ATTACK_MIX).
+    """
+    attack_mix = DEFAULT_ATTACK_MIX if attack_mix is None else attack_mix
+    unknown = set(attack_mix) - {'syn_flood', 'port_sweep'}
+    if unknown:
+        raise ValueError(f"Loại tấn công không hỗ trợ: {sorted(unknown)}")
+    if sum(attack_mix.values()) > 1.0:
+        raise ValueError("Tổng tỉ lệ các loại tấn công phải <= 1.")
+
+    rng = random.Random(seed)
+    services = NORMAL_SERVICES[:max(1, min(n_services, len(NORMAL_SERVICES)))]
+    # Phân bố Zipf: dịch vụ thứ k được chọn với trọng số 1/k
+    service_weights = [1.0 / (k + 1) for k in range(len(services))]
+    clients = [f"192.168.{i // 250}.{i % 250 + 1}" for i in range(n_clients)]
+    servers = [f"10.0.{i // 250}.{i % 250 + 1}" for i in range(n_servers)]
+    kinds = ['syn_flood', 'port_sweep', 'normal']
+    weights = [attack_mix.get('syn_flood', 0.0), attack_mix.get('port_sweep', 0.0)]
+    weights.append(max(0.0, 1.0 - sum(weights)))
+    episodes = {} # Loại tấn công -> trạng thái đợt đang diễn ra
+
+    def new_episode(kind):
+        episode = {'left': rng.randint(*ATTACK_EPISODE_FLOWS), 'target': rng.choice(servers)}
+        if kind == 'syn_flood':
+            episode['port'] = rng.choice(services)[0]
+            episode['sources'] = [f"172.16.{rng.randint(0, 255)}.{rng.randint(1, 254)}" for _ in range(rng.randint(1, 8))]
+        else:
+            episode['source'] = f"172.31.{rng.randint(0, 255)}.{rng.randint(1, 254)}"
+            episode['port'] = rng.randint(1, 1024)
+        return episode
+
+    ts = start_ts
+    for i in range(n):
+        ts += rng.expovariate(flow_rate)
+        kind = rng.choices(kinds, weights)[0]
+        entry = {'ts': f"{ts:.6f}", 'uid': f"C{seed:02d}{i:010d}"}
+        if kind == 'normal':
+            port, proto, service = rng.choices(services, service_weights)[0]
+            conn_state = rng.choice(NORMAL_CONN_STATES)
+            established = conn_state in ('SF', 'S1', 'RSTO', 'RSTR')
+            entry.update({
+                'id.orig_h': rng.choice(clients), 'id.orig_p': str(rng.randint(1024, 65535)),
+                'id.resp_h': rng.choice(servers), 'id.resp_p': str(port), 'proto': proto, 'service': service,
+                'duration': f"{rng.expovariate(2.0):.6f}" if established else '-',
+                'orig_bytes': str(int(rng.lognormvariate(6, 1.5))) if established else '0',
+                'resp_bytes': str(int(rng.lognormvariate(8, 2))) if established else '0',
+                'conn_state': conn_state, 'history': 'ShADadFf' if established else 'S',
+            })
+        else:
+            episode = episodes.get(kind)
+            if episode is None or episode['left'] <= 0:
+                episode = episodes[kind] = new_episode(kind)
+            episode['left'] -= 1
+            if kind == 'syn_flood':
+                source, port, conn_state, history = rng.choice(episode['sources']), episode['port'], 'S0', 'S'
+            else:
+                source, port, conn_state, history = episode['source'], episode['port'], 'REJ', 'Sr'
+                episode['port'] = episode['port'] % 65535 + 1
+            entry.update({
+                'id.orig_h': source, 'id.orig_p': str(rng.randint(1024, 65535)),
+                'id.resp_h': episode['target'], 'id.resp_p': str(port), 'proto': 'tcp', 'service': '-',
+                'duration': f"{rng.random() * 0.001:.6f}" if conn_state == 'REJ' else '-',
+                'orig_bytes': '0', 'resp_bytes': '0', 'conn_state': conn_state, 'history': history,
+                'orig_pkts': '1' if conn_state == 'S0' else '2', 'orig_ip_bytes': '44' if conn_state == 'S0' else '88',
+                'resp_pkts': '0' if conn_state == 'S0' else '1', 'resp_ip_bytes': '0' if conn_state == 'S0' else '40',
+            })
+        yield entry
+
+def write_synthetic_conn_log(path, n, **kwargs):
+    """Ghi n flow giả lập ra `path` (tham số như iter_conn_log_entries), không giữ cả log trong bộ nhớ."""
+    write_conn_log(path, iter_conn_log_entries(n, **kwargs))
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.conn_log_generator',
+                                     description="Sinh file conn.log giả lập định dạng Zeek.")
+    parser.add_argument('output', help="File conn.log cần ghi")
+    parser.add_argument('--flows', type=int, default=100000, help="Số flow")
+    parser.add_argument('--rate', type=float, default=2000.0, help="Số flow trung bình mỗi giây")
+    parser.add_argument('--clients', type=int, default=200, help="Số địa chỉ nguồn của lưu lượng bình thường")
+    parser.add_argument('--servers', type=int, default=50, help="Số địa chỉ đích của lưu lượng bình thường")
+    parser.add_argument('--services', type=int, default=12, help=f"Số dịch vụ (tối đa {len(NORMAL_SERVICES)})")
+    parser.add_argument('--syn-flood', type=float, default=DEFAULT_ATTACK_MIX['syn_flood'], help="Tỉ lệ flow SYN flood (S0)")
+    parser.add_argument('--port-sweep', type=float, default=DEFAULT_ATTACK_MIX['port_sweep'], help="Tỉ lệ flow quét cổng (REJ)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    if not math.isfinite(args.rate) or args.rate <= 0:
+        parser.error("--rate phải > 0")
+
+    write_synthetic_conn_log(args.output, args.flows, flow_rate=args.rate, n_clients=args.clients,
+                             n_servers=args.servers, n_services=args.services, seed=args.seed,
+                             attack_mix={'syn_flood': args.syn_flood, 'port_sweep': args.port_sweep})
+    print(f"Đã ghi {args.flows} flow vào {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+# benchmarks/reference_extractor.py
+"""
+Bản tính "vét cạn" các đặc trưng cửa sổ của ZeekFeatureExtractor: lọc lại toàn bộ cửa sổ
+bằng list comprehension cho mỗi flow (đúng như cách tính ban đầu, chi phí O(cửa sổ)).
+Dùng làm chuẩn để kiểm tra kết quả và làm mốc so sánh tốc độ. Cửa sổ được giải mã từ bộ đệm vòng
+thành dict (window_flows) ở mỗi flow nên bản này còn chậm hơn cách tính ban đầu trên deque các dict.
+"""
+
+from src.zeek_feature_extractor import ZeekFeatureExtractor
+
+def brute_force_window_features(recent_flows_time, recent_flows_host, current_flow_info):
+    """
+    Tính lại các đặc trưng 2 giây và N kết nối gần nhất từ nội dung hai cửa sổ.
+    :param current_flow_info: Flow hiện tại như trong cửa sổ host (có 'src_ip', 'src_port').
+    """
+    current_dest_ip = current_flow_info['dest_ip']
+    current_service = current_flow_info['service']
+    features = {}
+
+    relevant_time_flows = [f for f in recent_flows_time if f['dest_ip'] == current_dest_ip]
+    features['count'] = len(relevant_time_flows)
+    features['srv_count'] = sum(1 for f in relevant_time_flows if f['service'] == current_service)
+    total_serror_time = sum(1 for f in relevant_time_flows if f['flag'] in ['S0'])
+    total_rerror_time = sum(1 for f in relevant_time_flows if f['flag'] in ['REJ', 'RSTO', 'RSTR'])
+    features['serror_rate'] = total_serror_time / features['count'] if features['count'] > 0 else 0
+    features['srv_serror_rate'] = sum(1 for f in relevant_time_flows if f['service'] == current_service and f['flag'] in ['S0']) / features['srv_count'] if features['srv_count'] > 0 else 0
+    features['rerror_rate'] = total_rerror_time / features['count'] if features['count'] > 0 else 0
+    features['srv_rerror_rate'] = sum(1 for f in relevant_time_flows if f['service'] == current_service and f['flag'] in ['REJ', 'RSTO', 'RSTR']) / features['srv_count'] if features['srv_count'] > 0 else 0
+    features['same_srv_rate'] = features['srv_count'] / features['count'] if features['count'] > 0 else 0
+    features['diff_srv_rate'] = (features['count'] - features['srv_count']) / features['count'] if features['count'] > 0 else 0
+    same_service_flows = [f for f in recent_flows_time if f['service'] == current_service]
+    features['srv_diff_host_rate'] = sum(1 for f in same_service_flows if f['dest_ip'] != current_dest_ip) / len(same_service_flows) if same_service_flows else 0
+
+    relevant_host_flows = [f for f in recent_flows_host if f['dest_ip'] == current_dest_ip]
+    features['dst_host_count'] = len(relevant_host_flows)
+    features['dst_host_srv_count'] = sum(1 for f in relevant_host_flows if f['service'] == current_service)
+    total_serror_host = sum(1 for f in relevant_host_flows if f['flag'] in ['S0'])
+    total_rerror_host = sum(1 for f in relevant_host_flows if f['flag'] in ['REJ', 'RSTO', 'RSTR'])
+    features['dst_host_same_srv_rate'] = features['dst_host_srv_count'] / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
+    features['dst_host_diff_srv_rate'] = (features['dst_host_count'] - features['dst_host_srv_count']) / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
+    features['dst_host_serror_rate'] = total_serror_host / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
+    features['dst_host_srv_serror_rate'] = sum(1 for f in relevant_host_flows if f['service'] == current_service and f['flag'] in ['S0']) / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
+    features['dst_host_rerror_rate'] = total_rerror_host / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
+    features['dst_host_same_src_port_rate'] = sum(1 for f in relevant_host_flows if f['src_port'] == current_flow_info['src_port']) / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
+    features['dst_host_srv_diff_host_rate'] = sum(1 for f in relevant_host_flows if f['service'] == current_service and f['src_ip'] != current_flow_info['src_ip']) / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
+    features['dst_host_srv_rerror_rate'] = sum(1 for f in relevant_host_flows if f['service'] == current_service and f['flag'] in ['REJ', 'RSTO', 'RSTR']) / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
+    return features
+
+class BruteForceZeekFeatureExtractor(ZeekFeatureExtractor):
+    """ZeekFeatureExtractor nhưng các đặc trưng cửa sổ được tính lại bằng cách quét toàn bộ cửa sổ."""
+
+    def process_zeek_log_entry(self, log_entry_dict):
+        features = super().process_zeek_log_entry(log_entry_dict)
+        if features is None:
+            return None
+        host_flows = self.window_flows('host')
+        features.update(brute_force_window_features(self.window_flows('time'), host_flows, host_flows[-1]))
+        return features
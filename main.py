@@ -1,8 +1,9 @@
 import logging
 import os
 import sys # Import sys để xử lý tham số dòng lệnh
-from src.train_model import train_model as run_train_pipeline # Đổi tên để tránh trùng lặp
-from src.stream_monitor import monitor as run_monitor_pipeline # Đổi tên để tránh trùng lặp
+from src.config import LOG_ASYNC
+# Các module của từng chế độ (xgboost, sklearn, pandas...) chỉ được import khi chế độ đó chạy,
+# để khởi động monitor/replay không phải trả thời gian import của chế độ huấn luyện.
 
 def setup_logging():
     """Cấu hình hệ thống logging."""
@@ -11,14 +12,20 @@ def setup_logging():
     if not os.path.exists(log_dir):
         os.makedirs(log_dir)
 
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler(os.path.join(log_dir, 'app.log')),
-            logging.StreamHandler()
-        ]
-    )
+    handlers = [
+        logging.FileHandler(os.path.join(log_dir, 'app.log')),
+        logging.StreamHandler()
+    ]
+    if LOG_ASYNC:
+        # Ghi file/console ở luồng nền sau hàng đợi để log không chặn vòng chấm điểm
+        from src.monitor_logging import setup_async_logging
+        setup_async_logging(handlers)
+    else:
+        logging.basicConfig(
+            level=logging.INFO,
+            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+            handlers=handlers
+        )
 
 # Hàm train_pipeline cũ đã bị loại bỏ vì toàn bộ logic đã được gói gọn trong src.train_model.py
 
@@ -36,6 +43,8 @@ def main():
         logging.info("Chọn chế độ hoạt động:")
         print("1. Huấn luyện mô hình (train)")
         print("2. Giám sát thời gian thực (monitor)")
+        print("   (Tìm siêu tham số: python main.py tune)")
+        print("   (Chấm điểm log lưu trữ: python main.py replay <file conn.log...>)")
         choice = input("Nhập lựa chọn (1 hoặc 2 hoặc tên chế độ): ").strip().lower()
         if choice == '1' or choice == 'train':
             mode = 'train'
@@ -47,12 +56,22 @@ def main():
 
     if mode == 'train':
         logging.info("[*] Chế độ: Huấn luyện mô hình.")
+        from src.train_model import train_model as run_train_pipeline # Đổi tên để tránh trùng lặp
         run_train_pipeline() # Gọi hàm train_model từ src/train_model.py
+    elif mode == 'tune':
+        logging.info("[*] Chế độ: Huấn luyện mô hình với tìm siêu tham số song song.")
+        from src.train_model import train_model as run_train_pipeline
+        run_train_pipeline(search=True)
     elif mode == 'monitor':
         logging.info("[*] Chế độ: Giám sát thời gian thực.")
+        from src.stream_monitor import monitor as run_monitor_pipeline # Đổi tên để tránh trùng lặp
         run_monitor_pipeline() # Gọi hàm monitor từ src/stream_monitor.py
+    elif mode == 'replay':
+        logging.info("[*] Chế độ: Replay log Zeek lưu trữ.")
+        from src.replay import main as run_replay_pipeline
+        run_replay_pipeline(sys.argv[2:]) # Tham số còn lại do src/replay.py phân tích (argparse)
     else:
-        logging.error(f"Chế độ '{mode}' không được hỗ trợ. Vui lòng chọn 'train' hoặc 'monitor'.")
+        logging.error(f"Chế độ '{mode}' không được hỗ trợ. Vui lòng chọn 'train', 'tune', 'monitor' hoặc 'replay'.")
         sys.exit(1) # Thoát với mã lỗi
 
 if __name__ == "__main__":
@@ -0,0 +1,238 @@
+# src/alert_explainer.py
+"""
+Giải thích cảnh báo ở luồng nền: AlertExplainer đứng trước alert sink, nhận cảnh báo bằng send() như một
+AlertSink (chỉ đưa vào hàng đợi, không chặn vòng chấm điểm), rồi luồng 'alert-explainer' gom các cảnh báo
+đang chờ thành lô, tính đóng góp của từng đặc trưng bằng Booster.predict(pred_contribs=True) của XGBoost
+(giá trị SHAP chính xác cho mô hình cây, giống shap.TreeExplainer nhưng không phải tạo explainer mỗi lần)
+và gắn top-k đặc trưng đẩy flow về phía Malicious vào ml_ids.explanation trước khi chuyển tiếp cho sink.
+Chỉ flow Malicious (cảnh báo) được giải thích; booster được sao chép một lần khi khởi tạo và mỗi lần
+monitor đổi mô hình (set_model, src/model_reloader.py).
+"""
+
+import logging
+import queue
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.config import (EXPLAIN_ENABLED, EXPLAIN_TOP_K, EXPLAIN_QUEUE_SIZE, EXPLAIN_BATCH_SIZE,
+                        NSL_KDD_RELEVANT_COLUMNS, PREPROCESSOR_PATH)
+from src.compiled_preprocessor import CompiledPreprocessor, compile_preprocessor
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+class AlertExplainer:
+    """
+    Cùng giao diện start()/send()/close() như AlertSink để dùng thay alert sink trong process_batch
+    và ShardedFlowBatcher. Hàng đợi đầy hoặc lỗi khi giải thích thì cảnh báo được chuyển thẳng cho sink
+    (không có explanation) thay vì bị mất; khi đó thứ tự cảnh báo tới sink có thể bị đảo.
+    """
+
+    name = 'alert-explainer'
+
+    def __init__(self, model, preprocessor, sink, top_k=EXPLAIN_TOP_K, queue_size=EXPLAIN_QUEUE_SIZE,
+                 batch_size=EXPLAIN_BATCH_SIZE, metrics=None):
+        """
+        :param model: BoosterModel, CascadeModel (giải thích bằng mô hình đầy đủ) hoặc XGBClassifier.
+        :param preprocessor: CompiledPreprocessor hoặc ColumnTransformer gốc, như khi chấm điểm.
+        :param sink: AlertSink nhận cảnh báo đã giải thích.
+        :param top_k: Số đặc trưng có đóng góp lớn nhất được gắn vào cảnh báo.
+        :param queue_size: Số cảnh báo tối đa chờ giải thích.
+        :param batch_size: Số cảnh báo tối đa trong một lần gọi pred_contribs.
+        :param metrics: MonitorMetrics nhận thời gian giải thích mỗi lô (bước 'explain'), None để không đo.
+        """
+        self._load_model(model, preprocessor)
+        self._pending_model = None # (model, preprocessor, version) chờ cảnh báo đầu tiên của phiên bản mới
+        self.sink = sink
+        self.top_k = max(1, top_k)
+        self.batch_size = max(1, batch_size)
+        self.metrics = metrics
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.stats = {'explained': 0, 'unexplained': 0, 'batches': 0}
+        self._stats_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logging.info(f"Đã khởi động AlertExplainer: top {self.top_k} đặc trưng, lô {self.batch_size} cảnh báo.")
+        return self
+
+    def send(self, alert):
+        """
+        Đưa cảnh báo vào hàng đợi giải thích mà không chờ.
+        :return: Như AlertSink.send (hàng đợi đầy thì cảnh báo được gửi thẳng cho sink, không có explanation).
+        """
+        try:
+            self.queue.put_nowait(alert)
+            return True
+        except queue.Full:
+            self._count('unexplained', 1)
+            return self.sink.send(alert)
+
+    def close(self, timeout=10.0):
+        """Giải thích nốt các cảnh báo đang chờ rồi dừng luồng nền (không đóng sink phía sau)."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.warning(f"Luồng giải thích cảnh báo chưa xong sau {timeout}s, gửi các cảnh báo còn lại không kèm giải thích.")
+        self._thread = None
+        leftover = self._drain(self.queue.qsize())
+        for alert in leftover:
+            self.sink.send(alert)
+        self._count('unexplained', len(leftover))
+        logging.info(f"Đã đóng AlertExplainer: {self.stats}")
+
+    def set_model(self, model, preprocessor, version):
+        """
+        Gọi từ luồng chấm điểm khi đổi mô hình (chỉ ghi nhận, không sao chép booster ở luồng đó). Các cảnh báo
+        đã vào hàng đợi trước vẫn được giải thích bằng mô hình cũ; từ cảnh báo đầu tiên có
+        ml_ids.model_version == version, luồng giải thích sao chép booster mới và dùng nó.
+        """
+        self._pending_model = (model, preprocessor, version)
+
+    def explain(self, alerts):
+        """
+        Tính explanation cho một lô cảnh báo (đồng bộ, trong luồng gọi).
+        :return: Danh sách cảnh báo mới (bản sao nông) có ml_ids.explanation, cùng thứ tự.
+        """
+        pending = self._pending_model
+        if pending is not None:
+            for i, alert in enumerate(alerts):
+                if alert['ml_ids'].get('model_version') == pending[2]:
+                    explained = self._explain(alerts[:i]) if i else []
+                    self._pending_model = None
+                    self._load_model(pending[0], pending[1])
+                    return explained + self._explain(alerts[i:])
+        return self._explain(alerts)
+
+    def _load_model(self, model, preprocessor):
+        model = getattr(model, 'model', model) # CascadeModel: flow Malicious luôn do mô hình đầy đủ chấm điểm
+        booster = model.get_booster() if hasattr(model, 'get_booster') else model.booster
+        booster = booster.copy() # Bản riêng cho luồng nền, không dùng chung với luồng chấm điểm
+        booster.set_param({'nthread': 1})
+        if not isinstance(preprocessor, CompiledPreprocessor):
+            preprocessor = compile_preprocessor(preprocessor) or preprocessor
+        self.booster, self.iteration_range = booster, getattr(model, 'iteration_range', (0, 0))
+        self.preprocessor, self.features = preprocessor, _output_features(preprocessor)
+
+    def _explain(self, alerts):
+        import xgboost as xgb
+        features_batch = [alert['ml_ids']['nsl_kdd_features'] for alert in alerts]
+        X = self._transform(features_batch)
+        contribs = self.booster.predict(xgb.DMatrix(X), pred_contribs=True, iteration_range=self.iteration_range)
+        # Cột cuối là bias (giá trị kỳ vọng theo log-odds); lấy top_k đóng góp dương lớn nhất của mỗi flow
+        values = contribs[:, :-1]
+        k = min(self.top_k, values.shape[1])
+        top = np.argpartition(-values, k - 1, axis=1)[:, :k]
+        top_values = np.take_along_axis(values, top, axis=1)
+        order = np.argsort(-top_values, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1).tolist()
+        top_values = np.round(np.take_along_axis(top_values, order, axis=1), 6).tolist()
+        base_values = np.round(contribs[:, -1], 6).tolist()
+
+        explained = []
+        for alert, features, indices, contributions, base_value in zip(alerts, features_batch, top, top_values,
+                                                                        base_values):
+            top_features = []
+            for j, contribution in zip(indices, contributions):
+                name, column = self.features[j] if j < len(self.features) else (f"f{j}", None)
+                top_features.append({'feature': name, 'value': features.get(column) if column else None,
+                                     'contribution': contribution})
+            # Không sửa dict cảnh báo gốc: luồng ghi log có thể đang json.dumps nó
+            ml_ids = dict(alert['ml_ids'])
+            ml_ids['explanation'] = {'method': 'xgboost_pred_contribs', 'base_value': base_value,
+                                     'top_features': top_features}
+            explained.append({**alert, 'ml_ids': ml_ids})
+        return explained
+
+    def _transform(self, features_batch):
+        if isinstance(self.preprocessor, CompiledPreprocessor):
+            return self.preprocessor.transform_records(features_batch)
+        from src.preprocess import preprocess_features
+        X, _, _ = preprocess_features(pd.DataFrame(features_batch, columns=NSL_KDD_RELEVANT_COLUMNS),
+                                      preprocessor=self.preprocessor, fit=False, compiled=False)
+        return X
+
+    def _count(self, key, n):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _drain(self, limit):
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            try:
+                alert = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                if self._stop_event.is_set():
+                    return
+                continue
+            # Không chờ gom đủ lô: cảnh báo đang có được giải thích ngay, lô lớn dần khi cảnh báo dồn lại
+            alerts = [alert] + self._drain(self.batch_size - 1)
+            start = time.perf_counter()
+            try:
+                explained = self.explain(alerts)
+                self._count('explained', len(alerts))
+            except Exception as e:
+                logging.error(f"Lỗi khi giải thích {len(alerts)} cảnh báo, gửi không kèm giải thích: {e}", exc_info=True)
+                explained = alerts
+                self._count('unexplained', len(alerts))
+            self._count('batches', 1)
+            if self.metrics is not None:
+                self.metrics.observe_stage('explain', time.perf_counter() - start)
+            for alert in explained:
+                self.sink.send(alert)
+
+def _output_features(preprocessor):
+    """
+    Với mỗi cột đầu vào mô hình: (tên hiển thị, cột NSL-KDD gốc để lấy giá trị của flow).
+    Cột one-hot có tên 'cột=giá trị' và giá trị là giá trị thực của flow ở cột đó.
+    """
+    if isinstance(preprocessor, CompiledPreprocessor):
+        features = [(f"f{j}", None) for j in range(preprocessor.n_features_out)]
+        for j, column in zip(range(preprocessor.numeric_slice.start, preprocessor.numeric_slice.stop),
+                             preprocessor.numeric_columns):
+            features[j] = (column, column)
+        for column, lookup in zip(preprocessor.categorical_columns, preprocessor.category_lookups):
+            for value, j in lookup.items():
+                features[j] = (f"{column}={value}", column)
+        return features
+    try:
+        return [(name.split('__', 1)[-1], None) for name in preprocessor.get_feature_names_out()]
+    except Exception:
+        return [] # Không lấy được tên: dùng chỉ số cột (f<j>)
+
+def create_alert_explainer(sink, model=None, preprocessor=None, metrics=None):
+    """
+    AlertExplainer trước `sink` nếu EXPLAIN_ENABLED và có sink, không thì trả lại nguyên sink.
+    Thiếu model/preprocessor (tiến trình chính của chế độ nhiều worker) thì tự tải mô hình mặc định.
+    Không tạo được explainer thì ghi cảnh báo và dùng sink trực tiếp.
+    """
+    if not EXPLAIN_ENABLED or sink is None:
+        return sink
+    try:
+        if model is None:
+            from src.model_runtime import load_model
+            model = load_model(cascade=False, nthread=1)
+        if preprocessor is None:
+            import joblib
+            preprocessor = joblib.load(PREPROCESSOR_PATH)
+        return AlertExplainer(model, preprocessor, sink, metrics=metrics).start()
+    except Exception as e:
+        logging.error(f"Không thể khởi tạo AlertExplainer, cảnh báo sẽ không kèm giải thích: {e}")
+        return sink
@@ -0,0 +1,355 @@
+# src/alert_sink.py
+
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from src.config import (ALERT_SINK_TYPE, ELASTICSEARCH_HOSTS, ALERT_INDEX, ALERT_FILE_PATH,
+                        ALERT_QUEUE_SIZE, ALERT_BULK_SIZE, ALERT_FLUSH_INTERVAL_SEC,
+                        ALERT_MAX_RETRIES, ALERT_RETRY_BACKOFF_SEC, ALERT_RETRY_BACKOFF_MAX_SEC,
+                        ALERT_SPILL_PATH, ALERT_SPILL_BUFFER_SIZE, ALERT_SPILL_LOG_INTERVAL_SEC)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Mã HTTP của từng tài liệu trong phản hồi Bulk API đáng để thử lại (quá tải / tạm thời không sẵn sàng)
+RETRYABLE_BULK_STATUSES = (429, 502, 503, 504)
+
+class AlertSink:
+    """
+    Nơi nhận cảnh báo của stream_monitor, tách việc gửi cảnh báo khỏi vòng lặp chấm điểm.
+    send() chỉ đưa cảnh báo vào hàng đợi giới hạn trong bộ nhớ rồi trả về ngay; một luồng nền
+    gom cảnh báo thành lô (theo ALERT_BULK_SIZE hoặc ALERT_FLUSH_INTERVAL_SEC), ghi lô bằng
+    _write_bulk() và thử lại với thời gian chờ tăng dần khi lỗi. Cảnh báo không thể giữ
+    (hàng đợi đầy hoặc hết lượt thử lại) được ghi tràn ra file NDJSON thay vì bị mất; cảnh báo tràn do
+    hàng đợi đầy được luồng nền ghi ra đĩa theo lô, không mở file trên vòng lặp chấm điểm.
+    Lớp con chỉ cần cài đặt _open(), _write_bulk() và (tùy chọn) _close_backend().
+    """
+
+    name = 'alert'
+
+    def __init__(self, queue_size=ALERT_QUEUE_SIZE, bulk_size=ALERT_BULK_SIZE,
+                 flush_interval_sec=ALERT_FLUSH_INTERVAL_SEC, max_retries=ALERT_MAX_RETRIES,
+                 retry_backoff_sec=ALERT_RETRY_BACKOFF_SEC, retry_backoff_max_sec=ALERT_RETRY_BACKOFF_MAX_SEC,
+                 spill_path=ALERT_SPILL_PATH, spill_buffer_size=ALERT_SPILL_BUFFER_SIZE,
+                 spill_log_interval_sec=ALERT_SPILL_LOG_INTERVAL_SEC, metrics=None):
+        """
+        :param queue_size: Số cảnh báo tối đa chờ trong hàng đợi; vượt quá thì ghi tràn ra đĩa.
+        :param bulk_size: Số cảnh báo tối đa trong một lần ghi lô.
+        :param flush_interval_sec: Thời gian chờ tối đa của cảnh báo cũ nhất trước khi lô được ghi.
+        :param max_retries: Số lần thử lại một lô lỗi trước khi ghi tràn ra đĩa.
+        :param retry_backoff_sec: Thời gian chờ lần thử lại đầu tiên (nhân đôi sau mỗi lần).
+        :param retry_backoff_max_sec: Thời gian chờ tối đa giữa hai lần thử lại.
+        :param spill_path: File NDJSON nhận các cảnh báo không gửi được.
+        :param spill_buffer_size: Số cảnh báo tràn tối đa chờ luồng nền ghi ra đĩa; đầy thì send() tự ghi cả bộ đệm.
+        :param spill_log_interval_sec: Khoảng thời gian tối thiểu giữa hai dòng log tổng hợp số cảnh báo đã ghi tràn.
+        :param metrics: MonitorMetrics nhận thời gian ghi mỗi lô (bước 'sink'), None để không đo.
+        """
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.bulk_size = max(1, bulk_size)
+        self.flush_interval_sec = flush_interval_sec
+        self.max_retries = max_retries
+        self.retry_backoff_sec = retry_backoff_sec
+        self.retry_backoff_max_sec = retry_backoff_max_sec
+        self.spill_path = spill_path
+        self.spill_buffer_size = max(1, spill_buffer_size)
+        self.spill_log_interval_sec = spill_log_interval_sec
+        self.metrics = metrics
+
+        self.stats = {'queued': 0, 'written': 0, 'spilled': 0, 'retries': 0}
+        self._stats_lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        self._overflow = [] # Cảnh báo tràn do hàng đợi đầy, chờ luồng nền ghi ra đĩa
+        self._overflow_lock = threading.Lock()
+        self._spilled_since_log = {} # lý do -> số cảnh báo ghi tràn kể từ dòng log tổng hợp gần nhất
+        self._last_spill_log = time.monotonic()
+        self._stop_event = threading.Event()
+        self._abort_event = threading.Event() # close() hết thời gian chờ: bỏ thử lại, ghi tràn ngay
+        self._thread = None
+        self._opened = False
+
+    # --- Giao diện cho stream_monitor ---
+
+    def start(self):
+        """Khởi động luồng ghi nền (kết nối tới backend diễn ra trong luồng này, không chặn nơi gọi)."""
+        if self._thread is not None:
+            return self
+        self._stop_event.clear()
+        self._abort_event.clear()
+        self._thread = threading.Thread(target=self._run, name=f"{self.name}-sink-writer", daemon=True)
+        self._thread.start()
+        logging.info(f"Đã khởi động {type(self).__name__}: hàng đợi {self.queue.maxsize}, "
+                     f"lô {self.bulk_size} cảnh báo hoặc {self.flush_interval_sec}s.")
+        return self
+
+    def send(self, alert):
+        """
+        Đưa một cảnh báo vào hàng đợi mà không chờ ghi.
+        :return: True nếu đã vào hàng đợi, False nếu hàng đợi đầy và cảnh báo sẽ được ghi tràn ra đĩa.
+        """
+        try:
+            self.queue.put_nowait(alert)
+        except queue.Full:
+            with self._overflow_lock:
+                self._overflow.append(alert)
+                overflow = None
+                if len(self._overflow) >= self.spill_buffer_size:
+                    # Luồng ghi đang kẹt ở backend: tự ghi cả bộ đệm trong một lần mở file
+                    overflow, self._overflow = self._overflow, []
+            self._spill(overflow, reason="hàng đợi đầy")
+            return False
+        self._count('queued', 1)
+        return True
+
+    def close(self, timeout=10.0):
+        """Dừng luồng ghi sau khi đã xả hết hàng đợi (cảnh báo còn sót được ghi tràn ra đĩa)."""
+        if self._thread is None:
+            self._spill_overflow()
+            self._log_spilled(force=True)
+            return
+        self._stop_event.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            # Backend vẫn lỗi: dừng thử lại, phần còn lại được ghi tràn ra đĩa
+            logging.warning(f"Luồng ghi cảnh báo chưa xong sau {timeout}s, ghi tràn các cảnh báo còn lại ra đĩa.")
+            self._abort_event.set()
+            self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.warning("Luồng ghi cảnh báo vẫn chưa dừng, một số cảnh báo có thể chưa được ghi.")
+        else:
+            # Cảnh báo được đưa vào sau khi luồng ghi đã thoát: không còn ai gửi, ghi tràn ra đĩa
+            leftover = self._drain(self.queue.qsize())
+            if leftover:
+                self._spill(leftover, reason="sink đã đóng")
+            self._spill_overflow()
+        self._log_spilled(force=True)
+        self._thread = None
+        self._close_backend()
+        self._opened = False
+        logging.info(f"Đã đóng {type(self).__name__}: {self.stats}")
+
+    # --- Phần lớp con cài đặt ---
+
+    def _open(self):
+        """Kết nối/chuẩn bị backend. Được gọi trong luồng ghi trước lần ghi đầu tiên."""
+
+    def _write_bulk(self, alerts):
+        """
+        Ghi một lô cảnh báo.
+        :return: Danh sách cảnh báo cần thử lại (rỗng nếu ghi xong). Ném ngoại lệ nếu cả lô thất bại.
+        """
+        raise NotImplementedError
+
+    def _close_backend(self):
+        """Giải phóng tài nguyên backend."""
+
+    # --- Luồng ghi nền ---
+
+    def _count(self, key, n):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def _drain(self, limit):
+        """Lấy tối đa limit cảnh báo đang có trong hàng đợi mà không chờ."""
+        items = []
+        while len(items) < limit:
+            try:
+                items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        buffer = []
+        deadline = None # Thời điểm lô hiện tại phải được ghi (tính từ cảnh báo đầu tiên trong lô)
+        while True:
+            stopping = self._stop_event.is_set()
+            timeout = 0.1 if deadline is None else max(0.0, min(0.1, deadline - time.monotonic()))
+            try:
+                alert = self.queue.get(timeout=timeout)
+                if not buffer:
+                    deadline = time.monotonic() + self.flush_interval_sec
+                buffer.append(alert)
+                buffer.extend(self._drain(self.bulk_size - len(buffer)))
+            except queue.Empty:
+                pass
+
+            if buffer and (len(buffer) >= self.bulk_size or stopping or time.monotonic() >= deadline):
+                if self._abort_event.is_set():
+                    self._spill(buffer, reason="sink bị dừng khi backend còn lỗi")
+                else:
+                    self._flush(buffer)
+                buffer = []
+                deadline = None
+
+            self._spill_overflow()
+            self._log_spilled()
+            if stopping and not buffer and self.queue.empty():
+                return
+
+    def _flush(self, alerts):
+        """Ghi một lô, thử lại phần lỗi với thời gian chờ tăng theo cấp số nhân; hết lượt thì ghi tràn ra đĩa."""
+        pending = alerts
+        attempt = 0
+        start = time.perf_counter()
+        while True:
+            try:
+                # Kết nối muộn ở lần ghi đầu tiên; kết nối lỗi được thử lại như một lần ghi lỗi
+                if not self._opened:
+                    self._open()
+                    self._opened = True
+                pending = self._write_bulk(pending)
+                error = None
+            except Exception as e:
+                error = e
+            if error is None:
+                self._count('written', len(alerts) - len(pending))
+                alerts = pending
+                if not pending:
+                    logging.debug(f"Đã ghi lô cảnh báo qua {type(self).__name__}.")
+                    if self.metrics is not None:
+                        self.metrics.observe_stage('sink', time.perf_counter() - start)
+                    return
+
+            attempt += 1
+            if attempt > self.max_retries or self._abort_event.is_set():
+                logging.warning(f"Bỏ gửi {len(pending)} cảnh báo sau {attempt - 1} lần thử lại "
+                                f"({error or 'một phần lô bị từ chối'}), ghi tràn ra {self.spill_path}.")
+                self._spill(pending, reason="hết lượt thử lại")
+                return
+            delay = min(self.retry_backoff_max_sec, self.retry_backoff_sec * (2 ** (attempt - 1)))
+            logging.warning(f"Ghi {len(pending)} cảnh báo thất bại (lần {attempt}/{self.max_retries}): "
+                            f"{error or 'một phần lô bị từ chối'}. Thử lại sau {delay:.2f}s.")
+            self._count('retries', 1)
+            self._abort_event.wait(delay)
+
+    def _spill_overflow(self):
+        """Ghi các cảnh báo tràn do hàng đợi đầy ra đĩa trong một lần mở file."""
+        with self._overflow_lock:
+            overflow, self._overflow = self._overflow, []
+        self._spill(overflow, reason="hàng đợi đầy")
+
+    def _log_spilled(self, force=False):
+        """Log một dòng tổng hợp số cảnh báo đã ghi tràn theo lý do, tối đa một lần mỗi spill_log_interval_sec."""
+        now = time.monotonic()
+        if not force and now - self._last_spill_log < self.spill_log_interval_sec:
+            return
+        with self._stats_lock:
+            spilled, self._spilled_since_log = self._spilled_since_log, {}
+        self._last_spill_log = now
+        if spilled:
+            reasons = ', '.join(f"{reason}: {count}" for reason, count in spilled.items())
+            logging.warning(f"Đã ghi tràn {sum(spilled.values())} cảnh báo ra {self.spill_path} ({reasons}).")
+
+    def _spill(self, alerts, reason):
+        """Ghi nối các cảnh báo vào file NDJSON tràn (mỗi dòng một cảnh báo); số lượng được log tổng hợp định kỳ."""
+        if not alerts:
+            return
+        lines = ''.join(json.dumps(alert, default=str, ensure_ascii=False) + '\n' for alert in alerts)
+        try:
+            with self._spill_lock:
+                spill_dir = os.path.dirname(self.spill_path)
+                if spill_dir:
+                    os.makedirs(spill_dir, exist_ok=True)
+                with open(self.spill_path, 'a', encoding='utf-8') as spill_file:
+                    spill_file.write(lines)
+            with self._stats_lock:
+                self.stats['spilled'] += len(alerts)
+                self._spilled_since_log[reason] = self._spilled_since_log.get(reason, 0) + len(alerts)
+        except OSError as e:
+            logging.error(f"Không thể ghi tràn {len(alerts)} cảnh báo ra {self.spill_path}: {e}. Cảnh báo bị mất.")
+
+class ElasticsearchAlertSink(AlertSink):
+    """Gửi cảnh báo vào Elasticsearch bằng Bulk API; chỉ tài liệu bị từ chối tạm thời (429/5xx) được gửi lại."""
+
+    name = 'elasticsearch'
+
+    def __init__(self, hosts=None, index=ALERT_INDEX, **kwargs):
+        """
+        :param hosts: Danh sách node Elasticsearch (mặc định ELASTICSEARCH_HOSTS).
+        :param index: Index nhận cảnh báo.
+        """
+        super().__init__(**kwargs)
+        self.hosts = hosts or ELASTICSEARCH_HOSTS
+        self.index = index
+        self.client = None
+
+    def _open(self):
+        # Import và kết nối muộn: tải module stream_monitor không còn cần Elasticsearch đang chạy
+        from elasticsearch import Elasticsearch
+        client = Elasticsearch(self.hosts)
+        client.info() # Kiểm tra kết nối
+        self.client = client
+        logging.info("Đã kết nối thành công tới Elasticsearch.")
+
+    def _write_bulk(self, alerts):
+        operations = []
+        for alert in alerts:
+            operations.append({'index': {'_index': self.index}})
+            operations.append(alert)
+        response = self.client.bulk(operations=operations)
+        if not response.get('errors'):
+            return []
+
+        retry = []
+        rejected = []
+        for alert, item in zip(alerts, response['items']):
+            result = next(iter(item.values()))
+            status = result.get('status', 0)
+            if status in RETRYABLE_BULK_STATUSES:
+                retry.append(alert)
+            elif status >= 300:
+                rejected.append(alert)
+                logging.error(f"Elasticsearch từ chối cảnh báo (status {status}): {result.get('error')}")
+        # Lỗi không thể thử lại (mapping, dữ liệu sai...): giữ lại trên đĩa để xem xét
+        self._spill(rejected, reason="bị Elasticsearch từ chối")
+        if rejected:
+            self._count('written', -len(rejected))
+        return retry
+
+    def _close_backend(self):
+        if self.client is not None:
+            self.client.close()
+            self.client = None
+
+class FileAlertSink(AlertSink):
+    """Ghi cảnh báo dạng NDJSON ra file cục bộ; dùng khi không có cluster (thử nghiệm, replay, benchmark)."""
+
+    name = 'file'
+
+    def __init__(self, path=ALERT_FILE_PATH, **kwargs):
+        """:param path: File NDJSON nhận cảnh báo (ghi nối)."""
+        super().__init__(**kwargs)
+        self.path = path
+        self._file = None
+
+    def _open(self):
+        out_dir = os.path.dirname(self.path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        logging.info(f"Cảnh báo sẽ được ghi vào {self.path}.")
+
+    def _write_bulk(self, alerts):
+        self._file.write(''.join(json.dumps(alert, default=str, ensure_ascii=False) + '\n' for alert in alerts))
+        self._file.flush()
+        return []
+
+    def _close_backend(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def create_alert_sink(sink_type=ALERT_SINK_TYPE, **kwargs):
+    """
+    Tạo sink cảnh báo theo cấu hình (chưa khởi động; gọi start() trước khi send()).
+    :param sink_type: 'elasticsearch' hoặc 'file'.
+    """
+    sink_type = (sink_type or '').lower()
+    if sink_type in ('elasticsearch', 'es'):
+        return ElasticsearchAlertSink(**kwargs)
+    if sink_type == 'file':
+        return FileAlertSink(**kwargs)
+    raise ValueError(f"Loại alert sink không được hỗ trợ: '{sink_type}'. Chọn 'elasticsearch' hoặc 'file'.")
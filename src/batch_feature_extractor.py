@@ -0,0 +1,286 @@
+# src/batch_feature_extractor.py
+
+import logging
+import numpy as np
+import pandas as pd
+
+from src.config import NSL_KDD_RELEVANT_COLUMNS, SERVICE_MAPPING, ZEEK_CONN_STATE_TO_NSL_FLAG, EXTRACTOR_MAX_WINDOW_FLOWS
+from src.preprocess import CATEGORICAL_FEATURE_COLUMNS
+from src.zeek_feature_extractor import SERROR_FLAGS, RERROR_FLAGS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Các đặc trưng content/binary mà conn.log không có: ZeekFeatureExtractor luôn đặt 0
+ZERO_INT_FEATURES = ['urgent', 'hot', 'num_failed_logins', 'logged_in', 'num_compromised', 'root_shell',
+                     'su_attempted', 'num_root', 'num_file_creations', 'num_shells', 'num_access_files',
+                     'num_outbound_cmds', 'is_host_login', 'is_guest_login', 'wrong_fragment']
+
+def window_group_counts(keys, window_start, weights=()):
+    """
+    Với mỗi hàng k, đếm các hàng j thuộc cửa sổ [window_start[k], k] có keys[j] == keys[k],
+    cùng tổng các trọng số (ví dụ cờ lỗi) của các hàng đó. Không có vòng lặp Python theo hàng:
+    sắp xếp ổn định theo khóa, mã hóa (khóa, chỉ số) thành một số int64 tăng dần rồi dùng
+    searchsorted để tìm đầu cửa sổ trong nhóm, tổng trọng số lấy từ cumsum theo thứ tự đã sắp xếp.
+    :param keys: Mảng int64 mã khóa nhóm (0..n-1), ví dụ mã host đích hoặc (host, dịch vụ).
+    :param window_start: Mảng chỉ số hàng đầu tiên của cửa sổ của từng hàng (<= chỉ số hàng).
+    :param weights: Các mảng trọng số (0/1) cần cộng trong cửa sổ.
+    :return: (counts, [tổng từng trọng số]) đều là mảng int64 độ dài n.
+    """
+    n = len(keys)
+    order = np.argsort(keys, kind='stable') # Theo khóa, trong nhóm giữ thứ tự hàng
+    position = np.empty(n, dtype=np.int64)
+    position[order] = np.arange(n, dtype=np.int64)
+    encoded = keys[order].astype(np.int64) * n + order
+    start = np.searchsorted(encoded, keys.astype(np.int64) * n + window_start, side='left')
+    counts = position - start + 1
+
+    sums = []
+    for weight in weights:
+        cumulative = np.concatenate(([0], np.cumsum(weight[order], dtype=np.int64)))
+        sums.append(cumulative[position + 1] - cumulative[start])
+    return counts, sums
+
+def map_services(service, proto, resp_p):
+    """
+    Dịch vụ NSL-KDD của từng flow như ZeekFeatureExtractor: cột service của Zeek, '-' thì ánh xạ theo cổng
+    đích (chỉ tcp/udp), không khớp là 'other'.
+    :param proto: Series giao thức đã chuyển chữ thường.
+    :return: Mảng object.
+    """
+    service = pd.Series(service, dtype=object)
+    unset = (service == '-').to_numpy()
+    if unset.any():
+        by_port = pd.Series(resp_p[unset]).map(SERVICE_MAPPING)
+        by_port = by_port.where(proto[unset].isin(['tcp', 'udp']).to_numpy(), None).fillna('other')
+        service[unset] = by_port.to_numpy()
+    return service.to_numpy(dtype=object)
+
+def _safe_ratio(numerator, denominator):
+    """numerator / denominator, 0 khi mẫu bằng 0 (mẫu ở đây luôn >= 1 vì cửa sổ chứa chính flow đó)."""
+    return np.divide(numerator, denominator, out=np.zeros(len(numerator), dtype=np.float64),
+                     where=denominator > 0)
+
+class BatchFeatureExtractor:
+    """
+    Bản vector hóa của ZeekFeatureExtractor cho dữ liệu lịch sử (replay, tạo tập huấn luyện).
+    Nhận từng lô flow dạng cột (ZeekConnBatch hoặc dict tên cột -> mảng) theo thứ tự trong log
+    và trả về DataFrame đặc trưng NSL-KDD giống hệt gọi process_zeek_log_entry từng dòng:
+    - cửa sổ thời gian của flow k gồm các flow j <= k có watermark_j >= watermark_k - time_window_sec
+      (watermark = ts lớn nhất tính tới flow đó; tìm bằng searchsorted vì watermark không giảm);
+    - cửa sổ host gồm host_window_count flow gần nhất (j > k - host_window_count);
+    - như ZeekFeatureExtractor khi quá tải, cửa sổ thời gian chỉ giữ max_window_flows flow mới nhất (j > k - max_window_flows).
+    Phần đuôi của lô trước mà các flow sau còn cần được giữ lại để cửa sổ nối liền giữa các lô.
+    """
+
+    def __init__(self, time_window_sec=2.0, host_window_count=100, max_window_flows=EXTRACTOR_MAX_WINDOW_FLOWS):
+        """
+        :param time_window_sec: Khoảng thời gian (giây) cho các đặc trưng time-based.
+        :param host_window_count: Số lượng kết nối gần nhất cho các đặc trưng host-based.
+        :param max_window_flows: Giới hạn cứng số flow trong cửa sổ thời gian, như ZeekFeatureExtractor.
+        """
+        self.time_window_sec = time_window_sec
+        self.host_window_count = host_window_count
+        self.max_window_flows = max(1, max_window_flows)
+        self._carry = None # Các cột (dest, service, watermark, serror, rerror) của phần đuôi lô trước
+        logging.info(f"Khởi tạo BatchFeatureExtractor với time_window={time_window_sec}s, host_window={host_window_count} flows, "
+                     f"tối đa {self.max_window_flows} flow trong cửa sổ thời gian.")
+
+    @staticmethod
+    def _column(batch, name, default):
+        column = batch.column(name) if hasattr(batch, 'column') else batch.get(name)
+        return default if column is None else np.asarray(column)
+
+    def transform(self, batch):
+        """
+        :param batch: ZeekConnBatch (hoặc dict tên cột conn.log -> mảng đã chuyển kiểu) theo thứ tự log.
+        :return: DataFrame các cột NSL_KDD_RELEVANT_COLUMNS, mỗi hàng ứng với một flow của lô.
+        """
+        n = len(batch) if hasattr(batch, 'column') else len(next(iter(batch.values())))
+        if n == 0:
+            return pd.DataFrame(columns=NSL_KDD_RELEVANT_COLUMNS)
+
+        ts = self._column(batch, 'ts', None).astype(np.float64)
+        proto = pd.Series(self._column(batch, 'proto', np.full(n, 'unknown', dtype=object))).str.lower()
+        resp_p = self._column(batch, 'id.resp_p', np.zeros(n, dtype=np.int64))
+        orig_p = self._column(batch, 'id.orig_p', np.zeros(n, dtype=np.int64))
+        resp_h = self._column(batch, 'id.resp_h', np.full(n, None, dtype=object))
+        orig_h = self._column(batch, 'id.orig_h', np.full(n, None, dtype=object))
+
+        service = map_services(self._column(batch, 'service', np.full(n, '-', dtype=object)), proto, resp_p)
+        flag = pd.Series(self._column(batch, 'conn_state', np.full(n, 'OTH', dtype=object))) \
+            .map(ZEEK_CONN_STATE_TO_NSL_FLAG).fillna('OTH')
+
+        serror = flag.isin(SERROR_FLAGS).to_numpy().astype(np.int64)
+        rerror = flag.isin(RERROR_FLAGS).to_numpy().astype(np.int64)
+        window = self._window_features(ts, resp_h, service, serror, rerror, orig_h, orig_p)
+
+        features = {
+            'duration': self._column(batch, 'duration', np.zeros(n)).astype(np.float64),
+            'protocol_type': proto.to_numpy(dtype=object),
+            'service': service,
+            'flag': flag.to_numpy(dtype=object),
+            'src_bytes': self._column(batch, 'orig_bytes', np.zeros(n, dtype=np.int64)).astype(np.int64),
+            'dst_bytes': self._column(batch, 'resp_bytes', np.zeros(n, dtype=np.int64)).astype(np.int64),
+            'land': ((orig_h == resp_h) & (orig_p == resp_p)).astype(np.int64),
+            'outcome': np.full(n, 'normal', dtype=object),
+        }
+        features.update(window)
+        zeros = np.zeros(n, dtype=np.int64)
+        for col in ZERO_INT_FEATURES:
+            features[col] = zeros
+
+        columns = {}
+        for col in NSL_KDD_RELEVANT_COLUMNS:
+            if col in features:
+                columns[col] = features[col]
+            elif col in CATEGORICAL_FEATURE_COLUMNS or col == 'outcome':
+                columns[col] = np.full(n, 'unknown', dtype=object)
+            else:
+                columns[col] = np.zeros(n, dtype=np.float64)
+        return pd.DataFrame(columns, columns=NSL_KDD_RELEVANT_COLUMNS)
+
+    def _window_features(self, ts, dest, service, serror, rerror, source, src_port):
+        """Tính các đặc trưng cửa sổ thời gian và cửa sổ host cho lô (nối với phần đuôi lô trước)."""
+        n = len(ts)
+        carry = self._carry
+        if carry is not None:
+            m = len(carry['watermark'])
+            # watermark của phần đuôi đã đúng (không giảm), nối tiếp bằng ts mới rồi lấy max tích lũy
+            watermark = np.maximum.accumulate(np.concatenate((carry['watermark'], ts)))
+            dest = np.concatenate((carry['dest'], dest))
+            service = np.concatenate((carry['service'], service))
+            serror = np.concatenate((carry['serror'], serror))
+            rerror = np.concatenate((carry['rerror'], rerror))
+            source = np.concatenate((carry['source'], source))
+            src_port = np.concatenate((carry['src_port'], src_port))
+        else:
+            m = 0
+            watermark = np.maximum.accumulate(ts)
+        total = m + n
+        index = np.arange(total, dtype=np.int64)
+
+        dest_codes = pd.factorize(dest)[0].astype(np.int64)
+        service_codes = pd.factorize(service)[0].astype(np.int64)
+        srv_codes = pd.factorize(dest_codes * (service_codes.max() + 1) + service_codes)[0].astype(np.int64)
+        source_codes = pd.factorize(source)[0].astype(np.int64)
+        port_codes = pd.factorize(dest_codes * 65536 + src_port.astype(np.int64))[0].astype(np.int64)
+        srv_src_codes = pd.factorize(srv_codes * (source_codes.max() + 2) + source_codes + 1)[0].astype(np.int64)
+
+        time_start = np.maximum(np.searchsorted(watermark, watermark - self.time_window_sec, side='left'),
+                                index - (self.max_window_flows - 1))
+        host_start = np.maximum(index - (self.host_window_count - 1), 0)
+
+        count, (serror_count, rerror_count) = window_group_counts(dest_codes, time_start, (serror, rerror))
+        srv_count, (srv_serror, srv_rerror) = window_group_counts(srv_codes, time_start, (serror, rerror))
+        host_count, (host_serror, host_rerror) = window_group_counts(dest_codes, host_start, (serror, rerror))
+        host_srv_count, (host_srv_serror, host_srv_rerror) = window_group_counts(srv_codes, host_start, (serror, rerror))
+        service_count, _ = window_group_counts(service_codes, time_start) # Cùng dịch vụ, mọi host đích
+        same_port_count, _ = window_group_counts(port_codes, host_start)
+        same_source_count, _ = window_group_counts(srv_src_codes, host_start)
+
+        # Giữ phần đuôi mà các flow của lô sau còn có thể thấy trong cửa sổ
+        keep_from = min(max(int(np.searchsorted(watermark, watermark[-1] - self.time_window_sec, side='left')),
+                            total - (self.max_window_flows - 1)),
+                        max(0, total - (self.host_window_count - 1)))
+        self._carry = {'watermark': watermark[keep_from:], 'dest': dest[keep_from:], 'service': service[keep_from:],
+                       'serror': serror[keep_from:], 'rerror': rerror[keep_from:],
+                       'source': source[keep_from:], 'src_port': src_port[keep_from:]}
+
+        new = slice(m, total)
+        count, srv_count = count[new], srv_count[new]
+        host_count, host_srv_count = host_count[new], host_srv_count[new]
+        service_count = service_count[new]
+        return {
+            'count': count,
+            'srv_count': srv_count,
+            'serror_rate': _safe_ratio(serror_count[new], count),
+            'srv_serror_rate': _safe_ratio(srv_serror[new], srv_count),
+            'rerror_rate': _safe_ratio(rerror_count[new], count),
+            'srv_rerror_rate': _safe_ratio(srv_rerror[new], srv_count),
+            'same_srv_rate': _safe_ratio(srv_count, count),
+            'diff_srv_rate': _safe_ratio(count - srv_count, count),
+            'srv_diff_host_rate': _safe_ratio(service_count - srv_count, service_count),
+            'dst_host_count': host_count,
+            'dst_host_srv_count': host_srv_count,
+            'dst_host_same_srv_rate': _safe_ratio(host_srv_count, host_count),
+            'dst_host_diff_srv_rate': _safe_ratio(host_count - host_srv_count, host_count),
+            'dst_host_same_src_port_rate': _safe_ratio(same_port_count[new], host_count),
+            'dst_host_srv_diff_host_rate': _safe_ratio(host_srv_count - same_source_count[new], host_srv_count),
+            'dst_host_serror_rate': _safe_ratio(host_serror[new], host_count),
+            'dst_host_srv_serror_rate': _safe_ratio(host_srv_serror[new], host_srv_count),
+            'dst_host_rerror_rate': _safe_ratio(host_rerror[new], host_count),
+            'dst_host_srv_rerror_rate': _safe_ratio(host_srv_rerror[new], host_srv_count),
+        }
+
+class WindowGroupCounter:
+    """
+    Số flow cùng nhóm (tính cả chính flow đó) trong cửa sổ thời gian của từng flow, với cùng giới hạn
+    max_window_flows flow mới nhất như ZeekFeatureExtractor. Nhận mọi flow của luồng theo thứ tự, tự đánh số
+    flow và giữ (watermark, số thứ tự) của các flow còn trong cửa sổ theo từng nhóm; mỗi lô chỉ tốn
+    searchsorted trên các mảng này (không sắp xếp lại phần đuôi).
+    """
+
+    def __init__(self, time_window_sec=2.0, max_window_flows=EXTRACTOR_MAX_WINDOW_FLOWS):
+        self.time_window_sec = time_window_sec
+        self.max_window_flows = max(1, max_window_flows)
+        self._seq = 0 # Số thứ tự của flow kế tiếp
+        self._carry = {} # nhóm -> (mảng watermark, mảng số thứ tự) không giảm của các flow còn trong cửa sổ
+
+    def counts(self, groups, watermarks):
+        """
+        :param groups: Mảng nhóm của từng flow trong lô (giá trị bất kỳ pd.factorize nhận được).
+        :param watermarks: Watermark toàn cục của từng flow trong lô (không giảm).
+        :return: Mảng int64 số flow cùng nhóm trong cửa sổ.
+        """
+        n = len(watermarks)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        seqs = np.arange(self._seq, self._seq + n, dtype=np.int64)
+        self._seq += n
+
+        counts = np.empty(n, dtype=np.int64)
+        codes, uniques = pd.factorize(groups)
+        for code, name in enumerate(uniques):
+            index = np.flatnonzero(codes == code)
+            current_watermarks, current_seqs = watermarks[index], seqs[index]
+            carry = self._carry.get(name)
+            if carry is not None:
+                current_watermarks = np.concatenate((carry[0], current_watermarks))
+                current_seqs = np.concatenate((carry[1], current_seqs))
+            # Flow trước cùng nhóm còn trong cả cửa sổ thời gian lẫn max_window_flows flow gần nhất + chính flow đó
+            start = np.maximum(np.searchsorted(current_watermarks, watermarks[index] - self.time_window_sec, side='left'),
+                               np.searchsorted(current_seqs, seqs[index] - (self.max_window_flows - 1), side='left'))
+            counts[index] = np.arange(len(current_seqs) - len(index) + 1, len(current_seqs) + 1) - start
+            self._carry[name] = (current_watermarks, current_seqs)
+
+        horizon = watermarks[-1] - self.time_window_sec
+        oldest = self._seq - (self.max_window_flows - 1) # Số thứ tự nhỏ nhất mà flow kế tiếp còn thấy
+        for name, (carry_watermarks, carry_seqs) in list(self._carry.items()):
+            start = max(int(np.searchsorted(carry_watermarks, horizon, side='left')),
+                        int(np.searchsorted(carry_seqs, oldest, side='left')))
+            if start == len(carry_seqs):
+                del self._carry[name]
+            elif start:
+                self._carry[name] = (carry_watermarks[start:], carry_seqs[start:])
+        return counts
+
+class ServiceWindowCounter(WindowGroupCounter):
+    """
+    Số flow cùng dịch vụ (mọi host đích, tính cả chính flow đó) trong cửa sổ thời gian của từng flow,
+    cho tiến trình đọc của chế độ nhiều worker: worker chỉ thấy các host đích của shard mình nên không tự
+    đếm được srv_diff_host_rate.
+    """
+
+    def counts(self, columns, watermarks):
+        """
+        :param columns: dict tên cột conn.log -> mảng của lô (như ShardedFlowBatcher gửi cho worker).
+        :param watermarks: Watermark toàn cục của từng flow trong lô (không giảm).
+        :return: Mảng int64 service_count cho process_zeek_log_entry.
+        """
+        n = len(watermarks)
+        if n == 0:
+            return np.zeros(0, dtype=np.int64)
+        proto = pd.Series(columns.get('proto', np.full(n, 'unknown', dtype=object))).str.lower()
+        resp_p = np.asarray(columns.get('id.resp_p', np.zeros(n, dtype=np.int64)))
+        service = map_services(columns.get('service', np.full(n, '-', dtype=object)), proto, resp_p)
+        return super().counts(service, watermarks)
@@ -0,0 +1,167 @@
+# src/cascade.py
+"""
+Chấm điểm hai tầng: một bộ lọc trước rất rẻ (hồi quy logistic trên ma trận đầu ra của preprocessor, huấn luyện
+cùng lúc với mô hình chính) chạy trên mọi flow; flow có điểm của bộ lọc dưới ngưỡng được coi là Normal ngay
+(bỏ qua XGBoost), chỉ các flow còn lại mới được chấm điểm bằng mô hình đầy đủ.
+Bộ lọc chỉ là một phép nhân ma trận thưa với vector hệ số: không có chi phí cố định mỗi lần gọi như
+Booster.inplace_predict (cỡ vài trăm micro giây), nên có lợi cả với lô nhỏ của chế độ live.
+Ngưỡng được chọn trên tập validation sao cho tỉ lệ flow tấn công bị bộ lọc bỏ qua không vượt quá
+ngân sách false negative (CASCADE_FN_BUDGET) và được lưu cùng hệ số trong file .npz của bộ lọc.
+"""
+
+import logging
+import os
+
+import numpy as np
+
+from src.config import CASCADE_MODEL_PATH, CASCADE_FN_BUDGET, CASCADE_PREFILTER_C, TRAIN_VALIDATION_SIZE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+class LinearPrefilter:
+    """Hồi quy logistic đã huấn luyện, dự đoán bằng NumPy/scipy với cùng giao diện predict_proba như BoosterModel."""
+
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=np.float64).reshape(-1)
+        self.intercept = float(intercept)
+
+    @classmethod
+    def from_estimator(cls, estimator):
+        """Lấy hệ số từ sklearn LogisticRegression nhị phân."""
+        return cls(estimator.coef_[0], estimator.intercept_[0])
+
+    def set_params(self, n_jobs=None, **params):
+        return self
+
+    def decision_function(self, X):
+        return np.asarray(X @ self.coef).reshape(-1) + self.intercept
+
+    def predict_proba(self, X):
+        from scipy.special import expit # sigmoid không tràn số với điểm rất lớn
+        proba = expit(self.decision_function(X))
+        return np.column_stack((1.0 - proba, proba))
+
+class CascadeModel:
+    """
+    Cùng giao diện predict_proba/predict/set_params như BoosterModel.
+    Flow bị bộ lọc loại (điểm < threshold, luôn <= 0.5) giữ xác suất của bộ lọc nên vẫn có nhãn Normal.
+    """
+
+    def __init__(self, prefilter, model, threshold):
+        """
+        :param prefilter: LinearPrefilter (hoặc mô hình bất kỳ có predict_proba).
+        :param model: Mô hình đầy đủ (BoosterModel).
+        :param threshold: Flow có xác suất Malicious của bộ lọc nhỏ hơn ngưỡng này không qua mô hình đầy đủ.
+        """
+        self.prefilter = prefilter
+        self.model = model
+        self.threshold = min(float(threshold), 0.5)
+        self.stats = {'flows': 0, 'short_circuited': 0}
+
+    def set_params(self, n_jobs=None, **params):
+        self.prefilter.set_params(n_jobs=n_jobs, **params)
+        self.model.set_params(n_jobs=n_jobs, **params)
+        return self
+
+    @property
+    def short_circuit_rate(self):
+        """Tỉ lệ flow được bộ lọc kết luận Normal kể từ lúc tải."""
+        return self.stats['short_circuited'] / self.stats['flows'] if self.stats['flows'] else 0.0
+
+    def score(self, X):
+        """
+        :return: (xác suất Malicious của từng flow, số flow bỏ qua mô hình đầy đủ).
+        """
+        proba = self.prefilter.predict_proba(X)[:, 1]
+        uncertain = np.flatnonzero(proba >= self.threshold)
+        if len(uncertain) == len(proba):
+            proba = self.model.predict_proba(X)[:, 1]
+        elif len(uncertain):
+            proba[uncertain] = self.model.predict_proba(X[uncertain])[:, 1]
+        short_circuited = len(proba) - len(uncertain)
+        self.stats['flows'] += len(proba)
+        self.stats['short_circuited'] += short_circuited
+        return proba, short_circuited
+
+    def predict_proba(self, X):
+        proba = self.score(X)[0]
+        return np.column_stack((1.0 - proba, proba))
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(np.int64)
+
+def choose_threshold(scores, y, fn_budget=CASCADE_FN_BUDGET):
+    """
+    Ngưỡng lớn nhất (không quá 0.5) sao cho tỉ lệ flow tấn công (y = 1) có điểm dưới ngưỡng <= fn_budget.
+    :param scores: Xác suất Malicious của bộ lọc trên tập validation.
+    """
+    attack_scores = np.sort(np.asarray(scores, dtype=np.float64)[np.asarray(y) == 1])
+    if len(attack_scores) == 0:
+        return 0.0
+    allowed = int(np.floor(fn_budget * len(attack_scores))) # Số flow tấn công được phép bỏ lọt
+    # Mọi điểm < attack_scores[allowed] bị bỏ qua: đúng `allowed` flow tấn công (hoặc ít hơn nếu điểm trùng nhau)
+    return float(min(attack_scores[min(allowed, len(attack_scores) - 1)], 0.5))
+
+def train_prefilter(X_train, y_train, fn_budget=CASCADE_FN_BUDGET, C=CASCADE_PREFILTER_C,
+                    validation_size=TRAIN_VALIDATION_SIZE):
+    """
+    Huấn luyện bộ lọc trước trên phần lớn tập train và chọn ngưỡng trên phần validation tách phân tầng.
+    :return: (LinearPrefilter, ngưỡng, báo cáo trên tập validation như cascade_report).
+    """
+    from sklearn.linear_model import LogisticRegression
+    from sklearn.model_selection import train_test_split
+    y_train = np.asarray(y_train)
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, y_train, test_size=validation_size,
+                                                  stratify=y_train, random_state=42)
+    estimator = LogisticRegression(C=C, max_iter=1000)
+    estimator.fit(X_fit, y_fit)
+    prefilter = LinearPrefilter.from_estimator(estimator)
+    scores = prefilter.predict_proba(X_val)[:, 1]
+    threshold = choose_threshold(scores, y_val, fn_budget)
+    return prefilter, threshold, cascade_report(scores, threshold, y_val)
+
+def cascade_report(prefilter_scores, threshold, y, full_proba=None):
+    """
+    Chỉ số của cascade trên một tập có nhãn.
+    :param full_proba: Xác suất của mô hình đầy đủ trên cùng tập (nếu có): tính thêm số false negative
+                       mà cascade thêm vào (tấn công mô hình đầy đủ bắt được nhưng bộ lọc đã bỏ qua).
+    :return: dict short_circuit_rate, attack_miss_rate (tỉ lệ flow tấn công bị bộ lọc bỏ qua)
+             và, khi có full_proba, added_false_negatives, recall, cascade_recall.
+    """
+    y = np.asarray(y)
+    cleared = np.asarray(prefilter_scores) < threshold
+    attacks = max(int((y == 1).sum()), 1)
+    report = {
+        'threshold': float(threshold),
+        'short_circuit_rate': float(cleared.mean()) if len(cleared) else 0.0,
+        'attack_miss_rate': float((cleared & (y == 1)).sum() / attacks),
+    }
+    if full_proba is not None:
+        detected = np.asarray(full_proba) > 0.5
+        report['added_false_negatives'] = int((cleared & detected & (y == 1)).sum())
+        report['recall'] = float((detected & (y == 1)).sum() / attacks)
+        report['cascade_recall'] = float((detected & ~cleared & (y == 1)).sum() / attacks)
+    return report
+
+def export_prefilter(prefilter, threshold, fn_budget=CASCADE_FN_BUDGET, path=CASCADE_MODEL_PATH):
+    """Lưu hệ số của bộ lọc cùng ngưỡng và ngân sách FN vào một file .npz."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as f: # Mở file trước để np.savez không tự thêm đuôi .npz
+        np.savez(f, coef=prefilter.coef, intercept=prefilter.intercept, threshold=threshold, fn_budget=fn_budget)
+    return path
+
+def load_cascade(model, path=CASCADE_MODEL_PATH):
+    """
+    Bọc mô hình đầy đủ bằng CascadeModel nếu có file bộ lọc; không có thì trả lại nguyên mô hình.
+    :raises KeyError: Nếu file không phải do export_prefilter lưu.
+    """
+    if not os.path.exists(path):
+        logging.info(f"Chưa có bộ lọc cascade {path} (chạy lại huấn luyện để tạo), chấm điểm mọi flow bằng mô hình đầy đủ.")
+        return model
+    with np.load(path) as data:
+        prefilter = LinearPrefilter(data['coef'], data['intercept'])
+        threshold, fn_budget = float(data['threshold']), float(data['fn_budget'])
+    logging.info(f"Đã tải bộ lọc cascade {path}: ngưỡng {threshold:.4g} (ngân sách FN {fn_budget:.2%}).")
+    return CascadeModel(prefilter, model, threshold)
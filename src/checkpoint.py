@@ -0,0 +1,116 @@
+# src/checkpoint.py
+
+import json
+import logging
+import os
+import tempfile
+import time
+
+from src.config import CHECKPOINT_PATH, CHECKPOINT_INTERVAL_SEC
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+def file_identity(path_or_fd):
+    """Trả về (st_dev, st_ino) của một đường dẫn hoặc file descriptor, None nếu file không tồn tại."""
+    try:
+        st = os.fstat(path_or_fd) if isinstance(path_or_fd, int) else os.stat(path_or_fd)
+    except OSError:
+        return None
+    return (st.st_dev, st.st_ino)
+
+def find_file_by_identity(directory, identity):
+    """
+    Tìm file trong thư mục có cùng (dev, inode), ví dụ conn.log đã bị đổi tên khi Zeek xoay log.
+    :return: Đường dẫn file hoặc None nếu không còn (đã bị nén/chuyển đi/xóa).
+    """
+    if identity is None:
+        return None
+    try:
+        entries = list(os.scandir(directory))
+    except OSError:
+        return None
+    for entry in entries:
+        try:
+            if entry.is_file() and file_identity(entry.path) == tuple(identity):
+                return entry.path
+        except OSError:
+            continue
+    return None
+
+class OffsetCheckpoint:
+    """
+    Lưu vị trí đã xử lý của từng file log ra đĩa để khởi động lại không bỏ sót kết nối.
+    Mỗi mục được khóa theo đường dẫn và gắn với (dev, inode) của file: vị trí chỉ được dùng
+    lại khi file ở đường dẫn đó vẫn là file vật lý cũ. File checkpoint được ghi nguyên tử
+    (ghi file tạm cùng thư mục rồi os.replace), tối đa một lần mỗi interval_sec giây.
+    """
+
+    def __init__(self, path=CHECKPOINT_PATH, interval_sec=CHECKPOINT_INTERVAL_SEC):
+        """
+        :param path: File JSON chứa checkpoint.
+        :param interval_sec: Khoảng thời gian tối thiểu giữa hai lần ghi trong maybe_save().
+        """
+        self.path = path
+        self.interval_sec = interval_sec
+        self.entries = {} # log_path -> {'dev', 'inode', 'offset', 'updated_at'}
+        self._dirty = False
+        self._last_save = 0.0
+
+    def load(self):
+        """Đọc checkpoint từ đĩa (file không có hoặc hỏng thì bắt đầu rỗng)."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.entries = {path: entry for path, entry in data.get('files', {}).items()
+                            if isinstance(entry, dict) and 'offset' in entry}
+            logging.info(f"Đã tải checkpoint vị trí đọc của {len(self.entries)} file từ {self.path}.")
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Không đọc được checkpoint {self.path}: {e}. Bắt đầu không có checkpoint.")
+            self.entries = {}
+        return self
+
+    def get(self, log_path):
+        """Trả về mục checkpoint của log_path (dict có 'dev', 'inode', 'offset') hoặc None."""
+        return self.entries.get(log_path)
+
+    @staticmethod
+    def identity_of(entry):
+        return (entry.get('dev'), entry.get('inode')) if entry else None
+
+    def update(self, log_path, identity, offset):
+        """Ghi nhận vị trí đã xử lý xong của file (chỉ trong bộ nhớ; ghi đĩa bằng maybe_save/save)."""
+        entry = self.entries.get(log_path)
+        if entry and self.identity_of(entry) == tuple(identity) and entry['offset'] == offset:
+            return
+        self.entries[log_path] = {'dev': identity[0], 'inode': identity[1], 'offset': int(offset),
+                                  'updated_at': time.time()}
+        self._dirty = True
+
+    def maybe_save(self):
+        """Ghi checkpoint nếu có thay đổi và đã qua interval_sec từ lần ghi trước."""
+        if self._dirty and time.monotonic() - self._last_save >= self.interval_sec:
+            self.save()
+
+    def save(self):
+        """Ghi nguyên tử toàn bộ checkpoint ra đĩa."""
+        if not self._dirty:
+            return
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix='.checkpoint-', suffix='.tmp', dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    json.dump({'version': 1, 'files': self.entries}, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+            self._dirty = False
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logging.error(f"Không thể ghi checkpoint {self.path}: {e}")
@@ -0,0 +1,247 @@
+# src/compiled_preprocessor.py
+
+import logging
+import numpy as np
+import pandas as pd
+from src.preprocess import INT_FEATURE_COLUMNS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+TRANSFORM_CHUNK_ROWS = 65536 # Số dòng mỗi khối khi biến đổi DataFrame lớn (transform_frame)
+
+class CompiledPreprocessor:
+    """
+    Bản "biên dịch" của preprocessor.pkl (ColumnTransformer gồm StandardScaler + OneHotEncoder)
+    thành các phép toán NumPy thuần, dùng cho đường chấm điểm thời gian thực.
+    Không tạo DataFrame, không gọi pd.to_numeric hay ColumnTransformer cho mỗi lần transform,
+    nhưng cho kết quả giống hệt preprocess_features(..., fit=False).
+    """
+
+    def __init__(self, numeric_columns, mean, scale, numeric_slice,
+                 categorical_columns, category_lookups,
+                 n_features_out, sparse_output=False, feature_names=None, dtype=np.float64):
+        """
+        :param numeric_columns: Danh sách cột số theo đúng thứ tự của StandardScaler.
+        :param mean: Vector mean_ của StandardScaler (hoặc 0 nếu with_mean=False).
+        :param scale: Vector scale_ của StandardScaler (hoặc 1 nếu with_std=False).
+        :param numeric_slice: Vị trí khối cột số trong ma trận đầu ra.
+        :param categorical_columns: Danh sách cột phân loại theo thứ tự của OneHotEncoder.
+        :param category_lookups: Với mỗi cột phân loại, dict giá trị -> chỉ số cột one-hot (tuyệt đối).
+        :param n_features_out: Số cột của ma trận đầu vào mô hình.
+        :param sparse_output: True nếu ColumnTransformer gốc trả về ma trận sparse.
+        :param feature_names: Tên các cột đầu ra (nếu lấy được từ preprocessor).
+        :param dtype: Kiểu số của ma trận đầu ra (float32 với preprocessor mới, float64 với preprocessor.pkl cũ).
+        """
+        self.numeric_columns = list(numeric_columns)
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+        self.numeric_slice = numeric_slice
+        self.categorical_columns = list(categorical_columns)
+        self.category_lookups = category_lookups
+        self.n_features_out = n_features_out
+        self.sparse_output = sparse_output
+        self.feature_names = feature_names
+        self.dtype = np.dtype(dtype)
+
+        # Các cột số được ép kiểu int (cắt phần thập phân) giống preprocess_features
+        self._int_mask = np.array([col in INT_FEATURE_COLUMNS for col in self.numeric_columns], dtype=bool)
+
+    @classmethod
+    def from_preprocessor(cls, preprocessor):
+        """
+        Trích xuất tham số từ ColumnTransformer đã huấn luyện.
+        :raises ValueError: Nếu cấu trúc preprocessor không phải StandardScaler + OneHotEncoder.
+        """
+        output_indices = getattr(preprocessor, 'output_indices_', {})
+        numeric = None
+        categorical = None
+
+        for name, transformer, columns in preprocessor.transformers_:
+            if len(columns) == 0 or transformer == 'drop':
+                continue
+            if transformer == 'passthrough':
+                raise ValueError(f"Không hỗ trợ cột passthrough khi biên dịch preprocessor: {list(columns)}")
+
+            out_slice = output_indices.get(name)
+            kind = type(transformer).__name__
+            if kind == 'StandardScaler':
+                n = len(columns)
+                mean = transformer.mean_ if transformer.with_mean else np.zeros(n)
+                scale = transformer.scale_ if transformer.with_std and transformer.scale_ is not None else np.ones(n)
+                numeric = (list(columns), mean, scale, out_slice)
+            elif kind == 'OneHotEncoder':
+                if transformer.drop is not None or transformer.handle_unknown != 'ignore':
+                    raise ValueError("Chỉ hỗ trợ OneHotEncoder(handle_unknown='ignore') không drop cột.")
+                categorical = (list(columns), transformer.categories_, out_slice, transformer.dtype)
+            else:
+                raise ValueError(f"Không hỗ trợ transformer '{name}' kiểu {kind} khi biên dịch preprocessor.")
+
+        if numeric is None or categorical is None:
+            raise ValueError("Preprocessor phải có đủ khối 'num' (StandardScaler) và 'cat' (OneHotEncoder).")
+
+        numeric_columns, mean, scale, numeric_slice = numeric
+        categorical_columns, categories, categorical_slice, dtype = categorical
+        if numeric_slice is None:
+            numeric_slice = slice(0, len(numeric_columns))
+        if categorical_slice is None:
+            categorical_slice = slice(numeric_slice.stop, numeric_slice.stop + sum(len(c) for c in categories))
+
+        category_lookups = []
+        offset = categorical_slice.start
+        for values in categories:
+            category_lookups.append({value: offset + i for i, value in enumerate(values)})
+            offset += len(values)
+
+        try:
+            feature_names = list(preprocessor.get_feature_names_out())
+        except Exception:
+            feature_names = None
+
+        return cls(numeric_columns, mean, scale, numeric_slice,
+                   categorical_columns, category_lookups,
+                   n_features_out=max(numeric_slice.stop, categorical_slice.stop),
+                   sparse_output=bool(getattr(preprocessor, 'sparse_output_', False)),
+                   feature_names=feature_names, dtype=dtype)
+
+    def _numeric_matrix(self, records):
+        """Gom các cột số của lô bản ghi thành ma trận float64, ép kiểu như pd.to_numeric(errors='coerce')."""
+        columns = self.numeric_columns
+        rows = [[record.get(col, 0.0) for col in columns] for record in records]
+        try:
+            matrix = np.array(rows, dtype=np.float64)
+        except (TypeError, ValueError):
+            # Có giá trị không phải số (chuỗi lạ, None...): ép từng giá trị, lỗi thì coi là NaN
+            matrix = np.array([[_to_float(value) for value in row] for row in rows], dtype=np.float64)
+        if matrix.ndim != 2: # Lô rỗng
+            matrix = matrix.reshape(len(records), len(columns))
+
+        matrix[np.isnan(matrix)] = 0.0
+        if self._int_mask.any():
+            matrix[:, self._int_mask] = np.trunc(matrix[:, self._int_mask])
+        return matrix
+
+    def transform_records(self, records):
+        """
+        Biến đổi một lô bản ghi đặc trưng (dict theo NSL_KDD_RELEVANT_COLUMNS) thành ma trận đầu vào mô hình.
+        :param records: Danh sách dict đặc trưng (ví dụ từ ZeekFeatureExtractor).
+        :return: np.ndarray (hoặc scipy CSR nếu preprocessor gốc trả về sparse) kích thước (n, n_features_out).
+        """
+        return self._assemble(*self.encode_records(records))
+
+    def encode_records(self, records):
+        """
+        Bước đầu của transform_records: (ma trận float64 các cột số chưa chuẩn hóa, chỉ số one-hot của từng cột
+        phân loại, -1 là giá trị chưa gặp). Dùng cho PredictionCache tạo khóa theo đúng đầu vào mô hình.
+        """
+        n = len(records)
+        category_indices = [
+            np.fromiter((lookup.get(record.get(col, 'unknown'), -1) for record in records), dtype=np.int64, count=n)
+            for col, lookup in zip(self.categorical_columns, self.category_lookups)
+        ]
+        return self._numeric_matrix(records), category_indices
+
+    def transform_encoded(self, numeric, category_indices):
+        """Bước sau của transform_records cho kết quả của encode_records (ma trận numeric bị sửa tại chỗ)."""
+        return self._assemble(numeric, category_indices)
+
+    def transform_frame(self, frame, chunk_rows=TRANSFORM_CHUNK_ROWS):
+        """
+        Giống transform_records nhưng nhận DataFrame đặc trưng (ví dụ từ BatchFeatureExtractor hoặc tập huấn luyện),
+        xử lý theo cột nên không tạo dict cho từng hàng. DataFrame lớn được biến đổi theo từng khối chunk_rows dòng
+        rồi ghép lại, nên bộ nhớ tạm chỉ tỷ lệ với một khối thay vì cả tập dữ liệu.
+        :param frame: DataFrame có các cột NSL_KDD_RELEVANT_COLUMNS (cột thiếu được coi như giá trị mặc định).
+        """
+        if len(frame) <= chunk_rows:
+            return self._transform_frame_block(frame)
+        blocks = [self._transform_frame_block(frame.iloc[start:start + chunk_rows])
+                  for start in range(0, len(frame), chunk_rows)]
+        if self.sparse_output:
+            from scipy import sparse
+            return sparse.vstack(blocks, format='csr') # Các khối đều là CSR: ghép thẳng data/indices/indptr
+        return np.vstack(blocks)
+
+    def _transform_frame_block(self, frame):
+        n = len(frame)
+        numeric = frame.reindex(columns=self.numeric_columns, fill_value=0.0)
+        try:
+            matrix = numeric.to_numpy(dtype=np.float64, copy=True) # Có thể là view chỉ-đọc nếu không copy (pandas CoW)
+        except (TypeError, ValueError):
+            matrix = numeric.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+        matrix = matrix.reshape(n, len(self.numeric_columns))
+        matrix[np.isnan(matrix)] = 0.0
+        if self._int_mask.any():
+            matrix[:, self._int_mask] = np.trunc(matrix[:, self._int_mask])
+
+        category_indices = []
+        for col, lookup in zip(self.categorical_columns, self.category_lookups):
+            values = frame[col] if col in frame.columns else pd.Series('unknown', index=frame.index)
+            category_indices.append(values.map(lookup).fillna(-1).to_numpy(dtype=np.int64))
+        return self._assemble(matrix, category_indices)
+
+    def _assemble(self, numeric, category_indices):
+        """Chuẩn hóa khối cột số và bật các cột one-hot theo chỉ số đã tra (-1 là giá trị chưa gặp)."""
+        n = len(numeric)
+        if self.dtype == np.float32:
+            # Giống StandardScaler.transform trên đầu vào float32: mean_/scale_ được ép về float32 rồi tính bằng float32
+            numeric = numeric.astype(np.float32)
+            numeric -= self.mean.astype(np.float32)
+            numeric /= self.scale.astype(np.float32)
+        else:
+            numeric -= self.mean
+            numeric /= self.scale
+        if self.sparse_output:
+            return self._assemble_sparse(numeric, category_indices)
+
+        output = np.zeros((n, self.n_features_out), dtype=self.dtype)
+        output[:, self.numeric_slice] = numeric
+
+        row_index = np.arange(n)
+        for col_index in category_indices:
+            # Giá trị chưa gặp khi huấn luyện -> toàn 0 (handle_unknown='ignore')
+            known = col_index >= 0
+            output[row_index[known], col_index[known]] = 1.0
+        return output
+
+    def _assemble_sparse(self, numeric, category_indices):
+        """
+        Tạo thẳng ma trận CSR (không qua ma trận dense n x n_features_out). Như ColumnTransformer,
+        giá trị 0 không được lưu: XGBoost coi phần tử vắng mặt là missing, nên cấu trúc phải khớp hệt lúc huấn luyện.
+        """
+        n = len(numeric)
+        numeric_cols = np.arange(self.numeric_slice.start, self.numeric_slice.stop, dtype=np.int32)
+        columns = np.hstack([np.broadcast_to(numeric_cols, numeric.shape)] +
+                            [col_index.astype(np.int32).reshape(n, 1) for col_index in category_indices])
+        values = np.hstack([numeric, np.ones((n, len(category_indices)), dtype=self.dtype)])
+        stored = np.hstack([numeric != 0] + [col_index.reshape(n, 1) >= 0 for col_index in category_indices])
+
+        # Duyệt theo hàng nên các phần tử của mỗi hàng nằm liền nhau đúng thứ tự CSR
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(stored.sum(axis=1), out=indptr[1:])
+        from scipy import sparse
+        return sparse.csr_matrix((values[stored].astype(self.dtype, copy=False), columns[stored], indptr),
+                                 shape=(n, self.n_features_out))
+
+    def transform_one(self, features):
+        """Biến đổi một dict đặc trưng thành ma trận 1 hàng."""
+        return self.transform_records([features])
+
+def _to_float(value):
+    """Ép một giá trị về float, trả về NaN nếu không chuyển được (như pd.to_numeric errors='coerce')."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def compile_preprocessor(preprocessor):
+    """
+    Biên dịch preprocessor đã tải. Trả về None (kèm cảnh báo) nếu không biên dịch được,
+    khi đó nơi gọi nên quay lại dùng preprocess_features.
+    """
+    try:
+        compiled = CompiledPreprocessor.from_preprocessor(preprocessor)
+        logging.info(f"Đã biên dịch preprocessor: {len(compiled.numeric_columns)} cột số, "
+                     f"{len(compiled.categorical_columns)} cột phân loại -> {compiled.n_features_out} đặc trưng.")
+        return compiled
+    except Exception as e:
+        logging.warning(f"Không thể biên dịch preprocessor, dùng preprocess_features thay thế: {e}")
+        return None
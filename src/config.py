@@ -76,14 +76,14 @@ NSL_KDD_RELEVANT_COLUMNS = [
     'srv_rerror_rate',    # Tỷ lệ lỗi REJ/RST cùng dịch vụ trong 2 giây
     'same_srv_rate',      # Tỷ lệ kết nối cùng dịch vụ trong 2 giây
     'diff_srv_rate',      # Tỷ lệ kết nối khác dịch vụ trong 2 giây
-    'srv_diff_host_rate', # Tỷ lệ dịch vụ khác host trong 2 giây (khó, tạm 0)
+    'srv_diff_host_rate', # Tỷ lệ flow cùng dịch vụ tới host khác trong 2 giây
 
     'dst_host_count',     # Số kết nối đến cùng host đích trong N kết nối gần nhất
     'dst_host_srv_count', # Số kết nối đến cùng dịch vụ trên cùng host đích trong N kết nối gần nhất
     'dst_host_same_srv_rate', # Tỷ lệ kết nối cùng dịch vụ trên cùng host đích
     'dst_host_diff_srv_rate', # Tỷ lệ kết nối khác dịch vụ trên cùng host đích
     'dst_host_same_src_port_rate', # Tỷ lệ cổng nguồn giống trên cùng host đích
-    'dst_host_srv_diff_host_rate', # Tỷ lệ dịch vụ khác host trên cùng host đích (khó, tạm 0)
+    'dst_host_srv_diff_host_rate', # Tỷ lệ flow cùng dịch vụ tới host đích này từ host nguồn khác
     'dst_host_serror_rate', # Tỷ lệ lỗi SYN trên cùng host đích
     'dst_host_srv_serror_rate', # Tỷ lệ lỗi SYN cùng dịch vụ trên cùng host đích
     'dst_host_rerror_rate', # Tỷ lệ lỗi REJ/RST trên cùng host đích
@@ -140,4 +140,186 @@ ZEEK_CONN_STATE_TO_NSL_FLAG = {
 }
 
 # Các trường đặc trưng có thể được coi là lỗi trong NSL-KDD
-ERROR_FLAGS = ['S0', 'REJ', 'RSTO', 'RSTR'] # serror_rate, rerror_rate
\ No newline at end of file
+ERROR_FLAGS = ['S0', 'REJ', 'RSTO', 'RSTR'] # serror_rate, rerror_rate
+
+# --- Cấu hình chấm điểm theo lô (micro-batch) cho stream_monitor ---
+# Gom tối đa MONITOR_BATCH_SIZE flow hoặc chờ tối đa MONITOR_BATCH_TIMEOUT_MS mili giây
+# (tính từ flow đầu tiên trong lô) rồi mới tiền xử lý + dự đoán một lần cho cả lô.
+# Đặt MONITOR_BATCH_SIZE = 1 để quay về chế độ chấm điểm từng flow.
+MONITOR_BATCH_SIZE = 256
+MONITOR_BATCH_TIMEOUT_MS = 200
+
+# --- Cấu hình đọc conn.log theo khối (ZeekConnReader) ---
+ZEEK_READER_CHUNK_SIZE = 1 << 20 # Số byte đọc mỗi lần (1 MiB ~ vài nghìn dòng conn.log)
+
+# --- Cấu hình gửi cảnh báo (src/alert_sink.py) ---
+# ALERT_SINK_TYPE: 'elasticsearch' (gửi theo lô bằng Bulk API) hoặc 'file' (ghi NDJSON ra đĩa, không cần cluster)
+ALERT_SINK_TYPE = 'elasticsearch'
+ELASTICSEARCH_HOSTS = [{'host': 'localhost', 'port': 9200, 'scheme': 'http'}]
+ALERT_INDEX = 'my_ids_alerts'
+ALERT_FILE_PATH = os.path.join(BASE_DIR, 'logs', 'alerts.ndjson')
+ALERT_QUEUE_SIZE = 10000 # Số cảnh báo tối đa chờ trong hàng đợi bộ nhớ
+ALERT_BULK_SIZE = 500 # Gửi ngay khi gom đủ số cảnh báo này...
+ALERT_FLUSH_INTERVAL_SEC = 1.0 # ...hoặc khi cảnh báo cũ nhất đã chờ quá thời gian này
+ALERT_MAX_RETRIES = 5 # Số lần thử lại một lô bị lỗi trước khi ghi tràn ra đĩa
+ALERT_RETRY_BACKOFF_SEC = 0.5 # Thời gian chờ lần thử lại đầu tiên, nhân đôi sau mỗi lần
+ALERT_RETRY_BACKOFF_MAX_SEC = 30.0
+# Cảnh báo không gửi được (hàng đợi đầy hoặc hết lượt thử lại) được ghi NDJSON vào đây để nạp lại sau
+ALERT_SPILL_PATH = os.path.join(BASE_DIR, 'logs', 'alerts_spill.ndjson')
+# Cảnh báo tràn do hàng đợi đầy được giữ tạm trong bộ nhớ để luồng ghi nền ghi ra đĩa theo lô; chỉ khi bộ đệm
+# này đầy (luồng ghi đang kẹt ở backend) thì vòng lặp chấm điểm mới tự ghi cả bộ đệm trong một lần mở file
+ALERT_SPILL_BUFFER_SIZE = 5000
+ALERT_SPILL_LOG_INTERVAL_SEC = 10.0 # Log số cảnh báo đã ghi tràn tối đa một lần mỗi khoảng này
+
+# --- Checkpoint vị trí đọc conn.log và chế độ đuổi kịp backlog (stream_monitor) ---
+CHECKPOINT_PATH = os.path.join(BASE_DIR, 'state', 'conn_log_offsets.json')
+CHECKPOINT_INTERVAL_SEC = 5.0 # Ghi checkpoint ra đĩa tối đa một lần mỗi khoảng này
+# Khi phần chưa đọc của file lớn hơn ngưỡng này (ví dụ sau khi khởi động lại), chấm điểm theo lô lớn
+# MONITOR_CATCHUP_BATCH_SIZE flow, không chờ timeout và không log từng flow cho tới khi đuổi kịp.
+MONITOR_CATCHUP_THRESHOLD_BYTES = 4 << 20
+MONITOR_CATCHUP_BATCH_SIZE = 4096
+
+# --- Chế độ nhiều tiến trình (src/sharded_monitor.py) ---
+# MONITOR_WORKERS > 1: tiến trình chính chỉ đọc conn.log, flow được chia theo crc32(id.resp_h) cho
+# MONITOR_WORKERS tiến trình worker, mỗi worker có ZeekFeatureExtractor và mô hình riêng.
+MONITOR_WORKERS = 1
+MONITOR_SHARD_QUEUE_SIZE = 64 # Số lô tối đa chờ trong hàng đợi của mỗi worker
+
+# --- Theo dõi nhiều thư mục log Zeek (nhiều sensor/worker Zeek, src/merged_monitor.py) ---
+# Rỗng hoặc một thư mục: theo dõi một conn.log như trước (rỗng thì dùng ZEEK_LOG_DIR của stream_monitor).
+# Nhiều thư mục: mỗi thư mục có một luồng đọc riêng, flow của mọi thư mục được trộn theo ts (k-way merge)
+# trước khi vào một ZeekFeatureExtractor chung; chạy trong một tiến trình (bỏ qua MONITOR_WORKERS).
+ZEEK_LOG_DIRS = []
+# Độ trễ tối đa được chờ: flow có ts t chỉ được trích xuất khi mọi nguồn đang hoạt động đã đọc tới ts >= t + giá trị này.
+# Flow tới muộn hơn vẫn được xử lý (ngoài thứ tự) và được đếm trong ids_merge_late_flows_total.
+MONITOR_MERGE_LATENESS_SEC = 2.0
+MONITOR_MERGE_IDLE_SEC = 5.0 # Nguồn không có dòng mới trong khoảng này không giữ chân các nguồn khác
+MONITOR_MERGE_MAX_BUFFER = 500000 # Số flow tối đa chờ trong bộ trộn; vượt thì flow có ts nhỏ nhất được giải phóng sớm
+MONITOR_SOURCE_QUEUE_SIZE = 64 # Số khối tối đa chờ giữa các luồng đọc và vòng trộn
+
+# --- Trạng thái cửa sổ của ZeekFeatureExtractor (src/zeek_feature_extractor.py) ---
+# Mỗi flow trong cửa sổ là một ô của bộ đệm vòng dạng mảng (host đích/dịch vụ intern thành số nguyên, cờ là mã uint8),
+# cỡ 17 byte/ô. Host đích không còn flow nào trong cả hai cửa sổ bị xóa khỏi bảng intern.
+# EXTRACTOR_MAX_WINDOW_FLOWS: giới hạn cứng số flow trong cửa sổ thời gian (flood/DDoS). Khi đầy, flow cũ nhất bị loại
+# sớm (đếm trong ids_extractor_overload_evictions_total): đặc trưng time-based chỉ tính trên số flow gần nhất này.
+EXTRACTOR_MAX_WINDOW_FLOWS = 1000000
+EXTRACTOR_INITIAL_WINDOW_CAPACITY = 1024 # Số ô ban đầu của bộ đệm vòng (tăng gấp đôi khi đầy, giảm khi vắng)
+
+# --- Snapshot trạng thái cửa sổ của extractor khi khởi động lại (src/extractor_snapshot.py) ---
+# Monitor (một tiến trình) chụp hai cửa sổ định kỳ cùng lúc ghi checkpoint vị trí đọc, ghi ở luồng nền,
+# và nạp lại khi khởi động: các flow của cửa sổ thời gian đã hết hạn bị bỏ.
+EXTRACTOR_SNAPSHOT_ENABLED = True
+EXTRACTOR_SNAPSHOT_PATH = os.path.join(BASE_DIR, 'state', 'extractor_state.npz')
+EXTRACTOR_SNAPSHOT_INTERVAL_SEC = 30.0
+EXTRACTOR_SNAPSHOT_MAX_AGE_SEC = 3600 # Snapshot cũ hơn (theo ts flow cuối) bị bỏ toàn bộ; None để không giới hạn
+
+# --- Chỉ số vận hành của monitor (src/metrics.py) ---
+# Histogram độ trễ từng bước, bộ đếm flow/dòng lỗi/cảnh báo, độ trễ ingest, kích thước cửa sổ extractor
+# và độ sâu hàng đợi; xuất theo định dạng Prometheus tại http://METRICS_HOST:METRICS_PORT/metrics
+# và ghi một dòng log tổng kết mỗi METRICS_LOG_INTERVAL_SEC giây.
+METRICS_ENABLED = True
+METRICS_HOST = '127.0.0.1' # Chỉ nghe trên máy cục bộ; đổi thành '0.0.0.0' nếu Prometheus scrape từ máy khác
+METRICS_PORT = 9108 # None để không mở endpoint HTTP
+METRICS_LOG_INTERVAL_SEC = 60 # 0 để không ghi log tổng kết
+METRICS_LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1.0, 2.5, 5.0) # giây
+METRICS_LAG_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0) # giây
+
+# --- Logging của ứng dụng (main.setup_logging, src/monitor_logging.py) ---
+# LOG_ASYNC: handler file/console chạy ở luồng nền sau một hàng đợi, đường chấm điểm chỉ đưa bản ghi vào hàng đợi.
+# Hàng đợi đầy thì bản ghi dưới WARNING bị bỏ (có đếm), bản ghi WARNING trở lên (gồm cảnh báo tấn công) luôn được giữ.
+LOG_ASYNC = True
+LOG_QUEUE_SIZE = 10000
+LOG_FLUSH_INTERVAL_SEC = 0.2 # Luồng nền ghi hàng đợi ra file/console mỗi khoảng này (sớm hơn nếu hàng đợi đầy một nửa)
+# Dòng kết quả của từng flow trong monitor: 'all' (mọi flow), 'sample' (1 trên LOG_FLOW_SAMPLE_EVERY flow) hoặc 'off'.
+# Flow Malicious luôn được log đầy đủ (WARNING); dòng tổng kết mỗi LOG_SUMMARY_INTERVAL_SEC giây thay cho log từng flow.
+LOG_FLOW_MODE = 'sample'
+LOG_FLOW_SAMPLE_EVERY = 1000
+LOG_SUMMARY_INTERVAL_SEC = 30 # 0 để không ghi dòng tổng kết
+LOG_SUMMARY_TOP_TALKERS = 5 # Số địa chỉ nguồn nhiều flow nhất trong dòng tổng kết
+
+# --- Cache dự đoán theo vector đặc trưng (src/prediction_cache.py) ---
+# Khi quét cổng/SYN flood, nhiều flow liên tiếp có cùng vector đặc trưng NSL-KDD: lấy lại xác suất đã tính
+# thay vì tiền xử lý và chạy mô hình lại. Cache tự xóa khi mô hình hoặc preprocessor được tải lại.
+# Khóa chính xác hầu như không bao giờ trùng (count/srv_count/*_rate đổi theo từng flow), nên cache chỉ có lợi khi
+# bật lượng tử hóa với mô hình lớn và lưu lượng flood (benchmarks/bench_prediction_cache.py); mặc định tắt.
+PREDICTION_CACHE_ENABLED = False
+PREDICTION_CACHE_SIZE = 65536 # Số vector đặc trưng tối đa (LRU)
+PREDICTION_CACHE_TTL_SEC = 300 # Thời gian sống của một kết quả; None/0 để không hết hạn
+# Lượng tử hóa khóa: flow gần giống dùng chung kết quả (xấp xỉ). Tắt thì chỉ flow giống hệt mới dùng chung.
+PREDICTION_CACHE_QUANTIZE = False
+PREDICTION_CACHE_RELATIVE_STEP = 0.1 # duration, số byte, số đếm: chung khóa nếu chênh nhau khoảng dưới 10% (thang log)
+PREDICTION_CACHE_RATE_DECIMALS = 2 # các trường *_rate: giữ 2 chữ số thập phân
+# Lô có tỉ lệ hit dưới ngưỡng này thì PREDICTION_CACHE_PROBE_INTERVAL - 1 lô tiếp theo chấm điểm thẳng (bỏ qua chi phí
+# tạo khóa/tra cache), rồi thử lại cache với một lô. 0 để luôn dùng cache.
+PREDICTION_CACHE_MIN_HIT_RATE = 0.2
+PREDICTION_CACHE_PROBE_INTERVAL = 16
+
+# --- Chấm điểm hai tầng (src/cascade.py) ---
+# train_model huấn luyện thêm một bộ lọc trước rất rẻ (hồi quy logistic); khi bật, flow có điểm của bộ lọc dưới ngưỡng
+# được kết luận Normal ngay, chỉ flow còn lại mới qua mô hình đầy đủ. Ngưỡng được chọn trên tập validation sao cho
+# tỉ lệ flow tấn công bị bộ lọc bỏ qua không vượt CASCADE_FN_BUDGET, và được lưu trong file của bộ lọc.
+# Tắt mặc định: bộ lọc đổi kết luận của một phần nhỏ flow tấn công (tỉ lệ bỏ sót ngoài tập validation có thể vượt
+# ngân sách) để đổi lấy tốc độ, nên người vận hành phải tự bật sau khi xem benchmarks/bench_cascade.py.
+CASCADE_ENABLED = False # Chỉ có tác dụng khi đã có CASCADE_MODEL_PATH
+CASCADE_MODEL_PATH = 'models/cascade_prefilter.npz'
+CASCADE_FN_BUDGET = 0.001 # Tối đa 0.1% flow tấn công (tập validation) được phép bỏ qua mô hình đầy đủ
+CASCADE_PREFILTER_C = 1.0 # Nghịch đảo độ mạnh regularization của hồi quy logistic
+
+# --- Giải thích cảnh báo (src/alert_explainer.py) ---
+# Luồng nền tính đóng góp đặc trưng (Booster.predict pred_contribs, tương đương SHAP) cho các flow Malicious
+# và gắn top EXPLAIN_TOP_K đặc trưng vào ml_ids.explanation của cảnh báo trước khi gửi tới alert sink.
+# Hàng đợi đầy thì cảnh báo được gửi ngay không kèm giải thích, vòng chấm điểm không bao giờ phải chờ.
+EXPLAIN_ENABLED = True
+EXPLAIN_TOP_K = 5
+EXPLAIN_QUEUE_SIZE = 10000 # Số cảnh báo tối đa chờ giải thích
+EXPLAIN_BATCH_SIZE = 256 # Số cảnh báo tối đa mỗi lần gọi pred_contribs
+
+# --- Chế độ replay (python main.py replay <files...>) ---
+REPLAY_BATCH_SIZE = 8192 # Số flow mỗi lô chấm điểm khi replay log lưu trữ
+
+# --- Mô hình XGBoost định dạng gốc (src/model_runtime.py) ---
+# train_model lưu thêm booster theo định dạng gốc của XGBoost (.ubj nhị phân hoặc .json);
+# monitor/replay ưu tiên file này (tải nhanh, không cần unpickle lớp sklearn) và chấm điểm bằng
+# Booster.inplace_predict. Chưa có file này thì quay lại MODEL_PATHS['xgb'].
+NATIVE_MODEL_PATH = 'models/xgb_model.ubj'
+XGB_NTHREAD = 0 # Số luồng XGBoost khi dự đoán (0 = dùng tất cả lõi CPU)
+
+# --- Nạp lại mô hình khi monitor đang chạy (src/model_reloader.py) ---
+# train_model ghi MODEL_MANIFEST_PATH sau cùng (phiên bản, đường dẫn các file và sha256 của chúng). Khi manifest đổi,
+# luồng nền tải và chấm thử bộ mô hình mới rồi monitor đổi sang nó giữa hai lô; bộ mô hình hỏng bị từ chối và
+# mô hình cũ tiếp tục được dùng. Chưa có manifest thì monitor tải mô hình mặc định như trước (phiên bản 'unversioned').
+# Chế độ nhiều worker (sharded_monitor): mỗi worker tải bộ mô hình theo manifest và có luồng nạp lại riêng, đổi mô hình
+# giữa hai lô của mình; tiến trình chính tải phiên bản mà cảnh báo của worker mang theo để AlertExplainer đổi theo.
+# Replay tải bộ mô hình theo manifest một lần lúc bắt đầu (cảnh báo ghi ml_ids.model_version), không theo dõi manifest.
+MODEL_RELOAD_ENABLED = True
+MODEL_MANIFEST_PATH = 'models/manifest.json'
+# Mỗi lần huấn luyện ghi mọi file vào MODEL_RELEASES_DIR/<phiên bản>/ rồi mới ghi manifest trỏ tới đó; bản sao ở các
+# đường dẫn mặc định (NATIVE_MODEL_PATH, PREPROCESSOR_PATH...) chỉ được cập nhật sau khi manifest đã ghi xong
+MODEL_RELEASES_DIR = 'models/releases'
+MODEL_RELOAD_INTERVAL_SEC = 5.0 # Khoảng thời gian giữa hai lần kiểm tra manifest
+
+# --- Cache tập dữ liệu NSL-KDD đã tiền xử lý (src/dataset_cache.py) ---
+# Mỗi tổ hợp (hash file train/test, cấu hình tiền xử lý) có một thư mục con chứa ma trận float32,
+# nhãn int8 (.npy, tải bằng memory-map) và preprocessor đã huấn luyện.
+DATASET_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'datasets')
+DATASET_CACHE_VERSION = 2 # Tăng khi đổi cách tiền xử lý mà cấu hình cột không phản ánh được
+
+# --- Tìm siêu tham số khi huấn luyện (python main.py tune, src/hyperparameter_search.py) ---
+# Mỗi tổ hợp trong lưới là một ứng viên, huấn luyện song song trên TRAIN_SEARCH_WORKERS tiến trình
+# với tree_method='hist' và early stopping trên tập validation tách từ tập train.
+TRAIN_SEARCH_GRID = {
+    'max_depth': [3, 5, 7],
+    'learning_rate': [0.1, 0.3],
+    'n_estimators': [300], # Số cây tối đa; early stopping quyết định số cây thực dùng
+}
+TRAIN_SEARCH_WORKERS = None # None = số lõi CPU
+TRAIN_TREE_METHOD = 'hist'
+TRAIN_VALIDATION_SIZE = 0.2
+TRAIN_EARLY_STOPPING_ROUNDS = 20
+# Hàm mục tiêu chọn mô hình: TRAIN_SELECTION_METRIC - TRAIN_LATENCY_PENALTY * (ms dự đoán mỗi 1000 dòng).
+# Ứng viên chậm hơn TRAIN_MAX_LATENCY_MS_PER_1K (nếu đặt) bị loại dù chính xác hơn.
+TRAIN_SELECTION_METRIC = 'f1' # 'accuracy', 'f1' hoặc 'roc_auc'
+TRAIN_LATENCY_PENALTY = 0.01
+TRAIN_MAX_LATENCY_MS_PER_1K = None
+TRAIN_SEARCH_REPORT_PATH = os.path.join(BASE_DIR, 'logs', 'train_search.json')
@@ -0,0 +1,146 @@
+# src/dataset_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+import joblib
+import numpy as np
+
+from src.config import NSL_KDD_RELEVANT_COLUMNS, DATASET_CACHE_DIR, DATASET_CACHE_VERSION
+from src.preprocess import (load_nslkdd_data, preprocess_features, CATEGORICAL_FEATURE_COLUMNS,
+                            FLOAT_FEATURE_COLUMNS, INT_FEATURE_COLUMNS)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+META_FILE = 'meta.json'
+PREPROCESSOR_FILE = 'preprocessor.pkl'
+
+def file_sha256(path, chunk_size=1 << 20):
+    """Hash SHA-256 nội dung file (đọc theo khối)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def preprocessing_config():
+    """Những gì quyết định kết quả tiền xử lý; đổi bất kỳ giá trị nào thì cache cũ không còn dùng được."""
+    import sklearn
+    return {
+        'version': DATASET_CACHE_VERSION,
+        'columns': NSL_KDD_RELEVANT_COLUMNS,
+        'categorical': CATEGORICAL_FEATURE_COLUMNS,
+        'float': FLOAT_FEATURE_COLUMNS,
+        'int': INT_FEATURE_COLUMNS,
+        'sklearn': sklearn.__version__, # preprocessor.pkl chỉ chắc chắn tải lại được với cùng phiên bản
+    }
+
+def dataset_cache_key(train_hash, test_hash, config):
+    payload = json.dumps({'train': train_hash, 'test': test_hash, 'config': config}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+def _save_matrix(directory, name, X):
+    """Ghi ma trận float32: dense thành .npy (mở lại bằng memory-map), sparse thành .npz (CSR)."""
+    if hasattr(X, 'tocsr'):
+        from scipy import sparse
+        sparse.save_npz(os.path.join(directory, f'{name}.npz'), X.tocsr().astype(np.float32), compressed=False)
+    else:
+        np.save(os.path.join(directory, f'{name}.npy'), np.ascontiguousarray(X, dtype=np.float32))
+
+def _load_matrix(directory, name):
+    path = os.path.join(directory, f'{name}.npy')
+    if os.path.exists(path):
+        return np.load(path, mmap_mode='r')
+    from scipy import sparse
+    return sparse.load_npz(os.path.join(directory, f'{name}.npz'))
+
+def _load_entry(directory):
+    X_train, X_test = _load_matrix(directory, 'X_train'), _load_matrix(directory, 'X_test')
+    y_train = np.load(os.path.join(directory, 'y_train.npy'), mmap_mode='r')
+    y_test = np.load(os.path.join(directory, 'y_test.npy'), mmap_mode='r')
+    preprocessor = joblib.load(os.path.join(directory, PREPROCESSOR_FILE))
+    return X_train, y_train, X_test, y_test, preprocessor
+
+def _build_entry(train_path, test_path, cache_dir, key, meta):
+    """Đọc CSV, tiền xử lý và ghi entry vào thư mục tạm rồi đổi tên (không để lại entry ghi dở)."""
+    df_train = load_nslkdd_data(train_path)
+    df_test = load_nslkdd_data(test_path)
+    X_train, y_train, preprocessor = preprocess_features(df_train, fit=True, save_path=None)
+    X_test, y_test, _ = preprocess_features(df_test, preprocessor=preprocessor, fit=False)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f'.{key}.', dir=cache_dir)
+    try:
+        _save_matrix(tmp_dir, 'X_train', X_train)
+        _save_matrix(tmp_dir, 'X_test', X_test)
+        np.save(os.path.join(tmp_dir, 'y_train.npy'), np.asarray(y_train, dtype=np.int8))
+        np.save(os.path.join(tmp_dir, 'y_test.npy'), np.asarray(y_test, dtype=np.int8))
+        joblib.dump(preprocessor, os.path.join(tmp_dir, PREPROCESSOR_FILE))
+        meta['shape'] = {'train': list(X_train.shape), 'test': list(X_test.shape)}
+        meta['created_at'] = time.time()
+        with open(os.path.join(tmp_dir, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, indent=2)
+        entry_dir = os.path.join(cache_dir, key)
+        os.rename(tmp_dir, entry_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not os.path.isdir(os.path.join(cache_dir, key)): # Tiến trình khác vừa ghi cùng entry thì dùng luôn
+            raise
+    return os.path.join(cache_dir, key)
+
+def _remove_stale_entries(cache_dir, keep_key, train_path, test_path):
+    """Xóa các entry cũ của cùng cặp file train/test (nội dung file hoặc cấu hình đã đổi)."""
+    for name in os.listdir(cache_dir):
+        if name == keep_key or name.startswith('.'):
+            continue
+        try:
+            with open(os.path.join(cache_dir, name, META_FILE), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('train_path') == train_path and meta.get('test_path') == test_path:
+            shutil.rmtree(os.path.join(cache_dir, name), ignore_errors=True)
+            logging.info(f"Đã xóa cache tập dữ liệu cũ: {name}")
+
+def load_training_data(train_path, test_path, cache_dir=DATASET_CACHE_DIR, use_cache=True):
+    """
+    Tải tập train/test NSL-KDD đã tiền xử lý, dùng cache nhị phân nếu có.
+    Khóa cache gồm hash SHA-256 của hai file và cấu hình tiền xử lý, nên sửa file dữ liệu hoặc
+    đổi cấu hình cột đều tạo entry mới (entry cũ của cùng cặp file bị xóa).
+    :param train_path: File KDDTrain+.txt.
+    :param test_path: File KDDTest+.txt.
+    :param use_cache: False để luôn đọc lại CSV (và không ghi cache).
+    :return: (X_train, y_train, X_test, y_test, preprocessor); X là float32 (memory-map khi dense), y là int8.
+    :raises FileNotFoundError: Nếu không có file dữ liệu.
+    """
+    if not use_cache:
+        X_train, y_train, preprocessor = preprocess_features(load_nslkdd_data(train_path), fit=True, save_path=None)
+        X_test, y_test, _ = preprocess_features(load_nslkdd_data(test_path), preprocessor=preprocessor, fit=False)
+        return X_train, y_train, X_test, y_test, preprocessor
+
+    start = time.perf_counter()
+    train_path, test_path = os.path.abspath(train_path), os.path.abspath(test_path)
+    config = preprocessing_config()
+    key = dataset_cache_key(file_sha256(train_path), file_sha256(test_path), config)
+    entry_dir = os.path.join(cache_dir, key)
+
+    if os.path.isdir(entry_dir):
+        try:
+            data = _load_entry(entry_dir)
+            logging.info(f"Đã tải tập dữ liệu từ cache {entry_dir} trong {(time.perf_counter() - start) * 1000:.0f} ms.")
+            return data
+        except Exception as e:
+            logging.warning(f"Cache tập dữ liệu {entry_dir} bị hỏng, tạo lại: {e}")
+            shutil.rmtree(entry_dir, ignore_errors=True)
+
+    logging.info("Chưa có cache cho tập dữ liệu này, đọc và tiền xử lý CSV...")
+    meta = {'train_path': train_path, 'test_path': test_path, 'config': config}
+    entry_dir = _build_entry(train_path, test_path, cache_dir, key, meta)
+    _remove_stale_entries(cache_dir, key, train_path, test_path)
+    logging.info(f"Đã ghi cache tập dữ liệu {entry_dir} trong {time.perf_counter() - start:.2f}s.")
+    return _load_entry(entry_dir)
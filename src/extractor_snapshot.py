@@ -0,0 +1,165 @@
+# src/extractor_snapshot.py
+"""
+Snapshot trạng thái cửa sổ của ZeekFeatureExtractor để khởi động lại không phải bắt đầu với cửa sổ rỗng
+(vài giây đầu mọi count/rate đều sai, đúng lúc một đợt flood có thể đang diễn ra).
+
+Định dạng: một file .npz (không pickle) gồm các cột của hai bộ đệm vòng (time_keys, time_hosts, ...,
+host_src_ports) và 'meta' là JSON (tham số cửa sổ, seq/watermark, danh sách IP/dịch vụ đã intern).
+Mã host được đánh lại liên tục theo các host còn dùng nên file chỉ chứa giá trị thực sự cần. Bộ đếm
+không được lưu: ZeekFeatureExtractor.restore_state dựng lại từ các flow.
+
+Snapshot chỉ được chụp khi mọi flow đã trích xuất đều đã chấm điểm (FlowBatcher không còn flow chờ) và
+checkpoint vị trí đọc được ghi cùng lúc, nên khi khởi động lại không flow nào bị cộng hai lần vào cửa sổ;
+các flow giữa snapshot cuối và checkpoint cuối chỉ bị thiếu trong cửa sổ được nạp lại.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from src.config import EXTRACTOR_SNAPSHOT_ENABLED, EXTRACTOR_SNAPSHOT_PATH, EXTRACTOR_SNAPSHOT_INTERVAL_SEC
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+def _compact(names, *columns):
+    """Đánh lại mã (của `names`) dùng trong các cột thành 0..k-1; trả về (tên còn dùng, các cột mới)."""
+    used = np.unique(np.concatenate(columns))
+    return [names[code] for code in used.tolist()], [np.searchsorted(used, column).astype(np.uint32)
+                                                     for column in columns]
+
+def save_snapshot(state, path=EXTRACTOR_SNAPSHOT_PATH):
+    """
+    Ghi nguyên tử (file tạm cùng thư mục rồi os.replace) snapshot do ZeekFeatureExtractor.snapshot_state tạo.
+    :return: Số byte của file.
+    """
+    arrays = {name: column for name, column in state.items() if name != 'meta'}
+    meta = dict(state['meta'])
+    meta['hosts'], (arrays['time_hosts'], arrays['host_hosts']) = \
+        _compact(meta['hosts'], arrays['time_hosts'], arrays['host_hosts'])
+    meta['sources'], (arrays['host_sources'],) = _compact(meta['sources'], arrays['host_sources'])
+    if meta['watermark'] == float('-inf'):
+        meta['watermark'] = None # JSON không có -inf: extractor chưa thấy flow nào
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.extractor-state-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return os.path.getsize(path)
+
+def load_snapshot(path=EXTRACTOR_SNAPSHOT_PATH):
+    """Đọc snapshot (dict như snapshot_state trả về); None nếu không có file hoặc file hỏng."""
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            state = {name: data[name] for name in data.files}
+        meta = json.loads(state['meta'].tobytes().decode('utf-8'))
+        if meta.get('version') != 1:
+            raise ValueError(f"phiên bản {meta.get('version')} không được hỗ trợ")
+        if meta['watermark'] is None:
+            meta['watermark'] = float('-inf')
+        state['meta'] = meta
+        return state
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Không đọc được snapshot trạng thái extractor {path}: {e}. Bắt đầu với cửa sổ rỗng.")
+        return None
+
+def restore_extractor(extractor, path=EXTRACTOR_SNAPSHOT_PATH, now=None):
+    """
+    Nạp snapshot (nếu có) vào extractor vừa khởi tạo.
+    :return: (số flow cửa sổ thời gian, số flow cửa sổ host) đã nạp.
+    """
+    start = time.perf_counter()
+    state = load_snapshot(path)
+    if state is None:
+        return 0, 0
+    restored = extractor.restore_state(state, now=now)
+    logging.info(f"Đã nạp snapshot trạng thái extractor từ {path}: {restored[0]} flow cửa sổ thời gian, "
+                 f"{restored[1]} flow cửa sổ host ({(time.perf_counter() - start) * 1000:.0f} ms).")
+    return restored
+
+class ExtractorSnapshotter:
+    """
+    Ghi snapshot định kỳ mà không chặn vòng chấm điểm: luồng gọi snapshot() chỉ chép các cột của bộ đệm vòng
+    (snapshot_state), việc đánh lại mã, mã hóa và ghi đĩa (fsync) diễn ra ở luồng 'extractor-snapshot'.
+    Lần ghi trước chưa xong thì lần chụp mới bị bỏ qua.
+    """
+
+    name = 'extractor-snapshot'
+
+    def __init__(self, path=EXTRACTOR_SNAPSHOT_PATH, interval_sec=EXTRACTOR_SNAPSHOT_INTERVAL_SEC):
+        """
+        :param path: File .npz chứa snapshot.
+        :param interval_sec: Khoảng thời gian tối thiểu giữa hai lần chụp (due()).
+        """
+        self.path = path
+        self.interval_sec = interval_sec
+        self.stats = {'written': 0, 'skipped': 0, 'failed': 0, 'last_bytes': 0, 'last_copy_ms': 0.0,
+                      'last_write_ms': 0.0}
+        self._last_snapshot = time.monotonic()
+        self._thread = None
+
+    def due(self):
+        return time.monotonic() - self._last_snapshot >= self.interval_sec
+
+    def snapshot(self, extractor, wait=False):
+        """
+        Chụp trạng thái hiện tại của extractor và ghi ở luồng nền.
+        :param wait: Chờ ghi xong (khi dừng monitor), kể cả chờ lần ghi trước.
+        :return: True nếu đã chụp, False nếu bỏ qua vì lần ghi trước chưa xong.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            if not wait:
+                self.stats['skipped'] += 1
+                return False
+            self._thread.join()
+        start = time.perf_counter()
+        state = extractor.snapshot_state()
+        self.stats['last_copy_ms'] = (time.perf_counter() - start) * 1000
+        self._last_snapshot = time.monotonic()
+        self._thread = threading.Thread(target=self._write, args=(state,), name=self.name, daemon=True)
+        self._thread.start()
+        if wait:
+            self._thread.join()
+        return True
+
+    def close(self, extractor=None):
+        """Chờ lần ghi đang chạy; có `extractor` thì chụp và ghi lần cuối (đồng bộ)."""
+        if extractor is not None:
+            self.snapshot(extractor, wait=True)
+        elif self._thread is not None:
+            self._thread.join()
+        logging.info(f"Đã đóng ExtractorSnapshotter: {self.stats}")
+
+    def _write(self, state):
+        start = time.perf_counter()
+        try:
+            self.stats['last_bytes'] = save_snapshot(state, self.path)
+            self.stats['written'] += 1
+        except Exception as e:
+            self.stats['failed'] += 1
+            logging.error(f"Không thể ghi snapshot trạng thái extractor {self.path}: {e}")
+        self.stats['last_write_ms'] = (time.perf_counter() - start) * 1000
+
+def create_extractor_snapshotter(extractor):
+    """
+    Nạp snapshot vào extractor và trả về ExtractorSnapshotter nếu EXTRACTOR_SNAPSHOT_ENABLED, không thì None.
+    """
+    if not EXTRACTOR_SNAPSHOT_ENABLED:
+        return None
+    restore_extractor(extractor)
+    return ExtractorSnapshotter()
@@ -0,0 +1,139 @@
+# src/hyperparameter_search.py
+
+import itertools
+import json
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.config import (TRAIN_SEARCH_GRID, TRAIN_SEARCH_WORKERS, TRAIN_TREE_METHOD, TRAIN_VALIDATION_SIZE,
+                        TRAIN_EARLY_STOPPING_ROUNDS, TRAIN_SELECTION_METRIC, TRAIN_LATENCY_PENALTY,
+                        TRAIN_MAX_LATENCY_MS_PER_1K, TRAIN_SEARCH_REPORT_PATH, XGB_NTHREAD)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+LATENCY_ROWS = 1000
+
+# Dữ liệu của tiến trình worker, nạp một lần bởi _init_worker thay vì gửi kèm mỗi ứng viên
+_worker_data = None
+
+def expand_grid(grid):
+    """{'a': [1, 2], 'b': [3]} -> [{'a': 1, 'b': 3}, {'a': 2, 'b': 3}]"""
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def evaluate_model(model, X, y):
+    """Accuracy, precision, recall, F1 và ROC AUC của mô hình nhị phân trên (X, y)."""
+    from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
+    y_proba = model.predict_proba(X)[:, 1]
+    y_pred = (y_proba > 0.5).astype(np.int8)
+    return {
+        'accuracy': float(accuracy_score(y, y_pred)),
+        'precision': float(precision_score(y, y_pred, zero_division=0)),
+        'recall': float(recall_score(y, y_pred, zero_division=0)),
+        'f1': float(f1_score(y, y_pred, zero_division=0)),
+        'roc_auc': float(roc_auc_score(y, y_proba)),
+    }
+
+def measure_latency_ms_per_1k(model, X, nthread=XGB_NTHREAD, repeat=20):
+    """Độ trễ dự đoán (ms) cho một lô LATENCY_ROWS dòng qua đường chấm điểm của monitor (BoosterModel)."""
+    from src.model_runtime import BoosterModel
+    runtime = BoosterModel(model.get_booster(), nthread=nthread)
+    rows = X[:LATENCY_ROWS]
+    runtime.predict_proba(rows) # Làm nóng
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        runtime.predict_proba(rows)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000 * LATENCY_ROWS / rows.shape[0]
+
+def _init_worker(X_train, y_train, X_val, y_val):
+    global _worker_data
+    _worker_data = (X_train, y_train, X_val, y_val)
+
+def _fit_candidate(params, n_jobs):
+    """Huấn luyện một ứng viên trong tiến trình worker; trả về chỉ số trên tập validation và mô hình đã pickle."""
+    import xgboost as xgb
+    X_train, y_train, X_val, y_val = _worker_data
+    model = xgb.XGBClassifier(objective='binary:logistic', eval_metric='logloss', tree_method=TRAIN_TREE_METHOD,
+                              early_stopping_rounds=TRAIN_EARLY_STOPPING_ROUNDS, n_jobs=n_jobs,
+                              random_state=42, **params)
+    start = time.perf_counter()
+    model.fit(X_train, y_train, eval_set=[(X_val, y_val)], verbose=False)
+    fit_sec = time.perf_counter() - start
+    result = {'params': params, 'fit_sec': fit_sec, 'best_iteration': int(model.best_iteration)}
+    result.update(evaluate_model(model, X_val, y_val))
+    return result, pickle.dumps(model)
+
+def selection_score(result, metric=TRAIN_SELECTION_METRIC, latency_penalty=TRAIN_LATENCY_PENALTY,
+                    max_latency_ms=TRAIN_MAX_LATENCY_MS_PER_1K):
+    """Giá trị hàm mục tiêu (càng lớn càng tốt); None nếu ứng viên vượt giới hạn độ trễ."""
+    if max_latency_ms is not None and result['latency_ms_per_1k'] > max_latency_ms:
+        return None
+    return result[metric] - latency_penalty * result['latency_ms_per_1k']
+
+def search_hyperparameters(X_train, y_train, grid=TRAIN_SEARCH_GRID, workers=TRAIN_SEARCH_WORKERS,
+                           validation_size=TRAIN_VALIDATION_SIZE, report_path=TRAIN_SEARCH_REPORT_PATH):
+    """
+    Tìm siêu tham số XGBoost: huấn luyện các tổ hợp của `grid` song song trên một process pool
+    (tree_method hist, early stopping trên tập validation tách phân tầng từ tập train),
+    đo độ trễ dự đoán từng ứng viên lần lượt (không chạy song song để số đo không nhiễu)
+    rồi chọn ứng viên có selection_score lớn nhất.
+    :param workers: Số tiến trình (None = số lõi CPU); các lõi được chia đều cho n_jobs của mỗi ứng viên.
+    :param report_path: Ghi kết quả mọi ứng viên ra JSON (None để không ghi).
+    :return: (mô hình XGBClassifier tốt nhất, danh sách kết quả các ứng viên).
+    :raises ValueError: Nếu không ứng viên nào thỏa giới hạn độ trễ.
+    """
+    from sklearn.model_selection import train_test_split
+
+    X_fit, X_val, y_fit, y_val = train_test_split(X_train, np.asarray(y_train), test_size=validation_size,
+                                                  stratify=np.asarray(y_train), random_state=42)
+    candidates = expand_grid(grid)
+    cpu_count = os.cpu_count() or 1
+    workers = max(1, min(workers or cpu_count, len(candidates)))
+    n_jobs = max(1, cpu_count // workers)
+    logging.info(f"[*] Tìm siêu tham số: {len(candidates)} ứng viên, {workers} tiến trình x {n_jobs} luồng, "
+                 f"train {X_fit.shape[0]} / validation {X_val.shape[0]} dòng.")
+
+    results, models = [], []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(X_fit, y_fit, X_val, y_val)) as pool:
+        for result, model_bytes in pool.map(_fit_candidate, candidates, itertools.repeat(n_jobs)):
+            results.append(result)
+            models.append(pickle.loads(model_bytes))
+            logging.info(f"    {result['params']}: {result['fit_sec']:.1f}s, {result['best_iteration'] + 1} cây, "
+                         f"F1 {result['f1']:.4f}, ROC AUC {result['roc_auc']:.4f}")
+    search_sec = time.perf_counter() - start
+
+    best_index, best_score = None, None
+    for i, (result, model) in enumerate(zip(results, models)):
+        result['latency_ms_per_1k'] = measure_latency_ms_per_1k(model, X_val)
+        result['score'] = selection_score(result)
+        if result['score'] is not None and (best_score is None or result['score'] > best_score):
+            best_index, best_score = i, result['score']
+
+    logging.info(f"[*] Kết quả tìm siêu tham số ({search_sec:.1f}s), mục tiêu = {TRAIN_SELECTION_METRIC} - "
+                 f"{TRAIN_LATENCY_PENALTY} x ms/1k dòng:")
+    for i, result in enumerate(results):
+        score = 'loại (quá chậm)' if result['score'] is None else f"{result['score']:.4f}"
+        logging.info(f"  {'*' if i == best_index else ' '} {result['params']}: fit {result['fit_sec']:6.1f}s | "
+                     f"{result['latency_ms_per_1k']:7.3f} ms/1k dòng | acc {result['accuracy']:.4f} | "
+                     f"F1 {result['f1']:.4f} | AUC {result['roc_auc']:.4f} | mục tiêu {score}")
+
+    if report_path:
+        os.makedirs(os.path.dirname(report_path) or '.', exist_ok=True)
+        with open(report_path, 'w', encoding='utf-8') as f:
+            json.dump({'search_sec': search_sec, 'metric': TRAIN_SELECTION_METRIC,
+                       'latency_penalty': TRAIN_LATENCY_PENALTY, 'best': best_index, 'candidates': results},
+                      f, indent=2)
+        logging.info(f"Đã ghi kết quả tìm siêu tham số tại: {report_path}")
+
+    if best_index is None:
+        raise ValueError(f"Không ứng viên nào có độ trễ <= {TRAIN_MAX_LATENCY_MS_PER_1K} ms/1k dòng.")
+    return models[best_index], results
@@ -0,0 +1,330 @@
+# src/merged_monitor.py
+"""
+Theo dõi conn.log của nhiều thư mục log Zeek (nhiều sensor/worker Zeek) bằng một ZeekFeatureExtractor chung.
+Mỗi thư mục có một LogSourceTailer (luồng đọc riêng: I/O và parse không chặn nhau) đưa các khối đã đọc vào
+một hàng đợi chung có giới hạn. Vòng lặp chính trộn các khối theo ts bằng BoundedLatenessMerger (k-way merge
+trên heap, chờ trễ có giới hạn) rồi mới trích xuất đặc trưng, nên các cửa sổ thời gian/host thấy flow của
+mọi sensor theo đúng thứ tự thời gian.
+"""
+
+import heapq
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+from src.checkpoint import OffsetCheckpoint, file_identity
+from src.config import (MONITOR_BATCH_SIZE, MONITOR_BATCH_TIMEOUT_MS, MONITOR_MERGE_LATENESS_SEC,
+                        MONITOR_MERGE_IDLE_SEC, MONITOR_MERGE_MAX_BUFFER, MONITOR_SOURCE_QUEUE_SIZE)
+from src.stream_monitor import ZEEK_CONN_LOG_FILE_NAME, _open_conn_log, _resume_reader, _timed_blocks
+from src.zeek_reader import CONN_LOG_SCORING_FIELDS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+class LogSourceTailer:
+    """
+    Luồng nền theo dõi conn.log của một thư mục log: đọc dữ liệu mới theo khối, chuyển thành dict
+    và đưa (nguồn, đường dẫn, (dev, inode), vị trí sau khối, các dict flow) vào hàng đợi chung.
+    Vị trí bắt đầu và xử lý khi Zeek xoay log giống _monitor_loop (xem _resume_reader). Hàng đợi đầy thì
+    luồng chờ (áp lực ngược), khối chưa kịp đưa vào khi dừng sẽ được đọc lại nhờ checkpoint.
+    """
+
+    def __init__(self, source, log_dir, blocks, checkpoint, metrics=None, from_start=False):
+        """
+        :param source: Chỉ số của nguồn trong BoundedLatenessMerger.
+        :param blocks: queue.Queue chung của mọi nguồn.
+        :param checkpoint: OffsetCheckpoint để chọn vị trí bắt đầu (chỉ đọc).
+        :param metrics: MonitorMetrics ghi nhận thời gian parse và độ trễ ingest của từng khối.
+        :param from_start: Không có checkpoint thì đọc từ đầu file thay vì từ cuối file.
+        """
+        self.source = source
+        self.log_dir = log_dir
+        self.log_path = os.path.join(log_dir, ZEEK_CONN_LOG_FILE_NAME)
+        self.blocks = blocks
+        self.checkpoint = checkpoint
+        self.metrics = metrics
+        self.from_start = from_start
+        self.reader = None
+        self.stats = {'blocks': 0, 'flows': 0, 'rotations': 0}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=f"log-source-{self.source}", daemon=True)
+            self._thread.start()
+        return self
+
+    def close(self, timeout=5.0):
+        """Dừng luồng đọc và đóng file."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+
+    def backlog(self):
+        """Số byte đã có trong conn.log nhưng chưa được đọc."""
+        reader = self.reader
+        return reader.backlog() if reader is not None else 0
+
+    def _put(self, identity, end_offset, records):
+        """Đưa một khối vào hàng đợi chung, chờ khi đầy. :return: False nếu luồng bị dừng trước khi đưa được."""
+        item = (self.source, self.log_path, identity, end_offset, records)
+        while not self._stop_event.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _read(self, blocks, identity):
+        """Đưa mọi khối của iterator vào hàng đợi. :return: Số flow đã đọc."""
+        flows = 0
+        for zeek_batch in _timed_blocks(blocks, self.metrics):
+            records = zeek_batch.to_records(CONN_LOG_SCORING_FIELDS)
+            if not self._put(identity, zeek_batch.end_offset, records):
+                break
+            flows += len(records)
+            self.stats['blocks'] += 1
+        self.stats['flows'] += flows
+        return flows
+
+    def _open(self, after_rotation):
+        """Mở conn.log, chọn vị trí bắt đầu và đọc nốt file cũ đã xoay (nếu có). :return: (dev, inode) hoặc None."""
+        reader = _open_conn_log(self.log_path)
+        if reader is None:
+            return None
+        identity = file_identity(reader.fileno())
+        rotated = _resume_reader(reader, self.log_path, identity, self.checkpoint, after_rotation or self.from_start)
+        if rotated is not None:
+            try:
+                rotated_identity = file_identity(rotated.fileno())
+                self._put(rotated_identity, rotated.position, [])
+                self._read(iter(rotated), rotated_identity)
+            finally:
+                rotated.close()
+        self.reader = reader
+        self._put(identity, reader.position, []) # Vị trí bắt đầu được ghi checkpoint kể cả khi chưa có dòng mới
+        return identity
+
+    def _run(self):
+        identity = None
+        rotated = False
+        while not self._stop_event.is_set():
+            try:
+                new_identity = file_identity(self.log_path)
+                if self.reader is not None and new_identity != identity:
+                    # Zeek xoay log: đọc nốt file cũ (fd vẫn hợp lệ sau khi đổi tên) rồi mở file mới từ đầu
+                    self._read(iter(self.reader), identity)
+                    self.reader.close()
+                    self.reader = None
+                    self.stats['rotations'] += 1
+                    rotated = True
+                    logging.info(f"{self.log_path} đã được xoay, chuyển sang file mới.")
+                if self.reader is None:
+                    identity = self._open(rotated) if new_identity is not None else None
+                    if identity is None:
+                        self._stop_event.wait(1.0) # Chờ Zeek tạo log file
+                        continue
+                    rotated = False
+                if not self._read(self.reader.read_batches(), identity):
+                    self._stop_event.wait(0.1)
+            except FileNotFoundError:
+                if self.reader is not None:
+                    self.reader.close()
+                self.reader = None
+                self._stop_event.wait(1.0)
+            except Exception as e:
+                logging.error(f"Lỗi khi đọc {self.log_path}: {e}", exc_info=True)
+                self._stop_event.wait(1.0)
+
+class BoundedLatenessMerger:
+    """
+    Trộn k luồng flow (mỗi luồng gần đúng thứ tự ts, Zeek ghi conn.log khi kết nối kết thúc) thành một luồng
+    theo thứ tự (ts, nguồn, thứ tự trong nguồn). Flow được giữ trong heap tới khi mọi nguồn đang hoạt động
+    đã đọc tới ts >= ts của flow + lateness_sec. Nguồn không có khối mới trong idle_sec không được chờ.
+    Flow đến muộn hơn mức đó (ts nhỏ hơn flow đã giải phóng) vẫn được giải phóng ngay và được đếm ('late');
+    heap vượt max_buffer flow thì flow có ts nhỏ nhất được giải phóng sớm ('forced').
+    """
+
+    def __init__(self, sources, lateness_sec=MONITOR_MERGE_LATENESS_SEC, idle_sec=MONITOR_MERGE_IDLE_SEC,
+                 max_buffer=MONITOR_MERGE_MAX_BUFFER):
+        """:param sources: Tên của từng nguồn (thư mục log), theo chỉ số nguồn."""
+        self.sources = list(sources)
+        self.lateness_sec = lateness_sec
+        self.idle_sec = idle_sec
+        self.max_buffer = max(1, max_buffer)
+        n = len(self.sources)
+        self.heap = [] # (ts, nguồn, thứ tự trong nguồn, khối, dict flow)
+        self.max_ts = [float('-inf')] * n # ts lớn nhất đã đọc của từng nguồn
+        self.buffered = [0] * n
+        self.last_arrival = [time.monotonic()] * n
+        self.positions = [None] * n # (đường dẫn, (dev, inode), vị trí) mà mọi flow phía trước đã được giải phóng
+        self.frontier = float('-inf') # ts lớn nhất đã giải phóng
+        self.stats = {'released': 0, 'late': 0, 'forced': 0}
+        self._blocks = [deque() for _ in range(n)] # [đường dẫn, (dev, inode), vị trí, số flow chưa giải phóng]
+        self._seq = [0] * n
+
+    def __len__(self):
+        return len(self.heap)
+
+    def add(self, source, path, identity, end_offset, records):
+        """Nhận một khối của nguồn `source` (như LogSourceTailer đưa vào hàng đợi)."""
+        block = [path, identity, end_offset, len(records)]
+        self._blocks[source].append(block)
+        self.last_arrival[source] = time.monotonic()
+        if not records:
+            return
+        heap, push = self.heap, heapq.heappush
+        seq, max_ts = self._seq[source], self.max_ts[source]
+        for record in records:
+            ts = record['ts']
+            push(heap, (ts, source, seq, block, record))
+            seq += 1
+            if ts > max_ts:
+                max_ts = ts
+        self._seq[source], self.max_ts[source] = seq, max_ts
+        self.buffered[source] += len(records)
+
+    def release(self, flush=False):
+        """
+        Lấy ra các flow đã đủ điều kiện theo thứ tự ts.
+        :param flush: Giải phóng mọi flow đang giữ (khi dừng).
+        :return: Danh sách dict flow.
+        """
+        threshold = float('inf')
+        if not flush:
+            now = time.monotonic()
+            active = [max_ts for max_ts, arrival in zip(self.max_ts, self.last_arrival) if now - arrival < self.idle_sec]
+            if active:
+                threshold = min(active) - self.lateness_sec
+        heap, pop = self.heap, heapq.heappop
+        released = []
+        while heap and (heap[0][0] <= threshold or len(heap) > self.max_buffer):
+            ts, source, _, block, record = pop(heap)
+            if ts > threshold:
+                self.stats['forced'] += 1
+            if ts < self.frontier:
+                self.stats['late'] += 1
+            else:
+                self.frontier = ts
+            block[3] -= 1
+            self.buffered[source] -= 1
+            released.append(record)
+        self.stats['released'] += len(released)
+        for source, blocks in enumerate(self._blocks):
+            while blocks and blocks[0][3] == 0:
+                path, identity, offset, _ = blocks.popleft()
+                self.positions[source] = (path, identity, offset)
+        return released
+
+    def source_lag(self, source):
+        """ts lớn nhất của mọi nguồn trừ ts lớn nhất của nguồn `source` (giây, NaN nếu nguồn chưa có flow)."""
+        if self.max_ts[source] == float('-inf'):
+            return float('nan')
+        return max(self.max_ts) - self.max_ts[source]
+
+    def summary(self):
+        lags = ', '.join(f"{os.path.basename(os.path.normpath(name)) or name} {self.source_lag(i):.1f}s"
+                         for i, name in enumerate(self.sources))
+        return (f"{self.stats['released']} flow đã trộn, {self.stats['late']} đến muộn, "
+                f"{self.stats['forced']} giải phóng sớm, {len(self.heap)} đang chờ | độ trễ theo nguồn: {lags}")
+
+def _update_checkpoint(checkpoint, merger):
+    for position in merger.positions:
+        if position is not None:
+            checkpoint.update(*position)
+
+def _drain(blocks):
+    items = []
+    while True:
+        try:
+            items.append(blocks.get_nowait())
+        except queue.Empty:
+            return items
+
+def merged_monitor_loop(batcher, log_dirs, snapshotter=None, checkpoint=None, merger=None, from_start=False,
+                        stop_event=None):
+    """
+    Vòng lặp theo dõi nhiều thư mục log: đọc song song, trộn theo ts, trích xuất đặc trưng và chấm điểm theo lô.
+    Vị trí đã chấm điểm xong của từng conn.log được checkpoint (và trạng thái extractor được chụp) chỉ khi
+    batcher không còn flow chờ, lúc đó mọi flow bộ trộn đã giải phóng đều đã được chấm điểm. Dưới tải liên tục
+    batcher hầu như luôn giữ một lô dở, nên mỗi khi tới hạn checkpoint (interval_sec) hoặc snapshot thì lô đó
+    được chấm điểm ngay thay vì chờ đầy.
+    :param batcher: FlowBatcher (dùng add_records).
+    :param checkpoint: OffsetCheckpoint, mặc định đọc từ CHECKPOINT_PATH.
+    :param merger: BoundedLatenessMerger của log_dirs, mặc định theo cấu hình MONITOR_MERGE_*.
+    :param from_start: Đọc từ đầu các file chưa có checkpoint (mặc định từ cuối file như _monitor_loop).
+    :param stop_event: threading.Event để dừng vòng lặp (mặc định chạy tới khi bị ngắt).
+    """
+    checkpoint = checkpoint or OffsetCheckpoint().load()
+    stop_event = stop_event or threading.Event()
+    blocks = queue.Queue(maxsize=max(1, MONITOR_SOURCE_QUEUE_SIZE))
+    tailers = [LogSourceTailer(i, log_dir, blocks, checkpoint, metrics=batcher.metrics, from_start=from_start)
+               for i, log_dir in enumerate(log_dirs)]
+    if merger is None:
+        merger = BoundedLatenessMerger(log_dirs)
+    if batcher.metrics is not None:
+        batcher.metrics.watch_log_sources(merger, tailers)
+        batcher.metrics.watch_queue('source_blocks', blocks.qsize)
+
+    batch_size = max(1, MONITOR_BATCH_SIZE)
+    batch_timeout_ms = MONITOR_BATCH_TIMEOUT_MS
+    logging.info(f"Theo dõi {len(log_dirs)} thư mục log, trộn theo ts với độ trễ tối đa {merger.lateness_sec}s: "
+                 f"{', '.join(log_dirs)}")
+    for tailer in tailers:
+        tailer.start()
+    last_commit = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            try:
+                try:
+                    items = [blocks.get(timeout=0.1)]
+                except queue.Empty:
+                    items = []
+                for item in items + _drain(blocks):
+                    merger.add(*item)
+                records = merger.release()
+                if records:
+                    batcher.add_records(records, batch_size, batch_timeout_ms)
+                elif batcher.pending and batcher.waited_ms() >= batch_timeout_ms:
+                    batcher.flush()
+
+                snapshot_due = snapshotter is not None and snapshotter.due()
+                if batcher.pending and (snapshot_due or time.monotonic() - last_commit >= checkpoint.interval_sec):
+                    batcher.flush() # Lô dở: chấm điểm để vị trí đã xử lý tiến lên
+                if not batcher.pending:
+                    last_commit = time.monotonic()
+                    _update_checkpoint(checkpoint, merger)
+                    checkpoint.maybe_save()
+                    if snapshot_due:
+                        checkpoint.save()
+                        snapshotter.snapshot(batcher.feature_extractor)
+            except Exception as e:
+                logging.error(f"Lỗi tổng quát khi trộn hoặc xử lý log Zeek: {e}", exc_info=True)
+                time.sleep(1)
+    finally:
+        # Dừng: chấm điểm nốt mọi flow đã đọc (kể cả flow bộ trộn đang giữ) và lưu vị trí cuối cùng
+        for tailer in tailers:
+            tailer.close()
+        try:
+            for item in _drain(blocks):
+                merger.add(*item)
+            batcher.add_records(merger.release(flush=True), batch_size, log_flows=False)
+            batcher.flush()
+        except Exception as e:
+            logging.error(f"Lỗi khi chấm điểm lô cuối trước khi dừng: {e}")
+        if not batcher.pending:
+            _update_checkpoint(checkpoint, merger)
+        checkpoint.save()
+        if snapshotter is not None:
+            snapshotter.close(batcher.feature_extractor if not batcher.pending else None)
+        logging.info(f"[*] Bộ trộn nhiều nguồn: {merger.summary()}")
+    return merger
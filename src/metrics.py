@@ -0,0 +1,417 @@
+# src/metrics.py
+
+import bisect
+import logging
+import math
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.config import (METRICS_HOST, METRICS_PORT, METRICS_LOG_INTERVAL_SEC,
+                        METRICS_LATENCY_BUCKETS, METRICS_LAG_BUCKETS)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Các bước của đường chấm điểm có histogram độ trễ riêng
+MONITOR_STAGES = ('parse', 'extract', 'transform', 'predict', 'explain', 'sink')
+WINDOW_NAMES = ('time_flows', 'host_flows', 'time_hosts', 'time_services', 'host_hosts', 'host_services',
+                'interned_hosts', 'time_capacity')
+
+class Counter:
+    """Bộ đếm tăng dần. Nếu có func thì giá trị được đọc từ func() lúc xuất (ví dụ AlertSink.stats)."""
+
+    def __init__(self, func=None):
+        self._value = 0
+        self._func = func
+        self._lock = threading.Lock()
+
+    def inc(self, n=1):
+        with self._lock:
+            self._value += n
+
+    @property
+    def value(self):
+        return self._func() if self._func is not None else self._value
+
+class Gauge:
+    """Giá trị tức thời; func (nếu có) được gọi lúc xuất nên không tốn gì trên đường nóng."""
+
+    def __init__(self, func=None):
+        self._value = 0.0
+        self._func = func
+
+    def set(self, value):
+        self._value = value
+
+    @property
+    def value(self):
+        if self._func is None:
+            return self._value
+        try:
+            return self._func()
+        except Exception: # Ví dụ multiprocessing.Queue.qsize() không hỗ trợ trên macOS
+            return math.nan
+
+class Histogram:
+    """Histogram với các ngưỡng cố định (giây); observe() chỉ là một lần bisect và vài phép cộng."""
+
+    def __init__(self, buckets):
+        self.bounds = sorted(float(b) for b in buckets)
+        self._counts = [0] * (len(self.bounds) + 1) # Ô cuối cùng là +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self):
+        """(số mẫu của từng ô, không cộng dồn; tổng giá trị)."""
+        with self._lock:
+            return list(self._counts), self._sum
+
+def bucket_quantile(bounds, counts, q):
+    """Ước lượng phân vị q từ số mẫu của từng ô: trả về cận trên của ô chứa phân vị (inf nếu vượt ô cuối)."""
+    total = sum(counts)
+    if total == 0:
+        return None
+    rank = q * total
+    cumulative = 0
+    for bound, count in zip(bounds + [math.inf], counts):
+        cumulative += count
+        if cumulative >= rank:
+            return bound
+    return math.inf
+
+def _format_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return 'NaN'
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + '}'
+
+class MetricsRegistry:
+    """Tập các chỉ số theo tên (mỗi tên có thể có nhiều bộ nhãn), xuất theo định dạng văn bản của Prometheus."""
+
+    def __init__(self):
+        self._families = {} # tên -> (kiểu, mô tả, {bộ nhãn: chỉ số})
+        self._lock = threading.Lock()
+
+    def _register(self, kind, name, help_text, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, (kind, help_text, {}))
+            if family[0] != kind:
+                raise ValueError(f"Chỉ số '{name}' đã được khai báo với kiểu {family[0]}.")
+            if key not in family[2]:
+                family[2][key] = factory()
+            return family[2][key]
+
+    def counter(self, name, help_text, func=None, **labels):
+        return self._register('counter', name, help_text, labels, lambda: Counter(func))
+
+    def gauge(self, name, help_text, func=None, **labels):
+        return self._register('gauge', name, help_text, labels, lambda: Gauge(func))
+
+    def histogram(self, name, help_text, buckets, **labels):
+        return self._register('histogram', name, help_text, labels, lambda: Histogram(buckets))
+
+    def family(self, name):
+        """Danh sách (dict nhãn, chỉ số) đã khai báo với tên `name`."""
+        with self._lock:
+            metrics = self._families.get(name, (None, None, {}))[2]
+            return [(dict(labels), metric) for labels, metric in metrics.items()]
+
+    def render(self):
+        """Toàn bộ chỉ số theo định dạng text exposition 0.0.4 của Prometheus."""
+        with self._lock:
+            families = [(name, kind, help_text, list(metrics.items()))
+                        for name, (kind, help_text, metrics) in sorted(self._families.items())]
+        lines = []
+        for name, kind, help_text, metrics in families:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in metrics:
+                if kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(metric.value)}")
+                    continue
+                counts, total = metric.snapshot()
+                cumulative = 0
+                for bound, count in zip(metric.bounds + [math.inf], counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+class MonitorMetrics:
+    """
+    Các chỉ số của monitor: histogram độ trễ từng bước (MONITOR_STAGES), bộ đếm flow/dòng lỗi/cảnh báo,
+    độ trễ ingest (giờ hệ thống trừ ts của Zeek), kích thước cửa sổ của extractor và độ sâu các hàng đợi.
+    Đường nóng chỉ cập nhật chỉ số một lần cho mỗi khối/lô (không phải mỗi flow); các giá trị như
+    độ sâu hàng đợi được đọc qua hàm lúc xuất. Xuất qua HTTP (/metrics) và dòng log tổng kết định kỳ.
+    """
+
+    def __init__(self, registry=None):
+        self.registry = registry or MetricsRegistry()
+        r = self.registry
+        self.stage_latency = {stage: r.histogram('ids_stage_duration_seconds',
+                                                 "Thời gian xử lý một khối (parse, extract) hoặc một lô (transform, predict, sink).",
+                                                 METRICS_LATENCY_BUCKETS, stage=stage)
+                              for stage in MONITOR_STAGES}
+        self.flows_read = r.counter('ids_flows_read_total', "Số flow đọc từ conn.log.")
+        self.flows_scored = r.counter('ids_flows_scored_total', "Số flow đã chấm điểm.")
+        self.flows_skipped = r.counter('ids_flows_skipped_total', "Số flow ZeekFeatureExtractor bỏ qua (không có đặc trưng).")
+        self.skipped_lines = r.counter('ids_skipped_lines_total', "Số dòng conn.log không đọc được.")
+        self.mismatched_lines = r.counter('ids_column_mismatch_lines_total', "Số dòng conn.log có số cột khác header #fields.")
+        self.alerts = r.counter('ids_alerts_total', "Số flow bị đánh giá Malicious.")
+        self.ingest_lag = r.gauge('ids_ingest_lag_seconds', "Giờ hệ thống trừ ts lớn nhất của khối conn.log vừa đọc.")
+        self.ingest_lag_histogram = r.histogram('ids_ingest_lag_distribution_seconds',
+                                                "Phân bố độ trễ ingest của các khối conn.log.", METRICS_LAG_BUCKETS)
+        self.cache_hits = r.counter('ids_prediction_cache_hits_total', "Số flow lấy xác suất từ cache dự đoán.")
+        self.cache_misses = r.counter('ids_prediction_cache_misses_total', "Số flow không có trong cache dự đoán (khi bật cache).")
+        self.cache_evictions = r.counter('ids_prediction_cache_evictions_total', "Số phần tử bị bỏ khỏi cache dự đoán vì đầy.")
+        self.cascade_short_circuited = r.counter('ids_cascade_short_circuited_total',
+                                                 "Số flow bộ lọc cascade kết luận Normal, không qua mô hình đầy đủ.")
+        self.last_flow_ts = r.gauge('ids_last_flow_timestamp_seconds', "ts lớn nhất (Zeek) đã đọc.")
+        self._server = None
+        self._reporter = None
+
+    # --- Cập nhật từ đường nóng ---
+
+    def observe_stage(self, stage, seconds):
+        self.stage_latency[stage].observe(seconds)
+
+    def observe_block(self, zeek_batch, parse_sec):
+        """Ghi nhận một ZeekConnBatch vừa đọc: thời gian parse, số flow/dòng lỗi và độ trễ ingest."""
+        self.stage_latency['parse'].observe(parse_sec)
+        n = len(zeek_batch)
+        self.flows_read.inc(n)
+        if zeek_batch.skipped_lines:
+            self.skipped_lines.inc(zeek_batch.skipped_lines)
+        if zeek_batch.mismatched_lines:
+            self.mismatched_lines.inc(zeek_batch.mismatched_lines)
+        ts = zeek_batch.column('ts') if n else None
+        if ts is not None:
+            last_ts = float(ts.max())
+            lag = time.time() - last_ts
+            self.last_flow_ts.set(last_ts)
+            self.ingest_lag.set(lag)
+            self.ingest_lag_histogram.observe(lag)
+
+    def observe_scored(self, n_flows, n_alerts, timings=None):
+        """Ghi nhận một lô đã chấm điểm; timings là dict 'preprocess'/'predict' (giây) do score_batch trả về."""
+        self.flows_scored.inc(n_flows)
+        if n_alerts:
+            self.alerts.inc(n_alerts)
+        if timings:
+            self.stage_latency['transform'].observe(timings['preprocess'])
+            self.stage_latency['predict'].observe(timings['predict'])
+            if 'cache_hits' in timings:
+                self.cache_hits.inc(timings['cache_hits'])
+                self.cache_misses.inc(n_flows - timings['cache_hits'])
+                if timings['cache_evictions']:
+                    self.cache_evictions.inc(timings['cache_evictions'])
+            if timings.get('short_circuited'):
+                self.cascade_short_circuited.inc(timings['short_circuited'])
+
+    # --- Giá trị đọc lúc xuất ---
+
+    def watch_queue(self, name, func, **labels):
+        """Độ sâu hàng đợi `name`, đọc bằng func() mỗi lần xuất."""
+        self.registry.gauge('ids_queue_depth', "Số phần tử đang chờ trong hàng đợi.", func=func, queue=name, **labels)
+
+    def watch_extractor(self, extractor, shard=None):
+        """
+        Kích thước các cửa sổ/bảng đếm của một ZeekFeatureExtractor (xem window_sizes()).
+        :param extractor: ZeekFeatureExtractor, hoặc hàm trả về dict như window_sizes() (extractor nằm ở tiến trình khác).
+        """
+        sizes = extractor if callable(extractor) else extractor.window_sizes
+        labels = {} if shard is None else {'shard': str(shard)}
+        for window in WINDOW_NAMES:
+            self.registry.gauge('ids_extractor_window_size', "Số phần tử trong cửa sổ/bảng đếm của extractor.",
+                                func=lambda window=window: sizes().get(window, float('nan')), window=window, **labels)
+        self.registry.counter('ids_extractor_overload_evictions_total',
+                              "Số flow bị loại sớm khỏi cửa sổ thời gian do vượt EXTRACTOR_MAX_WINDOW_FLOWS.",
+                              func=lambda: sizes().get('overload_evictions', 0), **labels)
+
+    def watch_prediction_cache(self, cache, shard=None):
+        """Số phần tử hiện có trong PredictionCache (hit/miss/eviction được đếm qua observe_scored)."""
+        labels = {} if shard is None else {'shard': str(shard)}
+        self.registry.gauge('ids_prediction_cache_entries', "Số vector đặc trưng trong cache dự đoán.",
+                            func=cache.__len__, **labels)
+        self.registry.counter('ids_prediction_cache_bypassed_batches_total',
+                              "Số lô chấm điểm thẳng vì tỉ lệ hit gần đây dưới PREDICTION_CACHE_MIN_HIT_RATE.",
+                              func=lambda: cache.stats['bypassed_batches'], **labels)
+
+    def watch_log_sources(self, merger, tailers):
+        """Độ sâu bộ trộn, số flow đến muộn và độ trễ/backlog của từng nguồn ở chế độ nhiều thư mục log."""
+        self.watch_queue('merge_buffer', merger.__len__)
+        self.registry.counter('ids_merge_late_flows_total',
+                              "Số flow đến muộn hơn MONITOR_MERGE_LATENESS_SEC, được xử lý ngoài thứ tự ts.",
+                              func=lambda: merger.stats['late'])
+        self.registry.counter('ids_merge_forced_flows_total',
+                              "Số flow được giải phóng sớm vì bộ trộn vượt MONITOR_MERGE_MAX_BUFFER.",
+                              func=lambda: merger.stats['forced'])
+        for tailer in tailers:
+            source = tailer.source
+            self.registry.gauge('ids_source_lag_seconds', "ts lớn nhất của mọi nguồn trừ ts lớn nhất đã đọc của nguồn này.",
+                                func=lambda source=source: merger.source_lag(source), source=tailer.log_dir)
+            self.registry.gauge('ids_source_buffered_flows', "Số flow của nguồn đang chờ trong bộ trộn.",
+                                func=lambda source=source: merger.buffered[source], source=tailer.log_dir)
+            self.registry.gauge('ids_source_backlog_bytes', "Số byte đã có trong conn.log của nguồn nhưng chưa đọc.",
+                                func=tailer.backlog, source=tailer.log_dir)
+
+    def watch_alert_explainer(self, explainer):
+        """Hàng đợi và bộ đếm cảnh báo đã/không được giải thích của AlertExplainer."""
+        self.watch_queue('alert_explainer', explainer.queue.qsize)
+        for key in ('explained', 'unexplained'):
+            self.registry.counter('ids_alert_explanations_total', "Số cảnh báo theo trạng thái giải thích.",
+                                  func=lambda key=key: explainer.stats[key], status=key)
+
+    def watch_model_reloader(self, reloader):
+        """Số lần nạp/từ chối/đổi bộ mô hình của ModelReloader."""
+        for key in ('loaded', 'rejected', 'swapped'):
+            self.registry.counter('ids_model_reloads_total', "Số bộ mô hình mới theo trạng thái nạp lại.",
+                                  func=lambda key=key: reloader.stats[key], status=key)
+
+    def watch_alert_sink(self, alert_sink):
+        """Hàng đợi và bộ đếm ghi/tràn/thử lại của AlertSink."""
+        self.watch_queue('alert_sink', alert_sink.queue.qsize)
+        for key in ('queued', 'written', 'spilled', 'retries'):
+            self.registry.counter('ids_alert_sink_total', "Số cảnh báo theo trạng thái của alert sink.",
+                                  func=lambda key=key: alert_sink.stats[key], status=key)
+
+    # --- Xuất ---
+
+    def start(self, host=METRICS_HOST, port=METRICS_PORT, log_interval_sec=METRICS_LOG_INTERVAL_SEC):
+        """Mở endpoint HTTP (port None thì không mở) và luồng log tổng kết (interval 0/None thì không log)."""
+        if port is not None:
+            try:
+                self._server = MetricsServer(self.registry, host, port).start()
+            except OSError as e:
+                logging.error(f"Không thể mở endpoint metrics tại {host}:{port}: {e}")
+        if log_interval_sec:
+            self._reporter = MetricsReporter(self, log_interval_sec).start()
+        return self
+
+    def close(self):
+        if self._reporter is not None:
+            self._reporter.close()
+            self._reporter = None
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+class MetricsServer:
+    """Endpoint HTTP cục bộ: GET /metrics trả về registry.render() (luồng nền, daemon)."""
+
+    def __init__(self, registry, host=METRICS_HOST, port=METRICS_PORT):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?', 1)[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = registry_ref.render().encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # Không ghi log mỗi lần Prometheus scrape
+                pass
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._httpd.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='metrics-http', daemon=True)
+        self._thread.start()
+        logging.info(f"Endpoint metrics: http://{self.address[0]}:{self.address[1]}/metrics")
+        return self
+
+    def close(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+class MetricsReporter:
+    """Luồng nền ghi một dòng log tổng kết mỗi interval_sec: tốc độ flow, dòng lỗi, cảnh báo, p99 từng bước, hàng đợi."""
+
+    def __init__(self, metrics, interval_sec=METRICS_LOG_INTERVAL_SEC):
+        self.metrics = metrics
+        self.interval_sec = interval_sec
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._last = self._snapshot()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='metrics-log', daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_sec):
+            try:
+                logging.info(self.summary())
+            except Exception as e:
+                logging.error(f"Lỗi khi tổng kết metrics: {e}")
+
+    def _snapshot(self):
+        m = self.metrics
+        return {
+            'time': time.monotonic(),
+            'counters': {name: counter.value for name, counter in (
+                ('read', m.flows_read), ('scored', m.flows_scored), ('skipped', m.flows_skipped),
+                ('bad_lines', m.skipped_lines), ('mismatched', m.mismatched_lines), ('alerts', m.alerts))},
+            'stages': {stage: histogram.snapshot()[0] for stage, histogram in m.stage_latency.items()},
+        }
+
+    def summary(self):
+        """Dòng tổng kết cho khoảng thời gian từ lần gọi trước."""
+        current = self._snapshot()
+        last, self._last = self._last, current
+        elapsed = max(current['time'] - last['time'], 1e-9)
+        delta = {key: current['counters'][key] - last['counters'][key] for key in current['counters']}
+
+        p99 = []
+        for stage, counts in current['stages'].items():
+            bounds = self.metrics.stage_latency[stage].bounds
+            value = bucket_quantile(bounds, [c - p for c, p in zip(counts, last['stages'][stage])], 0.99)
+            if value is not None:
+                p99.append(f"{stage} {'>' + format(bounds[-1] * 1000, 'g') if value == math.inf else '≤' + format(value * 1000, 'g')}")
+
+        depths = [f"{labels['queue']} {_format_value(gauge.value)}"
+                  for labels, gauge in self.metrics.registry.family('ids_queue_depth')]
+
+        return (f"[metrics] {elapsed:.0f}s: {delta['read']} flow đọc ({delta['read'] / elapsed:.0f} flow/s), "
+                f"{delta['scored']} chấm điểm, {delta['skipped']} bỏ qua, {delta['bad_lines']} dòng lỗi, "
+                f"{delta['mismatched']} dòng lệch cột, {delta['alerts']} cảnh báo | "
+                f"trễ ingest {self.metrics.ingest_lag.value:.1f}s | p99 ms: {', '.join(p99) or '-'} | "
+                f"hàng đợi: {', '.join(depths) or '-'}")
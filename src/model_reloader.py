@@ -0,0 +1,285 @@
+# src/model_reloader.py
+"""
+Nạp lại mô hình và preprocessor khi monitor đang chạy, không phải dừng monitor (mất vị trí đọc và cửa sổ
+của extractor) mỗi lần triển khai mô hình mới.
+
+Bộ mô hình được mô tả bởi một manifest JSON (MODEL_MANIFEST_PATH), do train_model ghi sau cùng, khi mọi file
+đã được lưu:
+    {"version": "20261018-101500", "model": "xgb_model.ubj", "preprocessor": "preprocessor.pkl",
+     "cascade": "cascade_prefilter.npz", "sha256": {"model": "...", "preprocessor": "...", "cascade": "..."}}
+Đường dẫn tương đối tính từ thư mục của manifest, nên có thể trỏ vào thư mục theo phiên bản
+(ví dụ "releases/20261018-101500/xgb_model.ubj"); "cascade" và "sha256" không bắt buộc.
+
+ModelReloader theo dõi manifest ở luồng 'model-reloader': khi manifest đổi, luồng này tải bộ mô hình mới,
+kiểm tra checksum và chấm thử vài flow mẫu, rồi đưa ra cho FlowBatcher đổi sang giữa hai lô (take()).
+Vòng chấm điểm không chờ việc tải; bộ mô hình hỏng bị từ chối và mô hình cũ tiếp tục được dùng.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import numpy as np
+
+from src.config import (MODEL_RELOAD_ENABLED, MODEL_MANIFEST_PATH, MODEL_RELOAD_INTERVAL_SEC, PREPROCESSOR_PATH,
+                        XGB_NTHREAD, CASCADE_ENABLED)
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+MANIFEST_ARTIFACTS = ('model', 'preprocessor', 'cascade')
+UNVERSIONED = 'unversioned' # Phiên bản của mô hình tải từ đường dẫn mặc định khi chưa có manifest
+
+# Vài flow conn.log đại diện (HTTP bình thường, SYN không trả lời, cổng bị từ chối, DNS) để chấm thử bộ mô hình mới
+CANARY_ENTRIES = (
+    {'ts': '1700000000.000000', 'id.orig_h': '192.168.1.10', 'id.orig_p': '50000', 'id.resp_h': '10.0.0.1',
+     'id.resp_p': '80', 'proto': 'tcp', 'service': 'http', 'duration': '0.120000', 'orig_bytes': '320',
+     'resp_bytes': '5120', 'conn_state': 'SF'},
+    {'ts': '1700000000.100000', 'id.orig_h': '192.168.1.20', 'id.orig_p': '50001', 'id.resp_h': '10.0.0.1',
+     'id.resp_p': '22', 'proto': 'tcp', 'service': '-', 'duration': '-', 'orig_bytes': '0',
+     'resp_bytes': '0', 'conn_state': 'S0'},
+    {'ts': '1700000000.200000', 'id.orig_h': '192.168.1.20', 'id.orig_p': '50002', 'id.resp_h': '10.0.0.1',
+     'id.resp_p': '23', 'proto': 'tcp', 'service': '-', 'duration': '0.000100', 'orig_bytes': '0',
+     'resp_bytes': '0', 'conn_state': 'REJ'},
+    {'ts': '1700000000.300000', 'id.orig_h': '192.168.1.30', 'id.orig_p': '53000', 'id.resp_h': '10.0.0.53',
+     'id.resp_p': '53', 'proto': 'udp', 'service': 'dns', 'duration': '0.002000', 'orig_bytes': '40',
+     'resp_bytes': '120', 'conn_state': 'SF'},
+)
+
+class ModelBundle:
+    """Một bộ (model, preprocessor) đã tải cùng phiên bản của nó; FlowBatcher đổi cả bộ cùng lúc."""
+
+    def __init__(self, version, model, preprocessor):
+        self.version = version
+        self.model = model
+        self.preprocessor = preprocessor
+
+def file_sha256(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_model_manifest(version, model_path, preprocessor_path, cascade_path=None, path=MODEL_MANIFEST_PATH):
+    """
+    Ghi nguyên tử manifest cho các file đã lưu (đường dẫn tương đối tính từ thư mục của manifest, kèm sha256).
+    Phải gọi sau khi mọi file đã được ghi xong: monitor đang chạy sẽ nạp bộ mô hình ngay khi manifest đổi.
+    """
+    directory = os.path.dirname(path) or '.'
+    paths = {'model': model_path, 'preprocessor': preprocessor_path, 'cascade': cascade_path}
+    manifest = {'version': str(version)}
+    manifest.update({key: os.path.relpath(artifact, directory) for key, artifact in paths.items() if artifact})
+    manifest['sha256'] = {key: file_sha256(artifact) for key, artifact in paths.items() if artifact}
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.manifest-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(manifest, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return manifest
+
+def read_model_manifest(path=MODEL_MANIFEST_PATH):
+    """
+    Đọc manifest và đổi đường dẫn các file thành đường dẫn tính từ thư mục hiện tại.
+    :raises ValueError: Nếu manifest thiếu 'version', 'model' hoặc 'preprocessor'.
+    """
+    with open(path) as f:
+        manifest = json.load(f)
+    missing = [key for key in ('version', 'model', 'preprocessor') if not manifest.get(key)]
+    if missing:
+        raise ValueError(f"manifest thiếu {', '.join(missing)}")
+    directory = os.path.dirname(path)
+    manifest['paths'] = {key: os.path.join(directory, manifest[key]) for key in MANIFEST_ARTIFACTS if manifest.get(key)}
+    return manifest
+
+def load_model_bundle(manifest_path=MODEL_MANIFEST_PATH, nthread=XGB_NTHREAD):
+    """
+    Tải và kiểm tra bộ mô hình mà manifest mô tả.
+    :raises ValueError: Nếu sai checksum hoặc bộ mô hình không chấm điểm được các flow mẫu;
+        các lỗi đọc file/unpickle được raise nguyên vẹn.
+    """
+    import joblib
+    from src.compiled_preprocessor import compile_preprocessor
+    from src.model_runtime import load_model
+
+    manifest = read_model_manifest(manifest_path)
+    paths = manifest['paths']
+    # Kiểm tra checksum trước khi tải: bắt được file đang ghi dở hoặc bị thay sau khi ghi manifest
+    for key, expected in (manifest.get('sha256') or {}).items():
+        if key in paths and file_sha256(paths[key]) != expected:
+            raise ValueError(f"sha256 của {paths[key]} khác manifest")
+    model = load_model(paths['model'], nthread=nthread, cascade=False)
+    if CASCADE_ENABLED and 'cascade' in paths:
+        from src.cascade import load_cascade
+        if not os.path.exists(paths['cascade']):
+            raise FileNotFoundError(paths['cascade']) # load_cascade sẽ lặng lẽ bỏ bộ lọc
+        model = load_cascade(model, paths['cascade'])
+    preprocessor = joblib.load(paths['preprocessor'])
+    preprocessor = compile_preprocessor(preprocessor) or preprocessor
+    validate_model(model, preprocessor)
+    return ModelBundle(str(manifest['version']), model, preprocessor)
+
+def load_serving_bundle(manifest_path=MODEL_MANIFEST_PATH, nthread=XGB_NTHREAD):
+    """
+    Bộ mô hình lúc khởi động monitor: theo manifest nếu có và hợp lệ, không thì các đường dẫn mặc định
+    (load_model(), PREPROCESSOR_PATH) với phiên bản UNVERSIONED, cũng được chấm thử bằng validate_model.
+    :param nthread: Số luồng XGBoost (worker của chế độ nhiều tiến trình dùng 1).
+    :raises FileNotFoundError: Nếu chưa có mô hình/preprocessor (chưa huấn luyện).
+    :raises ValueError: Nếu mô hình/preprocessor mặc định không khớp nhau (validate_model).
+    """
+    if MODEL_RELOAD_ENABLED and os.path.exists(manifest_path):
+        try:
+            bundle = load_model_bundle(manifest_path, nthread=nthread)
+            logging.info(f"Đã tải bộ mô hình phiên bản {bundle.version} theo {manifest_path}.")
+            return bundle
+        except Exception as e:
+            logging.error(f"Không dùng được bộ mô hình theo {manifest_path}: {e}. Tải mô hình mặc định.")
+    import joblib
+    from src.compiled_preprocessor import compile_preprocessor
+    from src.model_runtime import load_model
+    model = load_model(nthread=nthread)
+    preprocessor = joblib.load(PREPROCESSOR_PATH)
+    # Biên dịch preprocessor sang NumPy cho đường chấm điểm nóng (nếu không được thì dùng bản gốc)
+    preprocessor = compile_preprocessor(preprocessor) or preprocessor
+    validate_model(model, preprocessor)
+    return ModelBundle(UNVERSIONED, model, preprocessor)
+
+def canary_features():
+    """Đặc trưng NSL-KDD của CANARY_ENTRIES (extractor mới cho mỗi lần gọi)."""
+    from src.zeek_feature_extractor import ZeekFeatureExtractor
+    extractor = ZeekFeatureExtractor()
+    features = (extractor.process_zeek_log_entry(dict(entry)) for entry in CANARY_ENTRIES)
+    return [f for f in features if f is not None]
+
+def validate_model(model, preprocessor, features_batch=None):
+    """
+    Chấm thử các flow mẫu bằng đúng đường chấm điểm của monitor.
+    :raises ValueError: Nếu số cột đầu ra của preprocessor khác số đặc trưng của mô hình, hoặc xác suất
+        không hữu hạn/nằm ngoài [0, 1].
+    """
+    from src.stream_monitor import _transform_batch, _predict # Import muộn: stream_monitor import module này
+    features_batch = canary_features() if features_batch is None else features_batch
+    X = _transform_batch(preprocessor, features_batch)
+    full_model = getattr(model, 'model', model) # CascadeModel
+    booster = full_model.get_booster() if hasattr(full_model, 'get_booster') else getattr(full_model, 'booster', None)
+    if booster is not None and booster.num_features() != X.shape[1]:
+        raise ValueError(f"preprocessor tạo {X.shape[1]} cột nhưng mô hình cần {booster.num_features()} đặc trưng")
+    probas = np.asarray(_predict(model, X)[0], dtype=np.float64)
+    if probas.shape != (len(features_batch),):
+        raise ValueError(f"mô hình trả về {probas.shape} xác suất cho {len(features_batch)} flow mẫu")
+    if not np.all(np.isfinite(probas)) or probas.min() < 0.0 or probas.max() > 1.0:
+        raise ValueError(f"xác suất không hợp lệ cho flow mẫu: {probas.tolist()}")
+    return probas
+
+class ModelReloader:
+    """
+    Theo dõi manifest ở luồng nền; bộ mô hình mới đã kiểm tra được giữ cho tới khi FlowBatcher lấy bằng take()
+    (giữa hai lô). Chỉ manifest là tín hiệu: file mô hình bị ghi đè mà manifest không đổi thì không nạp lại.
+    Mỗi phiên bản manifest chỉ được thử một lần: bộ mô hình bị từ chối không được thử lại cho tới khi manifest đổi.
+    """
+
+    name = 'model-reloader'
+
+    def __init__(self, manifest_path=MODEL_MANIFEST_PATH, interval_sec=MODEL_RELOAD_INTERVAL_SEC, version=None,
+                 nthread=XGB_NTHREAD):
+        """
+        :param manifest_path: File manifest cần theo dõi.
+        :param interval_sec: Khoảng thời gian giữa hai lần kiểm tra manifest.
+        :param version: Phiên bản đang phục vụ (manifest trỏ tới đúng phiên bản này thì không tải lại).
+        :param nthread: Số luồng XGBoost của mô hình mới, như mô hình đang phục vụ.
+        """
+        self.manifest_path = manifest_path
+        self.interval_sec = interval_sec
+        self.version = version
+        self.nthread = nthread
+        self.stats = {'loaded': 0, 'rejected': 0, 'swapped': 0, 'last_load_ms': 0.0}
+        self._signature = None # Lần kiểm tra đầu đọc manifest và so phiên bản với `version`
+        self._pending = None
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+            logging.info(f"Đã khởi động ModelReloader: theo dõi {self.manifest_path} mỗi {self.interval_sec}s "
+                         f"(phiên bản đang dùng: {self.version}).")
+        return self
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+        logging.info(f"Đã đóng ModelReloader: {self.stats}")
+
+    def take(self):
+        """Bộ mô hình mới đang chờ đổi (ModelBundle) rồi xóa nó, hoặc None. Gọi từ luồng chấm điểm giữa hai lô."""
+        if self._pending is None: # Đường nóng: không lấy khóa khi không có gì mới
+            return None
+        with self._lock:
+            bundle, self._pending = self._pending, None
+        if bundle is not None:
+            self.stats['swapped'] += 1
+        return bundle
+
+    def check(self):
+        """
+        Kiểm tra manifest một lần (luồng nền gọi định kỳ); manifest đổi thì tải và kiểm tra bộ mô hình mới.
+        :return: ModelBundle vừa tải (đang chờ take()), None nếu không có gì mới hoặc bị từ chối.
+        """
+        signature = self._manifest_signature()
+        if signature is None or signature == self._signature:
+            return None
+        self._signature = signature
+        start = time.perf_counter()
+        try:
+            version = str(read_model_manifest(self.manifest_path)['version'])
+            if version == self.version:
+                logging.debug(f"Manifest {self.manifest_path} vẫn là phiên bản {version}, không nạp lại.")
+                return None
+            bundle = load_model_bundle(self.manifest_path, nthread=self.nthread)
+        except Exception as e:
+            self.stats['rejected'] += 1
+            logging.error(f"Từ chối bộ mô hình mới theo {self.manifest_path}, tiếp tục dùng phiên bản {self.version}: {e}")
+            return None
+        self.stats['last_load_ms'] = (time.perf_counter() - start) * 1000
+        self.stats['loaded'] += 1
+        with self._lock:
+            self._pending = bundle # Bộ chưa được lấy (nếu có) bị thay bằng bộ mới hơn
+        logging.info(f"Đã tải và kiểm tra bộ mô hình phiên bản {bundle.version} ({self.stats['last_load_ms']:.0f} ms), "
+                     f"sẽ đổi từ phiên bản {self.version} ở lô kế tiếp.")
+        self.version = bundle.version
+        return bundle
+
+    def _manifest_signature(self):
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval_sec):
+            try:
+                self.check()
+            except Exception as e: # Luồng theo dõi không được chết vì một lỗi bất ngờ
+                logging.error(f"Lỗi khi kiểm tra manifest mô hình {self.manifest_path}: {e}", exc_info=True)
+
+def create_model_reloader(version, nthread=XGB_NTHREAD):
+    """ModelReloader đã khởi động nếu MODEL_RELOAD_ENABLED, không thì None."""
+    if not MODEL_RELOAD_ENABLED:
+        return None
+    return ModelReloader(version=version, nthread=nthread).start()
@@ -0,0 +1,93 @@
+# src/model_runtime.py
+
+import logging
+import os
+
+import numpy as np
+
+from src.config import MODEL_PATHS, NATIVE_MODEL_PATH, XGB_NTHREAD, CASCADE_ENABLED
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+class BoosterModel:
+    """
+    Bọc xgboost.Booster với cùng giao diện predict_proba như XGBClassifier, nhưng dự đoán bằng
+    Booster.inplace_predict: đọc trực tiếp ma trận NumPy/CSR, không tạo DMatrix cho mỗi lô.
+    Chỉ hỗ trợ mô hình nhị phân (objective binary:logistic), như mô hình của train_model.
+    """
+
+    def __init__(self, booster, nthread=XGB_NTHREAD):
+        """
+        :param booster: xgboost.Booster đã huấn luyện.
+        :param nthread: Số luồng khi dự đoán (0 = tất cả lõi CPU).
+        """
+        self.booster = booster
+        self.set_nthread(nthread)
+        # Giống XGBClassifier: nếu huấn luyện có early stopping thì chỉ dùng các cây tới best_iteration
+        best_iteration = booster.attr('best_iteration')
+        self.iteration_range = (0, int(best_iteration) + 1) if best_iteration is not None else (0, 0)
+
+    def set_nthread(self, nthread):
+        self.nthread = nthread
+        self.booster.set_param({'nthread': nthread})
+
+    def set_params(self, n_jobs=None, **params):
+        """Tương thích với XGBClassifier.set_params(n_jobs=...) (dùng bởi worker của sharded_monitor)."""
+        if n_jobs is not None:
+            self.set_nthread(n_jobs)
+        return self
+
+    def predict_proba(self, X):
+        """
+        :param X: np.ndarray hoặc scipy CSR (đầu ra của preprocessor).
+        :return: Mảng (n, 2) xác suất [Normal, Malicious], giống XGBClassifier.predict_proba.
+        """
+        proba = self.booster.inplace_predict(X, iteration_range=self.iteration_range)
+        proba = np.asarray(proba, dtype=np.float32).reshape(-1)
+        return np.column_stack((1.0 - proba, proba))
+
+    def predict(self, X):
+        return (self.predict_proba(X)[:, 1] > 0.5).astype(np.int64)
+
+def export_native_model(model, path=NATIVE_MODEL_PATH):
+    """
+    Lưu booster của XGBClassifier theo định dạng gốc của XGBoost (đuôi .ubj: nhị phân, .json: JSON).
+    """
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    booster.save_model(path)
+    return path
+
+def load_native_model(path=NATIVE_MODEL_PATH, nthread=XGB_NTHREAD):
+    """Tải booster đã lưu bằng export_native_model."""
+    import xgboost as xgb
+    return BoosterModel(xgb.Booster(model_file=path), nthread=nthread)
+
+def load_model(path=None, nthread=XGB_NTHREAD, cascade=None):
+    """
+    Tải mô hình để chấm điểm.
+    :param path: File mô hình; đuôi .pkl/.joblib thì unpickle XGBClassifier, còn lại là định dạng gốc.
+                 Mặc định dùng NATIVE_MODEL_PATH nếu đã có, nếu chưa thì MODEL_PATHS['xgb'].
+    :param cascade: True để đặt bộ lọc trước CASCADE_MODEL_PATH (src/cascade.py) trước mô hình nếu có file đó.
+                    Mặc định theo CASCADE_ENABLED khi tải mô hình mặc định (path=None): bộ lọc được huấn luyện
+                    cùng lúc với mô hình trong models/, không dùng kèm một file mô hình chỉ định khác.
+    :return: BoosterModel (cả khi tải từ pickle, để luôn dùng đường inplace_predict), hoặc CascadeModel bọc nó.
+    """
+    if cascade is None:
+        cascade = CASCADE_ENABLED and path is None
+    if path is None:
+        path = NATIVE_MODEL_PATH if os.path.exists(NATIVE_MODEL_PATH) else MODEL_PATHS['xgb']
+    if os.path.splitext(path)[1] in ('.pkl', '.joblib'):
+        import joblib
+        model = joblib.load(path)
+        logging.info(f"Đã tải mô hình pickle {path} (nên chạy lại huấn luyện để có {NATIVE_MODEL_PATH}).")
+        model = BoosterModel(model.get_booster(), nthread=nthread)
+    else:
+        model = load_native_model(path, nthread=nthread)
+        logging.info(f"Đã tải mô hình XGBoost định dạng gốc {path} (nthread={nthread}).")
+    if cascade:
+        from src.cascade import load_cascade
+        model = load_cascade(model)
+    return model
@@ -0,0 +1,222 @@
+# src/monitor_logging.py
+"""
+Logging nhẹ cho đường chấm điểm:
+- setup_async_logging: các handler thật (file, console) chạy ở luồng nền, luồng gọi logging
+  chỉ tạo LogRecord và đưa vào hàng đợi có giới hạn; luồng nền format và ghi theo lô;
+- FlowLogger: dòng kết quả từng flow được lấy mẫu hoặc tắt, flow Malicious luôn được log đầy đủ,
+  và một dòng tổng kết định kỳ (số flow, số Malicious, các nguồn nhiều flow nhất) thay cho log từng flow.
+"""
+
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import Counter, deque
+
+from src.config import (LOG_QUEUE_SIZE, LOG_FLUSH_INTERVAL_SEC, LOG_FLOW_MODE, LOG_FLOW_SAMPLE_EVERY,
+                        LOG_SUMMARY_INTERVAL_SEC, LOG_SUMMARY_TOP_TALKERS)
+
+FLOW_LOG_MODES = ('all', 'sample', 'off')
+
+class AsyncLogHandler(logging.Handler):
+    """
+    Handler gắn vào root logger: emit() chỉ đưa LogRecord vào một deque, luồng nền 'log-writer'
+    mỗi flush_interval_sec giây (hoặc sớm hơn khi hàng đợi đầy một nửa) lấy hết bản ghi và ghi theo lô
+    ra các handler thật: với StreamHandler/FileHandler là một lần write + flush cho cả lô thay vì mỗi dòng.
+    Hàng đợi đầy thì bản ghi dưới WARNING bị bỏ (có đếm); WARNING trở lên (gồm cảnh báo tấn công)
+    luôn được giữ. Message được format ở luồng nền nên tham số của lời gọi log không được sửa sau khi log.
+    """
+
+    def __init__(self, handlers, queue_size=LOG_QUEUE_SIZE, flush_interval_sec=LOG_FLUSH_INTERVAL_SEC):
+        super().__init__()
+        self.handlers = list(handlers)
+        self.queue_size = max(1, queue_size)
+        self.flush_interval_sec = flush_interval_sec
+        self.dropped = 0
+        self._queue = deque() # append/popleft của deque an toàn giữa các luồng, không cần khóa
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='log-writer', daemon=True)
+        self._thread.start()
+        return self
+
+    def handle(self, record):
+        # Không lấy khóa của Handler như bản gốc: chỉ có một thao tác append
+        if self.filter(record):
+            self.emit(record)
+            return True
+        return False
+
+    def emit(self, record):
+        depth = len(self._queue)
+        if depth >= self.queue_size:
+            if record.levelno < logging.WARNING:
+                self.dropped += 1
+                return
+            self._wake.set()
+        elif depth * 2 >= self.queue_size:
+            self._wake.set()
+        self._queue.append(record)
+
+    def stop(self):
+        """Ghi nốt hàng đợi rồi dừng luồng nền (gọi nhiều lần không sao), báo số bản ghi đã bỏ."""
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping = True
+        self._wake.set()
+        thread.join()
+        if self.dropped:
+            self._write([logging.makeLogRecord({
+                'name': __name__, 'levelno': logging.WARNING, 'levelname': 'WARNING',
+                'msg': f"Hàng đợi log đầy: đã bỏ {self.dropped} bản ghi dưới WARNING."})])
+
+    def close(self):
+        self.stop()
+        super().close()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval_sec)
+            self._wake.clear()
+            self._drain()
+        self._drain()
+
+    def _drain(self):
+        records = []
+        pop = self._queue.popleft
+        try:
+            while True:
+                records.append(pop())
+        except IndexError:
+            pass
+        if records:
+            self._write(records)
+
+    def _write(self, records):
+        formatted = {} # (id formatter, id record) -> dòng đã format: các handler dùng chung formatter chỉ format một lần
+        for handler in self.handlers:
+            selected = [record for record in records if record.levelno >= handler.level and handler.filter(record)]
+            if not selected:
+                continue
+            if not isinstance(handler, logging.StreamHandler):
+                for record in selected:
+                    handler.handle(record)
+                continue
+            lines = []
+            for record in selected:
+                key = (id(handler.formatter), id(record))
+                line = formatted.get(key)
+                if line is None:
+                    try:
+                        line = formatted[key] = handler.format(record)
+                    except Exception:
+                        handler.handleError(record)
+                        continue
+                lines.append(line + handler.terminator)
+            handler.acquire()
+            try:
+                handler.stream.write(''.join(lines))
+                handler.flush()
+            except Exception:
+                handler.handleError(selected[-1])
+            finally:
+                handler.release()
+
+def setup_async_logging(handlers, level=logging.INFO, queue_size=LOG_QUEUE_SIZE):
+    """
+    Thay các handler của root logger bằng một AsyncLogHandler ghi ra `handlers` ở luồng nền.
+    Luồng nền được dừng (ghi hết hàng đợi) khi tiến trình thoát hoặc khi gọi stop() của handler trả về.
+    :param handlers: Các handler đích (ví dụ FileHandler, StreamHandler), đã có formatter hoặc dùng format mặc định.
+    :return: AsyncLogHandler đã gắn vào root logger.
+    """
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    for handler in handlers:
+        if handler.formatter is None:
+            handler.setFormatter(formatter)
+    async_handler = AsyncLogHandler(handlers, queue_size).start()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(async_handler)
+    root.setLevel(level)
+    atexit.register(async_handler.stop)
+    return async_handler
+
+class FlowLogger:
+    """
+    Quyết định log gì cho mỗi lô flow đã chấm điểm (gọi từ process_batch):
+    - dòng kết quả từng flow theo `mode` ('all', 'sample': 1 trên sample_every flow, 'off');
+    - mỗi flow Malicious: một dòng WARNING chứa toàn bộ tài liệu cảnh báo;
+    - mỗi interval_sec giây: một dòng tổng kết số flow, số Malicious và top_talkers nguồn nhiều flow nhất.
+    Chỉ đếm theo lô (Counter.update) và kiểm tra đồng hồ một lần mỗi lô, không tạo luồng riêng.
+    """
+
+    def __init__(self, mode=LOG_FLOW_MODE, sample_every=LOG_FLOW_SAMPLE_EVERY,
+                 interval_sec=LOG_SUMMARY_INTERVAL_SEC, top_talkers=LOG_SUMMARY_TOP_TALKERS):
+        if mode not in FLOW_LOG_MODES:
+            raise ValueError(f"LOG_FLOW_MODE không hợp lệ: '{mode}'. Chọn một trong {FLOW_LOG_MODES}.")
+        self.mode = mode
+        self.sample_every = max(1, int(sample_every))
+        self.interval_sec = interval_sec
+        self.top_talkers = top_talkers
+        self._until_sample = 0 # Số flow còn lại trước flow được lấy mẫu tiếp theo
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self._window_start = now
+        self._flows = 0
+        self._malicious = 0
+        self._talkers = Counter()
+        self._malicious_talkers = Counter()
+
+    def flow_indices(self, n, log_flows=True):
+        """Chỉ số các flow trong lô n flow cần log dòng kết quả (log_flows=False khi đuổi kịp backlog: không log)."""
+        if not log_flows or self.mode == 'off':
+            return ()
+        if self.mode == 'all':
+            return range(n)
+        start = self._until_sample
+        self._until_sample = (start - n) % self.sample_every
+        return range(start, n, self.sample_every)
+
+    def log_alert(self, alert_data):
+        """Log đầy đủ một cảnh báo; json.dumps chạy ở luồng ghi log (qua %s), không ở luồng chấm điểm."""
+        logging.warning("[!] Cảnh báo tấn công: %s", _JsonMessage(alert_data))
+
+    def observe_batch(self, batch, labels):
+        """Cộng dồn lô vào dòng tổng kết và ghi dòng tổng kết nếu đã hết khoảng thời gian."""
+        self._flows += len(batch)
+        self._talkers.update(log_entry_dict.get('id.orig_h') for log_entry_dict, _ in batch)
+        malicious = [log_entry_dict.get('id.orig_h') for (log_entry_dict, _), label in zip(batch, labels)
+                     if label == 'Malicious']
+        self._malicious += len(malicious)
+        self._malicious_talkers.update(malicious)
+        if self.interval_sec:
+            now = time.monotonic()
+            if now - self._window_start >= self.interval_sec:
+                self.log_summary(now)
+
+    def log_summary(self, now=None):
+        """Ghi dòng tổng kết của khoảng thời gian hiện tại và bắt đầu khoảng mới."""
+        now = time.monotonic() if now is None else now
+        if self._flows:
+            elapsed = max(now - self._window_start, 1e-9)
+            talkers = ', '.join(f"{host} ({count} flow, {self._malicious_talkers.get(host, 0)} malicious)"
+                                for host, count in self._talkers.most_common(self.top_talkers))
+            logging.info(f"[*] Tổng kết {elapsed:.0f}s: {self._flows} flow ({self._flows / elapsed:.0f} flow/s), "
+                         f"{self._malicious} Malicious; nguồn nhiều flow nhất: {talkers}")
+        self._reset(now)
+
+class _JsonMessage:
+    """Trì hoãn json.dumps tới lúc handler format bản ghi."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __str__(self):
+        return json.dumps(self.data, default=str, ensure_ascii=False)
@@ -0,0 +1,195 @@
+# src/prediction_cache.py
+"""
+Cache xác suất dự đoán theo vector đặc trưng NSL-KDD. Khi bị quét cổng hoặc SYN flood, nhiều flow
+liên tiếp có đặc trưng giống hệt (hoặc gần giống) nhau; các flow đó lấy lại xác suất đã tính thay vì
+đi qua tiền xử lý và XGBoost lần nữa.
+- Khóa: với CompiledPreprocessor là bytes của một hàng (cột số chưa chuẩn hóa, chỉ số one-hot) do encode_records
+  tạo cho cả lô bằng NumPy, nên chỉ các cột mô hình thực sự dùng mới vào khóa; với preprocessor gốc là tuple giá trị
+  các cột theo thứ tự NSL_KDD_RELEVANT_COLUMNS (không gồm 'outcome'). Nếu bật lượng tử hóa, các trường liên tục
+  được làm tròn trước khi tạo khóa (flow gần giống dùng chung kết quả, xác suất chỉ còn là xấp xỉ).
+- LRU có giới hạn số phần tử, mỗi phần tử hết hạn sau ttl_sec giây.
+- Tạo khóa và tra cache tốn gần bằng chấm điểm với mô hình nhỏ: lô có tỉ lệ hit dưới min_hit_rate thì các lô
+  tiếp theo bỏ qua cache (active() trả về False) cho tới lô thử lại kế tiếp.
+- Cache gắn với (model, preprocessor) đã tính ra nó: đổi mô hình hoặc preprocessor (tải lại) thì cache tự xóa.
+"""
+
+import math
+import operator
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.config import (NSL_KDD_RELEVANT_COLUMNS, PREDICTION_CACHE_SIZE, PREDICTION_CACHE_TTL_SEC,
+                        PREDICTION_CACHE_QUANTIZE, PREDICTION_CACHE_RELATIVE_STEP, PREDICTION_CACHE_RATE_DECIMALS,
+                        PREDICTION_CACHE_MIN_HIT_RATE, PREDICTION_CACHE_PROBE_INTERVAL)
+
+KEY_COLUMNS = [col for col in NSL_KDD_RELEVANT_COLUMNS if col != 'outcome']
+# Các trường liên tục được lượng tử hóa: thời lượng/số byte/số đếm theo thang log, các tỷ lệ theo số chữ số thập phân
+LOG_SCALE_COLUMNS = ('duration', 'src_bytes', 'dst_bytes', 'count', 'srv_count', 'dst_host_count', 'dst_host_srv_count')
+RATE_COLUMNS = tuple(col for col in KEY_COLUMNS if col.endswith('_rate'))
+
+def log_bucket(values, log_step):
+    """
+    Lượng tử hóa một cột theo thang log: mỗi giá trị dương được thay bằng đại diện exp(k * log_step) của ô chứa nó
+    (các giá trị chênh nhau dưới khoảng một bước tương đối chung ô); 0, số âm và NaN giữ nguyên.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        buckets = np.exp(np.floor(np.log(values) / log_step + 0.5) * log_step)
+    return np.where(values > 0, buckets, values)
+
+class PredictionCache:
+    """LRU cache xác suất Malicious theo khóa đặc trưng, có TTL và tự xóa khi đổi mô hình/preprocessor."""
+
+    def __init__(self, max_size=PREDICTION_CACHE_SIZE, ttl_sec=PREDICTION_CACHE_TTL_SEC,
+                 quantize=PREDICTION_CACHE_QUANTIZE, relative_step=PREDICTION_CACHE_RELATIVE_STEP,
+                 rate_decimals=PREDICTION_CACHE_RATE_DECIMALS, min_hit_rate=PREDICTION_CACHE_MIN_HIT_RATE,
+                 probe_interval=PREDICTION_CACHE_PROBE_INTERVAL):
+        """
+        :param max_size: Số vector đặc trưng tối đa được giữ; vượt quá thì bỏ phần tử lâu nhất không dùng.
+        :param ttl_sec: Thời gian sống của một phần tử (None hoặc 0: không hết hạn).
+        :param quantize: True để làm tròn các trường liên tục trước khi tạo khóa (kết quả xấp xỉ cho flow gần giống).
+        :param relative_step: Bước tương đối của thang log cho duration, số byte và số đếm khi lượng tử hóa
+                              (0.1: các giá trị chênh nhau khoảng dưới 10% chung một ô).
+        :param rate_decimals: Số chữ số thập phân giữ lại của các trường *_rate khi lượng tử hóa.
+        :param min_hit_rate: Tỉ lệ hit tối thiểu của một lô để lô sau tiếp tục dùng cache (0: luôn dùng).
+        :param probe_interval: Khi bỏ qua cache, cứ probe_interval lô thì thử cache lại một lô.
+        """
+        self.max_size = max(1, int(max_size))
+        self.ttl_sec = ttl_sec or None
+        self.quantize = quantize
+        self.rate_decimals = rate_decimals
+        self._log_step = math.log1p(relative_step)
+        self._rate_scale = 10 ** rate_decimals
+        self._entries = OrderedDict() # khóa -> (xác suất, thời điểm hết hạn)
+        self._owner = None # (model, preprocessor) đã tính ra các phần tử trong cache
+        self.min_hit_rate = min_hit_rate
+        self.probe_interval = max(1, int(probe_interval))
+        self._bypass_left = 0 # Số lô còn lại chấm điểm thẳng trước lần thử cache kế tiếp
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expired': 0, 'invalidations': 0, 'bypassed_batches': 0}
+
+        self._values = operator.itemgetter(*KEY_COLUMNS)
+        self._log_index = [KEY_COLUMNS.index(col) for col in LOG_SCALE_COLUMNS]
+        self._rate_index = [KEY_COLUMNS.index(col) for col in RATE_COLUMNS]
+        self._quantized_for = None # numeric_columns của encoded_keys đã tính _quantized_index
+        self._quantized_index = ([], [])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def keys(self, features_batch):
+        """Khóa của từng dict đặc trưng trong lô (do ZeekFeatureExtractor trả về); lượng tử hóa theo cột bằng NumPy."""
+        get_values = self._values
+        try:
+            rows = list(map(get_values, features_batch))
+        except KeyError: # Dict thiếu cột: coi như None (transform_records cũng dùng giá trị mặc định)
+            rows = [tuple(map(features.get, KEY_COLUMNS)) for features in features_batch]
+        if not self.quantize or not rows:
+            return rows
+        columns = list(zip(*rows))
+        for i in self._log_index:
+            column = _float_column(columns[i])
+            if column is not None:
+                columns[i] = log_bucket(column, self._log_step).tolist()
+        for i in self._rate_index:
+            column = _float_column(columns[i])
+            if column is not None: # Tỷ lệ: làm tròn tới 1/rate_scale
+                columns[i] = np.floor(column * self._rate_scale + 0.5).tolist()
+        return list(zip(*columns))
+
+    def encoded_keys(self, numeric, category_indices, numeric_columns):
+        """
+        Khóa của từng hàng từ kết quả CompiledPreprocessor.encode_records: bytes của hàng float64
+        (các cột số, rồi chỉ số one-hot), không tạo tuple Python cho từng flow. Không sửa `numeric`.
+        :param numeric_columns: Tên các cột của `numeric` (CompiledPreprocessor.numeric_columns).
+        """
+        columns = [numeric]
+        if self.quantize:
+            log_index, rate_index = self._quantized_columns(tuple(numeric_columns))
+            numeric = numeric.copy()
+            if log_index:
+                numeric[:, log_index] = log_bucket(numeric[:, log_index], self._log_step)
+            if rate_index:
+                numeric[:, rate_index] = np.floor(numeric[:, rate_index] * self._rate_scale + 0.5)
+            columns = [numeric]
+        columns.extend(col_index.reshape(-1, 1) for col_index in category_indices)
+        rows = np.ascontiguousarray(np.hstack(columns), dtype=np.float64)
+        return rows.view(np.dtype((np.void, rows.shape[1] * rows.itemsize))).ravel().tolist()
+
+    def _quantized_columns(self, numeric_columns):
+        if self._quantized_for != numeric_columns:
+            self._quantized_index = ([i for i, col in enumerate(numeric_columns) if col in LOG_SCALE_COLUMNS],
+                                     [i for i, col in enumerate(numeric_columns) if col in RATE_COLUMNS])
+            self._quantized_for = numeric_columns
+        return self._quantized_index
+
+    def key(self, features):
+        return self.keys([features])[0]
+
+    def bind(self, model, preprocessor):
+        """Xóa cache nếu (model, preprocessor) khác lần trước, ví dụ sau khi tải lại mô hình."""
+        owner = self._owner
+        if owner is None or owner[0] is not model or owner[1] is not preprocessor:
+            if self._entries:
+                self.stats['invalidations'] += 1
+            self.clear()
+            self._owner = (model, preprocessor)
+
+    def active(self):
+        """Lô kế tiếp có dùng cache không (score_batch gọi một lần mỗi lô)."""
+        if self._bypass_left > 0:
+            self._bypass_left -= 1
+            self.stats['bypassed_batches'] += 1
+            return False
+        return True
+
+    def clear(self):
+        self._entries.clear()
+
+    def lookup(self, keys, now=None):
+        """
+        Tra một lô khóa.
+        :return: (probas, missing): xác suất của từng khóa (None nếu chưa có hoặc đã hết hạn) và dict
+                 khóa thiếu -> vị trí xuất hiện đầu tiên trong lô (mỗi khóa thiếu chỉ cần chấm điểm một lần).
+        """
+        now = time.monotonic() if now is None else now
+        entries = self._entries
+        probas = []
+        missing = {}
+        for i, key in enumerate(keys):
+            entry = entries.get(key)
+            if entry is not None:
+                if entry[1] is None or entry[1] > now:
+                    entries.move_to_end(key)
+                    probas.append(entry[0])
+                    continue
+                del entries[key]
+                self.stats['expired'] += 1
+            probas.append(None)
+            missing.setdefault(key, i)
+        # Hit: flow không phải chấm điểm (có trong cache hoặc trùng khóa với flow thiếu khác trong cùng lô)
+        self.stats['hits'] += len(keys) - len(missing)
+        self.stats['misses'] += len(missing)
+        if keys and len(keys) - len(missing) < self.min_hit_rate * len(keys):
+            self._bypass_left = self.probe_interval - 1
+        return probas, missing
+
+    def store(self, keys, probas, now=None):
+        """Lưu xác suất vừa tính cho các khóa thiếu của lookup(), bỏ các phần tử lâu nhất không dùng nếu vượt max_size."""
+        now = time.monotonic() if now is None else now
+        expires = now + self.ttl_sec if self.ttl_sec else None
+        entries = self._entries
+        for key, proba in zip(keys, probas):
+            entries[key] = (proba, expires) # Khóa thiếu không còn trong cache nên được thêm vào cuối (mới dùng nhất)
+        overflow = len(entries) - self.max_size
+        for _ in range(max(0, overflow)):
+            entries.popitem(last=False)
+        if overflow > 0:
+            self.stats['evictions'] += overflow
+
+def _float_column(values):
+    """Cột giá trị dạng float64, None nếu cột có giá trị không phải số (giữ nguyên cột đó trong khóa)."""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        return None
@@ -1,15 +1,28 @@
 # src/preprocess.py
 
+import numpy as np
 import pandas as pd
-from sklearn.preprocessing import LabelEncoder, StandardScaler, OneHotEncoder
-from sklearn.compose import ColumnTransformer
-from sklearn.pipeline import Pipeline
 import joblib
 import logging
-from src.config import NSL_KDD_RELEVANT_COLUMNS, SERVICE_MAPPING, ZEEK_CONN_STATE_TO_NSL_FLAG
+from src.config import NSL_KDD_RELEVANT_COLUMNS, SERVICE_MAPPING, ZEEK_CONN_STATE_TO_NSL_FLAG, PREPROCESSOR_PATH
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+# Các nhóm cột đặc trưng, dùng chung cho preprocess_features và CompiledPreprocessor
+CATEGORICAL_FEATURE_COLUMNS = ['protocol_type', 'service', 'flag']
+FLOAT_FEATURE_COLUMNS = ['duration', 'src_bytes', 'dst_bytes', 'count', 'srv_count',
+                         'serror_rate', 'srv_serror_rate', 'rerror_rate', 'srv_rerror_rate',
+                         'same_srv_rate', 'diff_srv_rate', 'srv_diff_host_rate',
+                         'dst_host_count', 'dst_host_srv_count', 'dst_host_same_srv_rate',
+                         'dst_host_diff_srv_rate', 'dst_host_same_src_port_rate',
+                         'dst_host_srv_diff_host_rate', 'dst_host_serror_rate',
+                         'dst_host_srv_serror_rate', 'dst_host_rerror_rate',
+                         'dst_host_srv_rerror_rate']
+INT_FEATURE_COLUMNS = ['land', 'wrong_fragment', 'urgent', 'hot', 'num_failed_logins',
+                       'logged_in', 'num_compromised', 'root_shell', 'su_attempted',
+                       'num_root', 'num_file_creations', 'num_shells', 'num_access_files',
+                       'num_outbound_cmds', 'is_host_login', 'is_guest_login']
+
 def map_port_to_service(protocol, port):
     """Ánh xạ cổng và giao thức sang dịch vụ NSL-KDD."""
     if protocol == 'tcp' and port in SERVICE_MAPPING:
@@ -18,53 +31,80 @@ def map_port_to_service(protocol, port):
         return SERVICE_MAPPING[port]
     return 'other'
 
-def preprocess_features(df, preprocessor=None, fit=True):
+def feature_dtype(preprocessor):
+    """
+    Kiểu số của ma trận đầu ra: float32 với preprocessor tạo từ phiên bản này (OneHotEncoder dtype float32,
+    đầu ra CSR), float64 với preprocessor.pkl cũ (giữ nguyên kết quả của chúng).
+    """
+    transformers = getattr(preprocessor, 'transformers_', None) or preprocessor.transformers
+    for _, transformer, _ in transformers:
+        if type(transformer).__name__ == 'OneHotEncoder':
+            return np.dtype(transformer.dtype)
+    return np.dtype(np.float64)
+
+def fit_preprocessor(preprocessor, X, categorical_cols, numerical_cols):
+    """
+    Huấn luyện ColumnTransformer mà không tạo ma trận đầu ra cho cả tập dữ liệu
+    (ColumnTransformer.fit gọi fit_transform, riêng bước ghép khối sparse đã tốn nhiều lần kích thước ma trận):
+    fit trên các dòng chứa đủ mọi giá trị phân loại (OneHotEncoder ra cùng categories_),
+    sau đó fit lại StandardScaler trên toàn bộ cột số. Kết quả giống hệt preprocessor.fit(X).
+    """
+    if len(categorical_cols) == 0:
+        return preprocessor.fit(X)
+    first_rows = np.flatnonzero(np.logical_or.reduce([~X[col].duplicated().to_numpy() for col in categorical_cols]))
+    preprocessor.fit(X.iloc[first_rows])
+    preprocessor.named_transformers_['num'].fit(X[numerical_cols])
+    return preprocessor
+
+def preprocess_features(df, preprocessor=None, fit=True, save_path=PREPROCESSOR_PATH, compiled=True):
     """
     Tiền xử lý các đặc trưng của bộ dữ liệu NSL-KDD.
     :param df: DataFrame chứa dữ liệu thô.
     :param preprocessor: Bộ tiền xử lý đã được huấn luyện (dùng cho chế độ monitor).
     :param fit: True nếu huấn luyện bộ tiền xử lý, False nếu chỉ transform.
+    :param save_path: Nơi lưu bộ tiền xử lý sau khi huấn luyện (None để không lưu).
+    :param compiled: Với preprocessor float32, tạo ma trận CSR bằng CompiledPreprocessor theo từng khối
+                     (cùng kết quả với ColumnTransformer.transform nhưng không qua ma trận trung gian dense/COO).
     :return: X_processed (features), y (labels), preprocessor (bộ tiền xử lý đã huấn luyện).
     """
     #logging.info(f"Kích thước DataFrame đầu vào: {df.shape}")
 
     # Bước 1: Đảm bảo DataFrame chỉ chứa các cột quan trọng và điền giá trị mặc định
     # Điều này cực kỳ quan trọng để đảm bảo đồng bộ giữa training và real-time
-    processed_df = pd.DataFrame(columns=NSL_KDD_RELEVANT_COLUMNS)
+    # Gom đủ các cột rồi tạo DataFrame một lần (không chèn từng cột vào DataFrame rỗng)
+    # Preprocessor mới nhận cột số float32 ngay từ đây (không giữ thêm bản float64 của cả tập dữ liệu);
+    # preprocessor.pkl cũ (float64) vẫn nhận đúng kiểu như trước
+    as_float32 = preprocessor is None or feature_dtype(preprocessor) == np.float32
+    columns = {}
     for col in NSL_KDD_RELEVANT_COLUMNS:
         if col in df.columns:
-            processed_df[col] = df[col]
+            columns[col] = df[col]
         else:
             # Điền giá trị mặc định cho các cột không có trong Zeek conn.log
-            if col in ['protocol_type', 'service', 'flag', 'outcome']:
-                processed_df[col] = 'unknown'
-            elif col in ['land', 'wrong_fragment', 'urgent', 'hot', 'num_failed_logins', 
-                          'logged_in', 'num_compromised', 'root_shell', 'su_attempted', 
-                          'num_root', 'num_file_creations', 'num_shells', 'num_access_files', 
-                          'num_outbound_cmds', 'is_host_login', 'is_guest_login']:
-                processed_df[col] = 0
+            if col in CATEGORICAL_FEATURE_COLUMNS or col == 'outcome':
+                columns[col] = 'unknown'
+            elif as_float32:
+                columns[col] = np.float32(0)
+            elif col in INT_FEATURE_COLUMNS:
+                columns[col] = 0
             else: # Các cột số khác
-                processed_df[col] = 0.0
-    
-    # Ép kiểu dữ liệu để tránh lỗi sau này (đặc biệt sau khi điền 0/unknown)
-    for col in ['duration', 'src_bytes', 'dst_bytes', 'count', 'srv_count',
-                'serror_rate', 'srv_serror_rate', 'rerror_rate', 'srv_rerror_rate',
-                'same_srv_rate', 'diff_srv_rate', 'srv_diff_host_rate',
-                'dst_host_count', 'dst_host_srv_count', 'dst_host_same_srv_rate',
-                'dst_host_diff_srv_rate', 'dst_host_same_src_port_rate',
-                'dst_host_srv_diff_host_rate', 'dst_host_serror_rate',
-                'dst_host_srv_serror_rate', 'dst_host_rerror_rate',
-                'dst_host_srv_rerror_rate']:
-        if col in processed_df.columns:
-            processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0.0)
-    
-    for col in ['land', 'wrong_fragment', 'urgent', 'hot', 'num_failed_logins', 
-                'logged_in', 'num_compromised', 'root_shell', 'su_attempted', 
-                'num_root', 'num_file_creations', 'num_shells', 'num_access_files', 
-                'num_outbound_cmds', 'is_host_login', 'is_guest_login']:
-        if col in processed_df.columns:
-            processed_df[col] = pd.to_numeric(processed_df[col], errors='coerce').fillna(0).astype(int)
+                columns[col] = 0.0
 
+    # Ép kiểu dữ liệu để tránh lỗi sau này (đặc biệt sau khi điền 0/unknown)
+    for col in FLOAT_FEATURE_COLUMNS:
+        if col in columns:
+            columns[col] = pd.to_numeric(columns[col], errors='coerce')
+            if isinstance(columns[col], pd.Series):
+                columns[col] = columns[col].fillna(0.0)
+                if as_float32:
+                    columns[col] = columns[col].astype(np.float32)
+
+    for col in INT_FEATURE_COLUMNS:
+        if col in columns and isinstance(columns[col], pd.Series):
+            columns[col] = pd.to_numeric(columns[col], errors='coerce').fillna(0).astype(int)
+            if as_float32:
+                columns[col] = columns[col].astype(np.float32)
+    processed_df = pd.DataFrame(columns, index=df.index, columns=NSL_KDD_RELEVANT_COLUMNS)
 
     # Loại bỏ các cột không cần thiết cho huấn luyện (ví dụ: 'outcome')
     if 'outcome' in processed_df.columns:
@@ -83,27 +123,41 @@ def preprocess_features(df, preprocessor=None, fit=True):
     # logging.info(f"Cột số: {list(numerical_cols)}")
 
     # Tạo pipeline tiền xử lý
+    fit = fit and preprocessor is None # Chỉ huấn luyện khi chưa có bộ tiền xử lý
     if preprocessor is None: # Chế độ huấn luyện
+        # Import sklearn tại đây: chế độ monitor/replay chỉ transform bằng preprocessor đã tải
+        from sklearn.compose import ColumnTransformer
+        from sklearn.preprocessing import StandardScaler, OneHotEncoder
+
         numerical_transformer = StandardScaler()
-        categorical_transformer = OneHotEncoder(handle_unknown='ignore')
+        categorical_transformer = OneHotEncoder(handle_unknown='ignore', dtype=np.float32)
 
+        # sparse_threshold=1.0: đầu ra luôn là CSR (khối one-hot không bao giờ bị chuyển sang dense)
         preprocessor = ColumnTransformer(
             transformers=[
                 ('num', numerical_transformer, numerical_cols),
                 ('cat', categorical_transformer, categorical_cols)
             ],
-            remainder='passthrough' # Giữ nguyên các cột không được biến đổi (nếu có)
+            remainder='passthrough', # Giữ nguyên các cột không được biến đổi (nếu có)
+            sparse_threshold=1.0
         )
-        if fit:
-            logging.info("Huấn luyện bộ tiền xử lý...")
-            X_processed = preprocessor.fit_transform(X)
-            joblib.dump(preprocessor, 'models/preprocessor.pkl') # Lưu bộ tiền xử lý
-            logging.info("Đã lưu preprocessor.pkl")
-        else:
-            # logging.info("Sử dụng bộ tiền xử lý đã có...")
-            X_processed = preprocessor.transform(X)
-    else: # Chế độ transform (monitor)
-        # logging.info("Sử dụng bộ tiền xử lý đã có để transform...")
+
+    if fit:
+        logging.info("Huấn luyện bộ tiền xử lý...")
+        fit_preprocessor(preprocessor, X, categorical_cols, numerical_cols)
+        if save_path:
+            joblib.dump(preprocessor, save_path) # Lưu bộ tiền xử lý
+            logging.info(f"Đã lưu preprocessor tại: {save_path}")
+
+    X_processed = None
+    if compiled and as_float32:
+        # Import tại đây: compiled_preprocessor dùng lại các nhóm cột của module này
+        from src.compiled_preprocessor import CompiledPreprocessor
+        try:
+            X_processed = CompiledPreprocessor.from_preprocessor(preprocessor).transform_frame(X)
+        except ValueError as e:
+            logging.warning(f"Không thể biên dịch preprocessor, dùng ColumnTransformer.transform: {e}")
+    if X_processed is None: # preprocessor float64 cũ giữ nguyên kết quả của ColumnTransformer
         X_processed = preprocessor.transform(X)
     
     # logging.info(f"Kích thước dữ liệu sau tiền xử lý: {X_processed.shape}")
@@ -130,12 +184,18 @@ def load_nslkdd_data(filepath="dataset/NSL-KDD-Dataset/KDDTrain+.txt"):
         'dst_host_rerror_rate', 'dst_host_srv_rerror_rate', 'outcome', 'difficulty'
     ]
     
+    # Khai báo kiểu từng cột để read_csv không phải đoán kiểu
+    dtypes = {col: 'float64' for col in FLOAT_FEATURE_COLUMNS}
+    dtypes.update({col: 'int64' for col in INT_FEATURE_COLUMNS})
+    dtypes.update({col: 'object' for col in CATEGORICAL_FEATURE_COLUMNS + ['outcome']})
+    dtypes['difficulty'] = 'int64'
+
     logging.info(f"Đang tải dữ liệu từ: {filepath}")
-    df = pd.read_csv(filepath, header=None, names=columns)
+    df = pd.read_csv(filepath, header=None, names=columns, dtype=dtypes)
     
     # Xử lý cột 'outcome'
     # 'normal' là 0, còn lại là 1 (tấn công)
-    df['outcome'] = df['outcome'].apply(lambda x: 0 if x == 'normal' else 1)
+    df['outcome'] = (df['outcome'] != 'normal').astype('int8')
     
     # Loại bỏ cột 'difficulty' vì nó không phải là đặc trưng
     df = df.drop('difficulty', axis=1)
@@ -0,0 +1,209 @@
+# src/replay.py
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.batch_feature_extractor import BatchFeatureExtractor
+from src.compiled_preprocessor import compile_preprocessor
+from src.config import PREPROCESSOR_PATH, REPLAY_BATCH_SIZE
+from src.model_reloader import load_serving_bundle
+from src.model_runtime import load_model
+from src.alert_sink import create_alert_sink
+from src.stream_monitor import build_alert, score_batch
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+REPLAY_STAGES = ('read', 'extract', 'preprocess', 'predict', 'output')
+
+def open_zeek_log(path):
+    """Mở conn.log dạng nhị phân; tự nhận file gzip (theo magic bytes, không chỉ đuôi .gz)."""
+    with open(path, 'rb') as f:
+        is_gzip = f.read(2) == b'\x1f\x8b'
+    return gzip.open(path, 'rb') if is_gzip else open(path, 'rb')
+
+def flow_result(log_entry_dict, label, proba):
+    """Bản ghi kết quả của một flow khi ghi ra file (NDJSON)."""
+    return {
+        'ts': log_entry_dict.get('ts'),
+        'src_ip': log_entry_dict.get('id.orig_h'), 'src_port': log_entry_dict.get('id.orig_p'),
+        'dst_ip': log_entry_dict.get('id.resp_h'), 'dst_port': log_entry_dict.get('id.resp_p'),
+        'proto': log_entry_dict.get('proto'), 'service': log_entry_dict.get('service'),
+        'label': label, 'proba': proba,
+    }
+
+def _score_pending(model, preprocessor, pending, alert_sink, output_file, alerts_only, timings, totals,
+                   model_version=None):
+    """
+    Chấm điểm một lô và ghi kết quả; cộng dồn thời gian từng bước vào timings.
+    :param pending: Danh sách các cặp (ZeekConnBatch, DataFrame đặc trưng) liên tiếp.
+    :param model_version: Phiên bản bộ mô hình, ghi vào ml_ids.model_version của từng cảnh báo.
+    """
+    frame = pd.concat([features for _, features in pending], ignore_index=True) if len(pending) > 1 else pending[0][1]
+    labels, probas, score_timings = score_batch(model, preprocessor, frame)
+    timings['preprocess'] += score_timings['preprocess']
+    timings['predict'] += score_timings['predict']
+    if 'short_circuited' in score_timings:
+        totals['short_circuited'] = totals.get('short_circuited', 0) + score_timings['short_circuited']
+
+    t0 = time.perf_counter()
+    malicious = np.flatnonzero(np.asarray(labels) == 'Malicious')
+    totals['malicious'] += len(malicious)
+    # Chỉ tạo dict (log Zeek + đặc trưng) cho những flow thực sự cần ghi/gửi
+    wanted = malicious if (alerts_only or output_file is None) else np.arange(len(labels))
+    if len(wanted) and (alert_sink is not None or output_file is not None):
+        offsets = np.cumsum([0] + [len(block) for block, _ in pending])
+        log_entries = {}
+        for i, (block, _) in enumerate(pending):
+            rows = wanted[(wanted >= offsets[i]) & (wanted < offsets[i + 1])]
+            if len(rows):
+                log_entries.update(zip(rows.tolist(), block.take(rows - offsets[i]).to_records(CONN_LOG_SCORING_FIELDS)))
+
+        if alert_sink is not None and len(malicious):
+            features_rows = frame.iloc[malicious].to_dict('records')
+            for index, nslkdd_features in zip(malicious.tolist(), features_rows):
+                alert_sink.send(build_alert(log_entries[index], nslkdd_features, labels[index], probas[index],
+                                           model_version))
+        if output_file is not None:
+            lines = [json.dumps(flow_result(log_entries[index], labels[index], probas[index])) for index in wanted.tolist()]
+            if lines:
+                output_file.write('\n'.join(lines) + '\n')
+    timings['output'] += time.perf_counter() - t0
+    totals['scored'] += len(labels)
+
+def replay(paths, model=None, preprocessor=None, alert_sink=None, output_path=None,
+           alerts_only=False, batch_size=REPLAY_BATCH_SIZE, model_version=None):
+    """
+    Chấm điểm offline các file conn.log đã lưu trữ (thường hoặc gzip) nhanh nhất có thể:
+    đọc theo khối lớn, chấm điểm theo lô lớn, không chờ/không log từng flow.
+    Đặc trưng được tính theo từng khối bằng BatchFeatureExtractor (giống hệt ZeekFeatureExtractor).
+    Các file được xử lý theo thứ tự truyền vào với cùng một extractor,
+    nên cửa sổ thống kê nối liền giữa các file log đã xoay liên tiếp.
+    :param paths: Danh sách file conn.log (theo thứ tự thời gian).
+    :param alert_sink: AlertSink đã start() nhận cảnh báo Malicious (tùy chọn).
+    :param output_path: File NDJSON nhận kết quả của từng flow (tùy chọn).
+    :param alerts_only: Chỉ ghi các flow Malicious vào output_path.
+    :param model_version: Phiên bản của model/preprocessor truyền vào (ghi vào cảnh báo).
+                          Không truyền model lẫn preprocessor thì tải bộ mô hình theo manifest như monitor.
+    :return: dict thống kê (số flow, phiên bản mô hình, thời gian tổng và theo từng bước).
+    """
+    if model is None and preprocessor is None:
+        # Cùng bộ mô hình mà monitor đang phục vụ (theo manifest nếu có)
+        bundle = load_serving_bundle()
+        model, preprocessor, model_version = bundle.model, bundle.preprocessor, bundle.version
+    if model is None:
+        model = load_model()
+    if preprocessor is None:
+        preprocessor = joblib.load(PREPROCESSOR_PATH)
+        preprocessor = compile_preprocessor(preprocessor) or preprocessor
+
+    extractor = BatchFeatureExtractor()
+    timings = dict.fromkeys(REPLAY_STAGES, 0.0)
+    totals = {'files': 0, 'lines': 0, 'scored': 0, 'skipped': 0, 'malicious': 0, 'model_version': model_version}
+    batch_size = max(1, batch_size)
+    output_file = open(output_path, 'w', encoding='utf-8') if output_path else None
+    start = time.perf_counter()
+
+    try:
+        for path in paths:
+            logging.info(f"[*] Replay {path}...")
+            file_start = time.perf_counter()
+            file_lines = 0
+            reader = ZeekConnReader(open_zeek_log(path))
+            try:
+                if not reader.read_header():
+                    logging.error(f"Không tìm thấy dòng '#fields' trong {path}. Bỏ qua file.")
+                    continue
+                pending, pending_rows = [], 0
+                batches = iter(reader)
+                while True:
+                    t0 = time.perf_counter()
+                    zeek_batch = next(batches, None)
+                    if zeek_batch is None:
+                        timings['read'] += time.perf_counter() - t0
+                        break
+                    t1 = time.perf_counter()
+                    timings['read'] += t1 - t0
+                    # Dòng không đọc được hoặc khác số cột với header: reader đã bỏ, không có trong khối
+                    totals['skipped'] += zeek_batch.skipped_lines + zeek_batch.mismatched_lines
+                    if len(zeek_batch) == 0:
+                        continue
+                    file_lines += len(zeek_batch)
+
+                    # Trích xuất đặc trưng cho cả khối bằng các phép toán theo cột
+                    pending.append((zeek_batch, extractor.transform(zeek_batch)))
+                    pending_rows += len(zeek_batch)
+                    timings['extract'] += time.perf_counter() - t1
+
+                    if pending_rows >= batch_size:
+                        _score_pending(model, preprocessor, pending, alert_sink, output_file, alerts_only, timings, totals,
+                                       model_version)
+                        pending, pending_rows = [], 0
+                if pending:
+                    _score_pending(model, preprocessor, pending, alert_sink, output_file, alerts_only, timings, totals,
+                                   model_version)
+            finally:
+                reader.close()
+            totals['files'] += 1
+            totals['lines'] += file_lines
+            elapsed = time.perf_counter() - file_start
+            logging.info(f"[*] Xong {os.path.basename(path)}: {file_lines} flow trong {elapsed:.2f}s "
+                         f"({file_lines / max(elapsed, 1e-9):.0f} flow/s).")
+    finally:
+        if output_file is not None:
+            output_file.close()
+
+    totals['total_sec'] = time.perf_counter() - start
+    totals['flows_per_sec'] = totals['lines'] / max(totals['total_sec'], 1e-9)
+    totals['stages_sec'] = timings
+    return totals
+
+def format_summary(stats):
+    """Bảng tổng kết in ra khi replay xong."""
+    total = stats['total_sec']
+    lines = [
+        f"Replay: {stats['files']} file, {stats['lines']} flow ({stats['scored']} đã chấm điểm, "
+        f"{stats['skipped']} bỏ qua, {stats['malicious']} Malicious), mô hình phiên bản {stats['model_version']}",
+        f"Tổng thời gian: {total:.2f}s -> {stats['flows_per_sec']:.0f} flow/s",
+    ]
+    if 'short_circuited' in stats:
+        lines.append(f"Bộ lọc cascade: {stats['short_circuited']} flow "
+                     f"({stats['short_circuited'] / max(stats['scored'], 1) * 100:.1f}%) không qua mô hình đầy đủ")
+    for stage in REPLAY_STAGES:
+        sec = stats['stages_sec'][stage]
+        lines.append(f"  {stage:<11s}: {sec:8.2f}s ({sec / max(total, 1e-9) * 100:5.1f}%)")
+    return '\n'.join(lines)
+
+def main(argv=None):
+    """Điểm vào của `python main.py replay <files...>`."""
+    parser = argparse.ArgumentParser(prog='main.py replay',
+                                     description="Chấm điểm offline các file conn.log (thường hoặc .gz) đã lưu trữ.")
+    parser.add_argument('files', nargs='+', help="Các file conn.log theo thứ tự thời gian")
+    parser.add_argument('--sink', choices=['elasticsearch', 'file'],
+                        help="Gửi cảnh báo Malicious tới alert sink này (mặc định: không gửi)")
+    parser.add_argument('--output', help="Ghi kết quả từng flow ra file NDJSON")
+    parser.add_argument('--alerts-only', action='store_true', help="Chỉ ghi các flow Malicious vào --output")
+    parser.add_argument('--batch-size', type=int, default=REPLAY_BATCH_SIZE, help="Số flow mỗi lô chấm điểm")
+    args = parser.parse_args(argv)
+
+    missing = [path for path in args.files if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"Không tìm thấy file: {', '.join(missing)}")
+
+    alert_sink = create_alert_sink(args.sink).start() if args.sink else None
+    try:
+        stats = replay(args.files, alert_sink=alert_sink, output_path=args.output,
+                       alerts_only=args.alerts_only, batch_size=args.batch_size)
+    finally:
+        if alert_sink is not None:
+            alert_sink.close()
+    print(format_summary(stats))
+    return stats
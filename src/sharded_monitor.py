@@ -0,0 +1,432 @@
+# src/sharded_monitor.py
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+import numpy as np
+
+from src.batch_feature_extractor import ServiceWindowCounter, WindowGroupCounter
+from src.config import PREPROCESSOR_PATH, MONITOR_SHARD_QUEUE_SIZE, EXTRACTOR_MAX_WINDOW_FLOWS
+from src.zeek_reader import ZeekConnBatch, CONN_LOG_SCORING_FIELDS
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+def shard_of_host(host, n_shards):
+    """Shard của một địa chỉ đích: crc32 ổn định giữa các lần chạy (khác hash() của Python)."""
+    return zlib.crc32(str(host).encode('utf-8')) % n_shards
+
+class _CollectingSink:
+    """Sink tạm trong worker: gom cảnh báo của một lô để gửi về tiến trình chính."""
+
+    def __init__(self):
+        self.alerts = []
+
+    def send(self, alert):
+        self.alerts.append(alert)
+        return True
+
+def _shard_worker(shard, task_queue, result_queue, model_path, preprocessor_path, collect_results, max_window_flows):
+    """
+    Tiến trình worker: tải mô hình một lần, giữ ZeekFeatureExtractor riêng cho các host đích
+    thuộc shard, nhận từng lô dạng cột từ tiến trình đọc, trích xuất đặc trưng với seq/watermark
+    toàn cục rồi chấm điểm cả lô bằng process_batch.
+    Không chỉ định model_path thì tải bộ mô hình theo manifest như chế độ một tiến trình, và mỗi worker
+    có ModelReloader riêng: bộ mô hình mới được tải ở luồng nền của worker và đổi giữa hai lô.
+    """
+    # Import trong worker: tiến trình được tạo bằng 'spawn' nên chỉ cần các module này khi chạy
+    import joblib
+    from src.compiled_preprocessor import compile_preprocessor
+    from src.model_reloader import ModelBundle, UNVERSIONED, load_serving_bundle, create_model_reloader
+    from src.model_runtime import load_model
+    from src.monitor_logging import FlowLogger
+    from src.stream_monitor import process_batch, score_batch, create_prediction_cache
+    from src.zeek_feature_extractor import ZeekFeatureExtractor
+
+    try:
+        # Mỗi worker đã là một tiến trình riêng: tránh mỗi worker lại mở nhiều luồng XGBoost
+        if model_path is None:
+            bundle = load_serving_bundle(nthread=1)
+        else:
+            preprocessor = joblib.load(preprocessor_path or PREPROCESSOR_PATH)
+            bundle = ModelBundle(UNVERSIONED, load_model(model_path, nthread=1),
+                                 compile_preprocessor(preprocessor) or preprocessor)
+    except Exception as e:
+        result_queue.put(('error', shard, f"{type(e).__name__}: {e}"))
+        return
+    model, preprocessor, model_version = bundle.model, bundle.preprocessor, bundle.version
+    reloader = create_model_reloader(model_version, nthread=1) if model_path is None else None
+    extractor = ZeekFeatureExtractor(max_window_flows=max_window_flows)
+    flow_log = FlowLogger() # Lấy mẫu dòng log từng flow, log đầy đủ cảnh báo và tổng kết định kỳ của shard
+    cache = create_prediction_cache() # Cache riêng của shard (các flow giống nhau cùng host đích nằm cùng shard)
+    result_queue.put(('ready', shard))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        min_seq, columns, seqs, watermarks, service_counts, window_flows, log_flows = task
+        extract_start = time.perf_counter()
+        records = ZeekConnBatch(columns, len(seqs)).to_records(CONN_LOG_SCORING_FIELDS)
+
+        batch = []
+        batch_seqs = []
+        for log_entry_dict, seq, watermark, service_count, flows in zip(records, seqs.tolist(), watermarks.tolist(),
+                                                                        service_counts.tolist(), window_flows.tolist()):
+            nslkdd_features = extractor.process_zeek_log_entry(log_entry_dict, seq=seq, watermark=watermark,
+                                                               service_count=service_count, window_flows=flows)
+            if nslkdd_features is not None:
+                batch.append((log_entry_dict, nslkdd_features))
+                batch_seqs.append(seq)
+        extract_sec = time.perf_counter() - extract_start
+
+        if reloader is not None:
+            new_bundle = reloader.take()
+            if new_bundle is not None:
+                logging.info(f"[*] Shard {shard} đổi mô hình: phiên bản {model_version} -> {new_bundle.version}.")
+                model, preprocessor, model_version = new_bundle.model, new_bundle.preprocessor, new_bundle.version
+
+        sink = _CollectingSink()
+        results = None
+        if collect_results and batch:
+            # Chế độ kiểm tra: trả về đặc trưng và xác suất của từng flow để so với chạy đơn tiến trình
+            _, probas, _ = score_batch(model, preprocessor, [features for _, features in batch])
+            results = [(seq, features, proba) for seq, (_, features), proba in zip(batch_seqs, batch, probas)]
+        timings = process_batch(model, preprocessor, batch, sink, log_flows=log_flows, flow_log=flow_log, cache=cache,
+                                model_version=model_version)
+        # Số liệu cho metrics của tiến trình chính: (thời gian trích xuất, số flow bị bỏ qua, số flow đã chấm điểm, timings, cửa sổ)
+        stats = (extract_sec, len(seqs) - len(batch), len(batch), timings, extractor.window_sizes())
+        result_queue.put(('result', shard, min_seq, len(seqs), sink.alerts, results, stats))
+
+    flow_log.log_summary()
+    if reloader is not None:
+        reloader.close()
+    result_queue.put(('done', shard))
+
+class ShardedFlowBatcher:
+    """
+    Thay cho FlowBatcher khi chạy nhiều worker: tiến trình chính chỉ đọc log, gán cho mỗi flow
+    số thứ tự và watermark toàn cục, rồi chia flow theo hash của id.resp_h tới N tiến trình worker.
+    Các đặc trưng cửa sổ của ZeekFeatureExtractor đếm flow có cùng host đích với flow hiện tại,
+    nên mỗi worker (sở hữu trọn vẹn các host đích của mình) cho kết quả giống hệt chạy một tiến trình;
+    riêng số flow cùng dịch vụ trên mọi host đích (cho srv_diff_host_rate) do tiến trình chính đếm
+    (ServiceWindowCounter) và gửi kèm từng flow. Giới hạn quá tải EXTRACTOR_MAX_WINDOW_FLOWS tính theo mọi flow của
+    luồng, nên tiến trình chính cũng đếm số flow của shard trong cửa sổ (WindowGroupCounter) để worker loại sớm giống hệt.
+    Cảnh báo do worker tạo được gửi về và đưa vào alert sink của tiến trình chính; khi cảnh báo mang phiên bản
+    mô hình mới, model_reloader của tiến trình chính tải bộ mô hình đó để AlertExplainer đổi theo.
+    Có cùng giao diện với FlowBatcher (add_block, flush, pending, waited_ms, committed_offset, reset_offset).
+    """
+
+    def __init__(self, n_workers, alert_sink=None, model_path=None,
+                 preprocessor_path=None, queue_size=MONITOR_SHARD_QUEUE_SIZE,
+                 on_result=None, metrics=None, model_version=None, model_reloader=None,
+                 max_window_flows=EXTRACTOR_MAX_WINDOW_FLOWS):
+        """
+        :param n_workers: Số tiến trình worker (số shard).
+        :param alert_sink: AlertSink nhận cảnh báo từ các worker (None thì bỏ qua cảnh báo).
+        :param model_path: File mô hình cho load_model; None thì worker tải bộ mô hình theo manifest
+                           (load_serving_bundle) và tự nạp lại khi manifest đổi.
+        :param preprocessor_path: File preprocessor đi kèm model_path (mặc định PREPROCESSOR_PATH).
+        :param queue_size: Số lô tối đa chờ trong hàng đợi của mỗi worker (đọc nhanh hơn chấm điểm thì tiến trình đọc phải chờ).
+        :param on_result: Nếu có, worker trả về (seq, đặc trưng, xác suất) của từng flow và hàm này được gọi
+                          với danh sách đó (dùng cho kiểm tra tính đúng đắn / benchmark).
+        :param metrics: MonitorMetrics nhận thời gian trích xuất/chấm điểm do worker gửi về (None để không đo).
+        :param model_version: Phiên bản bộ mô hình mà alert_sink (AlertExplainer) đang dùng.
+        :param model_reloader: ModelReloader (chưa khởi động) của tiến trình chính, tải bộ mô hình mới cho
+                               alert_sink khi cảnh báo của worker mang phiên bản khác model_version.
+        :param max_window_flows: Giới hạn quá tải của cửa sổ thời gian (như ZeekFeatureExtractor), tính theo mọi flow.
+        """
+        self.n_workers = max(1, int(n_workers))
+        self.alert_sink = alert_sink
+        self.model_path = model_path
+        self.preprocessor_path = preprocessor_path
+        self.queue_size = queue_size
+        self.on_result = on_result
+        self.metrics = metrics
+        self.model_version = model_version
+        self.model_reloader = model_reloader
+        self.max_window_flows = max_window_flows
+
+        self._seq = 0
+        self._watermark = float('-inf')
+        self._service_counter = ServiceWindowCounter(max_window_flows=max_window_flows)
+        self._shard_counter = WindowGroupCounter(max_window_flows=max_window_flows) # Số flow cùng shard trong cửa sổ (giới hạn quá tải của worker)
+        self._shard_cache = {} # host đích -> shard
+        self._pending = [[] for _ in range(self.n_workers)] # Các phần lô chưa gửi của từng shard
+        self._pending_count = [0] * self.n_workers
+        self._pending_since = [None] * self.n_workers
+        self._inflight = [deque() for _ in range(self.n_workers)] # seq nhỏ nhất của các lô đã gửi chưa xong
+        self._offset_marks = deque() # (seq cuối cùng của khối, vị trí byte sau khối)
+        self._committed_offset = 0
+        self._lock = threading.Condition()
+        self._errors = []
+        self._workers = []
+        self._task_queues = []
+        self._result_queue = None
+        self._collector = None
+        self._window_sizes = [{} for _ in range(self.n_workers)] # window_sizes() mới nhất của extractor từng worker
+        self.stats = {'dispatched_batches': 0, 'flows': 0, 'alerts': 0}
+
+    # --- Vòng đời ---
+
+    def start(self, timeout=120.0):
+        """Khởi động các worker và chờ chúng tải xong mô hình. :raises RuntimeError: nếu worker lỗi."""
+        ctx = multiprocessing.get_context('spawn')
+        self._result_queue = ctx.Queue()
+        for shard in range(self.n_workers):
+            task_queue = ctx.Queue(maxsize=self.queue_size)
+            worker = ctx.Process(target=_shard_worker, name=f"ids-shard-{shard}", daemon=True,
+                                 args=(shard, task_queue, self._result_queue, self.model_path,
+                                       self.preprocessor_path, self.on_result is not None, self.max_window_flows))
+            worker.start()
+            self._task_queues.append(task_queue)
+            self._workers.append(worker)
+
+        ready = 0
+        deadline = time.monotonic() + timeout
+        while ready < self.n_workers:
+            try:
+                message = self._result_queue.get(timeout=max(0.1, deadline - time.monotonic()))
+            except queue.Empty:
+                self.close()
+                raise RuntimeError(f"Worker không sẵn sàng sau {timeout}s.")
+            if message[0] == 'error':
+                self.close()
+                raise RuntimeError(f"Worker {message[1]} không tải được mô hình: {message[2]}")
+            ready += message[0] == 'ready'
+
+        self._collector = threading.Thread(target=self._collect, name='shard-results', daemon=True)
+        self._collector.start()
+        logging.info(f"Đã khởi động {self.n_workers} worker chấm điểm (chia flow theo id.resp_h).")
+        return self
+
+    def close(self, timeout=30.0):
+        """Gửi nốt lô đang chờ, chờ worker xử lý xong rồi dừng."""
+        if self._collector is not None:
+            try:
+                self.flush()
+            except RuntimeError as e:
+                logging.error(f"Không thể xả lô cuối cho worker: {e}")
+        for task_queue, worker in zip(self._task_queues, self._workers):
+            if worker.is_alive():
+                try:
+                    task_queue.put(None, timeout=timeout)
+                except queue.Full:
+                    pass
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        if self._collector is not None:
+            self._collector.join(timeout)
+            self._collector = None
+        self._workers, self._task_queues = [], []
+        logging.info(f"Đã dừng các worker chấm điểm: {self.stats}")
+
+    # --- Giao diện giống FlowBatcher ---
+
+    @property
+    def pending(self):
+        """Số flow đã đọc nhưng chưa gửi cho worker."""
+        return sum(self._pending_count)
+
+    def waited_ms(self):
+        started = [t for t in self._pending_since if t is not None]
+        return (time.monotonic() - min(started)) * 1000 if started else 0.0
+
+    @property
+    def committed_offset(self):
+        """Vị trí byte mà mọi flow phía trước đã được worker chấm điểm xong."""
+        with self._lock:
+            done_before = self._seq # seq nhỏ nhất chưa xong
+            for shard in range(self.n_workers):
+                if self._inflight[shard]:
+                    done_before = min(done_before, self._inflight[shard][0])
+                if self._pending[shard]:
+                    done_before = min(done_before, int(self._pending[shard][0][1][0]))
+            while self._offset_marks and self._offset_marks[0][0] < done_before:
+                self._committed_offset = max(self._committed_offset, self._offset_marks.popleft()[1])
+            return self._committed_offset
+
+    def reset_offset(self, offset):
+        """Chuyển sang file khác: chờ mọi lô đã gửi xong rồi đặt lại vị trí."""
+        self.flush()
+        with self._lock:
+            self._offset_marks.clear()
+            self._committed_offset = offset
+
+    def watch_queues(self, metrics):
+        """Đăng ký với MonitorMetrics độ sâu hàng đợi, số flow chờ gửi và cửa sổ extractor của từng shard."""
+        for shard in range(self.n_workers):
+            labels = {'shard': str(shard)}
+            metrics.watch_queue('shard_tasks', self._task_queues[shard].qsize, **labels)
+            metrics.watch_queue('pending_flows', lambda shard=shard: self._pending_count[shard], **labels)
+            metrics.watch_queue('inflight_batches', lambda shard=shard: len(self._inflight[shard]), **labels)
+            metrics.watch_extractor(lambda shard=shard: self._window_sizes[shard], shard=shard)
+
+    def add_block(self, zeek_batch, batch_size, batch_timeout_ms=None, log_flows=True):
+        """Gán seq/watermark cho các flow của khối, chia theo shard và gửi các shard đã đủ lô."""
+        n = len(zeek_batch)
+        if n:
+            columns = {}
+            for name in CONN_LOG_SCORING_FIELDS:
+                column = zeek_batch.column(name)
+                if column is not None:
+                    columns[name] = column
+            ts = columns.get('ts')
+            if ts is None:
+                ts = columns['ts'] = np.full(n, time.time())
+            watermarks = np.maximum.accumulate(np.concatenate(([self._watermark], ts)))[1:]
+            self._watermark = float(watermarks[-1])
+            seqs = np.arange(self._seq, self._seq + n, dtype=np.int64)
+            self._seq += n
+            service_counts = self._service_counter.counts(columns, watermarks)
+
+            shards = self._shards_of(columns.get('id.resp_h'), n)
+            window_flows = self._shard_counter.counts(shards, watermarks)
+            now = time.monotonic()
+            for shard in np.unique(shards).tolist():
+                index = np.flatnonzero(shards == shard)
+                part = ({name: column[index] for name, column in columns.items()}, seqs[index], watermarks[index],
+                        service_counts[index], window_flows[index])
+                if not self._pending[shard]:
+                    self._pending_since[shard] = now
+                self._pending[shard].append(part)
+                self._pending_count[shard] += len(index)
+                if self._pending_count[shard] >= batch_size:
+                    self._dispatch(shard, log_flows)
+            self.stats['flows'] += n
+
+        with self._lock:
+            self._offset_marks.append((self._seq - 1, zeek_batch.end_offset))
+
+        if batch_timeout_ms is not None:
+            now = time.monotonic()
+            for shard, since in enumerate(self._pending_since):
+                if since is not None and (now - since) * 1000 >= batch_timeout_ms:
+                    self._dispatch(shard, log_flows)
+        return n
+
+    def flush(self, log_flows=True, timeout=None):
+        """Gửi mọi lô đang chờ và chờ tới khi các worker chấm điểm xong."""
+        for shard in range(self.n_workers):
+            self._dispatch(shard, log_flows)
+        with self._lock:
+            while any(self._inflight) and not self._errors:
+                if not self._lock.wait(timeout=1.0):
+                    self._check_workers()
+            if self._errors:
+                raise RuntimeError(self._errors[0])
+
+    # --- Nội bộ ---
+
+    def _shards_of(self, hosts, n):
+        if hosts is None:
+            return np.zeros(n, dtype=np.int64)
+        cache = self._shard_cache
+        n_shards = self.n_workers
+        shards = np.empty(n, dtype=np.int64)
+        for i, host in enumerate(hosts.tolist()):
+            shard = cache.get(host)
+            if shard is None:
+                shard = cache[host] = shard_of_host(host, n_shards)
+            shards[i] = shard
+        return shards
+
+    def _dispatch(self, shard, log_flows):
+        parts = self._pending[shard]
+        if not parts:
+            return
+        if len(parts) == 1:
+            columns, seqs, watermarks, service_counts, window_flows = parts[0]
+        else:
+            columns = {name: np.concatenate([part[0][name] for part in parts]) for name in parts[0][0]}
+            seqs = np.concatenate([part[1] for part in parts])
+            watermarks = np.concatenate([part[2] for part in parts])
+            service_counts = np.concatenate([part[3] for part in parts])
+            window_flows = np.concatenate([part[4] for part in parts])
+        min_seq = int(seqs[0])
+        with self._lock:
+            self._inflight[shard].append(min_seq)
+        self._pending[shard] = []
+        self._pending_count[shard] = 0
+        self._pending_since[shard] = None
+
+        # Hàng đợi của worker có giới hạn: chờ (tạo áp lực ngược lên tiến trình đọc) nhưng phát hiện worker chết
+        while True:
+            try:
+                self._task_queues[shard].put((min_seq, columns, seqs, watermarks, service_counts, window_flows, log_flows),
+                                             timeout=1.0)
+                break
+            except queue.Full:
+                self._check_workers()
+        self.stats['dispatched_batches'] += 1
+
+    def _check_workers(self):
+        dead = [worker.name for worker in self._workers if not worker.is_alive()]
+        if dead:
+            message = f"Worker chấm điểm đã dừng bất thường: {', '.join(dead)}"
+            with self._lock:
+                self._errors.append(message)
+                self._lock.notify_all()
+            raise RuntimeError(message)
+
+    def _collect(self):
+        """Luồng nền của tiến trình chính: nhận kết quả từ worker, đưa cảnh báo vào sink."""
+        done = 0
+        while done < self.n_workers:
+            try:
+                message = self._result_queue.get(timeout=0.5)
+            except queue.Empty:
+                if not any(worker.is_alive() for worker in self._workers):
+                    break
+                continue
+            kind, shard = message[0], message[1]
+            if kind == 'done':
+                done += 1
+                continue
+            if kind == 'error':
+                with self._lock:
+                    self._errors.append(f"Worker {shard}: {message[2]}")
+                    self._lock.notify_all()
+                continue
+
+            _, _, min_seq, _, alerts, results, stats = message
+            if self.metrics is not None:
+                extract_sec, skipped, n_scored, timings, self._window_sizes[shard] = stats
+                self.metrics.observe_stage('extract', extract_sec)
+                if skipped:
+                    self.metrics.flows_skipped.inc(skipped)
+                if timings is not None:
+                    self.metrics.observe_scored(n_scored, len(alerts), timings)
+            if self.alert_sink is not None:
+                if self.model_reloader is not None and alerts:
+                    self._follow_model_version(alerts)
+                for alert in alerts:
+                    self.alert_sink.send(alert)
+            self.stats['alerts'] += len(alerts)
+            if self.on_result is not None and results:
+                self.on_result(results)
+            with self._lock:
+                inflight = self._inflight[shard]
+                if inflight and inflight[0] == min_seq:
+                    inflight.popleft()
+                self._lock.notify_all()
+
+    def _follow_model_version(self, alerts):
+        """
+        Worker đã đổi sang phiên bản mô hình mới: tải bộ mô hình đó trong luồng thu kết quả (không chặn worker)
+        và báo cho alert_sink trước khi gửi cảnh báo đầu tiên của phiên bản này.
+        """
+        if all(alert['ml_ids'].get('model_version') == self.model_version for alert in alerts):
+            return
+        self.model_reloader.check()
+        bundle = self.model_reloader.take()
+        if bundle is not None:
+            self.model_version = bundle.version
+            if hasattr(self.alert_sink, 'set_model'):
+                self.alert_sink.set_model(bundle.model, bundle.preprocessor, bundle.version)
@@ -1,48 +1,253 @@
 # src/stream_monitor.py
 
 import pandas as pd
-import joblib
 import logging
 import time
 import os
-import re
 from datetime import datetime 
-from elasticsearch import Elasticsearch
-import json
 
 from src.preprocess import preprocess_features
-from src.config import MODEL_PATHS, PREPROCESSOR_PATH, NSL_KDD_RELEVANT_COLUMNS
+from src.compiled_preprocessor import CompiledPreprocessor
+from src.config import (NSL_KDD_RELEVANT_COLUMNS,
+                        MONITOR_BATCH_SIZE, MONITOR_BATCH_TIMEOUT_MS,
+                        MONITOR_CATCHUP_THRESHOLD_BYTES, MONITOR_CATCHUP_BATCH_SIZE, MONITOR_WORKERS, ZEEK_LOG_DIRS,
+                        METRICS_ENABLED, PREDICTION_CACHE_ENABLED, EXTRACTOR_SNAPSHOT_ENABLED, MODEL_RELOAD_ENABLED)
 from src.zeek_feature_extractor import ZeekFeatureExtractor
+from src.zeek_reader import ZeekConnReader, CONN_LOG_SCORING_FIELDS
+from src.alert_sink import create_alert_sink
+from src.alert_explainer import create_alert_explainer
+from src.checkpoint import OffsetCheckpoint, file_identity, find_file_by_identity
+from src.extractor_snapshot import create_extractor_snapshotter
+from src.model_reloader import ModelReloader, load_serving_bundle, create_model_reloader
+from src.cascade import CascadeModel
+from src.monitor_logging import FlowLogger
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 ZEEK_LOG_DIR = "/opt/zeek/logs/current/"
 ZEEK_CONN_LOG_FILE_NAME = "conn.log"
 
-# Khởi tạo client Elasticsearch
-# Thay đổi địa chỉ IP và cổng nếu Elasticsearch không chạy trên localhost
-try:
-    es_client = Elasticsearch([{'host': 'localhost', 'port': 9200, 'scheme': 'http'}])
-    es_client.info() # Kiểm tra kết nối
-    logging.info("Đã kết nối thành công tới Elasticsearch.")
-except Exception as e:
-    logging.error(f"Không thể kết nối tới Elasticsearch: {e}. Vui lòng kiểm tra Elasticsearch đang chạy và cấu hình.")
-    es_client = None # Đặt về None để tránh lỗi sau này nếu không kết nối được
-
-def get_latest_zeek_conn_log_path():
+def get_latest_zeek_conn_log_path(log_dir=ZEEK_LOG_DIR):
     """Tìm đường dẫn đầy đủ đến file conn.log mới nhất trong thư mục Zeek log."""
-    full_path = os.path.join(ZEEK_LOG_DIR, ZEEK_CONN_LOG_FILE_NAME)
+    full_path = os.path.join(log_dir, ZEEK_CONN_LOG_FILE_NAME)
     if os.path.exists(full_path):
         return full_path
     else:
         logging.warning(f"File log Zeek không tìm thấy tại {full_path}. Đang chờ Zeek ghi log.")
         return None
 
-def monitor():
+def build_alert(log_entry_dict, nslkdd_features, label, proba, model_version=None):
+    """
+    Tạo tài liệu cảnh báo (định dạng ECS) cho một flow bị đánh giá là Malicious.
+    :param model_version: Phiên bản bộ mô hình đã chấm điểm flow (src/model_reloader.py), None nếu không rõ.
+    """
+    return {
+        # Dòng đã được sửa: Sử dụng datetime.utcfromtimestamp() để đảm bảo UTC
+        "@timestamp": datetime.utcfromtimestamp(float(log_entry_dict.get('ts', time.time()))).isoformat() + "Z",
+        "event": {
+            "category": "network",
+            "type": "alert",
+            "severity": "high" if proba >= 0.8 else "medium", # Tùy chỉnh mức độ nghiêm trọng
+            "kind": "event"
+        },
+        "source": {
+            "ip": log_entry_dict.get('id.orig_h'),
+            "port": log_entry_dict.get('id.orig_p')
+        },
+        "destination": {
+            "ip": log_entry_dict.get('id.resp_h'),
+            "port": log_entry_dict.get('id.resp_p')
+        },
+        "network": {
+            "transport": log_entry_dict.get('proto', 'unknown'),
+            "protocol": log_entry_dict.get('service', 'unknown')
+        },
+        "threat": {
+            "detection": {
+                "outcome": "detected",
+                "rule": {
+                    "name": "ML_IDS_Prediction"
+                }
+            },
+            "technique": [
+                { "id": "T1046", "name": "Network Service Scanning" } # MITRE ATT&CK for port scanning
+            ],
+            "score": int(proba * 100)
+        },
+        "ml_ids": { # Thông tin thêm từ mô hình 
+            "predicted_label": label,
+            "prediction_probability": proba,
+            "model_version": model_version,
+            # nslkdd_features là dict, có thể lưu trực tiếp
+            "nsl_kdd_features": nslkdd_features 
+        },
+        "message": f"ML IDS detected {label} activity from {log_entry_dict.get('id.orig_h')}:{log_entry_dict.get('id.orig_p')} to {log_entry_dict.get('id.resp_h')}:{log_entry_dict.get('id.resp_p')} with probability {proba:.4f}"
+    }
+
+def score_batch(model, preprocessor, features_batch, cache=None):
+    """
+    Tiền xử lý và dự đoán cho cả một lô đặc trưng NSL-KDD chỉ với một lần gọi mô hình.
+    Nhãn được suy ra từ xác suất (giống XGBClassifier.predict: Malicious khi xác suất > 0.5).
+    :param preprocessor: CompiledPreprocessor hoặc ColumnTransformer gốc (preprocessor.pkl).
+    :param features_batch: Danh sách các dict đặc trưng do ZeekFeatureExtractor trả về,
+        hoặc DataFrame đặc trưng do BatchFeatureExtractor trả về.
+    :param cache: PredictionCache (chỉ dùng với danh sách dict): flow có vector đặc trưng đã gặp lấy lại
+        xác suất từ cache, các vector còn lại (mỗi vector khác nhau một lần) mới được tiền xử lý và dự đoán.
+        Lô cache đang bỏ qua (cache.active() là False, tỉ lệ hit gần đây thấp) được chấm điểm thẳng.
+    :return: (labels, probas, timings) với timings là thời gian (giây) của từng bước
+        (kèm 'cache_hits', 'cache_evictions' khi dùng cache, 'short_circuited' khi model là CascadeModel).
+    """
+    if cache is not None and not isinstance(features_batch, pd.DataFrame) and cache.active():
+        return _score_batch_cached(model, preprocessor, features_batch, cache)
+    t0 = time.perf_counter()
+    X = _transform_batch(preprocessor, features_batch)
+    t1 = time.perf_counter()
+
+    probas, short_circuited = _predict(model, X)
+    t2 = time.perf_counter()
+
+    labels = ['Malicious' if proba > 0.5 else 'Normal' for proba in probas]
+    timings = {'preprocess': t1 - t0, 'predict': t2 - t1}
+    if short_circuited is not None:
+        timings['short_circuited'] = short_circuited
+    return labels, [float(proba) for proba in probas], timings
+
+def _predict(model, X):
+    """Xác suất Malicious của lô, kèm số flow bộ lọc trước đã kết luận Normal nếu model là CascadeModel (không thì None)."""
+    if isinstance(model, CascadeModel):
+        return model.score(X)
+    return model.predict_proba(X)[:, 1], None
+
+def _transform_batch(preprocessor, features_batch):
+    is_frame = isinstance(features_batch, pd.DataFrame)
+    if isinstance(preprocessor, CompiledPreprocessor):
+        # Đường nhanh: biến đổi trực tiếp bằng NumPy, không qua pandas/ColumnTransformer
+        return preprocessor.transform_frame(features_batch) if is_frame else preprocessor.transform_records(features_batch)
+    # Tạo DataFrame nhiều hàng từ các đặc trưng đã xử lý (giữ nguyên thứ tự flow)
+    df = features_batch if is_frame else pd.DataFrame(features_batch, columns=NSL_KDD_RELEVANT_COLUMNS)
+    X, _, _ = preprocess_features(df, preprocessor=preprocessor, fit=False, compiled=False)
+    return X
+
+def _score_batch_cached(model, preprocessor, features_batch, cache):
+    """score_batch với PredictionCache: chỉ chấm điểm các vector đặc trưng chưa có trong cache (mỗi vector một lần)."""
+    t0 = time.perf_counter()
+    cache.bind(model, preprocessor)
+    encoded = None
+    if isinstance(preprocessor, CompiledPreprocessor):
+        # Khóa tạo bằng NumPy từ đầu vào mô hình; flow thiếu chỉ còn bước chuẩn hóa/one-hot
+        encoded = preprocessor.encode_records(features_batch)
+        keys = cache.encoded_keys(*encoded, preprocessor.numeric_columns)
+    else:
+        keys = cache.keys(features_batch)
+    hits, evictions = cache.stats['hits'], cache.stats['evictions']
+    probas, missing = cache.lookup(keys)
+
+    t1 = t2 = time.perf_counter()
+    short_circuited = 0 if isinstance(model, CascadeModel) else None
+    if missing:
+        rows = list(missing.values())
+        if encoded is None:
+            X = _transform_batch(preprocessor, [features_batch[i] for i in rows])
+        else:
+            numeric, category_indices = encoded
+            X = preprocessor.transform_encoded(numeric[rows], [col_index[rows] for col_index in category_indices])
+        t1 = time.perf_counter()
+        scored, short_circuited = _predict(model, X)
+        scored = [float(proba) for proba in scored]
+        t2 = time.perf_counter()
+        cache.store(missing.keys(), scored)
+        computed = dict(zip(missing.keys(), scored))
+        probas = [computed[key] if proba is None else proba for key, proba in zip(keys, probas)]
+
+    labels = ['Malicious' if proba > 0.5 else 'Normal' for proba in probas]
+    timings = {'preprocess': t1 - t0, 'predict': t2 - t1, 'cache_hits': cache.stats['hits'] - hits,
+               'cache_evictions': cache.stats['evictions'] - evictions}
+    if short_circuited is not None:
+        timings['short_circuited'] = short_circuited # Chỉ tính các flow thực sự được chấm điểm (không lấy từ cache)
+    return labels, probas, timings
+
+def process_batch(model, preprocessor, batch, alert_sink=None, log_flows=True, metrics=None, flow_log=None,
+                  cache=None, model_version=None):
+    """
+    Chấm điểm một lô flow, gửi cảnh báo và ghi log kết quả theo đúng thứ tự flow.
+    :param batch: Danh sách các cặp (log_entry_dict, nslkdd_features).
+    :param alert_sink: AlertSink nhận cảnh báo (None thì chỉ ghi log).
+    :param log_flows: False để bỏ dòng log từng flow (khi đuổi kịp backlog), chỉ giữ dòng tổng kết lô.
+    :param metrics: MonitorMetrics ghi nhận thời gian tiền xử lý/dự đoán và số cảnh báo (None để không đo).
+    :param flow_log: FlowLogger quyết định dòng log từng flow (lấy mẫu/tắt), log đầy đủ cảnh báo và ghi
+                     dòng tổng kết định kỳ; None thì log mọi flow như trước (theo log_flows).
+    :param cache: PredictionCache dùng cho score_batch (None: luôn chấm điểm mọi flow).
+    :param model_version: Phiên bản bộ mô hình, ghi vào ml_ids.model_version của từng cảnh báo.
+    :return: timings của score_batch kèm 'alerts' (số flow Malicious), None nếu lô rỗng hoặc lỗi.
+    """
+    if not batch:
+        return None
+    batch_start = time.perf_counter()
+    try:
+        labels, probas, timings = score_batch(model, preprocessor, [features for _, features in batch], cache=cache)
+    except Exception as e:
+        logging.error(f"Lỗi trong quá trình tiền xử lý hoặc dự đoán lô {len(batch)} flow từ Zeek log: {e}", exc_info=True)
+        return None
+    timings['alerts'] = labels.count('Malicious')
+
+    if flow_log is None:
+        logged = range(len(batch)) if log_flows else ()
+    else:
+        logged = flow_log.flow_indices(len(batch), log_flows)
+    if timings['alerts'] and (alert_sink is not None or flow_log is not None):
+        for (log_entry_dict, nslkdd_features), label, proba in zip(batch, labels, probas):
+            if label != 'Malicious':
+                continue
+            alert_data = build_alert(log_entry_dict, nslkdd_features, label, proba, model_version)
+            # Đưa cảnh báo vào hàng đợi của sink (luồng nền sẽ gửi theo lô)
+            if alert_sink is not None and alert_sink.send(alert_data):
+                logging.debug(f"Đã đưa cảnh báo tấn công vào hàng đợi: {log_entry_dict.get('id.orig_h')} -> {log_entry_dict.get('id.resp_h')}, xác suất: {proba:.4f}")
+            if flow_log is not None:
+                flow_log.log_alert(alert_data)
+
+    # Log thông báo dự đoán ra console (luôn hiển thị nếu level là INFO); tham số kiểu %s để việc format
+    # diễn ra trong handler (luồng nền khi LOG_ASYNC) thay vì ở đây
+    for i in logged:
+        log_entry_dict = batch[i][0]
+        logging.info("[+] Zeek Flow (%s %s:%s -> %s:%s): %s (Xác suất tấn công: %.4f)",
+                     log_entry_dict.get('ts', 'N/A'), log_entry_dict.get('id.orig_h', 'N/A'),
+                     log_entry_dict.get('id.orig_p', 'N/A'), log_entry_dict.get('id.resp_h', 'N/A'),
+                     log_entry_dict.get('id.resp_p', 'N/A'), labels[i], probas[i])
+    if flow_log is not None:
+        flow_log.observe_batch(batch, labels)
+
+    if metrics is not None:
+        metrics.observe_scored(len(batch), timings['alerts'], timings)
+    total_ms = (time.perf_counter() - batch_start) * 1000
+    logging.info(f"[*] Lô {len(batch)} flow: tổng {total_ms:.1f} ms "
+                 f"(tiền xử lý {timings['preprocess'] * 1000:.1f} ms, dự đoán {timings['predict'] * 1000:.1f} ms, "
+                 f"{total_ms / len(batch):.3f} ms/flow"
+                 + (f", cache {timings['cache_hits']}/{len(batch)} flow" if 'cache_hits' in timings else "")
+                 + (f", bộ lọc cascade {timings['short_circuited']}/{len(batch)} flow" if 'short_circuited' in timings else "")
+                 + ")")
+    return timings
+
+def monitor(workers=None, log_dirs=None):
+    """
+    Theo dõi conn.log và chấm điểm thời gian thực.
+    :param workers: Số tiến trình worker; > 1 thì chia flow theo host đích cho nhiều tiến trình
+                    (mặc định MONITOR_WORKERS).
+    :param log_dirs: Các thư mục log Zeek cần theo dõi (mặc định ZEEK_LOG_DIRS, rỗng thì ZEEK_LOG_DIR).
+                     Nhiều thư mục thì flow của mọi thư mục được trộn theo ts (src/merged_monitor.py).
+    """
+    workers = MONITOR_WORKERS if workers is None else workers
+    log_dirs = list(ZEEK_LOG_DIRS if log_dirs is None else log_dirs) or [ZEEK_LOG_DIR]
+    if len(log_dirs) > 1 and workers > 1:
+        logging.warning(f"Chế độ nhiều thư mục log chạy trong một tiến trình, bỏ qua MONITOR_WORKERS={workers}.")
+    elif workers > 1:
+        _monitor_sharded(workers, log_dirs[0])
+        return
+
     logging.info("[*] Đang tải mô hình và preprocessor...")
     try:
-        model = joblib.load(MODEL_PATHS['xgb'])
-        preprocessor = joblib.load(PREPROCESSOR_PATH)
+        # Theo manifest nếu có (src/model_reloader.py), không thì mô hình/preprocessor mặc định
+        bundle = load_serving_bundle()
+        model, preprocessor = bundle.model, bundle.preprocessor
     except FileNotFoundError as e:
         logging.error(f"Không tìm thấy file mô hình hoặc preprocessor: {e}. Vui lòng chạy chế độ huấn luyện trước.")
         return
@@ -51,192 +256,439 @@ def monitor():
         return
 
     logging.info("[*] Bắt đầu giám sát log Zeek...")
-    
-    feature_extractor = ZeekFeatureExtractor()
+    metrics = _create_metrics()
 
-    current_log_path = None
-    log_file = None
-    column_names = [] # Khởi tạo rỗng, sẽ được điền khi đọc header
-    last_processed_pos = {} # Lưu trữ vị trí cuối cùng đọc của mỗi file
+    # Sink cảnh báo chạy luồng nền riêng; kết nối tới backend diễn ra trong luồng đó
+    try:
+        alert_sink = create_alert_sink(metrics=metrics).start()
+    except Exception as e:
+        logging.error(f"Không thể khởi tạo alert sink, cảnh báo sẽ chỉ được ghi log: {e}")
+        alert_sink = None
 
-    while True:
-        try:
-            new_log_path = get_latest_zeek_conn_log_path()
+    # Cảnh báo đi qua AlertExplainer (luồng nền gắn top-k đặc trưng đóng góp) rồi mới tới sink
+    explainer = create_alert_explainer(alert_sink, model, preprocessor, metrics=metrics)
+    extractor = ZeekFeatureExtractor()
+    snapshotter = create_extractor_snapshotter(extractor) # Nạp lại cửa sổ từ lần chạy trước
+    # Luồng nền tải bộ mô hình mới khi manifest đổi; FlowBatcher đổi sang nó giữa hai lô
+    reloader = create_model_reloader(bundle.version)
+    batcher = FlowBatcher(model, preprocessor, explainer, extractor, metrics=metrics, flow_log=FlowLogger(),
+                          prediction_cache=create_prediction_cache(), model_version=bundle.version,
+                          model_reloader=reloader)
+    if metrics is not None:
+        metrics.watch_extractor(extractor)
+        if batcher.prediction_cache is not None:
+            metrics.watch_prediction_cache(batcher.prediction_cache)
+        metrics.watch_queue('pending_flows', lambda: len(batcher.pending))
+        if alert_sink is not None:
+            metrics.watch_alert_sink(alert_sink)
+        if explainer is not alert_sink:
+            metrics.watch_alert_explainer(explainer)
+        if reloader is not None:
+            metrics.watch_model_reloader(reloader)
+        metrics.start()
+    try:
+        if len(log_dirs) > 1:
+            from src.merged_monitor import merged_monitor_loop
+            merged_monitor_loop(batcher, log_dirs, snapshotter)
+        else:
+            _monitor_loop(batcher, snapshotter, log_dirs[0])
+    finally:
+        batcher.flow_log.log_summary()
+        if reloader is not None:
+            reloader.close()
+        if explainer is not alert_sink:
+            explainer.close() # Trước sink: các cảnh báo đang chờ giải thích vẫn được gửi
+        if alert_sink is not None:
+            alert_sink.close()
+        if metrics is not None:
+            metrics.close()
 
-            # Nếu đường dẫn log thay đổi hoặc file hiện tại không còn tồn tại
-            # (ví dụ: Zeek đã xoay log và tạo file mới cùng tên nhưng thực chất là file khác)
-            # Hoặc nếu chưa có file log nào được mở
-            if new_log_path is None:
-                time.sleep(5) # Chờ Zeek tạo log file
-                continue
+def create_prediction_cache():
+    """PredictionCache theo cấu hình nếu PREDICTION_CACHE_ENABLED, không thì None."""
+    if not PREDICTION_CACHE_ENABLED:
+        return None
+    from src.prediction_cache import PredictionCache
+    return PredictionCache()
 
-            # Kiểm tra xem có phải là file mới hoàn toàn hoặc đã xoay file không
-            # Kiểm tra inode để biết đó có phải là file vật lý mới không
-            try:
-                # Lấy inode của file đang mở (nếu có)
-                current_inode = os.fstat(log_file.fileno()).st_ino if log_file else None
-            except (AttributeError, OSError): # log_file có thể là None hoặc đã đóng
-                current_inode = None
+def _create_metrics():
+    """MonitorMetrics nếu METRICS_ENABLED (import muộn: tắt metrics thì không cần module này)."""
+    if not METRICS_ENABLED:
+        return None
+    from src.metrics import MonitorMetrics
+    return MonitorMetrics()
 
-            # Lấy inode của file mới
-            try:
-                new_inode = os.stat(new_log_path).st_ino
-            except FileNotFoundError:
-                new_inode = None # Rất hiếm xảy ra ở đây do đã kiểm tra get_latest_zeek_conn_log_path
+def _monitor_sharded(workers, log_dir=ZEEK_LOG_DIR):
+    """
+    Chế độ nhiều tiến trình: tiến trình này chỉ đọc log và phân phối flow, các worker tải mô hình và chấm điểm.
+    Worker tải bộ mô hình theo manifest và tự nạp lại khi manifest đổi; snapshot cửa sổ extractor
+    (nằm trong các worker) chưa được hỗ trợ ở chế độ này.
+    """
+    # Import muộn để chế độ một tiến trình không cần tới multiprocessing
+    from src.sharded_monitor import ShardedFlowBatcher
 
-            # Nếu đường dẫn thay đổi HOẶC inode thay đổi (file mới cùng tên) HOẶC chưa có file nào được mở
-            if new_log_path != current_log_path or new_inode != current_inode or log_file is None:
-                if log_file:
-                    log_file.close()
-                    logging.info(f"Đóng file log cũ: {current_log_path}")
-                
-                current_log_path = new_log_path
-                logging.info(f"Đang mở file log mới: {current_log_path}")
-                
-                # Mở file mới
-                log_file = open(current_log_path, 'r', encoding='utf-8', errors='ignore')
-                
-                # Đọc header của file mới
-                header_parsed = False
-                column_names = [] # Reset column names
-                # Đọc một số dòng đầu để tìm dòng #fields
-                for _ in range(20): # Đọc tối đa 20 dòng đầu để tìm header (đủ để tìm #fields)
-                    line_header = log_file.readline()
-                    if not line_header:
-                        break # Hết file
-                    if '#fields' in line_header:
-                        match = re.search(r'#fields\s+(.*)', line_header)
-                        if match:
-                            column_names = match.group(1).split('\t')
-                            logging.info(f"Đã đọc header Zeek log. Các cột: {len(column_names)} cột.")
-                            # logging.debug(f"Các cột: {column_names}") # Có thể bật debug để xem tên cột
-                            header_parsed = True
-                            break
-                
-                if not header_parsed:
-                    logging.error(f"Không tìm thấy dòng '#fields' trong 20 dòng đầu của {current_log_path}. Đảm bảo Zeek ghi log đúng định dạng.")
-                    # Đóng file và thử lại vòng lặp sau
-                    if log_file:
-                        log_file.close()
-                        log_file = None
-                    time.sleep(5)
-                    continue
+    logging.info("[*] Đang tải mô hình và preprocessor...")
+    try:
+        # Cùng bộ mô hình mà các worker sẽ tải (theo manifest nếu có), dùng cho AlertExplainer của tiến trình này
+        bundle = load_serving_bundle(nthread=1)
+    except FileNotFoundError as e:
+        logging.error(f"Không tìm thấy file mô hình hoặc preprocessor: {e}. Vui lòng chạy chế độ huấn luyện trước.")
+        return
+    except Exception as e:
+        logging.error(f"Lỗi khi tải mô hình/preprocessor: {e}", exc_info=True)
+        return
+    if EXTRACTOR_SNAPSHOT_ENABLED:
+        logging.warning(f"Chế độ {workers} worker chưa hỗ trợ snapshot cửa sổ extractor: khởi động lại sẽ bắt đầu "
+                        f"với cửa sổ rỗng.")
+
+    logging.info(f"[*] Bắt đầu giám sát log Zeek với {workers} worker...")
+    metrics = _create_metrics()
+    try:
+        alert_sink = create_alert_sink(metrics=metrics).start()
+    except Exception as e:
+        logging.error(f"Không thể khởi tạo alert sink, cảnh báo sẽ chỉ được ghi log: {e}")
+        alert_sink = None
 
-                # Di chuyển đến vị trí cuối cùng đã đọc của file này (nếu có)
-                # Hoặc đến cuối file nếu là lần đầu mở
-                if current_log_path in last_processed_pos:
-                    log_file.seek(last_processed_pos[current_log_path])
-                    logging.info(f"Tiếp tục đọc từ vị trí {last_processed_pos[current_log_path]} trong file {os.path.basename(current_log_path)}.")
-                else:
-                    log_file.seek(0, 2) # Chuyển đến cuối file để chỉ đọc dòng mới
-                    logging.info(f"Đang đọc từ cuối file {os.path.basename(current_log_path)}.")
+    # Cảnh báo của các worker được giải thích tại tiến trình này
+    explainer = create_alert_explainer(alert_sink, bundle.model, bundle.preprocessor, metrics=metrics)
+    # Không khởi động luồng nền: ShardedFlowBatcher chỉ kiểm tra manifest khi worker gửi về phiên bản mới
+    reloader = ModelReloader(version=bundle.version, nthread=1) if MODEL_RELOAD_ENABLED and explainer is not alert_sink else None
+    batcher = None
+    try:
+        batcher = ShardedFlowBatcher(workers, explainer, metrics=metrics, model_version=bundle.version,
+                                     model_reloader=reloader).start()
+        if metrics is not None:
+            batcher.watch_queues(metrics)
+            if alert_sink is not None:
+                metrics.watch_alert_sink(alert_sink)
+            if explainer is not alert_sink:
+                metrics.watch_alert_explainer(explainer)
+            metrics.start()
+        _monitor_loop(batcher, log_dir=log_dir)
+    except RuntimeError as e:
+        logging.error(f"Lỗi ở chế độ nhiều worker: {e}")
+    finally:
+        if batcher is not None:
+            batcher.close()
+        if explainer is not alert_sink:
+            explainer.close()
+        if alert_sink is not None:
+            alert_sink.close()
+        if metrics is not None:
+            metrics.close()
 
-            if log_file is None or not column_names:
-                time.sleep(1)
-                continue
+class FlowBatcher:
+    """
+    Gom các flow đã trích xuất đặc trưng thành lô và chấm điểm, đồng thời theo dõi vị trí byte
+    mà mọi flow phía trước đã được chấm điểm xong (dùng làm checkpoint). Dùng chung cho theo dõi
+    trực tiếp (lô nhỏ, có timeout) và đuổi kịp backlog (lô lớn, không log từng flow).
+    """
 
-            line = log_file.readline()
-            if not line:
-                # Lưu lại vị trí hiện tại trước khi chờ
-                last_processed_pos[current_log_path] = log_file.tell()
-                time.sleep(0.1)
-                continue
-            
-            # Zeek có thể ghi các dòng header hoặc comment khác sau khi xoay file
-            # Bỏ qua các dòng comment (bắt đầu bằng #)
-            if line.startswith('#'):
-                continue
+    def __init__(self, model, preprocessor, alert_sink, feature_extractor, metrics=None, flow_log=None,
+                 prediction_cache=None, model_version=None, model_reloader=None):
+        self.model = model
+        self.preprocessor = preprocessor
+        self.model_version = model_version
+        self.model_reloader = model_reloader # ModelReloader (None: luôn dùng mô hình ban đầu)
+        self.alert_sink = alert_sink
+        self.feature_extractor = feature_extractor
+        self.metrics = metrics # MonitorMetrics (None: không đo)
+        self.flow_log = flow_log # FlowLogger (None: log mọi flow theo log_flows)
+        self.prediction_cache = prediction_cache # PredictionCache (None: không dùng cache)
+        self._flush_sec = 0.0 # Tổng thời gian chấm điểm, để tách thời gian trích xuất của mỗi khối
+        self.pending = [] # Các (log_entry_dict, nslkdd_features) đang chờ chấm điểm
+        self.started_at = time.monotonic()
+        self.committed_offset = 0 # Mọi dòng trước vị trí này của file hiện tại đã được chấm điểm
+        self._block_start = None  # Vị trí đầu của ZeekConnBatch đang được đưa vào
 
-            # Parse dòng log thành dictionary
-            values = line.strip().split('\t')
-            
-            if len(values) != len(column_names):
-                logging.warning(f"Số lượng cột không khớp. Dòng: {line.strip()}. Expected {len(column_names)}, Got {len(values)}. Bỏ qua dòng.")
-                continue
-            
-            log_entry_dict = dict(zip(column_names, values))
-            
-            nslkdd_features = feature_extractor.process_zeek_log_entry(log_entry_dict)
-            
+    def reset_offset(self, offset):
+        """Đặt lại vị trí đã xử lý khi chuyển sang file khác (lô đang chờ phải được xả trước)."""
+        self.committed_offset = offset
+        self._block_start = offset
+
+    def add_block(self, zeek_batch, batch_size, batch_timeout_ms=None, log_flows=True):
+        """
+        Trích xuất đặc trưng cho mọi flow của một ZeekConnBatch và chấm điểm mỗi khi lô đầy
+        (hoặc quá batch_timeout_ms). :return: Số flow đã đọc từ khối.
+        """
+        self._block_start = zeek_batch.start_offset
+        block_start, flush_sec = time.perf_counter(), self._flush_sec
+        records = zeek_batch.to_records(CONN_LOG_SCORING_FIELDS)
+        self._extract(records, batch_size, batch_timeout_ms, log_flows, block_start, flush_sec)
+        self._block_start = zeek_batch.end_offset
+        if not self.pending:
+            self.committed_offset = max(self.committed_offset, zeek_batch.end_offset)
+        return len(records)
+
+    def add_records(self, records, batch_size, batch_timeout_ms=None, log_flows=True):
+        """
+        Như add_block cho các dict flow đã đọc sẵn (ví dụ luồng đã trộn từ nhiều thư mục log);
+        không theo dõi vị trí byte, người gọi tự ghi nhận vị trí đã chấm điểm khi pending rỗng.
+        """
+        self._extract(records, batch_size, batch_timeout_ms, log_flows, time.perf_counter(), self._flush_sec)
+        return len(records)
+
+    def _extract(self, records, batch_size, batch_timeout_ms, log_flows, block_start, flush_sec):
+        skipped = 0
+        for log_entry_dict in records:
+            nslkdd_features = self.feature_extractor.process_zeek_log_entry(log_entry_dict)
             if nslkdd_features is None:
                 logging.debug("Bỏ qua Zeek log entry không thể xử lý hoặc không có đặc trưng.")
+                skipped += 1
                 continue
-            
-            # Tạo DataFrame 1 hàng từ các đặc trưng đã xử lý
-            df = pd.DataFrame([nslkdd_features], columns=NSL_KDD_RELEVANT_COLUMNS)
 
+            # Gom flow vào lô hiện tại, chỉ chấm điểm khi lô đủ lớn hoặc đã chờ quá lâu
+            if not self.pending:
+                self.started_at = time.monotonic()
+            self.pending.append((log_entry_dict, nslkdd_features))
+            if len(self.pending) >= batch_size or \
+               (batch_timeout_ms is not None and self.waited_ms() >= batch_timeout_ms):
+                self.flush(log_flows)
+
+        if self.metrics is not None:
+            # Thời gian của khối trừ phần chấm điểm các lô đầy trong khối = to_records + trích xuất đặc trưng
+            self.metrics.observe_stage('extract', time.perf_counter() - block_start - (self._flush_sec - flush_sec))
+            if skipped:
+                self.metrics.flows_skipped.inc(skipped)
+
+    def waited_ms(self):
+        return (time.monotonic() - self.started_at) * 1000
+
+    def swap_model(self, bundle):
+        """
+        Đổi sang bộ mô hình đã tải và kiểm tra (ModelBundle) trước lô kế tiếp: chỉ gán lại tham chiếu, các lô
+        trước đã chấm điểm xong bằng mô hình cũ. PredictionCache tự xóa khi thấy mô hình khác;
+        AlertExplainer đổi mô hình từ cảnh báo đầu tiên mang phiên bản mới.
+        """
+        logging.info(f"[*] Đổi mô hình: phiên bản {self.model_version} -> {bundle.version}.")
+        self.model, self.preprocessor, self.model_version = bundle.model, bundle.preprocessor, bundle.version
+        if hasattr(self.alert_sink, 'set_model'):
+            self.alert_sink.set_model(bundle.model, bundle.preprocessor, bundle.version)
+
+    def flush(self, log_flows=True):
+        """Chấm điểm lô đang chờ (nếu có)."""
+        if self.pending:
+            start = time.perf_counter()
+            if self.model_reloader is not None:
+                bundle = self.model_reloader.take()
+                if bundle is not None:
+                    self.swap_model(bundle)
+            process_batch(self.model, self.preprocessor, self.pending, self.alert_sink, log_flows=log_flows,
+                          metrics=self.metrics, flow_log=self.flow_log, cache=self.prediction_cache,
+                          model_version=self.model_version)
+            self._flush_sec += time.perf_counter() - start
+            self.pending = []
+        # Các khối trước khối đang đọc đã được chấm điểm hết
+        if self._block_start is not None:
+            self.committed_offset = max(self.committed_offset, self._block_start)
+
+def _open_conn_log(path):
+    """Mở conn.log và đọc header; trả về None nếu chưa có dòng #fields."""
+    reader = ZeekConnReader(path)
+    if not reader.read_header():
+        logging.error(f"Không tìm thấy dòng '#fields' trong 20 dòng đầu của {path}. Đảm bảo Zeek ghi log đúng định dạng.")
+        reader.close()
+        return None
+    logging.info(f"Đã đọc header Zeek log. Các cột: {len(reader.fields)} cột.")
+    return reader
+
+def _drain_reader(reader, batcher, label):
+    """
+    Đọc và chấm điểm toàn bộ phần còn lại của một file (kể cả dòng cuối không có '\\n')
+    bằng đường lô lớn, dùng cho file vừa bị xoay. Trả về số flow đã đọc.
+    """
+    start = time.perf_counter()
+    flows = 0
+    for zeek_batch in _timed_blocks(iter(reader), batcher.metrics):
+        flows += batcher.add_block(zeek_batch, MONITOR_CATCHUP_BATCH_SIZE, log_flows=False)
+    batcher.flush(log_flows=False)
+    if flows:
+        logging.info(f"[*] Đã xử lý nốt {flows} flow còn lại của {label} trong {time.perf_counter() - start:.2f}s.")
+    return flows
+
+def _timed_blocks(blocks, metrics):
+    """Bọc iterator các ZeekConnBatch để ghi nhận thời gian đọc/parse và độ trễ ingest của từng khối."""
+    if metrics is None:
+        yield from blocks
+        return
+    while True:
+        start = time.perf_counter()
+        zeek_batch = next(blocks, None)
+        if zeek_batch is None:
+            return
+        metrics.observe_block(zeek_batch, time.perf_counter() - start)
+        yield zeek_batch
+
+def _resume_position(reader, log_path, identity, checkpoint, batcher, after_rotation):
+    """
+    Chọn vị trí bắt đầu đọc conn.log vừa mở (xem _resume_reader); file cũ đã xoay (nếu còn)
+    được xử lý nốt bằng batcher trước.
+    """
+    rotated = _resume_reader(reader, log_path, identity, checkpoint, after_rotation)
+    if rotated is not None:
+        try:
+            batcher.reset_offset(rotated.position)
+            _drain_reader(rotated, batcher, rotated.path)
+        finally:
+            rotated.close()
+
+def _resume_reader(reader, log_path, identity, checkpoint, after_rotation):
+    """
+    Chọn vị trí bắt đầu đọc conn.log vừa mở:
+    - checkpoint khớp inode: tiếp tục từ vị trí đã lưu;
+    - checkpoint của inode khác (Zeek đã xoay log, ví dụ khi monitor đang dừng): xử lý nốt file cũ
+      nếu còn tìm thấy theo inode trong thư mục log, rồi đọc file mới từ đầu;
+    - vừa xoay log khi đang chạy: đọc file mới từ đầu (file cũ đã được xử lý nốt);
+    - chưa có checkpoint: bắt đầu từ cuối file như trước đây.
+    :return: ZeekConnReader của file cũ đã xoay, đặt ở vị trí checkpoint (người gọi đọc nốt rồi đóng), hoặc None.
+    """
+    entry = checkpoint.get(log_path)
+    saved_identity = checkpoint.identity_of(entry)
+    if entry is not None and saved_identity == identity:
+        offset = entry['offset']
+        if offset > os.fstat(reader.fileno()).st_size:
+            logging.warning(f"Checkpoint {offset} vượt quá kích thước {log_path} (file bị cắt?). Đọc lại từ đầu.")
+        else:
+            reader.seek(max(offset, reader.position))
+            logging.info(f"Tiếp tục đọc {os.path.basename(log_path)} từ checkpoint {reader.position} "
+                         f"(còn {reader.backlog()} byte chưa xử lý).")
+            return
+    elif entry is not None and not after_rotation:
+        rotated_path = find_file_by_identity(os.path.dirname(log_path), saved_identity)
+        if rotated_path:
+            logging.info(f"{log_path} đã được xoay sang {rotated_path}; xử lý nốt từ checkpoint {entry['offset']}.")
+            rotated = _open_conn_log(rotated_path)
+            if rotated is not None:
+                rotated.seek(max(entry['offset'], rotated.position))
+            logging.info(f"Đọc {os.path.basename(log_path)} từ đầu (vị trí {reader.position}).")
+            return rotated
+        else:
+            logging.warning(f"Không tìm thấy file {log_path} cũ (inode {saved_identity[1]}) đã xoay; "
+                            f"các kết nối sau checkpoint {entry['offset']} của file đó sẽ bị bỏ qua.")
+    elif entry is None and not after_rotation:
+        reader.seek_to_end() # Chuyển đến cuối file để chỉ đọc dòng mới
+        logging.info(f"Chưa có checkpoint, đang đọc từ cuối file {os.path.basename(log_path)}.")
+        return
+
+    # File mới sau khi xoay: mọi dòng sau header đều chưa được xử lý
+    logging.info(f"Đọc {os.path.basename(log_path)} từ đầu (vị trí {reader.position}).")
+
+def _monitor_loop(batcher, snapshotter=None, log_dir=ZEEK_LOG_DIR):
+    """
+    Vòng lặp theo dõi conn.log: đọc dòng mới, trích xuất đặc trưng và chấm điểm theo lô.
+    Vị trí đã chấm điểm xong được checkpoint ra đĩa; khi phần chưa đọc lớn (khởi động lại sau
+    một thời gian dừng) thì chuyển sang chế độ đuổi kịp với lô lớn cho tới khi tới cuối file.
+    :param snapshotter: ExtractorSnapshotter chụp trạng thái extractor cùng lúc ghi checkpoint, None để không chụp.
+    :param log_dir: Thư mục log Zeek chứa conn.log.
+    """
+    checkpoint = OffsetCheckpoint().load()
+
+    current_log_path = None
+    current_identity = None
+    reader = None # ZeekConnReader của file conn.log đang theo dõi
+    rotated = False # True khi file hiện tại vừa được thay bằng file mới lúc đang chạy
+
+    batch_size = max(1, MONITOR_BATCH_SIZE)
+    batch_timeout_ms = MONITOR_BATCH_TIMEOUT_MS
+    logging.info(f"Chấm điểm theo lô: tối đa {batch_size} flow hoặc {batch_timeout_ms} ms mỗi lô.")
+
+    try:
+        while True:
             try:
-                # Tiền xử lý các đặc trưng bằng preprocessor đã tải
-                # preprocess_features đã được cấu hình để log ở cấp độ WARNING cho chi tiết
-                X, _, _ = preprocess_features(df, preprocessor=preprocessor, fit=False)
-                
-                # Dự đoán
-                prediction = model.predict(X)[0]
-                label = 'Normal' if prediction == 0 else 'Malicious'
-                
-                proba = model.predict_proba(X)[0, 1]
-                
-                # Gửi cảnh báo đến Elasticsearch nếu là Malicious
-                if label == 'Malicious' and es_client : # Chỉ gửi nếu kết nối ES thành công
-                    alert_data = {
-                        # Dòng đã được sửa: Sử dụng datetime.utcfromtimestamp() để đảm bảo UTC
-                        "@timestamp": datetime.utcfromtimestamp(float(log_entry_dict.get('ts', time.time()))).isoformat() + "Z",
-                        "event": {
-                            "category": "network",
-                            "type": "alert",
-                            "severity": "high" if proba >= 0.8 else "medium", # Tùy chỉnh mức độ nghiêm trọng
-                            "kind": "event"
-                        },
-                        "source": {
-                            "ip": log_entry_dict.get('id.orig_h'),
-                            "port": log_entry_dict.get('id.orig_p')
-                        },
-                        "destination": {
-                            "ip": log_entry_dict.get('id.resp_h'),
-                            "port": log_entry_dict.get('id.resp_p')
-                        },
-                        "network": {
-                            "transport": log_entry_dict.get('proto', 'unknown'),
-                            "protocol": log_entry_dict.get('service', 'unknown')
-                        },
-                        "threat": {
-                            "detection": {
-                                "outcome": "detected",
-                                "rule": {
-                                    "name": "ML_IDS_Prediction"
-                                }
-                            },
-                            "technique": [
-                                { "id": "T1046", "name": "Network Service Scanning" } # MITRE ATT&CK for port scanning
-                            ],
-                            "score": int(proba * 100)
-                        },
-                        "ml_ids": { # Thông tin thêm từ mô hình 
-                            "predicted_label": label,
-                            "prediction_probability": proba,
-                            # nslkdd_features là dict, có thể lưu trực tiếp
-                            "nsl_kdd_features": nslkdd_features 
-                        },
-                        "message": f"ML IDS detected {label} activity from {log_entry_dict.get('id.orig_h')}:{log_entry_dict.get('id.orig_p')} to {log_entry_dict.get('id.resp_h')}:{log_entry_dict.get('id.resp_p')} with probability {proba:.4f}"
-                    }
-                    try:
-                        # Gửi tài liệu vào Elasticsearch index 'my_ids_alerts'
-                        es_client.index(index="my_ids_alerts", document=alert_data)
-                        logging.info(f"Đã gửi cảnh báo tấn công đến Elasticsearch: {log_entry_dict.get('id.orig_h')} -> {log_entry_dict.get('id.resp_h')}, xác suất: {proba:.4f}")
-                    except Exception as es_e:
-                        logging.error(f"Lỗi khi gửi cảnh báo đến Elasticsearch: {es_e}")
-
-                # Log thông báo dự đoán ra console (luôn hiển thị nếu level là INFO)
-                logging.info(f"[+] Zeek Flow ({log_entry_dict.get('ts', 'N/A')} {log_entry_dict.get('id.orig_h', 'N/A')}:{log_entry_dict.get('id.orig_p', 'N/A')} -> {log_entry_dict.get('id.resp_h', 'N/A')}:{log_entry_dict.get('id.resp_p', 'N/A')}): {label} (Xác suất tấn công: {proba:.4f})")
+                new_log_path = get_latest_zeek_conn_log_path(log_dir)
 
-            except Exception as e:
-                logging.error(f"Lỗi trong quá trình tiền xử lý hoặc dự đoán từ Zeek log: {e}", exc_info=True)
+                if new_log_path is None:
+                    time.sleep(5) # Chờ Zeek tạo log file
+                    continue
+
+                # Kiểm tra inode để biết đó có phải là file vật lý mới không
+                # (Zeek xoay log: file cũ bị đổi tên và conn.log mới được tạo cùng tên)
+                new_identity = file_identity(new_log_path)
 
-        except FileNotFoundError:
-            logging.error(f"File log Zeek không tìm thấy tại {new_log_path}. Đang chờ Zeek ghi log...")
-            current_log_path = None
-            log_file = None # Đặt lại log_file để nó sẽ được mở lại
-            time.sleep(5)
+                if reader is not None and (new_log_path != current_log_path or new_identity != current_identity):
+                    # Xử lý nốt các dòng cuối của file cũ (fd vẫn hợp lệ sau khi đổi tên) trước khi chuyển file
+                    _drain_reader(reader, batcher, current_log_path)
+                    checkpoint.update(current_log_path, current_identity, batcher.committed_offset)
+                    reader.close()
+                    logging.info(f"Đóng file log cũ: {current_log_path}")
+                    reader = None
+                    rotated = True
+
+                if reader is None:
+                    current_log_path = new_log_path
+                    logging.info(f"Đang mở file log mới: {current_log_path}")
+                    reader = _open_conn_log(current_log_path)
+                    if reader is None:
+                        time.sleep(5)
+                        continue
+                    current_identity = file_identity(reader.fileno())
+                    _resume_position(reader, current_log_path, current_identity, checkpoint, batcher, rotated)
+                    batcher.reset_offset(reader.position)
+                    checkpoint.update(current_log_path, current_identity, batcher.committed_offset)
+                    checkpoint.save()
+                    rotated = False
+
+                # Backlog lớn: đuổi kịp bằng lô lớn, không chờ timeout và không log từng flow
+                backlog = reader.backlog()
+                catching_up = backlog > MONITOR_CATCHUP_THRESHOLD_BYTES
+                if catching_up:
+                    logging.info(f"[*] Đuổi kịp backlog {backlog / (1 << 20):.1f} MiB của {os.path.basename(current_log_path)}...")
+                    catchup_start = time.perf_counter()
+                    catchup_flows = 0
+
+                # Đọc toàn bộ dữ liệu mới theo khối lớn, mỗi khối là một lô dạng cột
+                got_data = False
+                for zeek_batch in _timed_blocks(reader.read_batches(), batcher.metrics):
+                    if catching_up:
+                        n = batcher.add_block(zeek_batch, MONITOR_CATCHUP_BATCH_SIZE, log_flows=False)
+                        catchup_flows += n
+                    else:
+                        n = batcher.add_block(zeek_batch, batch_size, batch_timeout_ms)
+                    got_data = got_data or n > 0
+                    checkpoint.update(current_log_path, current_identity, batcher.committed_offset)
+                    checkpoint.maybe_save()
+
+                if catching_up:
+                    batcher.flush(log_flows=False)
+                    elapsed = time.perf_counter() - catchup_start
+                    logging.info(f"[*] Đã đuổi kịp: {catchup_flows} flow trong {elapsed:.2f}s "
+                                 f"({catchup_flows / max(elapsed, 1e-9):.0f} flow/s). Chuyển sang theo dõi trực tiếp.")
+
+                if not got_data:
+                    # Không có dòng mới: xả lô đang chờ nếu đã quá thời gian chờ tối đa
+                    if batcher.pending and batcher.waited_ms() >= batch_timeout_ms:
+                        batcher.flush()
+                    elif batcher.pending:
+                        time.sleep(min(0.1, (batch_timeout_ms - batcher.waited_ms()) / 1000))
+                    else:
+                        time.sleep(0.1)
+
+                checkpoint.update(current_log_path, current_identity, batcher.committed_offset)
+                checkpoint.maybe_save()
+                # Chỉ chụp khi không còn flow chờ (trạng thái extractor khớp committed_offset) và ghi checkpoint
+                # ngay trước đó: khởi động lại không bao giờ đọc lại flow đã có trong snapshot
+                if snapshotter is not None and reader is not None and not batcher.pending and snapshotter.due():
+                    checkpoint.save()
+                    snapshotter.snapshot(batcher.feature_extractor)
+
+            except FileNotFoundError:
+                logging.error(f"File log Zeek không tìm thấy tại {new_log_path}. Đang chờ Zeek ghi log...")
+                if reader is not None:
+                    reader.close()
+                current_log_path = None
+                reader = None # Đặt lại reader để file được mở lại
+                time.sleep(5)
+            except Exception as e:
+                logging.error(f"Lỗi tổng quát khi đọc hoặc xử lý log Zeek: {e}", exc_info=True)
+                time.sleep(1)
+    finally:
+        # Dừng (Ctrl+C/deploy): chấm điểm nốt lô đang chờ và lưu vị trí cuối cùng
+        try:
+            batcher.flush()
         except Exception as e:
-            logging.error(f"Lỗi tổng quát khi đọc hoặc xử lý log Zeek: {e}", exc_info=True)
-            time.sleep(1)
\ No newline at end of file
+            logging.error(f"Lỗi khi chấm điểm lô cuối trước khi dừng: {e}")
+        if reader is not None and current_identity is not None:
+            checkpoint.update(current_log_path, current_identity, batcher.committed_offset)
+            reader.close()
+        checkpoint.save()
+        if snapshotter is not None:
+            snapshotter.close(batcher.feature_extractor if not batcher.pending else None)
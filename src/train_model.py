@@ -1,74 +1,153 @@
 # src/train_model.py
 
-import pandas as pd
 import joblib
 import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime
 import xgboost as xgb
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, roc_auc_score
-from src.preprocess import load_nslkdd_data, preprocess_features # Import các hàm từ preprocess
-from src.config import MODEL_PATHS
+from src.dataset_cache import load_training_data
+from src.config import (MODEL_PATHS, NATIVE_MODEL_PATH, PREPROCESSOR_PATH, CASCADE_MODEL_PATH, CASCADE_FN_BUDGET,
+                        MODEL_MANIFEST_PATH, MODEL_RELEASES_DIR)
+from src.model_runtime import export_native_model
+from src.cascade import train_prefilter, cascade_report, export_prefilter
+from src.model_reloader import write_model_manifest, validate_model
+from src.hyperparameter_search import search_hyperparameters, evaluate_model, measure_latency_ms_per_1k
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
-def train_model():
+def _install_default_copy(path, default_path):
+    """Chép một file của bản phát hành ra đường dẫn mặc định (ghi file tạm rồi os.replace, không để lại file ghi dở)."""
+    directory = os.path.dirname(default_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + os.path.basename(default_path) + '-', suffix='.tmp', dir=directory)
+    os.close(fd)
+    try:
+        shutil.copyfile(path, tmp_path)
+        os.replace(tmp_path, default_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def train_model(search=False):
+    """
+    Huấn luyện mô hình XGBoost trên NSL-KDD, đánh giá trên tập test và lưu mô hình.
+    Mọi file của lần huấn luyện được ghi vào MODEL_RELEASES_DIR/<phiên bản>/, rồi manifest mới trỏ tới thư mục đó;
+    monitor đang chạy (hoặc khởi động lại giữa chừng) không bao giờ thấy manifest mô tả file đã bị ghi đè.
+    Các đường dẫn mặc định (khi chưa có manifest) chỉ được cập nhật sau khi manifest đã ghi xong.
+    :param search: True để tìm siêu tham số song song (src/hyperparameter_search.py) thay vì dùng cấu hình cố định.
+    """
     logging.info("[*] Bắt đầu quá trình huấn luyện mô hình.")
 
-    # 1. Tải dữ liệu NSL-KDD
+    # 1-3. Tải dữ liệu NSL-KDD đã tiền xử lý (từ cache nhị phân nếu file dữ liệu và cấu hình không đổi)
+    # preprocessor được huấn luyện trên tập train và dùng để transform tập test
     try:
-        df_train = load_nslkdd_data("dataset/NSL-KDD-Dataset/KDDTrain+.txt")
-        df_test = load_nslkdd_data("dataset/NSL-KDD-Dataset/KDDTest+.txt")
+        X_train_processed, y_train, X_test_processed, y_test, preprocessor = load_training_data(
+            "dataset/NSL-KDD-Dataset/KDDTrain+.txt", "dataset/NSL-KDD-Dataset/KDDTest+.txt")
     except FileNotFoundError as e:
         logging.error(f"Không tìm thấy file dữ liệu NSL-KDD: {e}. Vui lòng kiểm tra đường dẫn.")
         return
     except Exception as e:
         logging.error(f"Lỗi khi tải dữ liệu: {e}", exc_info=True)
         return
-
-    # 2. Tiền xử lý dữ liệu huấn luyện
-    # preprocessor sẽ được huấn luyện trên df_train và lưu lại
-    X_train_processed, y_train, preprocessor = preprocess_features(df_train, fit=True)
-    
-    # 3. Tiền xử lý dữ liệu kiểm thử
-    # Sử dụng preprocessor đã huấn luyện để transform df_test
-    X_test_processed, y_test, _ = preprocess_features(df_test, preprocessor=preprocessor, fit=False)
+    version = datetime.now().strftime('%Y%m%d-%H%M%S')
+    release_dir = os.path.join(MODEL_RELEASES_DIR, version)
+    release_paths = {name: os.path.join(release_dir, os.path.basename(path)) for name, path in
+                     (('pickle', MODEL_PATHS['xgb']), ('model', NATIVE_MODEL_PATH), ('preprocessor', PREPROCESSOR_PATH),
+                      ('cascade', CASCADE_MODEL_PATH))}
+    os.makedirs(release_dir, exist_ok=True)
+    joblib.dump(preprocessor, release_paths['preprocessor'])
+    logging.info(f"Đã lưu preprocessor tại: {release_paths['preprocessor']}")
 
     # 4. Huấn luyện mô hình XGBoost
-    logging.info("Huấn luyện mô hình XGBoost...")
-    model = xgb.XGBClassifier(
-        objective='binary:logistic',
-        eval_metric='logloss',
-        use_label_encoder=False,
-        n_estimators=100, # Số lượng cây
-        learning_rate=0.1,
-        max_depth=5,
-        random_state=42
-    )
-    model.fit(X_train_processed, y_train)
+    if search:
+        try:
+            model, _ = search_hyperparameters(X_train_processed, y_train)
+        except Exception as e:
+            logging.error(f"Lỗi khi tìm siêu tham số: {e}", exc_info=True)
+            return
+    else:
+        logging.info("Huấn luyện mô hình XGBoost...")
+        model = xgb.XGBClassifier(
+            objective='binary:logistic',
+            eval_metric='logloss',
+            use_label_encoder=False,
+            n_estimators=100, # Số lượng cây
+            learning_rate=0.1,
+            max_depth=5,
+            random_state=42
+        )
+        start = time.perf_counter()
+        model.fit(X_train_processed, y_train)
+        logging.info(f"Huấn luyện xong trong {time.perf_counter() - start:.1f}s.")
     
     # 5. Đánh giá mô hình
     logging.info("Đánh giá mô hình trên tập kiểm thử...")
-    y_pred = model.predict(X_test_processed)
-    y_proba = model.predict_proba(X_test_processed)[:, 1]
+    metrics = evaluate_model(model, X_test_processed, y_test)
 
-    accuracy = accuracy_score(y_test, y_pred)
-    precision = precision_score(y_test, y_pred)
-    recall = recall_score(y_test, y_pred)
-    f1 = f1_score(y_test, y_pred)
-    roc_auc = roc_auc_score(y_test, y_proba)
+    logging.info(f"Độ chính xác (Accuracy): {metrics['accuracy']:.4f}")
+    logging.info(f"Độ chính xác (Precision): {metrics['precision']:.4f}")
+    logging.info(f"Độ thu hồi (Recall): {metrics['recall']:.4f}")
+    logging.info(f"Điểm F1 (F1-Score): {metrics['f1']:.4f}")
+    logging.info(f"ROC AUC: {metrics['roc_auc']:.4f}")
+    logging.info(f"Độ trễ dự đoán: {measure_latency_ms_per_1k(model, X_test_processed):.3f} ms / 1000 dòng")
 
-    logging.info(f"Độ chính xác (Accuracy): {accuracy:.4f}")
-    logging.info(f"Độ chính xác (Precision): {precision:.4f}")
-    logging.info(f"Độ thu hồi (Recall): {recall:.4f}")
-    logging.info(f"Điểm F1 (F1-Score): {f1:.4f}")
-    logging.info(f"ROC AUC: {roc_auc:.4f}")
+    # 5b. Bộ lọc trước cho chấm điểm hai tầng (src/cascade.py): ngưỡng chọn trên validation tách từ tập train
+    logging.info(f"Huấn luyện bộ lọc cascade (ngân sách FN {CASCADE_FN_BUDGET:.2%} flow tấn công)...")
+    try:
+        prefilter, threshold, val_report = train_prefilter(X_train_processed, y_train)
+        test_report = cascade_report(prefilter.predict_proba(X_test_processed)[:, 1], threshold, y_test,
+                                     full_proba=model.predict_proba(X_test_processed)[:, 1])
+        logging.info(f"Bộ lọc cascade: ngưỡng {threshold:.4g}, validation: bỏ qua mô hình đầy đủ "
+                     f"{val_report['short_circuit_rate']:.1%} flow, lọt {val_report['attack_miss_rate']:.3%} flow tấn công.")
+        logging.info(f"Bộ lọc cascade trên tập kiểm thử: bỏ qua {test_report['short_circuit_rate']:.1%} flow, "
+                     f"lọt {test_report['attack_miss_rate']:.3%} flow tấn công, thêm {test_report['added_false_negatives']} "
+                     f"false negative (recall {test_report['recall']:.4f} -> {test_report['cascade_recall']:.4f}).")
+    except Exception as e:
+        logging.error(f"Lỗi khi huấn luyện bộ lọc cascade, monitor sẽ chấm điểm mọi flow bằng mô hình đầy đủ: {e}",
+                      exc_info=True)
+        prefilter = None
 
-    # 6. Lưu mô hình
+    # 6. Lưu mô hình vào thư mục của phiên bản này (không đụng tới các file mà manifest hiện tại trỏ tới)
+    try:
+        joblib.dump(model, release_paths['pickle'])
+        logging.info(f"Đã lưu mô hình XGBoost tại: {release_paths['pickle']}")
+        # Lưu thêm booster định dạng gốc cho monitor/replay (tải nhanh, dự đoán bằng inplace_predict)
+        export_native_model(model, release_paths['model'])
+        logging.info(f"Đã lưu booster định dạng gốc tại: {release_paths['model']}")
+        if prefilter is not None:
+            export_prefilter(prefilter, threshold, path=release_paths['cascade'])
+            logging.info(f"Đã lưu bộ lọc cascade tại: {release_paths['cascade']}")
+        # Chấm thử bằng đúng đường chấm điểm của monitor trước khi công bố phiên bản này
+        validate_model(model, preprocessor)
+    except Exception as e:
+        logging.error(f"Lỗi khi lưu mô hình, giữ nguyên manifest và mô hình đang phục vụ: {e}", exc_info=True)
+        return
+
+    # 7. Ghi manifest (monitor đang chạy nạp lại bộ mô hình khi manifest đổi, src/model_reloader.py),
+    # sau đó mới cập nhật bản sao ở các đường dẫn mặc định
+    try:
+        manifest = write_model_manifest(version, release_paths['model'], release_paths['preprocessor'],
+                                        release_paths['cascade'] if prefilter is not None else None)
+        logging.info(f"Đã ghi manifest phiên bản {manifest['version']} tại: {MODEL_MANIFEST_PATH}")
+    except Exception as e:
+        logging.error(f"Lỗi khi ghi manifest: {e}", exc_info=True)
+        return
     try:
-        joblib.dump(model, MODEL_PATHS['xgb'])
-        logging.info(f"Đã lưu mô hình XGBoost tại: {MODEL_PATHS['xgb']}")
+        for name, default_path in (('pickle', MODEL_PATHS['xgb']), ('model', NATIVE_MODEL_PATH),
+                                   ('preprocessor', PREPROCESSOR_PATH)):
+            _install_default_copy(release_paths[name], default_path)
+        if prefilter is not None:
+            _install_default_copy(release_paths['cascade'], CASCADE_MODEL_PATH)
+        elif os.path.exists(CASCADE_MODEL_PATH):
+            os.remove(CASCADE_MODEL_PATH) # Bộ lọc cũ thuộc về mô hình trước, không dùng kèm mô hình mới
+            logging.info(f"Đã xóa bộ lọc cascade cũ {CASCADE_MODEL_PATH}.")
+        logging.info(f"Đã chép phiên bản {version} ra các đường dẫn mặc định ({os.path.dirname(NATIVE_MODEL_PATH)}/).")
     except Exception as e:
-        logging.error(f"Lỗi khi lưu mô hình: {e}", exc_info=True)
+        logging.error(f"Lỗi khi chép mô hình ra các đường dẫn mặc định (manifest đã trỏ tới {release_dir}): {e}",
+                      exc_info=True)
 
     logging.info("[*] Hoàn tất quá trình huấn luyện mô hình.")
 
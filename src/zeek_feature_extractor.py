@@ -1,30 +1,341 @@
 # src/zeek_feature_extractor.py
 
 import time
-from collections import deque
+from array import array
 import logging
 import re
-from src.config import NSL_KDD_RELEVANT_COLUMNS, SERVICE_MAPPING, ZEEK_CONN_STATE_TO_NSL_FLAG, ERROR_FLAGS
+import numpy as np
+from src.config import (NSL_KDD_RELEVANT_COLUMNS, SERVICE_MAPPING, ZEEK_CONN_STATE_TO_NSL_FLAG, ERROR_FLAGS,
+                        EXTRACTOR_MAX_WINDOW_FLOWS, EXTRACTOR_INITIAL_WINDOW_CAPACITY, EXTRACTOR_SNAPSHOT_MAX_AGE_SEC)
+
+# Cờ NSL-KDD được tính là lỗi SYN (serror) và lỗi REJ/RST (rerror)
+SERROR_FLAGS = ('S0',)
+RERROR_FLAGS = ('REJ', 'RSTO', 'RSTR')
+
+# Cờ NSL-KDD được lưu trong cửa sổ dưới dạng mã uint8 (chỉ số trong FLAG_NAMES)
+FLAG_NAMES = tuple(sorted(set(ZEEK_CONN_STATE_TO_NSL_FLAG.values()) | {'OTH'}))
+FLAG_CODES = {flag: code for code, flag in enumerate(FLAG_NAMES)}
+
+# Bộ đếm [số kết nối, số lỗi SYN, số lỗi REJ/RST] được gói trong một số nguyên (mỗi trường COUNTER_BITS bit)
+# để mỗi khóa của bảng đếm chỉ tốn một int thay vì một list ba phần tử.
+COUNTER_BITS = 24
+COUNTER_MASK = (1 << COUNTER_BITS) - 1
+FLAG_DELTAS = tuple(1 | (flag in SERROR_FLAGS) << COUNTER_BITS | (flag in RERROR_FLAGS) << 2 * COUNTER_BITS
+                    for flag in FLAG_NAMES)
+SERROR_BY_CODE = np.array([flag in SERROR_FLAGS for flag in FLAG_NAMES], dtype=np.int64)
+RERROR_BY_CODE = np.array([flag in RERROR_FLAGS for flag in FLAG_NAMES], dtype=np.int64)
 
 # Cấu hình logging cho module này
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
+def _packed_counters(keys, flags):
+    """Bộ đếm gói (xem COUNTER_BITS) theo từng khóa của các flow có khóa `keys` và mã cờ `flags` (mảng NumPy)."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inverse, minlength=len(keys))
+    serrors = np.bincount(inverse, weights=SERROR_BY_CODE[flags], minlength=len(keys)).astype(np.int64)
+    rerrors = np.bincount(inverse, weights=RERROR_BY_CODE[flags], minlength=len(keys)).astype(np.int64)
+    return {key: count | serror << COUNTER_BITS | rerror << 2 * COUNTER_BITS
+            for key, count, serror, rerror in zip(keys.tolist(), counts.tolist(), serrors.tolist(), rerrors.tolist())}
+
+class FlowRing:
+    """
+    Bộ đệm vòng các flow của một cửa sổ, mỗi cột là một array.array số (không có object Python cho từng flow):
+    keys (watermark 'd' hoặc seq 'q'), hosts (mã host đích), services (mã dịch vụ), flags (mã cờ uint8).
+    Dung lượng tăng gấp đôi khi đầy (tối đa max_capacity) và giảm một nửa khi còn dưới 1/4.
+    """
+
+    COLUMNS = (('hosts', 'I'), ('services', 'I'), ('flags', 'B'))
+
+    def __init__(self, key_typecode, max_capacity, initial_capacity=EXTRACTOR_INITIAL_WINDOW_CAPACITY):
+        self.key_typecode = key_typecode
+        self.max_capacity = max(1, max_capacity)
+        self.initial_capacity = max(1, min(initial_capacity, self.max_capacity))
+        self.capacity = self.initial_capacity
+        self.keys = array(key_typecode, [0]) * self.capacity
+        for name, typecode in self.COLUMNS:
+            setattr(self, name, array(typecode, [0]) * self.capacity)
+        self.head = 0
+        self.size = 0
+
+    @classmethod
+    def from_columns(cls, key_typecode, max_capacity, columns):
+        """Bộ đệm chứa sẵn các flow (mảng NumPy theo tên cột, từ cũ tới mới) như ordered_columns trả về."""
+        size = len(columns['keys'])
+        ring = cls(key_typecode, max_capacity, initial_capacity=max(EXTRACTOR_INITIAL_WINDOW_CAPACITY, size))
+        for name, typecode in (('keys', key_typecode),) + cls.COLUMNS:
+            items = array(typecode, np.ascontiguousarray(columns[name], dtype=typecode).tobytes())
+            setattr(ring, name, items + array(typecode, [0]) * (ring.capacity - size))
+        ring.size = size
+        ring.initial_capacity = min(EXTRACTOR_INITIAL_WINDOW_CAPACITY, ring.max_capacity)
+        return ring
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        """(key, các cột theo COLUMNS) của từng flow, từ cũ tới mới."""
+        columns = [self.keys] + [getattr(self, name) for name, _ in self.COLUMNS]
+        for i in range(self.size):
+            j = (self.head + i) % self.capacity
+            yield tuple(column[j] for column in columns)
+
+    @property
+    def full(self):
+        return self.size >= self.max_capacity
+
+    @property
+    def nbytes(self):
+        """Số byte của các mảng (đã cấp phát, gồm cả ô trống)."""
+        columns = [self.keys] + [getattr(self, name) for name, _ in self.COLUMNS]
+        return sum(column.itemsize * len(column) for column in columns)
+
+    def append(self, key, host, service, flag):
+        """Thêm flow mới nhất; người gọi phải loại bớt flow trước nếu cửa sổ đã đầy (full)."""
+        if self.size == self.capacity:
+            self._resize(min(self.capacity * 2, self.max_capacity))
+        j = self.head + self.size
+        if j >= self.capacity:
+            j -= self.capacity
+        self.keys[j] = key
+        self.hosts[j] = host
+        self.services[j] = service
+        self.flags[j] = flag
+        self.size += 1
+
+    def popleft(self):
+        """Loại flow cũ nhất; trả về (host, service, flag) của nó."""
+        j = self.head
+        flow = (self.hosts[j], self.services[j], self.flags[j])
+        self.head = j + 1 if j + 1 < self.capacity else 0
+        self.size -= 1
+        if self.size < self.capacity >> 2 and self.capacity > self.initial_capacity:
+            self._resize(max(self.capacity >> 1, self.initial_capacity))
+        return flow
+
+    def ordered_columns(self):
+        """Bản sao các cột theo thứ tự từ cũ tới mới dưới dạng mảng NumPy (chỉ chép bộ nhớ, dùng cho snapshot)."""
+        return {name: np.frombuffer(self._ordered(getattr(self, name)), dtype=typecode)
+                for name, typecode in (('keys', self.key_typecode),) + self.COLUMNS}
+
+    def _ordered(self, column):
+        end = self.head + self.size
+        if end <= self.capacity:
+            return column[self.head:end]
+        return column[self.head:] + column[:end - self.capacity]
+
+    def _resize(self, capacity):
+        """Chép các flow (theo thứ tự) sang mảng mới dung lượng `capacity`, bắt đầu từ ô 0."""
+        for name, typecode in (('keys', self.key_typecode),) + self.COLUMNS:
+            setattr(self, name, self._ordered(getattr(self, name)) + array(typecode, [0]) * (capacity - self.size))
+        self.head = 0
+        self.capacity = capacity
+
+class SourceFlowRing(FlowRing):
+    """FlowRing của cửa sổ host: thêm mã host nguồn (sources) và cổng nguồn (src_ports) của từng flow."""
+
+    COLUMNS = FlowRing.COLUMNS + (('sources', 'I'), ('src_ports', 'H'))
+
+    def append(self, key, host, service, flag, source, src_port):
+        if self.size == self.capacity:
+            self._resize(min(self.capacity * 2, self.max_capacity))
+        j = self.head + self.size
+        if j >= self.capacity:
+            j -= self.capacity
+        self.keys[j] = key
+        self.hosts[j] = host
+        self.services[j] = service
+        self.flags[j] = flag
+        self.sources[j] = source
+        self.src_ports[j] = src_port
+        self.size += 1
+
+    def popleft(self):
+        """Loại flow cũ nhất; trả về (host, service, flag, source, src_port) của nó."""
+        j = self.head
+        flow = (self.hosts[j], self.services[j], self.flags[j], self.sources[j], self.src_ports[j])
+        self.head = j + 1 if j + 1 < self.capacity else 0
+        self.size -= 1
+        if self.size < self.capacity >> 2 and self.capacity > self.initial_capacity:
+            self._resize(max(self.capacity >> 1, self.initial_capacity))
+        return flow
+
+class InternTable:
+    """Ánh xạ giá trị (IP, tên dịch vụ) <-> mã số nguyên nhỏ; mã đã giải phóng được cấp lại cho giá trị mới."""
+
+    def __init__(self, names=()):
+        """:param names: Các giá trị được cấp sẵn mã 0, 1, ... (khi nạp lại snapshot)."""
+        self.names = list(names) # mã -> giá trị (None nếu mã đã được giải phóng)
+        self.ids = {name: code for code, name in enumerate(self.names)} # giá trị -> mã
+        self._free = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def intern(self, name):
+        """Mã của `name`, cấp mã mới (ưu tiên mã đã giải phóng) nếu chưa có."""
+        code = self.ids.get(name)
+        if code is None:
+            if self._free:
+                code = self._free.pop()
+                self.names[code] = name
+            else:
+                code = len(self.names)
+                self.names.append(name)
+            self.ids[name] = code
+        return code
+
+    def release(self, code):
+        del self.ids[self.names[code]]
+        self.names[code] = None
+        self._free.append(code)
+
 class ZeekFeatureExtractor:
-    def __init__(self, time_window_sec=2.0, host_window_count=100):
+    def __init__(self, time_window_sec=2.0, host_window_count=100, max_window_flows=EXTRACTOR_MAX_WINDOW_FLOWS):
         """
         Khởi tạo ZeekFeatureExtractor.
         :param time_window_sec: Khoảng thời gian (giây) cho các đặc trưng time-based (count, rates).
         :param host_window_count: Số lượng kết nối gần nhất cho các đặc trưng host-based.
+        :param max_window_flows: Giới hạn cứng số flow trong cửa sổ thời gian. Khi đầy (flood), flow cũ nhất bị
+                                 loại sớm: các đặc trưng time-based chỉ tính trên max_window_flows flow gần nhất.
         """
         self.time_window_sec = time_window_sec
         self.host_window_count = host_window_count
+        self.max_window_flows = max(1, min(max_window_flows, COUNTER_MASK))
+
+        # Bộ đệm vòng dạng mảng cho hai cửa sổ; host đích, host nguồn và dịch vụ được intern thành số nguyên nhỏ
+        self.time_window = FlowRing('d', self.max_window_flows) # key: watermark của flow
+        self.host_window = SourceFlowRing('q', max(1, host_window_count)) # key: seq của flow
+        self.hosts = InternTable()     # host đích, giải phóng khi không còn flow nào trong cả hai cửa sổ
+        self.sources = InternTable()   # host nguồn, chỉ có trong cửa sổ host
+        self.services = InternTable()  # số dịch vụ nhỏ, không giải phóng
+
+        # Bộ đếm cộng dồn cho từng cửa sổ, cập nhật khi flow vào/ra khỏi cửa sổ tương ứng
+        # để mọi đặc trưng thống kê đều tính được trong O(1) thay vì quét lại cả cửa sổ.
+        # Mỗi giá trị là [số kết nối, số lỗi SYN (S0), số lỗi REJ/RSTO/RSTR] gói trong một int (xem COUNTER_BITS).
+        # Khóa theo (host, dịch vụ) là mã dịch vụ << 32 | mã host.
+        self.time_host_stats = {}  # mã host -> bộ đếm trong cửa sổ thời gian
+        self.time_srv_stats = {}   # (host, dịch vụ) -> bộ đếm trong cửa sổ thời gian
+        self.host_host_stats = {}  # mã host -> bộ đếm trong N kết nối gần nhất
+        self.host_srv_stats = {}   # (host, dịch vụ) -> bộ đếm trong N kết nối gần nhất
+        # Bộ đếm cho các đặc trưng "khác host"/"cùng cổng nguồn" (số flow, không gói):
+        self.time_service_stats = {}  # mã dịch vụ -> số flow (mọi host đích) trong cửa sổ thời gian
+        self.host_port_stats = {}     # cổng nguồn << 32 | mã host -> số flow trong N kết nối gần nhất
+        self.host_srv_src_stats = {}  # mã host nguồn << 64 | khóa (host, dịch vụ) -> số flow trong N kết nối gần nhất
+        self.source_refs = {}         # mã host nguồn -> số flow trong cửa sổ host
+        self.stats = {'overload_evictions': 0}
+        self._overloaded = False
+
+        # Cửa sổ được xác định theo số thứ tự flow (seq) và watermark (timestamp lớn nhất đã thấy
+        # tính tới flow đó) thay vì độ dài cửa sổ và ts của flow hiện tại. Với một luồng duy nhất
+        # hai cách cho cùng kết quả (kể cả khi ts không tăng dần), nhưng cách này cho phép tiến trình
+        # đọc gán seq/watermark toàn cục để mỗi worker (chỉ thấy một phần flow) tính giống hệt.
+        self._next_seq = 0
+        self._watermark = float('-inf')
 
-        # Deque để lưu trữ các bản ghi flow gần đây theo thời gian và host
-        # Mỗi entry là một dictionary chứa các đặc trưng quan trọng từ log Zeek
-        self.recent_flows_time = deque()  # (timestamp, parsed_features)
-        self.recent_flows_host = deque()  # (timestamp, parsed_features)
+        logging.info(f"Khởi tạo ZeekFeatureExtractor với time_window={time_window_sec}s, host_window={host_window_count} flows, "
+                     f"tối đa {self.max_window_flows} flow trong cửa sổ thời gian.")
 
-        logging.info(f"Khởi tạo ZeekFeatureExtractor với time_window={time_window_sec}s, host_window={host_window_count} flows.")
+    def window_sizes(self):
+        """Số flow trong hai cửa sổ, số khóa trong các bảng đếm và bộ nhớ của trạng thái (dùng cho metrics của monitor)."""
+        return {
+            'time_flows': len(self.time_window), 'host_flows': len(self.host_window),
+            'time_hosts': len(self.time_host_stats), 'time_services': len(self.time_srv_stats),
+            'host_hosts': len(self.host_host_stats), 'host_services': len(self.host_srv_stats),
+            'interned_hosts': len(self.hosts), 'time_capacity': self.time_window.capacity,
+            'overload_evictions': self.stats['overload_evictions'],
+        }
+
+    def window_flows(self, window='time'):
+        """
+        Các flow trong một cửa sổ dưới dạng dict (giải mã host/dịch vụ/cờ), từ cũ tới mới. Chỉ dùng để kiểm tra.
+        :param window: 'time' (mỗi flow có 'watermark') hoặc 'host' (mỗi flow có 'seq', 'src_ip', 'src_port').
+        """
+        if window == 'time':
+            return [{'watermark': key, 'dest_ip': self.hosts.names[host], 'service': self.services.names[service],
+                     'flag': FLAG_NAMES[flag]} for key, host, service, flag in self.time_window]
+        return [{'seq': key, 'dest_ip': self.hosts.names[host], 'service': self.services.names[service],
+                 'flag': FLAG_NAMES[flag], 'src_ip': self.sources.names[source], 'src_port': src_port}
+                for key, host, service, flag, source, src_port in self.host_window]
+
+    def snapshot_state(self):
+        """
+        Bản sao trạng thái cửa sổ để ghi ra đĩa (src/extractor_snapshot.py): chỉ chép các cột của hai bộ đệm vòng
+        và danh sách giá trị đã intern, phần nén và ghi đĩa để luồng khác làm. Bộ đếm không được lưu vì
+        restore_state dựng lại được từ các flow.
+        """
+        state = {'time_' + name: column for name, column in self.time_window.ordered_columns().items()}
+        state.update(('host_' + name, column) for name, column in self.host_window.ordered_columns().items())
+        state['meta'] = {
+            'version': 1, 'taken_at': time.time(), 'time_window_sec': self.time_window_sec,
+            'host_window_count': self.host_window_count, 'flags': list(FLAG_NAMES),
+            'next_seq': self._next_seq, 'watermark': self._watermark,
+            'hosts': list(self.hosts.names), 'sources': list(self.sources.names), 'services': list(self.services.names),
+        }
+        return state
+
+    def restore_state(self, state, now=None, max_age_sec=EXTRACTOR_SNAPSHOT_MAX_AGE_SEC):
+        """
+        Nạp lại trạng thái do snapshot_state tạo vào extractor vừa khởi tạo. Flow của cửa sổ thời gian đã hết hạn
+        tại thời điểm `now` bị bỏ; cửa sổ host (N kết nối gần nhất, không phụ thuộc thời gian) được giữ nguyên.
+        Snapshot cũ hơn max_age_sec hoặc khác cấu hình cửa sổ / bảng cờ thì bị bỏ toàn bộ.
+        :param state: Dict như snapshot_state trả về (hoặc load_snapshot đọc từ đĩa).
+        :param now: Timestamp hiện tại của luồng log, mặc định time.time() (ts của Zeek khi theo dõi trực tiếp).
+        :param max_age_sec: Tuổi tối đa (theo watermark của snapshot), None hoặc 0 để không giới hạn.
+        :return: (số flow cửa sổ thời gian, số flow cửa sổ host) đã nạp.
+        """
+        meta = state['meta']
+        if (meta['time_window_sec'], meta['host_window_count'], tuple(meta['flags'])) != \
+                (self.time_window_sec, self.host_window_count, FLAG_NAMES):
+            logging.warning("Snapshot trạng thái extractor có cấu hình cửa sổ khác, bỏ qua.")
+            return 0, 0
+        now = time.time() if now is None else now
+        watermark = meta['watermark']
+        if max_age_sec and now - watermark > max_age_sec:
+            logging.info(f"Snapshot trạng thái extractor đã cũ {now - watermark:.0f}s (quá {max_age_sec}s), bỏ qua.")
+            return 0, 0
+
+        # Bỏ các flow đã ra khỏi cửa sổ thời gian, giữ tối đa max_window_flows flow mới nhất
+        time_columns = {name[5:]: column for name, column in state.items() if name.startswith('time_')}
+        host_columns = {name[5:]: column for name, column in state.items() if name.startswith('host_')}
+        keep = np.flatnonzero(time_columns['keys'] >= max(watermark, now) - self.time_window_sec)
+        keep = keep[-self.max_window_flows:]
+        time_columns = {name: column[keep] for name, column in time_columns.items()}
+        host_columns = {name: column[-max(1, self.host_window_count):] for name, column in host_columns.items()}
+
+        # Đánh lại mã host/host nguồn liên tục theo các giá trị còn được dùng (host chỉ có trong flow đã bỏ được giải phóng)
+        used = np.unique(np.concatenate((time_columns['hosts'], host_columns['hosts'])))
+        time_columns['hosts'] = np.searchsorted(used, time_columns['hosts'])
+        host_columns['hosts'] = np.searchsorted(used, host_columns['hosts'])
+        self.hosts = InternTable(meta['hosts'][code] for code in used.tolist())
+        used = np.unique(host_columns['sources'])
+        host_columns['sources'] = np.searchsorted(used, host_columns['sources'])
+        self.sources = InternTable(meta['sources'][code] for code in used.tolist())
+        self.services = InternTable(meta['services'])
+        self.time_window = FlowRing.from_columns('d', self.max_window_flows, time_columns)
+        self.host_window = SourceFlowRing.from_columns('q', max(1, self.host_window_count), host_columns)
+
+        # Bộ đếm của cửa sổ thời gian (có thể tới max_window_flows flow) được đếm bằng NumPy
+        hosts = time_columns['hosts'].astype(np.int64)
+        services = time_columns['services'].astype(np.int64)
+        flags = time_columns['flags']
+        self.time_host_stats = _packed_counters(hosts, flags)
+        self.time_srv_stats = _packed_counters(services << 32 | hosts, flags)
+        services, counts = np.unique(services, return_counts=True)
+        self.time_service_stats = dict(zip(services.tolist(), counts.tolist()))
+
+        # Cửa sổ host chỉ có tối đa host_window_count flow: cộng từng flow như khi xử lý log
+        self.host_host_stats, self.host_srv_stats = {}, {}
+        self.host_port_stats, self.host_srv_src_stats, self.source_refs = {}, {}, {}
+        for _, host, service, flag, source, src_port in self.host_window:
+            srv_key = service << 32 | host
+            self._add_flow(self.host_host_stats, self.host_srv_stats, host, srv_key, FLAG_DELTAS[flag])
+            self.host_port_stats[src_port << 32 | host] = self.host_port_stats.get(src_port << 32 | host, 0) + 1
+            self.host_srv_src_stats[source << 64 | srv_key] = self.host_srv_src_stats.get(source << 64 | srv_key, 0) + 1
+            self.source_refs[source] = self.source_refs.get(source, 0) + 1
+
+        self._next_seq = meta['next_seq']
+        self._watermark = watermark
+        return len(self.time_window), len(self.host_window)
 
     def _map_zeek_conn_state_to_nsl_flag(self, conn_state):
         """Ánh xạ trạng thái kết nối Zeek sang cờ NSL-KDD."""
@@ -42,13 +353,99 @@ class ZeekFeatureExtractor:
         #     return zeek_log_dict['service']
         return 'other' # Mặc định là 'other' nếu không khớp
 
-    def process_zeek_log_entry(self, log_entry_dict):
+    @staticmethod
+    def _add_flow(host_stats, srv_stats, host, srv_key, delta):
+        """Cộng một flow vừa vào cửa sổ vào các bộ đếm theo host và theo (host, dịch vụ)."""
+        host_stats[host] = host_stats.get(host, 0) + delta
+        srv_stats[srv_key] = srv_stats.get(srv_key, 0) + delta
+
+    @staticmethod
+    def _decrement(stats, key):
+        """Bớt 1 ở bộ đếm `key`, xóa khóa khi về 0. :return: True nếu khóa đã bị xóa."""
+        count = stats[key]
+        if count == 1:
+            del stats[key]
+            return True
+        stats[key] = count - 1
+        return False
+
+    def _remove_flow(self, host_stats, srv_stats, other_host_stats, flow):
+        """
+        Trừ một flow vừa bị loại khỏi cửa sổ; xóa khóa khi không còn flow nào để giới hạn bộ nhớ,
+        và giải phóng mã host khi host cũng không còn trong cửa sổ còn lại (other_host_stats): host đích
+        đã nhàn rỗi thì không còn trạng thái nào.
+        """
+        host, service, flag = flow[:3]
+        delta = FLAG_DELTAS[flag]
+        srv_key = service << 32 | host
+        counters = srv_stats[srv_key]
+        if counters & COUNTER_MASK == 1:
+            del srv_stats[srv_key]
+        else:
+            srv_stats[srv_key] = counters - delta
+        counters = host_stats[host]
+        if counters & COUNTER_MASK == 1:
+            del host_stats[host]
+            if host not in other_host_stats:
+                self.hosts.release(host)
+        else:
+            host_stats[host] = counters - delta
+
+    def _expire(self, watermark, seq, window_flows=None):
+        """
+        Loại các flow đã ra khỏi hai cửa sổ trước khi thêm flow (watermark, seq).
+        :param window_flows: Số flow tối đa của cửa sổ thời gian tính cả flow sắp thêm (mặc định max_window_flows).
+        """
+        # Cửa sổ thời gian: flow j còn trong cửa sổ khi watermark_j >= watermark hiện tại - time_window_sec
+        # (watermark không giảm nên bộ đệm luôn có thứ tự)
+        ring, horizon = self.time_window, watermark - self.time_window_sec
+        while ring.size and ring.keys[ring.head] < horizon:
+            self._remove_time_flow(ring.popleft())
+        limit = self.max_window_flows if window_flows is None else min(window_flows, self.max_window_flows)
+        if ring.size >= limit:
+            # Quá tải (flood): loại sớm flow cũ nhất để giữ giới hạn bộ nhớ
+            if not self._overloaded:
+                self._overloaded = True
+                logging.warning(f"Cửa sổ thời gian của extractor đạt giới hạn {self.max_window_flows} flow: "
+                                f"loại sớm flow cũ nhất, đặc trưng time-based chỉ tính trên {self.max_window_flows} flow gần nhất.")
+            while ring.size >= limit:
+                self._remove_time_flow(ring.popleft())
+                self.stats['overload_evictions'] += 1
+        elif self._overloaded:
+            self._overloaded = False
+            logging.info(f"Cửa sổ thời gian của extractor hết quá tải (đã loại sớm {self.stats['overload_evictions']} flow).")
+
+        # Cửa sổ host: giữ các flow thuộc host_window_count flow gần nhất của luồng
+        ring, horizon = self.host_window, seq - self.host_window_count
+        while ring.size and (ring.keys[ring.head] <= horizon or ring.full):
+            self._remove_host_flow(ring.popleft())
+
+    def _remove_time_flow(self, flow):
+        self._remove_flow(self.time_host_stats, self.time_srv_stats, self.host_host_stats, flow)
+        self._decrement(self.time_service_stats, flow[1])
+
+    def _remove_host_flow(self, flow):
+        host, service, _, source, src_port = flow
+        self._remove_flow(self.host_host_stats, self.host_srv_stats, self.time_host_stats, flow)
+        self._decrement(self.host_port_stats, src_port << 32 | host)
+        self._decrement(self.host_srv_src_stats, source << 64 | service << 32 | host)
+        if self._decrement(self.source_refs, source):
+            self.sources.release(source)
+
+    def process_zeek_log_entry(self, log_entry_dict, seq=None, watermark=None, service_count=None, window_flows=None):
         """
         Chuyển đổi một dictionary từ log Zeek sang các đặc trưng NSL-KDD.
         Cập nhật bộ đệm và tính toán các đặc trưng thống kê.
+        :param seq: Số thứ tự toàn cục của flow (chế độ chia shard). Mặc định tự đánh số.
+        :param watermark: Timestamp lớn nhất của luồng tính tới flow này (chế độ chia shard). Mặc định tự tính.
+        :param service_count: Số flow cùng dịch vụ với flow này (mọi host đích, tính cả nó) trong cửa sổ thời gian
+                              (chế độ chia shard: worker chỉ thấy một phần host đích nên tiến trình đọc đếm). Mặc định tự đếm.
+        :param window_flows: Số flow của extractor này (tính cả flow hiện tại) nằm trong max_window_flows flow gần nhất
+                             của cả luồng (chế độ chia shard: giới hạn quá tải tính theo mọi flow, không theo flow của shard).
+                             Mặc định max_window_flows.
         """
         current_ts = float(log_entry_dict.get('ts', time.time())) # Timestamp của dòng log
-        
+
         # 1. Trích xuất các đặc trưng cơ bản trực tiếp từ log Zeek
         features = {}
         try:
@@ -65,9 +462,10 @@ class ZeekFeatureExtractor:
             features['flag'] = self._map_zeek_conn_state_to_nsl_flag(log_entry_dict.get('conn_state', 'OTH'))
             features['src_bytes'] = int(log_entry_dict.get('orig_bytes', 0))
             features['dst_bytes'] = int(log_entry_dict.get('resp_bytes', 0))
+            src_port = int(log_entry_dict.get('id.orig_p', 0))
             features['land'] = 1 if (log_entry_dict.get('id.orig_h') == log_entry_dict.get('id.resp_h') and \
                                      log_entry_dict.get('id.orig_p') == log_entry_dict.get('id.resp_p')) else 0
-            
+
             # Các đặc trưng content/binary khó trích xuất từ conn.log, mặc định là 0
             features['urgent'] = 0
             features['hot'] = 0
@@ -85,77 +483,83 @@ class ZeekFeatureExtractor:
             features['is_guest_login'] = 0
             features['wrong_fragment'] = 0 # Không có trực tiếp trong conn.log
 
-            # Lưu lại một số thông tin cần thiết để tính toán thống kê
-            current_flow_info = {
-                'ts': current_ts,
-                'dest_ip': log_entry_dict.get('id.resp_h'),
-                'src_ip': log_entry_dict.get('id.orig_h'),
-                'service': features['service'],
-                'flag': features['flag']
-            }
-
-            # Cập nhật buffer thời gian
-            self.recent_flows_time.append(current_flow_info)
-            while self.recent_flows_time and \
-                  self.recent_flows_time[0]['ts'] < current_ts - self.time_window_sec:
-                self.recent_flows_time.popleft()
-
-            # Cập nhật buffer host
-            self.recent_flows_host.append(current_flow_info)
-            while len(self.recent_flows_host) > self.host_window_count:
-                self.recent_flows_host.popleft()
+            if seq is None:
+                seq = self._next_seq
+            self._next_seq = seq + 1
+            if watermark is None:
+                watermark = max(self._watermark, current_ts)
+            self._watermark = watermark
+
+            # Loại các flow đã hết hạn trước (có thể giải phóng mã host), rồi mới intern host/dịch vụ của flow này
+            self._expire(watermark, seq, window_flows)
+            host = self.hosts.intern(log_entry_dict.get('id.resp_h'))
+            source = self.sources.intern(log_entry_dict.get('id.orig_h'))
+            service = self.services.intern(features['service'])
+            flag = FLAG_CODES[features['flag']]
+            srv_key = service << 32 | host
+            port_key = src_port << 32 | host
+            src_key = source << 64 | srv_key
+            delta = FLAG_DELTAS[flag]
+
+            # Cập nhật hai cửa sổ và bộ đếm tương ứng
+            self.time_window.append(watermark, host, service, flag)
+            self._add_flow(self.time_host_stats, self.time_srv_stats, host, srv_key, delta)
+            self.time_service_stats[service] = self.time_service_stats.get(service, 0) + 1
+            self.host_window.append(seq, host, service, flag, source, src_port)
+            self._add_flow(self.host_host_stats, self.host_srv_stats, host, srv_key, delta)
+            self.host_port_stats[port_key] = self.host_port_stats.get(port_key, 0) + 1
+            self.host_srv_src_stats[src_key] = self.host_srv_src_stats.get(src_key, 0) + 1
+            self.source_refs[source] = self.source_refs.get(source, 0) + 1
 
             # 2. Tính toán các đặc trưng thống kê time-based
-            current_dest_ip = current_flow_info['dest_ip']
-            current_service = current_flow_info['service']
-
-            # Lọc các kết nối liên quan trong cửa sổ thời gian
-            relevant_time_flows = [
-                f for f in self.recent_flows_time 
-                if f['dest_ip'] == current_dest_ip
-            ]
-            
-            features['count'] = len(relevant_time_flows)
-            features['srv_count'] = sum(1 for f in relevant_time_flows if f['service'] == current_service)
-
-            total_serror_time = sum(1 for f in relevant_time_flows if f['flag'] in ['S0']) # S0, REJ, RSTO, RSTR for serror in NSL-KDD
-            total_rerror_time = sum(1 for f in relevant_time_flows if f['flag'] in ['REJ', 'RSTO', 'RSTR']) # REJ, RSTO, RSTR for rerror in NSL-KDD
-            
+
+            # Các kết nối liên quan trong cửa sổ thời gian: đọc thẳng từ bộ đếm
+            # (flow hiện tại luôn nằm trong cửa sổ nên khóa chắc chắn tồn tại)
+            counters = self.time_host_stats[host]
+            count, total_serror_time, total_rerror_time = \
+                counters & COUNTER_MASK, counters >> COUNTER_BITS & COUNTER_MASK, counters >> 2 * COUNTER_BITS
+            counters = self.time_srv_stats[srv_key]
+            srv_count, srv_serror_time, srv_rerror_time = \
+                counters & COUNTER_MASK, counters >> COUNTER_BITS & COUNTER_MASK, counters >> 2 * COUNTER_BITS
+
+            features['count'] = count
+            features['srv_count'] = srv_count
+
             features['serror_rate'] = total_serror_time / features['count'] if features['count'] > 0 else 0
-            features['srv_serror_rate'] = sum(1 for f in relevant_time_flows if f['service'] == current_service and f['flag'] in ['S0']) / features['srv_count'] if features['srv_count'] > 0 else 0
+            features['srv_serror_rate'] = srv_serror_time / features['srv_count'] if features['srv_count'] > 0 else 0
             features['rerror_rate'] = total_rerror_time / features['count'] if features['count'] > 0 else 0
-            features['srv_rerror_rate'] = sum(1 for f in relevant_time_flows if f['service'] == current_service and f['flag'] in ['REJ', 'RSTO', 'RSTR']) / features['srv_count'] if features['srv_count'] > 0 else 0
+            features['srv_rerror_rate'] = srv_rerror_time / features['srv_count'] if features['srv_count'] > 0 else 0
 
             features['same_srv_rate'] = features['srv_count'] / features['count'] if features['count'] > 0 else 0
             features['diff_srv_rate'] = (features['count'] - features['srv_count']) / features['count'] if features['count'] > 0 else 0
-            
-            # srv_diff_host_rate: khó tính chính xác từ conn.log mà không theo dõi các host khác. Tạm thời 0
-            features['srv_diff_host_rate'] = 0 
 
-            # 3. Tính toán các đặc trưng thống kê host-based (dựa trên host_window_count)
-            relevant_host_flows = [
-                f for f in self.recent_flows_host 
-                if f['dest_ip'] == current_dest_ip
-            ]
+            # srv_diff_host_rate: trong các flow cùng dịch vụ (mọi host đích) của cửa sổ thời gian, tỉ lệ flow tới host khác
+            if service_count is None:
+                service_count = self.time_service_stats[service]
+            features['srv_diff_host_rate'] = (service_count - srv_count) / service_count if service_count > 0 else 0
 
-            features['dst_host_count'] = len(relevant_host_flows)
-            features['dst_host_srv_count'] = sum(1 for f in relevant_host_flows if f['service'] == current_service)
+            # 3. Tính toán các đặc trưng thống kê host-based (dựa trên host_window_count)
+            counters = self.host_host_stats[host]
+            dst_host_count, total_serror_host, total_rerror_host = \
+                counters & COUNTER_MASK, counters >> COUNTER_BITS & COUNTER_MASK, counters >> 2 * COUNTER_BITS
+            counters = self.host_srv_stats[srv_key]
+            dst_host_srv_count, srv_serror_host, srv_rerror_host = \
+                counters & COUNTER_MASK, counters >> COUNTER_BITS & COUNTER_MASK, counters >> 2 * COUNTER_BITS
 
-            total_serror_host = sum(1 for f in relevant_host_flows if f['flag'] in ['S0'])
-            total_rerror_host = sum(1 for f in relevant_host_flows if f['flag'] in ['REJ', 'RSTO', 'RSTR'])
+            features['dst_host_count'] = dst_host_count
+            features['dst_host_srv_count'] = dst_host_srv_count
 
             features['dst_host_same_srv_rate'] = features['dst_host_srv_count'] / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
             features['dst_host_diff_srv_rate'] = (features['dst_host_count'] - features['dst_host_srv_count']) / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
-            
-            # dst_host_same_src_port_rate: cần theo dõi src_port của từng flow, phức tạp hơn
-            # Tạm thời đặt là 0 hoặc cần thêm logic vào current_flow_info
-            features['dst_host_same_src_port_rate'] = 0 
-            features['dst_host_srv_diff_host_rate'] = 0 
+
+            # Tỉ lệ flow tới host này có cùng cổng nguồn, và trong các flow tới (host, dịch vụ) này tỉ lệ flow từ host nguồn khác
+            features['dst_host_same_src_port_rate'] = self.host_port_stats[port_key] / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
+            features['dst_host_srv_diff_host_rate'] = (features['dst_host_srv_count'] - self.host_srv_src_stats[src_key]) / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
 
             features['dst_host_serror_rate'] = total_serror_host / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
-            features['dst_host_srv_serror_rate'] = sum(1 for f in relevant_host_flows if f['service'] == current_service and f['flag'] in ['S0']) / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
+            features['dst_host_srv_serror_rate'] = srv_serror_host / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
             features['dst_host_rerror_rate'] = total_rerror_host / features['dst_host_count'] if features['dst_host_count'] > 0 else 0
-            features['dst_host_srv_rerror_rate'] = sum(1 for f in relevant_host_flows if f['service'] == current_service and f['flag'] in ['REJ', 'RSTO', 'RSTR']) / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
+            features['dst_host_srv_rerror_rate'] = srv_rerror_host / features['dst_host_srv_count'] if features['dst_host_srv_count'] > 0 else 0
 
             features['outcome'] = 'normal' # Luôn là normal cho dữ liệu giám sát
 
@@ -178,4 +582,4 @@ class ZeekFeatureExtractor:
             return None
         except Exception as e:
             logging.error(f"Lỗi khi xử lý log Zeek: {e}", exc_info=True)
-            return None
\ No newline at end of file
+            return None
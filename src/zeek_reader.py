@@ -0,0 +1,353 @@
+# src/zeek_reader.py
+
+import logging
+import os
+import sys
+from itertools import repeat
+import numpy as np
+from src.config import ZEEK_READER_CHUNK_SIZE
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+# Các kiểu Zeek được chuyển sang mảng số, các kiểu còn lại giữ dạng chuỗi (đã intern)
+FLOAT_ZEEK_TYPES = {'time', 'interval', 'double'}
+INT_ZEEK_TYPES = {'port', 'count', 'int'}
+
+# Kiểu mặc định của các cột conn.log quan trọng, dùng khi file không có dòng #types
+DEFAULT_CONN_LOG_TYPES = {
+    'ts': 'time', 'duration': 'interval',
+    'id.orig_p': 'port', 'id.resp_p': 'port',
+    'orig_bytes': 'count', 'resp_bytes': 'count', 'missed_bytes': 'count',
+    'orig_pkts': 'count', 'orig_ip_bytes': 'count', 'resp_pkts': 'count', 'resp_ip_bytes': 'count',
+}
+
+# Các cột conn.log mà ZeekFeatureExtractor và tài liệu cảnh báo thực sự dùng tới.
+# Chỉ các cột này được chuyển kiểu khi tạo dict cho đường chấm điểm.
+CONN_LOG_SCORING_FIELDS = ['ts', 'id.orig_h', 'id.orig_p', 'id.resp_h', 'id.resp_p',
+                           'proto', 'service', 'duration', 'orig_bytes', 'resp_bytes', 'conn_state']
+
+class ZeekConnBatch:
+    """
+    Một lô dòng conn.log ở dạng cột. Mỗi cột được chuyển kiểu khi được truy cập lần đầu
+    (float64 cho time/interval, int64 cho port/count, mảng object chứa chuỗi đã intern cho các cột khác).
+    Giá trị '-' (unset) và '(empty)' của cột số được thay bằng 0, giống giá trị mặc định
+    mà ZeekFeatureExtractor dùng khi thiếu trường; '(empty)' của cột chuỗi thành ''.
+    """
+
+    def __init__(self, columns, size, types=None, start_offset=None, end_offset=None,
+                 skipped_lines=0, mismatched_lines=0, unset_field=b'-', empty_field=b'(empty)'):
+        """
+        :param columns: dict tên cột -> mảng NumPy đã chuyển kiểu, hoặc list các giá trị bytes thô.
+        :param types: dict tên cột -> kiểu Zeek (dùng khi cột còn ở dạng bytes thô).
+        """
+        self._raw = {name: col for name, col in columns.items() if isinstance(col, list)}
+        self._converted = {name: col for name, col in columns.items() if not isinstance(col, list)}
+        self.fields = list(columns)
+        self.types = types or {}
+        self.size = size
+        self.start_offset = start_offset  # Vị trí byte của dòng đầu tiên trong lô
+        self.end_offset = end_offset      # Vị trí byte ngay sau dòng cuối cùng trong lô
+        self.skipped_lines = skipped_lines
+        self.mismatched_lines = mismatched_lines
+        self._unset_field = unset_field
+        self._empty_field = empty_field
+
+    def __len__(self):
+        return self.size
+
+    def column(self, name, default=None):
+        """Trả về mảng đã chuyển kiểu của cột `name` (hoặc default nếu log không có cột này)."""
+        if name in self._converted:
+            return self._converted[name]
+        raw = self._raw.pop(name, None)
+        if raw is None:
+            return default
+        zeek_type = self.types.get(name, DEFAULT_CONN_LOG_TYPES.get(name, 'string'))
+        if zeek_type in FLOAT_ZEEK_TYPES:
+            converted = self._to_numeric(raw, np.float64)
+        elif zeek_type in INT_ZEEK_TYPES:
+            converted = self._to_numeric(raw, np.int64)
+        else:
+            converted = self._to_strings(raw)
+        self._converted[name] = converted
+        return converted
+
+    def _to_numeric(self, raw, dtype):
+        """Chuyển list bytes sang mảng số; '-'/'(empty)' được thay bằng 0 cho cả cột một lần."""
+        try:
+            return np.array(raw, dtype=dtype)
+        except ValueError:
+            pass
+        values = np.array(raw)
+        missing = (values == self._unset_field) | (values == self._empty_field) | (values == b'')
+        values = np.where(missing, b'0', values)
+        try:
+            return values.astype(dtype)
+        except ValueError:
+            # Có giá trị hỏng trong cột: chuyển từng giá trị, lỗi thì coi là 0
+            return np.array([_parse_number(value, dtype) for value in values.tolist()], dtype=dtype)
+
+    def _to_strings(self, raw):
+        """Giải mã mỗi giá trị khác nhau đúng một lần và intern."""
+        decoded = {value: sys.intern(value.decode('utf-8', 'replace')) for value in dict.fromkeys(raw)}
+        if self._empty_field in decoded:
+            decoded[self._empty_field] = ''
+        column = np.empty(len(raw), dtype=object)
+        column[:] = list(map(decoded.__getitem__, raw))
+        return column
+
+    def to_records(self, fields=None):
+        """
+        Chuyển lô về danh sách dict (kiểu Python thuần) theo từng dòng,
+        dùng cho ZeekFeatureExtractor.process_zeek_log_entry và tài liệu cảnh báo.
+        :param fields: Chỉ lấy các cột này (bỏ qua cột không có trong log); mặc định lấy tất cả.
+        """
+        names = [name for name in (fields or self.fields) if name in self._raw or name in self._converted]
+        values = [self.column(name).tolist() for name in names]
+        return list(map(dict, map(zip, repeat(names), zip(*values))))
+
+    def take(self, indices, fields=None):
+        """Tạo lô con gồm các dòng có chỉ số `indices` (giữ nguyên thứ tự), chỉ với các cột `fields`."""
+        indices = np.asarray(indices, dtype=np.int64)
+        names = [name for name in (fields or self.fields) if name in self._raw or name in self._converted]
+        return ZeekConnBatch({name: self.column(name)[indices] for name in names}, len(indices),
+                             start_offset=self.start_offset, end_offset=self.end_offset)
+
+class ZeekConnReader:
+    """
+    Đọc conn.log của Zeek theo từng khối nhị phân lớn thay vì readline() từng dòng.
+    Header (#separator, #fields, #types) chỉ được phân tích một lần; phần dòng chưa ghi xong
+    ở cuối khối được giữ lại cho lần đọc sau. Dùng chung cho theo dõi thời gian thực
+    (gọi read_batches() lặp lại) và đọc file offline (duyệt reader tới hết file).
+    """
+
+    def __init__(self, source, chunk_size=ZEEK_READER_CHUNK_SIZE):
+        """
+        :param source: Đường dẫn tới conn.log hoặc một file object nhị phân đã mở (ví dụ gzip.open(...)).
+        :param chunk_size: Số byte đọc mỗi lần.
+        """
+        if isinstance(source, (str, bytes, os.PathLike)):
+            self.path = os.fspath(source)
+            self._file = open(self.path, 'rb')
+        else:
+            self.path = getattr(source, 'name', None)
+            self._file = source
+        self.chunk_size = chunk_size
+
+        self.separator = b'\t'
+        self.unset_field = b'-'
+        self.empty_field = b'(empty)'
+        self.fields = []
+        self.types = []
+
+        self._buffer = b''
+        self._position = self._tell()  # Vị trí byte ngay sau dòng hoàn chỉnh cuối cùng đã đọc
+        self._discard_partial_line = False
+
+    @property
+    def position(self):
+        """Vị trí byte của dòng chưa xử lý tiếp theo (dùng để lưu/tiếp tục vị trí đọc)."""
+        return self._position
+
+    def backlog(self):
+        """Số byte đã có trong file nhưng chưa được đọc (0 nếu không xác định được kích thước)."""
+        try:
+            return max(0, os.fstat(self._file.fileno()).st_size - self._position)
+        except (OSError, AttributeError, ValueError):
+            return 0
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def close(self):
+        try:
+            self._file.close()
+        except Exception:
+            pass
+
+    def _tell(self):
+        try:
+            return self._file.tell()
+        except (OSError, AttributeError):
+            return 0
+
+    def _parse_header_line(self, line):
+        """Cập nhật cấu hình từ một dòng header '#...'. Trả về True nếu là dòng #fields."""
+        if line.startswith(b'#separator'):
+            value = line[len(b'#separator'):].strip()
+            try:
+                self.separator = value.decode('unicode_escape').encode('latin-1') or b'\t'
+            except Exception:
+                self.separator = b'\t'
+            return False
+        key, _, value = line.partition(self.separator)
+        if key == b'#fields':
+            self.fields = value.decode('utf-8', 'replace').split(self.separator.decode('latin-1'))
+            if len(self.types) != len(self.fields):
+                self.types = [DEFAULT_CONN_LOG_TYPES.get(name, 'string') for name in self.fields]
+            return True
+        if key == b'#types':
+            types = value.decode('utf-8', 'replace').split(self.separator.decode('latin-1'))
+            if len(types) == len(self.fields) or not self.fields:
+                self.types = types
+        elif key == b'#unset_field':
+            self.unset_field = value
+        elif key == b'#empty_field':
+            self.empty_field = value
+        return False
+
+    def read_header(self, max_lines=20):
+        """
+        Đọc header từ đầu file (tối đa max_lines dòng '#').
+        :return: True nếu tìm thấy dòng #fields. Vị trí đọc được đặt ngay sau header.
+        """
+        self._file.seek(0)
+        self._buffer = b''
+        self._position = 0
+        found = False
+        for _ in range(max_lines):
+            line = self._file.readline()
+            if not line or not line.endswith(b'\n') or not line.startswith(b'#'):
+                break
+            self._position += len(line)
+            found = self._parse_header_line(line.rstrip(b'\r\n')) or found
+        self._file.seek(self._position)
+        return found and bool(self.fields)
+
+    def seek(self, offset):
+        """Tiếp tục đọc từ vị trí byte `offset` (đầu một dòng, ví dụ lấy từ `position`)."""
+        self._file.seek(offset)
+        self._buffer = b''
+        self._position = offset
+        self._discard_partial_line = False
+
+    def seek_to_end(self):
+        """Nhảy tới cuối file để chỉ đọc dòng mới; bỏ qua phần dòng đang ghi dở (nếu có)."""
+        end = self._file.seek(0, os.SEEK_END)
+        self._buffer = b''
+        self._position = end
+        self._discard_partial_line = False
+        if end > 0:
+            self._file.seek(end - 1)
+            self._discard_partial_line = self._file.read(1) != b'\n'
+        self._file.seek(end)
+
+    def read_batches(self):
+        """
+        Đọc toàn bộ dữ liệu hiện có (tới EOF) và sinh ra các ZeekConnBatch, mỗi lô tương ứng
+        một khối đọc. Không chờ dữ liệu mới: khi hết dữ liệu thì dừng, gọi lại sau để đọc tiếp.
+        """
+        while True:
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                return
+            data = self._buffer + chunk
+            last_newline = data.rfind(b'\n')
+            if last_newline < 0:
+                self._buffer = data
+                continue
+            self._buffer = data[last_newline + 1:]
+            complete = data[:last_newline]
+            start_offset = self._position
+            self._position += last_newline + 1
+
+            if self._discard_partial_line:
+                # Phần còn lại của dòng đang ghi dở khi seek_to_end(): bỏ qua
+                self._discard_partial_line = False
+                first_newline = complete.find(b'\n')
+                if first_newline < 0:
+                    continue
+                start_offset += first_newline + 1
+                complete = complete[first_newline + 1:]
+
+            yield from self._parse_block(complete, start_offset)
+
+    def __iter__(self):
+        """Đọc file offline từ vị trí hiện tại tới hết (kể cả dòng cuối không có '\\n')."""
+        yield from self.read_batches()
+        if self._buffer:
+            tail, self._buffer = self._buffer, b''
+            start_offset = self._position
+            self._position += len(tail)
+            yield from self._parse_block(tail, start_offset)
+
+    def _parse_block(self, block, start_offset):
+        """
+        Tách một khối gồm các dòng hoàn chỉnh thành các cột thô.
+        Đường nhanh: khi khối chỉ gồm dòng dữ liệu đủ cột, tách cả khối bằng một lần split()
+        rồi cắt lát theo bước số cột. Nếu có comment/header, dòng trống hay dòng sai số cột
+        thì xử lý từng dòng.
+        """
+        separator = self.separator
+        n_fields = len(self.fields)
+        lines = block.split(b'\n')
+        if n_fields and block[:1] != b'#' and b'\n#' not in block and b'\r' not in block \
+                and set(map(bytes.count, lines, repeat(separator))) == {n_fields - 1}:
+            values = block.replace(b'\n', separator).split(separator)
+            columns = {name: values[i::n_fields] for i, name in enumerate(self.fields)}
+            yield self._build_batch(columns, len(lines), start_offset, 0, 0)
+            return
+
+        rows = []
+        skipped = 0
+        mismatched = 0
+        offset = start_offset # Vị trí byte đầu dòng đang xét
+        for line in lines:
+            line_start = offset
+            offset += len(line) + 1
+            if line.endswith(b'\r'):
+                line = line[:-1]
+            if not line:
+                skipped += 1
+                continue
+            if line[:1] == b'#':
+                skipped += 1
+                old_fields, old_types = self.fields, self.types
+                if self._parse_header_line(line) and self.fields != old_fields:
+                    # Header mới giữa chừng (ví dụ file được ghi lại): xả các dòng theo header cũ trước,
+                    # với kiểu của header cũ (#types của header mới chỉ tới ở dòng sau)
+                    if rows:
+                        yield self._build_batch(self._rows_to_columns(rows, old_fields), len(rows),
+                                                start_offset, skipped, mismatched, end_offset=line_start,
+                                                types=self._field_types(old_fields, old_types))
+                        rows, skipped, mismatched = [], 0, 0
+                        start_offset = line_start
+                    n_fields = len(self.fields)
+                continue
+            values = line.split(separator)
+            if len(values) != n_fields:
+                mismatched += 1
+                logging.warning(f"Số lượng cột không khớp. Dòng: {line.decode('utf-8', 'replace')}. "
+                                f"Expected {n_fields}, Got {len(values)}. Bỏ qua dòng.")
+                continue
+            rows.append(values)
+
+        if rows or skipped or mismatched:
+            yield self._build_batch(self._rows_to_columns(rows, self.fields), len(rows),
+                                    start_offset, skipped, mismatched)
+
+    @staticmethod
+    def _rows_to_columns(rows, fields):
+        if not rows:
+            return {name: [] for name in fields}
+        return {name: list(values) for name, values in zip(fields, zip(*rows))}
+
+    @staticmethod
+    def _field_types(fields, types):
+        """dict tên cột -> kiểu Zeek, rỗng nếu #types không khớp số cột (dùng kiểu mặc định)."""
+        return dict(zip(fields, types)) if len(types) == len(fields) else {}
+
+    def _build_batch(self, columns, size, start_offset, skipped, mismatched, end_offset=None, types=None):
+        if types is None:
+            types = self._field_types(self.fields, self.types)
+        if end_offset is None:
+            end_offset = self._position
+        return ZeekConnBatch(columns, size, types=types, start_offset=start_offset, end_offset=end_offset,
+                             skipped_lines=skipped, mismatched_lines=mismatched,
+                             unset_field=self.unset_field, empty_field=self.empty_field)
+
+def _parse_number(value, dtype):
+    try:
+        return dtype(float(value)) if dtype is np.int64 else dtype(value)
+    except ValueError:
+        return 0